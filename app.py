@@ -1,55 +1,178 @@
 import os
-import logging
+import json
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from database import REPLICA_BIND, configure_engine, engine_options
+from extensions import db
+from services.logging_service import logging_pipeline
+from services.serialization import FastJSONProvider
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
-
-class Base(DeclarativeBase):
-    pass
-
-db = SQLAlchemy(model_class=Base)
-
-# Create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
-
-# Configure the database
-database_url = os.environ.get("DATABASE_URL", "sqlite:///consent_management.db")
-app.config["SQLALCHEMY_DATABASE_URI"] = database_url
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-
-# Configure upload settings
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['SIGNED_FOLDER'] = 'signed'
-
-# Initialize the app with the extension
-db.init_app(app)
-
-# Ensure upload directories exist
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['SIGNED_FOLDER'], exist_ok=True)
+def load_config(app):
+    """Apply the settings read from the environment"""
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+    
+    # Log through a background thread as JSON (or text), with patient
+    # contact details masked; LOG_SAMPLE_RATES maps endpoints to the
+    # fraction of their INFO records kept
+    app.config['LOG_LEVEL'] = os.environ.get("LOG_LEVEL", "INFO").upper()
+    app.config['LOG_FORMAT'] = os.environ.get("LOG_FORMAT", "json")
+    app.config['LOG_FILE'] = os.environ.get("LOG_FILE")
+    app.config['LOG_REDACT_PII'] = os.environ.get("LOG_REDACT_PII", "1") == "1"
+    app.config['LOG_RATE_LIMIT'] = int(os.environ.get("LOG_RATE_LIMIT", "200"))
+    app.config['LOG_SAMPLE_RATES'] = json.loads(os.environ.get("LOG_SAMPLE_RATES", "{}"))
+    
+    # Configure the database
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///consent_management.db")
+    
+    # Read-only views send their queries to a replica when one is configured
+    app.config["DATABASE_REPLICA_URL"] = os.environ.get("DATABASE_REPLICA_URL")
+    
+    # Configure upload settings
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max request body
+    app.config['UPLOAD_CHUNK_SIZE'] = 8 * 1024 * 1024  # chunk size for resumable uploads
+    app.config['UPLOAD_CHUNK_LEASE_SECONDS'] = 60  # renewed while a chunk is being written
+    app.config['MAX_UPLOAD_SIZE'] = 1024 * 1024 * 1024  # 1GB max resumable upload
+    app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['SIGNED_FOLDER'] = 'signed'
+    
+    # Threads that run views when served over ASGI (asgi:app)
+    app.config['ASGI_THREADS'] = int(os.environ.get("ASGI_THREADS", "32"))
+    
+    # Let the front-end server send document bodies: USE_X_SENDFILE for
+    # Apache/lighttpd, or the internal nginx location for X-Accel-Redirect
+    app.config['USE_X_SENDFILE'] = os.environ.get("USE_X_SENDFILE") == "1"
+    app.config['FILE_ACCEL_REDIRECT_PREFIX'] = os.environ.get("FILE_ACCEL_REDIRECT_PREFIX")
+    
+    # Request metrics on /metrics, and folded-stack dumps of slow requests
+    app.config['METRICS_ENABLED'] = os.environ.get("METRICS_ENABLED", "1") == "1"
+    app.config['PROFILE_SLOW_REQUESTS'] = os.environ.get("PROFILE_SLOW_REQUESTS") == "1"
+    app.config['PROFILE_THRESHOLD_SECONDS'] = float(os.environ.get("PROFILE_THRESHOLD_SECONDS", "0.5"))
+    
+    # Configure batch sends
+    app.config['BATCH_SEND_CHUNK_SIZE'] = 1000  # rows per transaction
+    app.config['BATCH_SEND_MAX_PATIENTS'] = 10000
+    
+    # Expire consents left unsigned this many days after they were sent, with
+    # per-form overrides as a JSON object of form name to days (opt-in: unset
+    # or 0 never expires them)
+    app.config['CONSENT_TTL_DAYS'] = float(os.environ.get("CONSENT_TTL_DAYS") or 0) or None
+    app.config['CONSENT_TTL_BY_FORM'] = json.loads(os.environ.get("CONSENT_TTL_BY_FORM", "{}"))
+    
+    # Move consents signed more than this many days ago, with their
+    # transmissions and signed documents, to compressed files under
+    # ARCHIVE_FOLDER (opt-in: unset or 0 disables archiving)
+    app.config['ARCHIVE_FOLDER'] = os.environ.get("ARCHIVE_FOLDER", "archive")
+    app.config['ARCHIVE_AFTER_DAYS'] = float(os.environ.get("ARCHIVE_AFTER_DAYS") or 0) or None
 
-with app.app_context():
-    # Import models to ensure tables are created
-    import models
+def configure_database(app, config):
+    """Derive the engine options from the final database URLs"""
+    if "SQLALCHEMY_ENGINE_OPTIONS" not in config:
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+    
+    replica_url = app.config.get("DATABASE_REPLICA_URL")
+    if replica_url and "SQLALCHEMY_BINDS" not in config:
+        app.config["SQLALCHEMY_BINDS"] = {REPLICA_BIND: {"url": replica_url, **engine_options(replica_url)}}
     
-    # Create all tables
-    db.create_all()
+    db.init_app(app)
     
-    # Register blueprints
+    with app.app_context():
+        # Apply the connection pragmas of each engine's profile; engines
+        # only connect on first use
+        for engine in db.engines.values():
+            configure_engine(engine)
+
+def register_blueprints(app):
     from blueprints.main import main_bp
     from blueprints.upload import upload_bp
     from blueprints.consent import consent_bp
+    from blueprints.files import files_bp
+    from blueprints.events import events_bp
+    from blueprints.metrics import metrics_bp
+    from blueprints.stats import stats_bp
+    from blueprints.export import export_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(upload_bp, url_prefix='/api')
     app.register_blueprint(consent_bp, url_prefix='/api')
+    app.register_blueprint(files_bp, url_prefix='/api')
+    app.register_blueprint(events_bp, url_prefix='/api')
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(stats_bp, url_prefix='/api')
+    app.register_blueprint(export_bp, url_prefix='/api')
+
+def register_services(app):
+    # Set up request metrics, the audit log, the response cache, dashboard
+    # counters and change feed, start delivery workers, the webhook
+    # consumer, the expiry sweeper, the archiver, the upload cleaner and the
+    # PDF analysis pool lazily and register CLI commands
+    from services.metrics_service import metrics
+    from services.audit_service import audit_log
+    from services.cache_service import response_cache
+    from services.stats_service import dashboard_stats
+    from services.delivery_service import delivery_pool
+    from services.event_service import event_broker
+    from services.webhook_service import webhook_consumer
+    from services.expiry_service import expiry_sweeper
+    from services.archive_service import archiver
+    from services.upload_service import upload_cleaner
+    from services.pdf_service import pdf_analysis
+    from cli import register_commands
+    
+    metrics.init_app(app)
+    audit_log.init_app(app)
+    response_cache.init_app(app)
+    dashboard_stats.init_app(app)
+    delivery_pool.init_app(app)
+    event_broker.init_app(app)
+    webhook_consumer.init_app(app)
+    expiry_sweeper.init_app(app)
+    archiver.init_app(app)
+    upload_cleaner.init_app(app)
+    pdf_analysis.init_app(app)
+    register_commands(app)
+
+def create_app(config=None):
+    """Create and configure an app, with config overriding the environment.
+    
+    Nothing here connects to the database or touches the filesystem, so an
+    app can be built per test and a preloaded app forked into workers
+    cheaply. The schema and the storage folders are set up by bootstrap(),
+    run as `flask --app main bootstrap`.
+    """
+    config = config or {}
+    app = Flask(__name__)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+    
+    # Encode JSON responses with orjson when it is installed
+    app.json = FastJSONProvider(app)
+    
+    load_config(app)
+    app.config.update(config)
+    logging_pipeline.init_app(app)
+    configure_database(app, config)
+    
+    # Import the models, and the schema hooks that create the search index
+    # alongside their tables
+    import models
+    import schema
+    
+    register_blueprints(app)
+    register_services(app)
+    return app
+
+def bootstrap(app):
+    """Create the storage folders and tables and apply schema upgrades"""
+    from schema import upgrade_schema
+    
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['SIGNED_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['ARCHIVE_FOLDER'], exist_ok=True)
+    
+    with app.app_context():
+        # Create all tables, with the search index DDL hooked onto them
+        db.create_all()
+        
+        # Add columns and indexes introduced since the tables were created
+        upgrade_schema(db.engine)
+
+app = create_app()
@@ -0,0 +1,282 @@
+"""ASGI entry point: the same app, with client I/O on an event loop.
+
+    uvicorn asgi:app --workers 4
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+
+Under gunicorn's sync and gthread workers (`gunicorn main:app`, still the
+default) a request holds its thread for as long as the client takes to
+send the body and read the response, so slow clients cap concurrency at
+the thread count. Here the server handles the sockets on its event loop,
+and AsgiAdapter buffers each request body without a thread, runs the
+Flask view in a pool of ASGI_THREADS threads, where its database and file
+calls block only that thread, and streams the response back from the
+loop, pulling the next part of a streamed body in the pool only once the
+client has taken the previous one. Event streams wait for changes on the
+loop itself, so open dashboards hold no thread, and the per-process
+EVENT_STREAM_MAX_CLIENTS cap that protects the WSGI threads does not apply;
+bound connections with the server instead (uvicorn --limit-concurrency).
+
+uvicorn is an optional dependency: pip install '.[asgi]'.
+"""
+import os
+import sys
+import asyncio
+import contextvars
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.wsgi import FileWrapper
+from app import app as flask_app
+
+class AsgiAdapter:
+    """Serve a WSGI app over ASGI, offloading only the view to threads.
+
+    Request bodies are spooled in memory up to ASGI_SPOOL_SIZE bytes and to
+    a temporary file beyond that, with the disk writes done in the pool.
+    Response bodies of known length are sent in parts of up to
+    ASGI_RESPONSE_BUFFER bytes, and one that fits in one part takes a
+    single trip to the pool; streamed bodies are forwarded chunk by chunk.
+    """
+
+    def __init__(self, app):
+        app.config.setdefault('ASGI_THREADS', 32)
+        app.config.setdefault('ASGI_SPOOL_SIZE', 1024 * 1024)
+        app.config.setdefault('ASGI_RESPONSE_BUFFER', 256 * 1024)
+        app.extensions['asgi_adapter'] = self
+        self.flask_app = app
+        self.executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        # One pool per process, so an adapter preloaded before a fork
+        # never shares its threads
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self.executor = ThreadPoolExecutor(self.flask_app.config['ASGI_THREADS'],
+                                                       thread_name_prefix='asgi')
+                    self._pid = os.getpid()
+        return self.executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise RuntimeError(f"Unsupported ASGI scope type: {scope['type']}")
+
+        loop = asyncio.get_running_loop()
+        executor = self._executor()
+        body = await self._read_body(scope, receive, loop, executor)
+        if body is None:
+            return
+
+        # Every step of the request runs in one context, whichever pool
+        # thread takes it, so contexts pushed by the view (a streamed
+        # body's stream_with_context) are still there when it resumes
+        context = contextvars.copy_context()
+        try:
+            environ = self._environ(scope, *body)
+            status, headers, iterable, iterator, data, done = \
+                await loop.run_in_executor(executor, context.run, self._start, environ)
+            await send({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            })
+            if iterator is None:
+                await self._send_async(iterable, receive, send, loop, executor, context)
+                return
+            coalesce = any(name.lower() == 'content-length' for name, _ in headers)
+            try:
+                while True:
+                    if data or done:
+                        await send({'type': 'http.response.body', 'body': data, 'more_body': not done})
+                    if done:
+                        break
+                    data, done = await loop.run_in_executor(executor, context.run, self._pull, iterator, coalesce)
+            finally:
+                if not done and hasattr(iterable, 'close'):
+                    await loop.run_in_executor(executor, context.run, iterable.close)
+        finally:
+            body[0].close()
+
+    async def _send_async(self, iterable, receive, send, loop, executor, context):
+        """Send a body that can be iterated asynchronously from the loop.
+
+        A client waiting on such a body (an event stream) holds no thread.
+        The server only reports a disconnect through receive(), which is
+        checked between chunks.
+        """
+        disconnected = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        iterator = aiter(iterable)
+        try:
+            async for chunk in iterator:
+                if disconnected.done():
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            else:
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            disconnected.cancel()
+            if hasattr(iterator, 'aclose'):
+                await iterator.aclose()
+            if hasattr(iterable, 'close'):
+                await loop.run_in_executor(executor, context.run, iterable.close)
+
+    async def _wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.executor is not None and self._pid == os.getpid():
+                    self.executor.shutdown(wait=False)
+                    self._pid = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, scope, receive, loop, executor):
+        """Receive the whole request body into a spooled file.
+
+        Returns the file and its size, or None when the client disconnected.
+        A body over MAX_CONTENT_LENGTH is not read further; the declared or
+        received size is passed on so the app answers 413.
+        """
+        limit = self.flask_app.config.get('MAX_CONTENT_LENGTH')
+        spool_size = self.flask_app.config['ASGI_SPOOL_SIZE']
+        body = tempfile.SpooledTemporaryFile(spool_size)
+        declared = dict(scope['headers']).get(b'content-length')
+        if limit is not None and declared is not None and declared.isdigit() and int(declared) > limit:
+            return body, int(declared)
+
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            chunk = message.get('body', b'')
+            if chunk:
+                # Writes that roll the spool over to disk, and every one
+                # after that, go to the pool
+                if size + len(chunk) > spool_size:
+                    await loop.run_in_executor(executor, body.write, chunk)
+                else:
+                    body.write(chunk)
+                size += len(chunk)
+                if limit is not None and size > limit:
+                    break
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body, size
+
+    def _environ(self, scope, body, size):
+        """Build the WSGI environ of a request"""
+        root_path = scope.get('root_path', '')
+        path = scope['path']
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+            'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'CONTENT_LENGTH': str(size),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': self._file_wrapper,
+            # Tells views their body may be iterated on the event loop
+            'asgi.scope': scope,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+            environ['REMOTE_PORT'] = str(scope['client'][1])
+
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            if name == 'CONTENT_LENGTH':
+                # The received size is what the app gets to read
+                continue
+            key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+            value = value.decode('latin-1')
+            if key in environ:
+                value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+            environ[key] = value
+        return environ
+
+    def _file_wrapper(self, file, buffer_size=8192):
+        # Read files in parts as large as the response buffer
+        return FileWrapper(file, max(buffer_size, self.flask_app.config['ASGI_RESPONSE_BUFFER']))
+
+    def _start(self, environ):
+        """Call the app; runs in the pool.
+
+        A body of known length is read up to the first part here, so a
+        small response takes a single trip to the pool. A streamed body is
+        left for the caller to forward chunk by chunk once the headers are
+        out, and one with __aiter__ is left to the loop (iterator is None).
+        """
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response[:] = [status, headers]
+
+        iterable = self.flask_app(environ, start_response)
+        status, headers = response
+        if hasattr(iterable, '__aiter__'):
+            return status, headers, iterable, None, b'', False
+        iterator = iter(iterable)
+        if not any(name.lower() == 'content-length' for name, _ in headers):
+            return status, headers, iterable, iterator, b'', False
+        try:
+            data, done = self._pull(iterator, True)
+        except BaseException:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+            raise
+        if done and hasattr(iterable, 'close'):
+            iterable.close()
+        return status, headers, iterable, iterator, data, done
+
+    def _pull(self, iterator, coalesce):
+        """Read the next part of a response body; runs in the pool.
+
+        Returns the bytes and whether the body is finished. With coalesce,
+        chunks are joined up to ASGI_RESPONSE_BUFFER bytes; without it the
+        next chunk is returned as soon as the app yields it, since the app
+        may block before the one after (an event stream between events).
+        """
+        limit = self.flask_app.config['ASGI_RESPONSE_BUFFER']
+        chunks = []
+        size = 0
+        for chunk in iterator:
+            if chunk:
+                if not coalesce:
+                    return chunk, False
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= limit:
+                    return b''.join(chunks), False
+        return b''.join(chunks), True
+
+app = AsgiAdapter(flask_app)
@@ -0,0 +1,187 @@
+"""Measure what archiving old signed consents does to the live tier.
+
+Seeds --consents signed consents spread evenly over the last --years years,
+each with an email and an SMS transmission and three audit events; the
+oldest --documents of them get their own --doc-kb KB signed PDF (text,
+which compresses, and image-like random bytes, which do not). Reports the
+hot table sizes, the latency of the list, search, stats, history and
+document endpoints and the bytes on disk, then archives everything signed
+more than --after-days days ago and reports them again (after VACUUM),
+along with the archive size and cold-read latencies.
+
+    python benchmarks/bench_archive.py --consents 300000 --documents 20000 --after-days 365
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import load_app, timed
+
+def disk_bytes(folder):
+    """Bytes allocated to the files under folder"""
+    total = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            total += os.stat(os.path.join(root, name)).st_blocks * 512
+    return total
+
+def table_sizes(db):
+    """Bytes used by each live table, its indexes included, from dbstat"""
+    from sqlalchemy import text
+    rows = db.session.execute(text(
+        "SELECT coalesce(m.tbl_name, s.name), sum(s.pgsize) FROM dbstat s "
+        "LEFT JOIN sqlite_master m ON m.name = s.name GROUP BY 1"
+    )).all()
+    sizes = {}
+    for name, size in rows:
+        # Fold the FTS5 shadow tables into the search index
+        name = 'consent_search' if name.startswith('consent_search') else name
+        sizes[name] = sizes.get(name, 0) + size
+    return sizes
+
+def fake_pdf(index, size):
+    """A PDF-shaped document: half repetitive text, half incompressible"""
+    text = (f'BT /F1 11 Tf 72 700 Td (Consent {index}: I agree to the procedure described above.) Tj ET\n'
+            * (size // 160)).encode()
+    return b'%PDF-1.7\n' + text + os.urandom(size - len(text)) + b'\n%%EOF\n'
+
+def seed(db, count, years, documents, doc_kb, signed_folder, chunk_size=20000):
+    from sqlalchemy import insert, select
+    from models import Consent, ConsentEvent, ConsentStatus, DeliveryMethod, Transmission, TransmissionStatus
+
+    now = datetime.utcnow()
+    step = timedelta(days=365 * years) / count
+    start = now - step * count
+    for offset in range(0, count, chunk_size):
+        rows = []
+        for i in range(offset, min(offset + chunk_size, count)):
+            signed_at = start + step * i
+            signed_file_path = None
+            if i < documents:
+                signed_file_path = os.path.join(signed_folder, f'signed_{i}.pdf')
+                with open(signed_file_path, 'wb') as f:
+                    f.write(fake_pdf(i, doc_kb * 1024))
+            rows.append({
+                'patient_name': f'Patient {i}',
+                'patient_email': f'patient{i}@example.com',
+                'patient_phone': f'+1555{i:07d}',
+                'form_name': f'form_{i % 20}.pdf',
+                'file_path': f'uploads/form_{i % 20}.pdf',
+                'signed_file_path': signed_file_path,
+                'status': ConsentStatus.SIGNED,
+                'created_at': signed_at - timedelta(days=1),
+                'sent_at': signed_at - timedelta(days=1),
+                'signed_at': signed_at,
+            })
+        ids = db.session.scalars(insert(Consent).returning(Consent.id, sort_by_parameter_order=True), rows).all()
+
+        transmissions, events = [], []
+        for consent_id, row in zip(ids, rows):
+            for method, recipient in ((DeliveryMethod.EMAIL, row['patient_email']),
+                                      (DeliveryMethod.SMS, row['patient_phone'])):
+                transmissions.append({
+                    'consent_id': consent_id, 'method': method, 'recipient': recipient,
+                    'status': TransmissionStatus.DELIVERED, 'created_at': row['sent_at'],
+                    'sent_at': row['sent_at'], 'delivered_at': row['signed_at'], 'attempts': 1,
+                })
+            for event_type, occurred_at in (('transmission.sent', row['sent_at']),
+                                            ('transmission.delivered', row['signed_at']),
+                                            ('consent.signed', row['signed_at'])):
+                events.append({
+                    'event_type': event_type, 'consent_id': consent_id, 'transmission_id': None,
+                    'consent_status': 'signed' if event_type == 'consent.signed' else 'sent',
+                    'transmission_status': None, 'method': 'email', 'recipient': row['patient_email'],
+                    'attempts': 1, 'detail': None, 'occurred_at': occurred_at,
+                })
+        db.session.execute(insert(Transmission), transmissions)
+        db.session.execute(insert(ConsentEvent), events)
+        db.session.commit()
+    return db.session.scalar(select(Consent.id).order_by(Consent.id).limit(1))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--consents', type=int, default=300000)
+    parser.add_argument('--years', type=float, default=3)
+    parser.add_argument('--documents', type=int, default=20000)
+    parser.add_argument('--doc-kb', type=int, default=64)
+    parser.add_argument('--after-days', type=float, default=365)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    folders = {key: tempfile.mkdtemp(prefix=f'bench_{key.lower()}_')
+               for key in ('SIGNED_FOLDER', 'ARCHIVE_FOLDER')}
+    app.config.update(folders)
+    app.config['CACHE_ENABLED'] = False
+    app.config['ARCHIVE_AFTER_DAYS'] = args.after_days
+    app.config['ARCHIVE_INTERVAL'] = 0
+    client = app.test_client()
+
+    from sqlalchemy import text
+    from services.archive_service import ArchiveService, _read_block
+    from services.stats_service import StatsService
+
+    try:
+        with app.app_context():
+            started = time.perf_counter()
+            oldest_id = seed(db, args.consents, args.years, args.documents, args.doc_kb,
+                             folders['SIGNED_FOLDER'])
+            StatsService.reconcile()
+            print(f"Seeded {args.consents} consents in {time.perf_counter() - started:.1f}s")
+
+        def get(url):
+            def request():
+                response = client.get(url)
+                assert response.status_code == 200, (url, response.status_code)
+            return request
+
+        endpoints = [
+            ('list first page', '/api/consents?limit=50'),
+            ('search', f'/api/consents/search?q=Patient%20{args.consents // 2}'),
+            ('stats', '/api/stats'),
+            ('old history', f'/api/consents/{oldest_id}/history'),
+            ('old signed document', f'/api/consents/{oldest_id}/document?signed=1'),
+        ]
+
+        def report(label):
+            with app.app_context():
+                db.session.execute(text('VACUUM'))
+                sizes = table_sizes(db)
+            hot = ('consents', 'transmissions', 'consent_events', 'consent_search')
+            print(f"\n{label}")
+            for name in hot + ('archived_consents',):
+                print(f"  {name:>20} {sizes.get(name, 0) / 2 ** 20:>9.1f} MB")
+            print(f"  {'hot tables':>20} {sum(sizes.get(name, 0) for name in hot) / 2 ** 20:>9.1f} MB")
+            print(f"  {'database file':>20} {os.path.getsize(app.config['SQLALCHEMY_DATABASE_URI'][10:]) / 2 ** 20:>9.1f} MB")
+            for key, folder in folders.items():
+                print(f"  {key.lower():>20} {disk_bytes(folder) / 2 ** 20:>9.1f} MB on disk")
+            for name, url in endpoints:
+                print(f"  {name:>20} {timed(get(url), args.repeat):>9.2f} ms")
+
+        report('Before archiving')
+
+        with app.app_context():
+            started = time.perf_counter()
+            archived = ArchiveService.sweep()
+            elapsed = time.perf_counter() - started
+        print(f"\nArchived {archived} consents in {elapsed:.1f}s ({archived / elapsed:.0f}/s)")
+
+        report('After archiving')
+
+        def cold(url):
+            request = get(url)
+
+            def run():
+                _read_block.cache_clear()
+                request()
+            return run
+        print(f"  {'old history, cold':>20} {timed(cold(endpoints[3][1]), args.repeat):>9.2f} ms")
+    finally:
+        for folder in folders.values():
+            shutil.rmtree(folder)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Compare thread-per-request and ASGI serving under slow clients.
+
+--clients clients connect at once, each trickling its request body in
+--chunks chunks --delay seconds apart: a third upload a PDF, a third queue
+a consent send and a third post a DocuSeal webhook. Meanwhile a fast client
+reads the consent list or a history every --probe-interval seconds. The
+same app is served first the way the gthread worker does, with the slow
+reads holding one of --threads threads, and then through asgi.AsgiAdapter
+with the same number of view threads. Reports the total time, client
+latencies and the fast reads' latency for each.
+
+    python benchmarks/bench_asgi.py --clients 1000 --threads 32 --chunks 10 --delay 0.1
+"""
+import argparse
+import asyncio
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import load_app, seed_consents
+
+class TrickleInput(io.RawIOBase):
+    """A request body arriving chunk by chunk, delay seconds apart"""
+
+    def __init__(self, chunks, delay):
+        self.chunks = list(chunks)
+        self.delay = delay
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.pending and self.chunks:
+            time.sleep(self.delay)
+            self.pending = self.chunks.pop(0)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+def fake_pdf(label, size):
+    text = f'BT /F1 11 Tf 72 700 Td (Consent form {label}) Tj ET\n'.encode()
+    return b'%PDF-1.4\n' + text * (size // len(text)) + b'\n%%EOF\n'
+
+def requests_for(mode, clients, consent_ids, chunks):
+    """One (method, path, headers, body chunks) per slow client"""
+    boundary = 'bench-boundary'
+    requests = []
+    for i in range(clients):
+        kind = i % 3
+        if kind == 0:
+            body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="form_{i}.pdf"\r\n'
+                    f'Content-Type: application/pdf\r\n\r\n').encode() + fake_pdf(f'{mode} {i}', 32 * 1024) + \
+                f'\r\n--{boundary}--\r\n'.encode()
+            request = ('POST', '/api/upload', {'Content-Type': f'multipart/form-data; boundary={boundary}'}, body)
+        elif kind == 1:
+            body = json.dumps({'delivery_method': 'email', 'recipient': f'patient{i}@example.com'}).encode()
+            request = ('POST', f'/api/consents/{consent_ids[i % len(consent_ids)]}/send',
+                       {'Content-Type': 'application/json'}, body)
+        else:
+            body = json.dumps({'event_type': 'form.viewed', 'timestamp': '2026-01-01T00:00:00Z',
+                               'data': {'id': i}}).encode()
+            request = ('POST', '/api/docuseal-callback',
+                       {'Content-Type': 'application/json', 'X-Webhook-Id': f'{mode}-{i}'}, body)
+        method, path, headers, body = request
+        step = -(-len(body) // chunks)
+        requests.append((method, path, headers, [body[n:n + step] for n in range(0, len(body), step)]))
+    return requests
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.99)] * 1000
+
+def run_threaded(app, requests, probes, args):
+    """Every connection holds a pool thread while its body arrives"""
+    from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+    def handle(connected, method, path, headers, chunks, delay):
+        environ = EnvironBuilder(path=path, method=method, headers=headers,
+                                 data=b''.join(chunks)).get_environ()
+        environ['wsgi.input'] = io.BufferedReader(TrickleInput(chunks, delay))
+        status = run_wsgi_app(app, environ, buffered=True)[1]
+        # Waiting for a free thread counts, as it would in the accept queue
+        return int(status.split(' ', 1)[0]), time.perf_counter() - connected
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        started = time.perf_counter()
+        futures = [pool.submit(handle, started, *request, args.delay) for request in requests]
+        probe_futures = []
+        while not all(future.done() for future in futures):
+            probe_futures.append(pool.submit(handle, time.perf_counter(),
+                                             'GET', probes[len(probe_futures) % 2], {}, [], 0))
+            time.sleep(args.probe_interval)
+        results = [future.result() for future in futures]
+        total = time.perf_counter() - started
+        probe_results = [future.result() for future in probe_futures]
+    return (total, [status for status, _ in results], [elapsed for _, elapsed in results],
+            [elapsed for _, elapsed in probe_results])
+
+async def run_asgi(adapter, requests, probes, args):
+    """The event loop reads the bodies; threads only run the views"""
+
+    async def handle(method, path, headers, chunks, delay):
+        chunks = list(chunks) or [b'']
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+            'scheme': 'http', 'path': path, 'root_path': '', 'query_string': b'',
+            'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+            'client': ('127.0.0.1', 50000), 'server': ('bench', 80),
+        }
+        response = {}
+        started = time.perf_counter()
+
+        async def receive():
+            if not chunks:
+                await asyncio.sleep(3600)
+                return {'type': 'http.disconnect'}
+            if delay:
+                await asyncio.sleep(delay)
+            chunk = chunks.pop(0)
+            return {'type': 'http.request', 'body': chunk, 'more_body': bool(chunks)}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+
+        await adapter(scope, receive, send)
+        return response['status'], time.perf_counter() - started
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(handle(*request, args.delay)) for request in requests]
+    probe_tasks = []
+    while not all(task.done() for task in tasks):
+        probe_tasks.append(asyncio.create_task(handle('GET', probes[len(probe_tasks) % 2], {}, [], 0)))
+        await asyncio.sleep(args.probe_interval)
+    results = await asyncio.gather(*tasks)
+    total = time.perf_counter() - started
+    probe_results = await asyncio.gather(*probe_tasks)
+    return (total, [status for status, _ in results], [elapsed for _, elapsed in results],
+            [elapsed for _, elapsed in probe_results])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--chunks', type=int, default=10)
+    parser.add_argument('--delay', type=float, default=0.1)
+    parser.add_argument('--probe-interval', type=float, default=0.05)
+    parser.add_argument('--consents', type=int, default=10000)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    # Leave the delivery, webhook and other background workers off
+    app.config['TESTING'] = True
+    app.config['ASGI_THREADS'] = args.threads
+    from asgi import AsgiAdapter
+    from models import Consent, ConsentStatus
+
+    with app.app_context():
+        seed_consents(db, args.consents)
+        consent_ids = [consent.id for consent in
+                       Consent.query.filter_by(status=ConsentStatus.DRAFT).limit(args.clients)]
+    probes = ['/api/consents?limit=50', f'/api/consents/{consent_ids[0]}/history']
+    print(f"{args.clients} clients, each sending its body in {args.chunks} chunks "
+          f"{args.delay * 1000:.0f} ms apart; {args.threads} view threads")
+
+    for mode in ('threaded', 'asgi'):
+        requests = requests_for(mode, args.clients, consent_ids, args.chunks)
+        if mode == 'threaded':
+            total, statuses, latencies, probe_latencies = run_threaded(app, requests, probes, args)
+        else:
+            adapter = AsgiAdapter(app)
+            total, statuses, latencies, probe_latencies = asyncio.run(run_asgi(adapter, requests, probes, args))
+            adapter.executor.shutdown()
+        failed = sum(status >= 400 for status in statuses)
+        print(f"\n{mode}")
+        print(f"  {'total':>16} {total:>9.2f} s ({len(statuses) / total:.0f} req/s, {failed} failed)")
+        print(f"  {'client p50/p99':>16} {percentiles(latencies)[0]:>9.0f} / {percentiles(latencies)[1]:.0f} ms")
+        print(f"  {'fast read p50/p99':>16} {percentiles(probe_latencies)[0]:>9.1f} / "
+              f"{percentiles(probe_latencies)[1]:.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Measure what the state change log costs a send, and reading it back.
+
+Sends --count consents through ConsentService.send_consent with the log
+buffered (written in batches by the flusher thread), with every commit's
+entries written straight after it (what a synchronous log write costs),
+and with the log hook removed. Then times the consent audit trail read, a
+single range scan of the log's consent index, with --history-events
+entries per consent.
+
+    python benchmarks/bench_audit.py --count 2000 --history-events 50
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from common import load_app, seed_consents, timed
+
+def send_all(app, db, consent_ids):
+    from models import Consent, DeliveryMethod
+    from services.consent_service import ConsentService
+
+    with app.app_context():
+        started = time.perf_counter()
+        for consent_id in consent_ids:
+            consent = db.session.get(Consent, consent_id)
+            ConsentService.send_consent(consent, DeliveryMethod.EMAIL, 'patient@example.com')
+        elapsed = time.perf_counter() - started
+    return len(consent_ids) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--history-events', type=int, default=50)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    app.config['DELIVERY_WORKERS'] = 0
+    from sqlalchemy import event, insert, select
+    from models import Consent, ConsentEvent
+    from services.audit_service import audit_log
+
+    with app.app_context():
+        seed_consents(db, args.count * 3)
+        consent_ids = db.session.scalars(select(Consent.id).order_by(Consent.id)).all()
+    batches = [consent_ids[i * args.count:(i + 1) * args.count] for i in range(3)]
+
+    # Without a flusher thread every commit writes its entries inline
+    app.config['TESTING'] = True
+    synchronous = send_all(app, db, batches[0])
+    app.config['TESTING'] = False
+    buffered = send_all(app, db, batches[1])
+    audit_log.close()
+    event.remove(db.session, 'after_commit', audit_log._after_commit)
+    try:
+        unlogged = send_all(app, db, batches[2])
+    finally:
+        event.listen(db.session, 'after_commit', audit_log._after_commit)
+
+    print(f"{'log writes':>13} {'sends/s':>9}")
+    print(f"{'none':>13} {unlogged:>9.0f}")
+    print(f"{'buffered':>13} {buffered:>9.0f}")
+    print(f"{'at commit':>13} {synchronous:>9.0f}")
+
+    with app.app_context():
+        start = datetime.utcnow()
+        db.session.execute(insert(ConsentEvent), [{
+            'event_type': 'transmission.retrying',
+            'consent_id': consent_id,
+            'transmission_status': 'pending',
+            'occurred_at': start + timedelta(seconds=n),
+            'created_at': start + timedelta(seconds=n),
+        } for consent_id in consent_ids for n in range(args.history_events)])
+        db.session.commit()
+        total = db.session.query(ConsentEvent).count()
+
+    app.config['TESTING'] = True
+    client = app.test_client()
+    median = timed(lambda: client.get(f'/api/consents/{consent_ids[len(consent_ids) // 2]}/audit'), repeat=50)
+    print(f"audit trail read with {total} log rows: {median:.2f} ms median")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Benchmark sending one form to many patients.
+
+Compares the per-row path the dashboard uses (POST /api/consents followed by
+POST /api/consents/<id>/send for every patient, two commits each) with a
+single POST /api/consents/batch-send.
+
+    python benchmarks/bench_batch_send.py --count 10000
+"""
+import argparse
+import time
+
+from common import load_app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    app.config['BATCH_SEND_CHUNK_SIZE'] = args.chunk_size
+    # Measure the enqueue path only; nobody drains the queue here
+    app.config['DELIVERY_WORKERS'] = 0
+    client = app.test_client()
+
+    patients = [{
+        'patient_name': f'Patient {i}',
+        'patient_email': f'patient{i}@example.com',
+    } for i in range(args.count)]
+
+    started = time.perf_counter()
+    for patient in patients:
+        consent = client.post('/api/consents', json={
+            **patient,
+            'form_name': 'campaign.pdf',
+            'file_path': 'uploads/campaign.pdf',
+        }).get_json()
+        client.post(f"/api/consents/{consent['id']}/send", json={
+            'delivery_method': 'email',
+            'recipient': patient['patient_email'],
+        })
+    per_row = time.perf_counter() - started
+
+    started = time.perf_counter()
+    response = client.post('/api/consents/batch-send', json={
+        'form_name': 'campaign.pdf',
+        'file_path': 'uploads/campaign.pdf',
+        'delivery_method': 'email',
+        'patients': patients,
+    })
+    batch = time.perf_counter() - started
+    assert response.get_json()['queued'] == args.count
+
+    print(f"{'path':>10} {'seconds':>8} {'rows/s':>9}")
+    print(f"{'per-row':>10} {per_row:>8.2f} {args.count / per_row:>9.0f}")
+    print(f"{'batch':>10} {batch:>8.2f} {args.count / batch:>9.0f}")
+    print(f"speedup: {per_row / batch:.1f}x")
+
+if __name__ == '__main__':
+    main()
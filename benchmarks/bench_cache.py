@@ -0,0 +1,65 @@
+"""Load test the dashboard list endpoints with and without the response cache.
+
+Replays the dashboard's tab-switch polling (status=sent, status=signed and
+the transmission history) with one write for every --write-every reads, and
+reports throughput with CACHE_ENABLED off and on, plus the cache counters.
+
+    python benchmarks/bench_cache.py --consents 10000 --requests 3000 --write-every 100
+"""
+import argparse
+import time
+
+from common import load_app, seed_consents, seed_transmissions
+
+LIST_URLS = [
+    '/api/consents?status=sent&fields=patient_name,form_name,status,sent_at,signed_at',
+    '/api/consents?status=signed&fields=patient_name,form_name,status,sent_at,signed_at',
+    '/api/transmissions',
+]
+
+def run(client, requests, write_every):
+    started = time.perf_counter()
+    for i in range(requests):
+        if write_every and i % write_every == write_every - 1:
+            client.post('/api/consents', json={
+                'patient_name': f'Walk-in {i}',
+                'form_name': 'intake.pdf',
+                'file_path': 'uploads/intake.pdf',
+            })
+        else:
+            client.get(LIST_URLS[i % len(LIST_URLS)])
+    return requests / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--consents', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--write-every', type=int, default=100)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    app.config['DELIVERY_WORKERS'] = 0
+    from services.cache_service import response_cache
+    client = app.test_client()
+
+    with app.app_context():
+        seed_consents(db, args.consents)
+        seed_transmissions(db)
+        # Give the namespaces a generation, as the first real write would
+        response_cache.bump('consents', 'transmissions')
+        db.session.commit()
+
+    response_cache.enabled = False
+    uncached = run(client, args.requests, args.write_every)
+
+    response_cache.enabled = True
+    cached = run(client, args.requests, args.write_every)
+
+    print(f"{'cache':>8} {'req/s':>9}")
+    print(f"{'off':>8} {uncached:>9.0f}")
+    print(f"{'on':>8} {cached:>9.0f}")
+    print(f"speedup: {cached / uncached:.1f}x")
+    print(f"stats: {response_cache.stats()}")
+
+if __name__ == '__main__':
+    main()
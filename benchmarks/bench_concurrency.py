@@ -0,0 +1,121 @@
+"""Compare SQLite engine profiles under concurrent multi-process load.
+
+Runs --processes worker processes (as gunicorn would) with --threads
+clients each against one shared SQLite file for --duration seconds. Each
+client mixes dashboard list reads with consent creates (--write-ratio),
+first with the old profile (rollback journal, synchronous=FULL) and then
+with the WAL profile. Reports completed operations per second and how many
+failed with "database is locked".
+
+    python benchmarks/bench_concurrency.py --processes 4 --threads 4 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from common import seed_consents
+
+PROFILES = {
+    'journal': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL'},
+    'wal': {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL'},
+}
+
+LIST_URL = '/api/consents?status=sent&fields=patient_name,form_name,status,sent_at,signed_at'
+
+def seed(database_url, count):
+    os.environ['DATABASE_URL'] = database_url
+    from app import app, db, bootstrap
+    bootstrap(app)
+    with app.app_context():
+        seed_consents(db, count)
+
+def worker(database_url, threads, duration, write_ratio, seed_value, results):
+    import threading
+    os.environ['DATABASE_URL'] = database_url
+    from app import app
+    app.config['TESTING'] = True
+    app.config['CACHE_ENABLED'] = False
+    from services.cache_service import response_cache
+    response_cache.enabled = False
+
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client_loop(n):
+        rng = random.Random(seed_value * 100 + n)
+        client = app.test_client()
+        while time.monotonic() < deadline:
+            if rng.random() < write_ratio:
+                kind = 'writes'
+                response = client.post('/api/consents', json={
+                    'patient_name': f'Load Patient {rng.randrange(10 ** 6)}',
+                    'form_name': 'form.pdf',
+                    'file_path': 'uploads/form.pdf',
+                })
+            else:
+                kind = 'reads'
+                response = client.get(LIST_URL)
+            with lock:
+                counts[kind if response.status_code < 400 else 'errors'] += 1
+
+    pool = [threading.Thread(target=client_loop, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put(counts)
+
+def run_profile(name, args):
+    os.environ.update(PROFILES[name])
+    fd, path = tempfile.mkstemp(suffix='.db', prefix='bench_')
+    os.close(fd)
+    database_url = f'sqlite:///{path}'
+    context = multiprocessing.get_context('spawn')
+
+    seeder = context.Process(target=seed, args=(database_url, args.consents))
+    seeder.start()
+    seeder.join()
+
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(database_url, args.threads, args.duration,
+                                             args.write_ratio, n, results))
+        for n in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    totals = {'reads': 0, 'writes': 0, 'errors': 0}
+    for _ in processes:
+        for key, value in results.get().items():
+            totals[key] += value
+    for process in processes:
+        process.join()
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--consents', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{args.processes} processes x {args.threads} threads, {args.write_ratio:.0%} writes, {args.duration}s")
+    print(f"{'profile':>8} {'ops/s':>8} {'reads/s':>8} {'writes/s':>9} {'errors':>7}")
+    for name in PROFILES:
+        totals = run_profile(name, args)
+        ops = (totals['reads'] + totals['writes']) / args.duration
+        print(f"{name:>8} {ops:>8.0f} {totals['reads'] / args.duration:>8.0f} "
+              f"{totals['writes'] / args.duration:>9.0f} {totals['errors']:>7}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Benchmark GET /api/consents as the consents table grows.
+
+Seeds 1k, 10k, 100k and 1M consents (override with --sizes) and times the
+first page, a deep page reached through a cursor, and a projected page of the
+status=sent list. Keyset pagination keeps every one of them flat; the
+unpaginated .all() path the endpoint used to run is timed up to 100k rows for
+comparison.
+
+    python benchmarks/bench_consent_list.py --sizes 1000,10000,100000,1000000
+"""
+import argparse
+
+from common import load_app, seed_consents, timed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    from models import Consent, ConsentStatus
+    from services.pagination import encode_cursor
+    client = app.test_client()
+
+    seeded = 0
+    print(f"{'rows':>9} {'first page':>11} {'deep page':>10} {'projected':>10} {'old .all()':>11}")
+    for size in sorted(int(size) for size in args.sizes.split(',')):
+        with app.app_context():
+            seed_consents(db, size - seeded, first_index=seeded)
+        seeded = size
+
+        first = client.get('/api/consents?status=sent&limit=50').get_json()
+        # Jump roughly halfway into the list by building a cursor from a real row
+        with app.app_context():
+            middle = Consent.query.filter(Consent.status == ConsentStatus.SENT)\
+                                  .order_by(Consent.created_at.desc())\
+                                  .offset(size // 6).first()
+            deep_cursor = encode_cursor(middle.created_at, middle.id)
+        assert first['next_cursor']
+
+        first_ms = timed(lambda: client.get('/api/consents?status=sent&limit=50'), args.repeat)
+        deep_ms = timed(lambda: client.get(f'/api/consents?status=sent&limit=50&cursor={deep_cursor}'), args.repeat)
+        projected_ms = timed(lambda: client.get(
+            '/api/consents?status=sent&limit=50&fields=patient_name,form_name,status,sent_at'), args.repeat)
+
+        old_ms = None
+        if size <= 100000:
+            def old_path():
+                with app.app_context():
+                    consents = Consent.query.filter(Consent.status == ConsentStatus.SENT)\
+                                            .order_by(Consent.created_at.desc()).all()
+                    [consent.to_dict() for consent in consents]
+            old_ms = timed(old_path, max(1, args.repeat // 10))
+
+        old = f"{old_ms:>9.1f}ms" if old_ms is not None else f"{'-':>11}"
+        print(f"{size:>9} {first_ms:>9.2f}ms {deep_ms:>8.2f}ms {projected_ms:>8.2f}ms {old}")
+
+if __name__ == '__main__':
+    main()
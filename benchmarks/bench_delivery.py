@@ -0,0 +1,66 @@
+"""Benchmark delivery throughput at different worker counts.
+
+Queues --count pending transmissions, then drains them with a pool of
+delivery workers talking to the fake gateway with --latency seconds of
+simulated network time per message. Throughput should scale with the
+number of workers until the database becomes the bottleneck.
+
+    python benchmarks/bench_delivery.py --count 500 --latency 0.05 --workers 1,2,4,8,16
+"""
+import argparse
+import time
+
+from common import load_app, seed_consents
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', default='1,2,4,8,16')
+    parser.add_argument('--batch-size', type=int, default=5)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    app.config['DELIVERY_POLL_INTERVAL'] = 0.05
+    app.config['DELIVERY_BATCH_SIZE'] = args.batch_size
+
+    from sqlalchemy import delete, func, insert, select
+    from models import Consent, DeliveryMethod, Transmission, TransmissionStatus
+    from services.delivery_service import DeliveryService, DeliveryWorkerPool, FakeGateway
+
+    for method in DeliveryMethod:
+        DeliveryService.register_adapter(method, FakeGateway(latency=args.latency))
+
+    with app.app_context():
+        seed_consents(db, args.count)
+        consent_ids = db.session.scalars(select(Consent.id)).all()
+
+    print(f"{'workers':>8} {'seconds':>8} {'msgs/s':>8}")
+    for workers in [int(count) for count in args.workers.split(',')]:
+        with app.app_context():
+            db.session.execute(delete(Transmission))
+            db.session.execute(insert(Transmission), [{
+                'consent_id': consent_id,
+                'method': DeliveryMethod.EMAIL,
+                'recipient': 'patient@example.com',
+                'status': TransmissionStatus.PENDING,
+            } for consent_id in consent_ids])
+            db.session.commit()
+
+        pool = DeliveryWorkerPool()
+        started = time.perf_counter()
+        pool.start(app, workers)
+        while True:
+            with app.app_context():
+                remaining = db.session.scalar(select(func.count(Transmission.id))
+                                              .where(Transmission.status == TransmissionStatus.PENDING))
+            if not remaining:
+                break
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        pool.stop()
+
+        print(f"{workers:>8} {elapsed:>8.2f} {args.count / elapsed:>8.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Sweep expired consents out of a large table while writers keep working.
+
+Seeds --consents consents (a third of them sent, about half of those past
+the TTL) with a pending transmission each, then runs the expiry sweep batch
+by batch while a writer thread keeps creating consents. Each batch reads
+its rows first and then writes them in one short transaction; the time from
+its first UPDATE to COMMIT is how long the sweep holds the write lock, and
+the writer's latency shows what that costs concurrent requests. Exits
+non-zero when a batch holds the lock longer than --max-lock-ms.
+
+    python benchmarks/bench_expiry.py --consents 2000000 --batch-size 500
+"""
+import argparse
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from common import load_app, seed_consents
+
+TTL_DAYS = 30
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] if samples else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--consents', type=int, default=2000000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--max-lock-ms', type=float, default=250)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    app.config['CONSENT_TTL_DAYS'] = TTL_DAYS
+    app.config['CONSENT_TTL_BY_FORM'] = {}
+    from sqlalchemy import event, insert, select
+    from models import Consent, ConsentStatus, Transmission, DeliveryMethod, TransmissionStatus
+    from services.expiry_service import ExpiryService
+    from services.stats_service import StatsService
+
+    # The seeded sent_at values span --consents seconds; centre them on the cutoff
+    span = timedelta(seconds=args.consents)
+    start = datetime.utcnow() - timedelta(days=TTL_DAYS) - span / 2
+    started = time.perf_counter()
+    with app.app_context():
+        seed_consents(db, args.consents, start=start)
+        ids = db.session.scalars(select(Consent.id).where(Consent.status == ConsentStatus.SENT)).all()
+        for offset in range(0, len(ids), 50000):
+            db.session.execute(insert(Transmission), [{
+                'consent_id': consent_id,
+                'method': DeliveryMethod.EMAIL,
+                'recipient': f'patient{consent_id}@example.com',
+                'status': TransmissionStatus.PENDING,
+            } for consent_id in ids[offset:offset + 50000]])
+            db.session.commit()
+        StatsService.reconcile()
+
+        if db.engine.dialect.name == 'sqlite':
+            overdue = ExpiryService._overdue(datetime.utcnow())
+            query = select(Consent.id).where(*overdue).order_by(Consent.sent_at).limit(args.batch_size)
+            compiled = query.compile(db.engine, compile_kwargs={'literal_binds': True})
+            for row in db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}'):
+                print(f"plan: {row[-1]}")
+    print(f"seeded {args.consents} consents, {len(ids)} sent, in {time.perf_counter() - started:.0f}s")
+
+    done = threading.Event()
+    write_ms = []
+
+    def writer():
+        with app.app_context():
+            while not done.is_set():
+                began = time.perf_counter()
+                consent = Consent(patient_name='Concurrent Patient', form_name='form.pdf',
+                                  file_path='uploads/form.pdf')
+                db.session.add(consent)
+                db.session.commit()
+                write_ms.append((time.perf_counter() - began) * 1000)
+                time.sleep(0.005)
+            db.session.remove()
+
+    # The write lock is taken by the batch's first UPDATE and held to COMMIT
+    lock_ms = []
+    locked_at = threading.local()
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE consents') and threading.current_thread() is sweeper:
+            locked_at.value = time.perf_counter()
+
+    def on_commit(conn):
+        began = getattr(locked_at, 'value', None)
+        if began is not None and threading.current_thread() is sweeper:
+            lock_ms.append((time.perf_counter() - began) * 1000)
+            locked_at.value = None
+
+    sweeper = threading.current_thread()
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', before_execute)
+        event.listen(db.engine, 'commit', on_commit)
+
+    thread = threading.Thread(target=writer, daemon=True)
+    batch_ms = []
+    expired = 0
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    thread.start()
+    with app.app_context():
+        while True:
+            began = time.perf_counter()
+            count = ExpiryService.expire_batch(args.batch_size, now)
+            batch_ms.append((time.perf_counter() - began) * 1000)
+            expired += count
+            if count < args.batch_size:
+                break
+            time.sleep(app.config['EXPIRY_BATCH_PAUSE'])
+        elapsed = time.perf_counter() - started
+        done.set()
+        thread.join()
+
+        remaining = db.session.scalar(select(db.func.count()).select_from(Consent).where(
+            Consent.status == ConsentStatus.SENT, Consent.sent_at < now - timedelta(days=TTL_DAYS)))
+        failed = db.session.scalar(select(db.func.count()).select_from(Transmission).where(
+            Transmission.status == TransmissionStatus.FAILED))
+
+    print(f"expired {expired} consents and failed {failed} transmissions in {elapsed:.1f}s "
+          f"({expired / elapsed:.0f} consents/s), {remaining} overdue left")
+    print(f"{'':>16} {'count':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, samples in (('sweep batch', batch_ms), ('lock held', lock_ms), ('concurrent write', write_ms)):
+        print(f"{name:>16} {len(samples):>7} {percentile(samples, 0.5):>8.2f} "
+              f"{percentile(samples, 0.99):>8.2f} {max(samples, default=0):>8.2f}")
+
+    if remaining or max(lock_ms) > args.max_lock_ms:
+        print(f"FAIL: overdue consents left or a batch held its locks over {args.max_lock_ms} ms")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
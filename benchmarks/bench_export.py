@@ -0,0 +1,108 @@
+"""Stream large exports and check that memory stays flat.
+
+Seeds --consents signed consents whose signed documents are --doc-mb MB
+PDFs, then streams GET /api/export/consents as CSV, NDJSON and a ZIP of
+the documents for the first --documents consents (a multi-gigabyte archive
+by default). Each export is consumed chunk by chunk and discarded, as a
+client download would be, while the process RSS is sampled. Exits non-zero
+when RSS grows by more than --max-rss-mb during any export.
+
+    python benchmarks/bench_export.py --consents 1000000 --documents 4000 --doc-mb 1
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from common import load_app
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE / 2 ** 20
+
+def seed_signed(db, count, documents, chunk_size=50000):
+    """Bulk insert signed consents pointing at the given document paths"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import insert
+    from models import Consent, ConsentStatus
+
+    start = datetime.utcnow() - timedelta(days=365)
+    for offset in range(0, count, chunk_size):
+        db.session.execute(insert(Consent), [{
+            'patient_name': f'Patient {i}',
+            'patient_email': f'patient{i}@example.com',
+            'form_name': f'form_{i % 20}.pdf',
+            'file_path': documents[i % len(documents)],
+            'signed_file_path': documents[i % len(documents)],
+            'status': ConsentStatus.SIGNED,
+            'created_at': start + timedelta(seconds=i),
+            'sent_at': start + timedelta(seconds=i),
+            'signed_at': start + timedelta(seconds=i, minutes=5),
+        } for i in range(offset, min(offset + chunk_size, count))])
+        db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--consents', type=int, default=1000000)
+    parser.add_argument('--documents', type=int, default=4000)
+    parser.add_argument('--doc-mb', type=float, default=1)
+    parser.add_argument('--max-rss-mb', type=float, default=64)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    signed_folder = tempfile.mkdtemp(prefix='bench_signed_')
+    app.config['SIGNED_FOLDER'] = signed_folder
+
+    try:
+        documents = []
+        for n in range(8):
+            path = os.path.join(signed_folder, f'document_{n}.pdf')
+            with open(path, 'wb') as f:
+                f.write(b'%PDF-1.4\n' + os.urandom(int(args.doc_mb * 2 ** 20)))
+            documents.append(path)
+
+        started = time.perf_counter()
+        with app.app_context():
+            seed_signed(db, args.consents, documents)
+            from models import Consent
+            until = db.session.get(Consent, args.documents).signed_at.isoformat()
+        print(f"seeded {args.consents} signed consents in {time.perf_counter() - started:.0f}s")
+
+        client = app.test_client()
+        exports = {
+            'csv': '/api/export/consents?status=signed',
+            'ndjson': '/api/export/consents?status=signed&format=ndjson',
+            'zip': f'/api/export/consents?status=signed&format=zip&date_field=signed_at&until={until}',
+        }
+
+        failed = False
+        print(f"{'format':>7} {'rows':>9} {'MB':>9} {'seconds':>8} {'MB/s':>7} {'RSS growth MB':>14}")
+        for fmt, url in exports.items():
+            baseline = peak = rss_mb()
+            size = 0
+            started = time.perf_counter()
+            response = client.get(url, buffered=False)
+            for n, chunk in enumerate(response.response):
+                size += len(chunk)
+                if n % 50 == 0:
+                    peak = max(peak, rss_mb())
+            response.close()
+            elapsed = time.perf_counter() - started
+            growth = max(peak, rss_mb()) - baseline
+            rows = args.documents if fmt == 'zip' else args.consents
+            failed = failed or growth > args.max_rss_mb
+            print(f"{fmt:>7} {rows:>9} {size / 2 ** 20:>9.1f} {elapsed:>8.1f} "
+                  f"{size / 2 ** 20 / elapsed:>7.1f} {growth:>14.1f}")
+    finally:
+        shutil.rmtree(signed_folder)
+
+    if failed:
+        print(f"FAIL: RSS grew by more than {args.max_rss_mb} MB during an export")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Measure what request logging costs the request threads.
+
+--threads threads each make --requests requests to a route that logs
+--records INFO records with structured fields, the way a consent send does,
+and the per-request latency is reported with logging disabled, with the
+JSON formatter writing to a file on the request thread (a plain
+StreamHandler) and through the background queue pipeline. --slow-ms adds a
+delay to every write, standing in for a slow disk or a stalled log shipper;
+records the queue had no room for are reported as dropped.
+
+    python benchmarks/bench_logging.py --threads 8 --requests 500 --slow-ms 1
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from common import load_app
+
+class SlowFileHandler(logging.FileHandler):
+    """A file handler whose every write stalls for delay seconds"""
+
+    def __init__(self, path, delay):
+        super().__init__(path)
+        self.delay = delay
+
+    def emit(self, record):
+        if self.delay:
+            time.sleep(self.delay)
+        super().emit(record)
+
+def run_clients(client_factory, threads, requests):
+    """Per-request latencies in ms and the overall requests per second"""
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        client = client_factory()
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.get('/bench/logged')
+            samples.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.status_code
+        with lock:
+            latencies.extend(samples)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return latencies, len(latencies) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--records', type=int, default=3)
+    parser.add_argument('--slow-ms', type=float, default=1)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    from services.logging_service import JsonFormatter, logging_pipeline
+    from services.metrics_service import metrics
+
+    logger = logging.getLogger('bench.logging')
+
+    @app.route('/bench/logged')
+    def logged():
+        for n in range(args.records):
+            logger.info("Consent %s sent via %s as transmission %s", n, 'email', n,
+                        extra={'consent_id': n, 'transmission_id': n})
+        return 'ok'
+
+    root = logging.getLogger()
+    workdir = tempfile.mkdtemp(prefix='bench_logging_')
+
+    def configure(mode, delay):
+        logging.disable(logging.NOTSET)
+        logging_pipeline.stop()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        output = SlowFileHandler(os.path.join(workdir, f'{mode}.log'), delay)
+        if mode == 'disabled':
+            logging.disable(logging.CRITICAL)
+        elif mode == 'synchronous':
+            output.setFormatter(JsonFormatter())
+            root.addHandler(output)
+            root.setLevel(logging.INFO)
+        else:
+            logging_pipeline.configure(dict(app.config, LOG_RATE_LIMIT=0), output=output)
+
+    print(f"{args.threads} threads x {args.requests} requests, {args.records} records each")
+    print(f"{'mode':>24} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'dropped':>8}")
+    for delay in sorted({0, args.slow_ms / 1000}):
+        for mode in ('disabled', 'synchronous', 'queue'):
+            configure(mode, delay)
+            dropped = sum(metrics.log_records_dropped._values.values())
+            latencies, throughput = run_clients(app.test_client, args.threads, args.requests)
+            logging_pipeline.stop()
+            dropped = sum(metrics.log_records_dropped._values.values()) - dropped
+            name = f'{mode} +{delay * 1000:g}ms' if delay else mode
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[int(len(latencies) * 0.99)]
+            print(f"{name:>24} {throughput:>8.0f} {p50:>8.2f} {p99:>8.2f} {latencies[-1]:>8.2f} {dropped:>8.0f}")
+    logging.disable(logging.NOTSET)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Measure the overhead of request metrics and the sampling profiler.
+
+Replays the same list reads with METRICS_ENABLED off, on, and on with the
+slow-request profiler sampling every request, and reports throughput.
+
+    python benchmarks/bench_metrics.py --consents 10000 --requests 1000 --rounds 3
+"""
+import argparse
+import tempfile
+import time
+
+from common import load_app, seed_consents, seed_transmissions
+
+URLS = [
+    '/api/consents?status=sent&fields=patient_name,form_name,status,sent_at,signed_at',
+    '/api/transmissions',
+]
+
+def run(client, requests):
+    started = time.perf_counter()
+    for i in range(requests):
+        client.get(URLS[i % len(URLS)])
+    return requests / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--consents', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    app.config['TESTING'] = True
+    app.config['CACHE_ENABLED'] = False
+    app.config['PROFILE_OUTPUT_DIR'] = tempfile.mkdtemp()
+    from services.cache_service import response_cache
+    from services.metrics_service import metrics
+    response_cache.enabled = False
+    client = app.test_client()
+
+    with app.app_context():
+        seed_consents(db, args.consents)
+        seed_transmissions(db)
+
+    # Warm up connections and code paths
+    run(client, 200)
+
+    # Interleave the modes over several rounds and keep each one's best
+    modes = {'off': (False, False), 'on': (True, False), 'profiler': (True, True)}
+    best = dict.fromkeys(modes, 0.0)
+    app.config['PROFILE_THRESHOLD_SECONDS'] = 60
+    for _ in range(args.rounds):
+        for name, (enabled, profile) in modes.items():
+            metrics.set_enabled(enabled)
+            app.config['PROFILE_SLOW_REQUESTS'] = profile
+            best[name] = max(best[name], run(client, args.requests))
+    results = list(best.items())
+
+    baseline = results[0][1]
+    print(f"{'metrics':>9} {'req/s':>9} {'overhead':>9}")
+    for name, rate in results:
+        print(f"{name:>9} {rate:>9.0f} {(baseline / rate - 1) * 100:>8.1f}%")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Measure PDF analysis throughput per worker count and its cost to uploads.
+
+Uploads --files distinct PDFs of --pages pages padded to about --size-kb KB
+each, then:
+
+    throughput   `flask analyze-pdfs` over every blob with 1, 2, ... up to
+                 --max-workers processes (default: the core count)
+    upload       median POST /api/upload latency with the analysis inline,
+                 with the process pool, and for a re-upload of known content
+
+    python benchmarks/bench_pdf_analysis.py --files 200 --pages 50 --size-kb 512
+"""
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from common import load_app, timed
+
+def make_pdf(pages, size, seed):
+    """A well-formed PDF padded with an uncompressed stream to about size bytes"""
+    kids = ' '.join(f'{4 + n} 0 R' for n in range(pages))
+    padding = (f'% {seed}\n'.encode() + os.urandom(max(size, 0))).replace(b'endstream', b'endstreaX')
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        f'<< /Type /Pages /Kids [{kids}] /Count {pages} /MediaBox [0 0 612 792] >>'.encode(),
+        f'<< /Length {len(padding)} >>\nstream\n'.encode() + padding + b'\nendstream',
+    ] + [b'<< /Type /Page /Parent 2 0 R /Contents 3 0 R >>'] * pages
+
+    out = bytearray(b'%PDF-1.7\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return bytes(out)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--size-kb', type=int, default=512)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    upload_folder = tempfile.mkdtemp(prefix='bench_uploads_')
+    app.config['UPLOAD_FOLDER'] = upload_folder
+    app.config['TESTING'] = True
+
+    from concurrent.futures import ProcessPoolExecutor
+    from sqlalchemy import update
+    from models import Blob
+    from services.pdf_service import PdfService, pdf_analysis, pool_context
+
+    client = app.test_client()
+    documents = [make_pdf(args.pages, args.size_kb * 1024, n) for n in range(args.files + args.repeat * 2)]
+
+    def upload(data):
+        response = client.post('/api/upload', data={'file': (io.BytesIO(data), 'form.pdf')},
+                               content_type='multipart/form-data')
+        assert response.status_code == 200, response.get_data()
+        return response.get_json()
+
+    try:
+        # Store the corpus without analyzing it
+        with app.app_context():
+            from services.file_service import FileService
+            from werkzeug.datastructures import FileStorage
+            for data in documents[:args.files]:
+                FileService.save_upload(FileStorage(io.BytesIO(data), 'form.pdf'), 'form.pdf')
+
+        print(f"{args.files} PDFs of {args.pages} pages, {len(documents[0]) / 1024:.0f} KB each")
+        print(f"{'workers':>8} {'seconds':>8} {'PDFs/s':>8} {'speedup':>8}")
+        baseline = None
+        context = pool_context(app.config['PDF_ANALYSIS_START_METHOD'])
+        for workers in range(1, args.max_workers + 1):
+            with app.app_context():
+                db.session.execute(update(Blob).values(analyzed_at=None))
+                db.session.commit()
+                with ProcessPoolExecutor(workers, mp_context=context) as executor:
+                    executor.submit(int).result()  # start the pool before timing
+                    started = time.perf_counter()
+                    analyzed = PdfService.analyze_pending(executor, batch_size=workers * 16)
+                    elapsed = time.perf_counter() - started
+            assert analyzed == args.files, analyzed
+            baseline = baseline or elapsed
+            print(f"{workers:>8} {elapsed:>8.2f} {args.files / elapsed:>8.1f} {baseline / elapsed:>7.1f}x")
+
+        fresh = iter(documents[args.files:])
+        inline = timed(lambda: upload(next(fresh)), args.repeat)
+        pdf_analysis.start(app, workers=args.max_workers)
+        try:
+            pooled = timed(lambda: upload(next(fresh)), args.repeat)
+            assert pdf_analysis.wait(timeout=300)
+        finally:
+            pdf_analysis.stop()
+        cached = timed(lambda: upload(documents[0]), args.repeat)
+        assert upload(documents[0])['analysis']['status'] == 'valid'
+
+        print(f"\n{'upload':>22} {'median ms':>10}")
+        print(f"{'analysis inline':>22} {inline:>10.2f}")
+        print(f"{'analysis in pool':>22} {pooled:>10.2f}")
+        print(f"{'re-upload (cached)':>22} {cached:>10.2f}")
+    finally:
+        shutil.rmtree(upload_folder)
+
+if __name__ == '__main__':
+    main()
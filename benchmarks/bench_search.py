@@ -0,0 +1,109 @@
+"""Time patient search queries against a large consent table.
+
+Seeds --consents consents with varied patient names, emails and phone
+numbers (the shared seed gives every row the same words, which is not what
+a search index sees in practice), indexed by the search triggers as they
+are inserted. Then times GET /api/consents/search for a full name, a name
+prefix, an email, a formatted phone number, a broad term, a second page and
+a misspelled name. The response cache is disabled so every request runs
+the query. Exits non-zero when a median exceeds --max-ms.
+
+    python benchmarks/bench_search.py --consents 1000000 --max-ms 20
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from common import load_app, timed
+
+FIRST_NAMES = [
+    'James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'William',
+    'Elizabeth', 'David', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah',
+    'Charles', 'Karen', 'Daniel', 'Nancy', 'Matthew', 'Lisa', 'Anthony', 'Betty', 'Mark', 'Sandra',
+    'Donald', 'Ashley', 'Steven', 'Emily', 'Andrew', 'Donna', 'Joshua', 'Michelle', 'Kenneth',
+    'Carol', 'Kevin', 'Amanda', 'Brian', 'Melissa', 'George', 'Deborah', 'Timothy', 'Stephanie',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+    'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore',
+    'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark',
+    'Ramirez', 'Lewis', 'Robinson', 'Walker', 'Young', 'Allen', 'King', 'Wright', 'Scott', 'Torres',
+    'Nguyen', 'Hill', 'Flores', 'Green', 'Adams', 'Nelson', 'Baker', 'Hall', 'Rivera', 'Campbell',
+]
+DOMAINS = ['gmail.com', 'yahoo.com', 'outlook.com', 'icloud.com', 'clinicmail.org']
+FORMS = ['intake', 'hipaa_release', 'treatment_consent', 'financial_policy', 'telehealth_consent',
+         'photo_release', 'minor_treatment', 'records_request', 'surgery_consent', 'vaccine_consent']
+
+def seed_patients(db, count, chunk_size=50000):
+    """Bulk insert consents for randomly generated patients"""
+    from sqlalchemy import insert
+    from models import Consent, ConsentStatus
+
+    rng = random.Random(15)
+    start = datetime.utcnow() - timedelta(days=365)
+    for offset in range(0, count, chunk_size):
+        rows = []
+        for i in range(offset, min(offset + chunk_size, count)):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            form = rng.choice(FORMS)
+            rows.append({
+                'patient_name': f'{first} {last}',
+                'patient_email': f'{first.lower()}.{last.lower()}{rng.randrange(1000)}@{rng.choice(DOMAINS)}',
+                'patient_phone': f'+1 ({rng.randrange(200, 1000)}) {rng.randrange(200, 1000)}-{rng.randrange(10000):04d}',
+                'patient_fax': f'{rng.randrange(200, 1000)}-{rng.randrange(200, 1000)}-{rng.randrange(10000):04d}' if i % 4 == 0 else None,
+                'form_name': f'{form}.pdf',
+                'file_path': f'uploads/{form}.pdf',
+                'status': ConsentStatus.SENT,
+                'created_at': start + timedelta(seconds=i),
+                'sent_at': start + timedelta(seconds=i),
+            })
+        db.session.execute(insert(Consent), rows)
+        db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--consents', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--max-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    app.config['CACHE_ENABLED'] = False
+    from services.cache_service import response_cache
+    response_cache.enabled = False
+
+    started = time.perf_counter()
+    with app.app_context():
+        seed_patients(db, args.consents)
+        from models import Consent
+        sample = db.session.get(Consent, args.consents // 2)
+    print(f"seeded and indexed {args.consents} consents in {time.perf_counter() - started:.0f}s")
+
+    client = app.test_client()
+    first_page = client.get('/api/consents/search?q=smith&limit=50').get_json()
+    queries = {
+        'full name': {'q': sample.patient_name},
+        'name prefix': {'q': sample.patient_name[:6]},
+        'email': {'q': sample.patient_email},
+        'phone': {'q': sample.patient_phone},
+        'broad term': {'q': 'gmail'},
+        'next page': {'q': 'smith', 'cursor': first_page['next_cursor']},
+        'misspelled': {'q': 'Rodrigeuz'},
+    }
+
+    failed = False
+    print(f"{'query':>12} {'median ms':>10} {'results':>8} {'fuzzy':>6}")
+    for name, params in queries.items():
+        page = client.get('/api/consents/search', query_string=params).get_json()
+        median = timed(lambda: client.get('/api/consents/search', query_string=params), args.repeat)
+        failed = failed or median > args.max_ms
+        print(f"{name:>12} {median:>10.2f} {len(page['consents']):>8} {str(page['fuzzy']):>6}")
+
+    if failed:
+        print(f"FAIL: a median search time exceeded {args.max_ms} ms")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
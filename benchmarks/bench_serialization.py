@@ -0,0 +1,71 @@
+"""Compare the ORM + to_dict() + stdlib JSON path with column tuples + orjson.
+
+Seeds --rows consents and serializes all of them, the size of the largest
+batch send response, three ways:
+
+    orm + stdlib     Consent objects, to_dict(), Flask's default encoder
+    rows + stdlib    column tuples, dicts, the stdlib fallback encoder
+    rows + orjson    column tuples, dicts, orjson
+
+Each is timed from the query to the encoded bytes.
+
+    python benchmarks/bench_serialization.py --rows 10000
+"""
+import argparse
+
+from common import load_app, seed_consents, timed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    from flask.json.provider import DefaultJSONProvider
+    from models import Consent
+    from services import serialization
+    from services.serialization import dumps, row_dicts
+
+    with app.app_context():
+        seed_consents(db, args.rows)
+
+    stdlib = DefaultJSONProvider(app)
+    fields = Consent.SERIALIZABLE_FIELDS
+    columns = [getattr(Consent, field) for field in fields]
+
+    def orm_stdlib():
+        consents = Consent.query.order_by(Consent.id).all()
+        return stdlib.dumps({'consents': [consent.to_dict() for consent in consents]}).encode()
+
+    def rows_encode():
+        rows = db.session.query(*columns).order_by(Consent.id).all()
+        return dumps({'consents': row_dicts(rows, fields)})
+
+    def rows_fallback():
+        fast = serialization.orjson
+        serialization.orjson = None
+        try:
+            return rows_encode()
+        finally:
+            serialization.orjson = fast
+
+    paths = {
+        'orm + stdlib': orm_stdlib,
+        'rows + stdlib': rows_fallback,
+        'rows + orjson': rows_encode,
+    }
+    with app.app_context():
+        expected = serialization.loads(orm_stdlib())
+        baseline = None
+        print(f"{'path':>14} {'median ms':>10} {'speedup':>8}")
+        for name, path in paths.items():
+            assert serialization.loads(path()) == expected, name
+            median = timed(lambda: (path(), db.session.remove()), args.repeat)
+            baseline = baseline or median
+            print(f"{name:>14} {median:>10.2f} {baseline / median:>7.1f}x")
+        if serialization.orjson is None:
+            print("orjson is not installed: the orjson paths used the stdlib encoder")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Measure import-to-first-request latency and per-worker memory.
+
+startup      Fresh interpreters, timed from start to the first response of
+             GET /api/consents, either importing the app alone (the factory,
+             against a bootstrapped database) or also running bootstrap(),
+             which is what every import used to do.
+memory       --workers processes each serving one request, forked the way
+             gunicorn does it: from a master that preloaded the app
+             (preload_app, engines disposed after the fork) or from a bare
+             master, each worker importing the app itself. Reports the mean
+             RSS, PSS and USS (private memory) per worker, and the time from
+             the fork to the worker's first response.
+
+    python benchmarks/bench_startup.py --repeat 10 --workers 4
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP = """
+import time
+started = time.perf_counter()
+from app import app, bootstrap
+imported = time.perf_counter()
+if {bootstrap}:
+    bootstrap(app)
+response = app.test_client().get('/api/consents')
+assert response.status_code == 200, response.status_code
+print(imported - started, time.perf_counter() - started)
+"""
+
+def memory_kb():
+    """RSS, PSS and USS of this process in KB"""
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values['Rss'], values['Pss'], values['Private_Clean'] + values['Private_Dirty']
+
+def serve_one(app):
+    response = app.test_client().get('/api/consents')
+    assert response.status_code == 200, response.status_code
+
+def fork_workers(count, preload):
+    """Fork workers that serve a request and report their memory and latency"""
+    app = None
+    if preload:
+        from app import app
+    pipes = []
+    for _ in range(count):
+        read_fd, write_fd = os.pipe()
+        forked = time.perf_counter()
+        if os.fork() == 0:
+            os.close(read_fd)
+            if preload:
+                from extensions import db
+                with app.app_context():
+                    for engine in db.engines.values():
+                        engine.dispose(close=False)
+                worker_app = app
+            else:
+                from app import app as worker_app
+            serve_one(worker_app)
+            ready_ms = (time.perf_counter() - forked) * 1000
+            os.write(write_fd, ' '.join(map(str, memory_kb() + (ready_ms,))).encode())
+            os._exit(0)
+        os.close(write_fd)
+        pipes.append(read_fd)
+
+    # Keep every worker alive until all have reported, so pages stay shared
+    samples = []
+    for read_fd in pipes:
+        samples.append([float(value) for value in os.read(read_fd, 100).split()])
+        os.close(read_fd)
+    while True:
+        try:
+            os.wait()
+        except ChildProcessError:
+            break
+    rss, pss, uss, ready_ms = [sum(column) / len(samples) for column in zip(*samples)]
+    return rss / 1024, pss / 1024, uss / 1024, ready_ms
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--mode', choices=['report', 'preload', 'bare'], default='report',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode != 'report':
+        # Child run of the memory measurement, from a fresh interpreter
+        sys.path.insert(0, ROOT)
+        print(' '.join(f'{value:.1f}' for value in fork_workers(args.workers, args.mode == 'preload')))
+        return
+
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{workdir}/startup.db', PYTHONPATH=ROOT)
+
+    def run(*command):
+        return subprocess.run([sys.executable, *command], cwd=workdir, env=env, check=True,
+                              capture_output=True, text=True).stdout
+
+    run('-m', 'flask', '--app', 'main', 'bootstrap')
+
+    print(f"{'startup':>20} {'import ms':>10} {'first response ms':>18}")
+    for name, with_bootstrap in (('factory', False), ('import + bootstrap', True)):
+        samples = sorted(tuple(map(float, run('-c', STARTUP.format(bootstrap=with_bootstrap)).split()))
+                         for _ in range(args.repeat))
+        imported, responded = samples[len(samples) // 2]
+        print(f"{name:>20} {imported * 1000:>10.0f} {responded * 1000:>18.0f}")
+
+    print(f"\n{args.workers} workers {'RSS MB':>12} {'PSS MB':>8} {'USS MB':>8} {'fork to response ms':>20}")
+    for name, mode in (('preload_app', 'preload'), ('import per worker', 'bare')):
+        rss, pss, uss, ready_ms = map(float, run(os.path.abspath(__file__), '--mode', mode,
+                                                 '--workers', str(args.workers)).split())
+        print(f"{name:>20} {rss:>8.1f} {pss:>8.1f} {uss:>8.1f} {ready_ms:>20.0f}")
+
+if __name__ == '__main__':
+    main()
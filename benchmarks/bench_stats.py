@@ -0,0 +1,60 @@
+"""Compare the dashboard counters with counting the consent tables.
+
+Grows the consent and transmission tables through --sizes and at each size
+times GET /api/stats, which reads the pre-aggregated counters, against the
+GROUP BY counts the dashboard tiles would otherwise need. Also times one
+full reconciliation at each size.
+
+    python benchmarks/bench_stats.py --sizes 10000,100000,1000000
+"""
+import argparse
+import time
+
+from common import load_app, seed_consents, timed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    from sqlalchemy import func, insert, select
+    from models import Consent, DeliveryMethod, Transmission, TransmissionStatus
+    from services.stats_service import StatsService
+
+    client = app.test_client()
+
+    def group_by_counts():
+        with app.app_context():
+            db.session.execute(select(Consent.status, func.count()).group_by(Consent.status)).all()
+            db.session.execute(select(Transmission.method, Transmission.status, func.count())
+                               .group_by(Transmission.method, Transmission.status)).all()
+
+    print(f"{'consents':>10} {'/api/stats ms':>14} {'group by ms':>12} {'reconcile s':>12}")
+    seeded = 0
+    methods = list(DeliveryMethod)
+    for size in [int(size) for size in args.sizes.split(',')]:
+        with app.app_context():
+            seed_consents(db, size - seeded, first_index=seeded)
+            ids = db.session.scalars(select(Consent.id).where(Consent.id > seeded)).all()
+            for start in range(0, len(ids), 50000):
+                db.session.execute(insert(Transmission), [{
+                    'consent_id': consent_id,
+                    'method': methods[consent_id % len(methods)],
+                    'recipient': f'patient{consent_id}@example.com',
+                    'status': TransmissionStatus.SENT,
+                } for consent_id in ids[start:start + 50000]])
+                db.session.commit()
+            seeded = size
+
+            started = time.perf_counter()
+            StatsService.reconcile()
+            reconcile = time.perf_counter() - started
+
+        stats = timed(lambda: client.get('/api/stats'), args.repeat)
+        counts = timed(group_by_counts, args.repeat)
+        print(f"{size:>10} {stats:>14.2f} {counts:>12.2f} {reconcile:>12.2f}")
+
+if __name__ == '__main__':
+    main()
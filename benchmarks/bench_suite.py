@@ -0,0 +1,280 @@
+"""Replay a realistic mix of API traffic and report latency percentiles.
+
+Seeds a throwaway database (or BENCH_DATABASE_URL) with synthetic consents
+and transmissions at the chosen scale, then drives the Flask app with a
+seeded random mix of uploads, consent sends, dashboard list and stats
+reads, history reads and signatures. Reports p50/p95/p99 per operation,
+overall throughput and peak RSS, optionally as JSON for run-to-run
+comparison.
+
+The gate options exit non-zero when a run regresses:
+
+    python benchmarks/bench_suite.py --scale 100k --json results.json
+    python benchmarks/bench_suite.py --scale 100k --baseline results.json --max-regression 0.25
+    python benchmarks/bench_suite.py --scale 1k --max-p95 list_sent=20 --max-p95 send=50
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from common import load_app, seed_consents, seed_transmissions
+
+SCALES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+# Relative weight of each operation in the replayed traffic
+MIX = {
+    'list_sent': 30,
+    'list_signed': 15,
+    'list_next_page': 10,
+    'transmissions': 10,
+    'history': 10,
+    'stats': 10,
+    'upload': 8,
+    'send': 12,
+    'sign': 5,
+}
+
+LIST_FIELDS = 'patient_name,form_name,status,sent_at,signed_at'
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of sorted samples"""
+    if not samples:
+        return None
+    index = min(len(samples) - 1, max(0, int(round(fraction * len(samples) + 0.5)) - 1))
+    return samples[index]
+
+class Replay:
+    """Issues the operations of the mix against one test client"""
+
+    def __init__(self, client, rng, seeded_ids, upload_bytes):
+        self.client = client
+        self.rng = rng
+        self.seeded_ids = seeded_ids
+        self.upload_bytes = upload_bytes
+        self.uploaded = []
+        self.sent = []
+        self.next_cursor = None
+
+    def check(self, response, *expected):
+        if response.status_code not in expected:
+            raise RuntimeError(f"{response.request.method} {response.request.path} "
+                               f"returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return response
+
+    def list_sent(self):
+        data = self.check(self.client.get(f'/api/consents?status=sent&fields={LIST_FIELDS}'), 200).get_json()
+        self.next_cursor = data['next_cursor']
+
+    def list_signed(self):
+        self.check(self.client.get(f'/api/consents?status=signed&fields={LIST_FIELDS}'), 200)
+
+    def list_next_page(self):
+        cursor = f'&cursor={self.next_cursor}' if self.next_cursor else ''
+        self.check(self.client.get(f'/api/consents?status=sent&fields={LIST_FIELDS}{cursor}'), 200)
+
+    def transmissions(self):
+        self.check(self.client.get('/api/transmissions'), 200)
+
+    def stats(self):
+        self.check(self.client.get('/api/stats'), 200)
+
+    def history(self):
+        self.check(self.client.get(f'/api/consents/{self.rng.choice(self.seeded_ids)}/history'), 200)
+
+    def upload(self):
+        # Random content so every upload is a new blob
+        content = b'%PDF-1.4\n' + self.rng.randbytes(self.upload_bytes) + b'\n%%EOF'
+        response = self.check(self.client.post('/api/upload',
+                                               data={'file': (io.BytesIO(content), 'consent.pdf')},
+                                               content_type='multipart/form-data'), 200)
+        self.uploaded.append(response.get_json()['file_path'])
+
+    def send(self):
+        if not self.uploaded:
+            self.upload()
+        response = self.check(self.client.post('/api/consents', json={
+            'patient_name': f'Bench Patient {self.rng.randrange(10 ** 6)}',
+            'patient_email': 'bench@example.com',
+            'form_name': 'consent.pdf',
+            'file_path': self.rng.choice(self.uploaded),
+        }), 201)
+        consent_id = response.get_json()['id']
+        self.check(self.client.post(f'/api/consents/{consent_id}/send', json={
+            'delivery_method': 'email',
+            'recipient': 'bench@example.com',
+        }), 202)
+        self.sent.append(consent_id)
+
+    def sign(self):
+        if not self.sent:
+            self.send()
+        consent_id = self.sent.pop(self.rng.randrange(len(self.sent)))
+        self.check(self.client.post(f'/api/simulate-sign/{consent_id}'), 200)
+
+def replay(app, operations, seed, seeded_ids, upload_bytes, latencies, errors):
+    rng = random.Random(seed)
+    names = list(MIX)
+    weights = [MIX[name] for name in names]
+    runner = Replay(app.test_client(), rng, seeded_ids, upload_bytes)
+    for _ in range(operations):
+        name = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            getattr(runner, name)()
+        except Exception as e:
+            errors[name] += 1
+            if errors[name] == 1:
+                print(f"{name} failed: {e}", file=sys.stderr)
+            continue
+        latencies[name].append((time.perf_counter() - started) * 1000)
+
+def summarize(latencies, errors, elapsed):
+    operations = {}
+    for name in MIX:
+        samples = sorted(latencies.get(name, []))
+        operations[name] = {
+            'count': len(samples),
+            'errors': errors.get(name, 0),
+            'p50_ms': percentile(samples, 0.50),
+            'p95_ms': percentile(samples, 0.95),
+            'p99_ms': percentile(samples, 0.99),
+            'mean_ms': sum(samples) / len(samples) if samples else None,
+        }
+    total = sum(len(samples) for samples in latencies.values())
+    return operations, total / elapsed
+
+def gate(result, baseline, max_regression, max_p95):
+    """Return the list of threshold violations for a run"""
+    failures = []
+    for name, limit in max_p95.items():
+        p95 = result['operations'].get(name, {}).get('p95_ms')
+        if p95 is not None and p95 > limit:
+            failures.append(f"{name}: p95 {p95:.1f}ms exceeds {limit:.1f}ms")
+    if baseline:
+        for name, stats in result['operations'].items():
+            before = baseline['operations'].get(name, {}).get('p95_ms')
+            if before and stats['p95_ms'] is not None and stats['p95_ms'] > before * (1 + max_regression):
+                failures.append(f"{name}: p95 {stats['p95_ms']:.1f}ms is more than "
+                                f"{max_regression:.0%} above baseline {before:.1f}ms")
+        before = baseline.get('throughput_rps')
+        if before and result['throughput_rps'] < before / (1 + max_regression):
+            failures.append(f"throughput {result['throughput_rps']:.0f} req/s is more than "
+                            f"{max_regression:.0%} below baseline {before:.0f} req/s")
+    for name, stats in result['operations'].items():
+        if stats['errors']:
+            failures.append(f"{name}: {stats['errors']} errors")
+    return failures
+
+def parse_thresholds(values):
+    thresholds = {}
+    for value in values:
+        name, _, limit = value.partition('=')
+        if name not in MIX or not limit:
+            raise argparse.ArgumentTypeError(f"--max-p95 expects OPERATION=MS with OPERATION in {', '.join(MIX)}")
+        thresholds[name] = float(limit)
+    return thresholds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='1k', type=str.lower,
+                        help='number of seeded consents (one transmission each)')
+    parser.add_argument('--operations', type=int, default=2000, help='operations per thread')
+    parser.add_argument('--threads', type=int, default=1, help='concurrent clients')
+    parser.add_argument('--upload-kb', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', dest='json_path', help='write the results to this file')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='allowed p95 increase and throughput drop against --baseline')
+    parser.add_argument('--max-p95', action='append', default=[], metavar='OPERATION=MS',
+                        help='absolute p95 limit for an operation, may be repeated')
+    args = parser.parse_args()
+    max_p95 = parse_thresholds(args.max_p95)
+
+    app, db = load_app()
+    app.config['TESTING'] = True
+    app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+    app.config['SIGNED_FOLDER'] = tempfile.mkdtemp()
+    from models import Consent
+
+    started = time.perf_counter()
+    with app.app_context():
+        seed_consents(db, SCALES[args.scale])
+        seed_transmissions(db)
+        seeded_ids = [row[0] for row in db.session.query(Consent.id)]
+        dialect = db.engine.dialect.name
+    seed_seconds = time.perf_counter() - started
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    threads = [
+        threading.Thread(target=replay, args=(app, args.operations, args.seed + n, seeded_ids,
+                                              args.upload_kb * 1024, latencies, errors))
+        for n in range(args.threads)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    operations, throughput = summarize(latencies, errors, elapsed)
+    result = {
+        'timestamp': datetime.utcnow().isoformat(),
+        'scale': args.scale,
+        'seeded_consents': SCALES[args.scale],
+        'operations_per_thread': args.operations,
+        'threads': args.threads,
+        'seed': args.seed,
+        'database': dialect,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'seed_seconds': round(seed_seconds, 2),
+        'elapsed_seconds': round(elapsed, 2),
+        'throughput_rps': throughput,
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                       / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+        'operations': operations,
+    }
+
+    print(f"{args.scale} consents, {args.threads} x {args.operations} operations on {dialect}")
+    print(f"{'operation':>15} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, stats in operations.items():
+        if stats['count']:
+            print(f"{name:>15} {stats['count']:>6} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f}")
+    print(f"throughput: {throughput:.0f} req/s, peak RSS: {result['peak_rss_mb']:.0f} MB")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    shutil.rmtree(app.config['UPLOAD_FOLDER'])
+    shutil.rmtree(app.config['SIGNED_FOLDER'])
+
+    failures = gate(result, baseline, args.max_regression, max_p95)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
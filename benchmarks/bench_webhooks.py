@@ -0,0 +1,101 @@
+"""Replay a burst of DocuSeal webhooks through the inbox and its consumer.
+
+Builds --events callbacks for sent consents: a view and a completion per
+consent, plus provider redeliveries (identical bodies, deduped on ingest)
+and repeated completions (collapsed by the consumer), all shuffled so they
+arrive out of order. Reports the ingest rate of the callback endpoint, the
+drain rate of the consumer at --batch-size and checks the end state.
+
+    python benchmarks/bench_webhooks.py --events 50000 --batch-size 500
+"""
+import argparse
+import io
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import load_app, seed_consents
+
+def build_events(consent_ids, count, seed=7):
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    events = []
+    for n, consent_id in enumerate(consent_ids):
+        signed = start + timedelta(minutes=n)
+        completed = {
+            'event_type': 'form.completed',
+            'timestamp': signed.isoformat() + 'Z',
+            'data': {'id': n, 'external_id': str(consent_id), 'status': 'completed'},
+        }
+        events.append({
+            'event_type': 'form.viewed',
+            'timestamp': (signed - timedelta(minutes=3)).isoformat() + 'Z',
+            'data': {'id': n, 'external_id': str(consent_id)},
+        })
+        events.append(completed)
+        if n % 5 == 0:
+            events.append(completed)
+        if n % 5 == 1:
+            events.append({**completed, 'timestamp': (signed + timedelta(seconds=30)).isoformat() + 'Z'})
+    events = events[:count]
+    rng.shuffle(events)
+    return events
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    app, db = load_app()
+    app.config['TESTING'] = True
+    app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+    app.config['SIGNED_FOLDER'] = tempfile.mkdtemp()
+    app.config['WEBHOOK_BATCH_SIZE'] = args.batch_size
+    from sqlalchemy import func, update
+    from models import Consent, ConsentStatus, WebhookEvent
+    from services.webhook_service import WebhookService
+    client = app.test_client()
+
+    # Every consent shares one stored document, as a mass-sent form would
+    response = client.post('/api/upload', data={'file': (io.BytesIO(b'%PDF-1.4\n%%EOF'), 'form.pdf')},
+                           content_type='multipart/form-data')
+    file_path = response.get_json()['file_path']
+    consents = args.events * 5 // 12 + 1
+    with app.app_context():
+        seed_consents(db, consents)
+        db.session.execute(update(Consent).values(status=ConsentStatus.SENT, file_path=file_path))
+        db.session.commit()
+        consent_ids = [row[0] for row in db.session.query(Consent.id).order_by(Consent.id)]
+
+    events = build_events(consent_ids, args.events)
+
+    started = time.perf_counter()
+    duplicates = 0
+    for payload in events:
+        duplicates += client.post('/api/docuseal-callback', json=payload).get_json()['duplicate']
+    ingest = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with app.app_context():
+        while WebhookService.process_batch():
+            pass
+    drain = time.perf_counter() - started
+
+    with app.app_context():
+        outcome = dict(db.session.query(WebhookEvent.status, func.count()).group_by(WebhookEvent.status).all())
+        signed = Consent.query.filter(Consent.status == ConsentStatus.SIGNED).count()
+
+    print(f"events posted:    {len(events)} ({duplicates} redeliveries deduped on ingest)")
+    print(f"ingest:           {len(events) / ingest:>9.0f} events/s")
+    print(f"drain (batch {args.batch_size}): {(len(events) - duplicates) / drain:>9.0f} events/s")
+    print(f"inbox outcome:    {outcome}")
+    print(f"consents signed:  {signed}")
+
+    shutil.rmtree(app.config['UPLOAD_FOLDER'])
+    shutil.rmtree(app.config['SIGNED_FOLDER'])
+
+if __name__ == '__main__':
+    main()
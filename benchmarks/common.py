@@ -0,0 +1,89 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks run against a throwaway database so they never touch the
+development data. Set BENCH_DATABASE_URL to benchmark against Postgres.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def load_app():
+    """Import the app against a fresh benchmark database"""
+    database_url = os.environ.get('BENCH_DATABASE_URL')
+    if not database_url:
+        fd, path = tempfile.mkstemp(suffix='.db', prefix='bench_')
+        os.close(fd)
+        database_url = f'sqlite:///{path}'
+    os.environ['DATABASE_URL'] = database_url
+
+    from app import app, db, bootstrap
+    with app.app_context():
+        db.drop_all()
+    bootstrap(app)
+    return app, db
+
+def seed_consents(db, count, first_index=0, start=None, chunk_size=50000):
+    """Bulk insert synthetic consents spread evenly over sent/signed/draft"""
+    from sqlalchemy import insert
+    from models import Consent, ConsentStatus
+
+    statuses = [ConsentStatus.SENT, ConsentStatus.SIGNED, ConsentStatus.DRAFT]
+    start = start or datetime.utcnow() - timedelta(days=365)
+
+    end = first_index + count
+    for offset in range(first_index, end, chunk_size):
+        rows = []
+        for i in range(offset, min(offset + chunk_size, end)):
+            created_at = start + timedelta(seconds=i)
+            rows.append({
+                'patient_name': f'Patient {i}',
+                'patient_email': f'patient{i}@example.com',
+                'patient_phone': f'+1555{i:07d}',
+                'form_name': f'form_{i % 20}.pdf',
+                'file_path': f'uploads/form_{i % 20}.pdf',
+                'status': statuses[i % len(statuses)],
+                'created_at': created_at,
+                'sent_at': created_at,
+            })
+        db.session.execute(insert(Consent), rows)
+        db.session.commit()
+
+def seed_transmissions(db, per_consent=1, chunk_size=50000):
+    """Bulk insert transmissions for every seeded consent"""
+    from sqlalchemy import insert, select
+    from models import Consent, DeliveryMethod, Transmission, TransmissionStatus
+
+    methods = list(DeliveryMethod)
+    consents = db.session.execute(select(Consent.id, Consent.created_at)).all()
+    rows = []
+    for consent_id, created_at in consents:
+        for n in range(per_consent):
+            rows.append({
+                'consent_id': consent_id,
+                'method': methods[(consent_id + n) % len(methods)],
+                'recipient': f'patient{consent_id}@example.com',
+                'status': TransmissionStatus.SENT,
+                'created_at': created_at + timedelta(seconds=n),
+                'sent_at': created_at + timedelta(seconds=n),
+            })
+        if len(rows) >= chunk_size:
+            db.session.execute(insert(Transmission), rows)
+            db.session.commit()
+            rows = []
+    if rows:
+        db.session.execute(insert(Transmission), rows)
+        db.session.commit()
+
+def timed(func, repeat=20):
+    """Run func repeatedly and return the median wall time in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
@@ -1,13 +1,26 @@
 import logging
 from datetime import datetime
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
+from database import use_replica
 from models import Consent, Transmission, ConsentStatus, DeliveryMethod, TransmissionStatus
+from services.archive_service import ArchiveService
+from services.audit_service import audit_log
 from services.consent_service import ConsentService
-from app import db
+from services.cache_service import response_cache, CONSENTS, TRANSMISSIONS
+from services.event_service import EventService
+from services.pagination import parse_fields, parse_limit
+from services.search_service import SearchService
+from services.serialization import dumps, json_response, row_dicts
+from services.stats_service import StatsService
+from services.webhook_service import WebhookService, webhook_consumer
+from extensions import db
 
 consent_bp = Blueprint('consent', __name__)
 logger = logging.getLogger(__name__)
 
+# Columns of each row of ConsentService.get_transmission_history
+TRANSMISSION_LIST_FIELDS = Transmission.SERIALIZABLE_FIELDS + ('patient_name',)
+
 @consent_bp.route('/consents', methods=['POST'])
 def create_consent():
     """Create a new consent form entry"""
@@ -30,19 +43,23 @@ def create_consent():
         consent.file_path = data['file_path']
         
         db.session.add(consent)
+        db.session.flush()
+        EventService.record('consent.created', consent)
+        StatsService.consent_transition(None, consent.status)
+        response_cache.bump(CONSENTS)
         db.session.commit()
         
-        logger.info(f"Consent created: {consent.id}")
+        logger.info("Consent created: %s", consent.id, extra={'consent_id': consent.id})
         return jsonify(consent.to_dict()), 201
         
     except Exception as e:
-        logger.error(f"Error creating consent: {str(e)}")
+        logger.error("Error creating consent: %s", e)
         db.session.rollback()
         return jsonify({'error': 'Failed to create consent'}), 500
 
 @consent_bp.route('/consents/<int:consent_id>/send', methods=['POST'])
 def send_consent(consent_id):
-    """Send a consent form to patient"""
+    """Queue a consent form for delivery to the patient"""
     try:
         data = request.get_json()
         
@@ -60,43 +77,216 @@ def send_consent(consent_id):
             recipient=data['recipient']
         )
         
-        return jsonify(transmission.to_dict()), 200
+        return jsonify(transmission.to_dict()), 202
         
     except Exception as e:
-        logger.error(f"Error sending consent: {str(e)}")
+        logger.error("Error sending consent: %s", e)
         return jsonify({'error': 'Failed to send consent'}), 500
 
+@consent_bp.route('/consents/batch-send', methods=['POST'])
+def batch_send_consents():
+    """Send one uploaded form to many patients in a single request"""
+    try:
+        data = request.get_json()
+        
+        # Validate required fields
+        required_fields = ['form_name', 'file_path', 'delivery_method', 'patients']
+        for field in required_fields:
+            if not data.get(field):
+                return jsonify({'error': f'{field} is required'}), 400
+        
+        patients = data['patients']
+        if not isinstance(patients, list):
+            return jsonify({'error': 'patients must be a list'}), 400
+        if len(patients) > current_app.config['BATCH_SEND_MAX_PATIENTS']:
+            return jsonify({'error': f"At most {current_app.config['BATCH_SEND_MAX_PATIENTS']} patients per batch"}), 400
+        
+        try:
+            method = DeliveryMethod(data['delivery_method'])
+        except ValueError:
+            return jsonify({'error': 'Invalid delivery_method'}), 400
+        
+        results = ConsentService.batch_send(
+            form_name=data['form_name'],
+            file_path=data['file_path'],
+            method=method,
+            patients=patients
+        )
+        
+        queued = sum(1 for result in results if 'error' not in result)
+        return json_response({'queued': queued, 'failed': len(results) - queued, 'results': results})
+        
+    except Exception as e:
+        logger.error("Error in batch send: %s", e)
+        db.session.rollback()
+        return jsonify({'error': 'Failed to send consents'}), 500
+
 @consent_bp.route('/consents', methods=['GET'])
+@use_replica
 def get_consents():
-    """Get all consents with optional status filter"""
+    """Get a page of consents with optional status filter and field projection"""
     try:
         status_filter = request.args.get('status')
+        status = ConsentStatus(status_filter) if status_filter else None
+        limit = parse_limit(request.args.get('limit'))
+        fields = parse_fields(request.args.get('fields'), Consent.SERIALIZABLE_FIELDS)
+        
+        cursor = request.args.get('cursor')
         
-        query = Consent.query
-        if status_filter:
-            query = query.filter(Consent.status == ConsentStatus(status_filter))
+        def render():
+            consents, next_cursor = ConsentService.list_consents(
+                status=status,
+                limit=limit,
+                cursor=cursor,
+                fields=fields
+            )
+            return dumps({
+                'consents': row_dicts(consents, fields or Consent.SERIALIZABLE_FIELDS),
+                'next_cursor': next_cursor
+            })
         
-        consents = query.order_by(Consent.created_at.desc()).all()
+        cache_key = f"{status_filter}|{limit}|{cursor}|{fields}"
+        body = response_cache.get_or_compute(CONSENTS, cache_key, render)
         
-        return jsonify([consent.to_dict() for consent in consents]), 200
+        return current_app.response_class(body, mimetype='application/json'), 200
+        
+    except ValueError as e:
+        # Unknown status, or an invalid limit, cursor or field list
+        return jsonify({'error': str(e)}), 400
         
     except Exception as e:
-        logger.error(f"Error fetching consents: {str(e)}")
+        logger.error("Error fetching consents: %s", e)
         return jsonify({'error': 'Failed to fetch consents'}), 500
 
+@consent_bp.route('/consents/search', methods=['GET'])
+@use_replica
+def search_consents():
+    """Search consents by patient name, email, phone or fax number and form name"""
+    try:
+        query = request.args.get('q', '')
+        limit = parse_limit(request.args.get('limit'))
+        fields = parse_fields(request.args.get('fields'), Consent.SERIALIZABLE_FIELDS)
+        
+        cursor = request.args.get('cursor')
+        
+        def render():
+            consents, next_cursor, fuzzy = SearchService.search(
+                query=query,
+                limit=limit,
+                cursor=cursor,
+                fields=fields
+            )
+            return dumps({
+                'consents': row_dicts(consents, fields or Consent.SERIALIZABLE_FIELDS),
+                'next_cursor': next_cursor,
+                'fuzzy': fuzzy
+            })
+        
+        cache_key = f"search|{query}|{limit}|{cursor}|{fields}"
+        body = response_cache.get_or_compute(CONSENTS, cache_key, render)
+        
+        return current_app.response_class(body, mimetype='application/json'), 200
+        
+    except ValueError as e:
+        # Too short a query, or an invalid limit, cursor or field list
+        return jsonify({'error': str(e)}), 400
+        
+    except Exception as e:
+        logger.error("Error searching consents: %s", e)
+        return jsonify({'error': 'Failed to search consents'}), 500
+
 @consent_bp.route('/consents/<int:consent_id>/history', methods=['GET'])
+@use_replica
 def get_consent_history(consent_id):
     """Get transmission history for a consent"""
     try:
-        consent = Consent.query.get_or_404(consent_id)
-        transmissions = Transmission.query.filter_by(consent_id=consent_id)\
-                                         .order_by(Transmission.created_at.desc()).all()
+        if db.session.get(Consent, consent_id) is not None:
+            transmissions = Transmission.query.filter_by(consent_id=consent_id)\
+                                             .order_by(Transmission.created_at.desc()).all()
+            return jsonify([transmission.to_dict() for transmission in transmissions]), 200
         
-        return jsonify([transmission.to_dict() for transmission in transmissions]), 200
+        # Only consents no longer in the live tables are looked up in the archive
+        archived = ArchiveService.load(consent_id)
         
     except Exception as e:
-        logger.error(f"Error fetching consent history: {str(e)}")
+        logger.error("Error fetching consent history: %s", e)
         return jsonify({'error': 'Failed to fetch history'}), 500
+    
+    if archived is None:
+        return jsonify({'error': 'Consent not found'}), 404
+    # Archived records keep them oldest first
+    return jsonify(list(reversed(archived[1]['transmissions']))), 200
+
+@consent_bp.route('/consents/<int:consent_id>/audit', methods=['GET'])
+@use_replica
+def get_consent_audit(consent_id):
+    """Get the audit trail of a consent's sends, deliveries and signature, newest first"""
+    try:
+        history = audit_log.history(consent_id)
+        archived = ArchiveService.load(consent_id)
+    except Exception as e:
+        logger.error("Error fetching consent audit trail: %s", e)
+        return jsonify({'error': 'Failed to fetch audit trail'}), 500
+    
+    if archived is not None:
+        # Anything still in the live log was written after archiving
+        history = history + archived[1]['audit']
+        transmissions = archived[1]['transmissions']
+    elif not history:
+        consent = Consent.query.get_or_404(consent_id)
+        transmissions = [transmission.to_dict() for transmission in
+                         Transmission.query.filter_by(consent_id=consent.id)
+                                           .order_by(Transmission.created_at).all()]
+    
+    if not history:
+        # Consents from before the audit log only have their transmission rows
+        history = [{
+            'id': None,
+            'event_type': f"transmission.{transmission['status']}",
+            'consent_id': consent_id,
+            'transmission_id': transmission['id'],
+            'consent_status': None,
+            'transmission_status': transmission['status'],
+            'method': transmission['method'],
+            'recipient': transmission['recipient'],
+            'attempts': transmission['attempts'],
+            'detail': transmission['error_message'],
+            'occurred_at': transmission['created_at'],
+        } for transmission in reversed(transmissions)]
+    
+    return jsonify(history), 200
+
+@consent_bp.route('/transmissions', methods=['GET'])
+@use_replica
+def get_transmissions():
+    """Get a page of transmission attempts across all consents"""
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+        
+        def render():
+            rows, next_cursor = ConsentService.get_transmission_history(limit=limit, cursor=cursor)
+            
+            return dumps({
+                'transmissions': row_dicts(rows, TRANSMISSION_LIST_FIELDS),
+                'next_cursor': next_cursor
+            })
+        
+        body = response_cache.get_or_compute(TRANSMISSIONS, f"{limit}|{cursor}", render)
+        
+        return current_app.response_class(body, mimetype='application/json'), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+        
+    except Exception as e:
+        logger.error("Error fetching transmissions: %s", e)
+        return jsonify({'error': 'Failed to fetch transmissions'}), 500
+
+@consent_bp.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get hit/miss/eviction counters of the list response cache"""
+    return jsonify(response_cache.stats()), 200
 
 @consent_bp.route('/simulate-sign/<int:consent_id>', methods=['POST'])
 def simulate_signature(consent_id):
@@ -113,21 +303,29 @@ def simulate_signature(consent_id):
         }), 200
         
     except Exception as e:
-        logger.error(f"Error simulating signature: {str(e)}")
+        logger.error("Error simulating signature: %s", e)
         return jsonify({'error': 'Failed to complete signature'}), 500
 
 @consent_bp.route('/docuseal-callback', methods=['POST'])
 def docuseal_callback():
-    """Mock DocuSeal webhook callback"""
+    """DocuSeal webhook callback.
+    
+    The event is only stored in the webhook inbox, which is idempotent on
+    the provider event id, so the provider gets its acknowledgement at once
+    and the consumer applies the event in the background.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    
     try:
-        data = request.get_json()
-        logger.info(f"DocuSeal callback received: {data}")
+        stored = WebhookService.ingest(data, request.headers.get('X-Webhook-Id'))
+        if stored:
+            webhook_consumer.notify()
         
-        # In a real implementation, this would process the DocuSeal webhook
-        # For now, just log and return success
-        
-        return jsonify({'status': 'received'}), 200
+        return jsonify({'status': 'accepted', 'duplicate': not stored}), 202
         
     except Exception as e:
-        logger.error(f"Error processing DocuSeal callback: {str(e)}")
+        logger.error("Error storing DocuSeal callback: %s", e)
+        db.session.rollback()
         return jsonify({'error': 'Callback processing failed'}), 500
@@ -0,0 +1,125 @@
+import json
+import time
+import asyncio
+import logging
+from flask import Blueprint, Response, request, jsonify, current_app
+from services.event_service import EventService, event_broker
+from services.pagination import MAX_PAGE_SIZE, parse_limit
+
+events_bp = Blueprint('events', __name__)
+logger = logging.getLogger(__name__)
+
+def format_sse(event):
+    """Format a change event as a server-sent event frame"""
+    return f"id: {event['id']}\nevent: {event['event_type']}\ndata: {json.dumps(event)}\n\n"
+
+class EventStream:
+    """Body of an event stream response, iterable both ways.
+    
+    WSGI servers iterate it on their request thread, which blocks between
+    events; the ASGI adapter (asgi.py) iterates it asynchronously, so a
+    client waiting there holds no thread.
+    """
+    
+    def __init__(self, app, cursor, holds_slot=False):
+        self.app = app
+        self.cursor = cursor
+        self.holds_slot = holds_slot
+        self.heartbeat = app.config['EVENT_HEARTBEAT_SECONDS']
+        self.deadline = time.monotonic() + app.config['EVENT_STREAM_MAX_SECONDS']
+    
+    def _timeout(self):
+        return min(self.heartbeat, max(self.deadline - time.monotonic(), 0))
+    
+    def _backfill(self):
+        # Too far behind the in-memory buffer: catch up from the table
+        with self.app.app_context():
+            return EventService.events_after(self.cursor)
+    
+    def _frames(self, events):
+        if not events:
+            return b": keep-alive\n\n"
+        self.cursor = events[-1]['id']
+        return ''.join(format_sse(event) for event in events).encode()
+    
+    def close(self):
+        # Called by the server once the response is done, however it ended
+        if self.holds_slot:
+            self.holds_slot = False
+            event_broker.close_stream()
+    
+    def __iter__(self):
+        try:
+            yield b"retry: 3000\n\n"
+            while time.monotonic() < self.deadline:
+                events = event_broker.wait_for(self.cursor, self._timeout())
+                yield self._frames(self._backfill() if events is None else events)
+        finally:
+            self.close()
+    
+    async def __aiter__(self):
+        yield b"retry: 3000\n\n"
+        while time.monotonic() < self.deadline:
+            events = await event_broker.wait_for_async(self.cursor, self._timeout())
+            if events is None:
+                events = await asyncio.to_thread(self._backfill)
+            yield self._frames(events)
+
+@events_bp.route('/events', methods=['GET'])
+def get_events():
+    """Get change events newer than ?after=, oldest first (polling fallback)"""
+    try:
+        after = int(request.args.get('after', 0))
+    except ValueError:
+        return jsonify({'error': 'after must be an integer'}), 400
+    try:
+        limit = parse_limit(request.args.get('limit'), default=MAX_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    events = EventService.events_after(after, limit)
+    return jsonify({
+        'events': events,
+        'last_event_id': events[-1]['id'] if events else after
+    }), 200
+
+@events_bp.route('/events/stream', methods=['GET'])
+def stream_events():
+    """Stream consent and transmission changes as server-sent events.
+
+    Reconnecting clients send Last-Event-ID (or ?last_event_id=) and get
+    every event they missed before the live feed. The stream ends after
+    EVENT_STREAM_MAX_SECONDS and the browser reconnects where it left off.
+    
+    Under a WSGI server each open stream holds a request thread, so a
+    process serves at most EVENT_STREAM_MAX_CLIENTS of them and answers 503
+    beyond that (the dashboard then polls /events). The cap is WSGI-only:
+    served over ASGI (asgi:app) streams wait on the event loop, hold no
+    thread and are not capped, so limit connections at the server there.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+
+    holds_slot = 'asgi.scope' not in request.environ
+    if holds_slot and not event_broker.open_stream():
+        response = jsonify({'error': 'Too many open event streams'})
+        response.headers['Retry-After'] = str(current_app.config['EVENT_STREAM_MAX_SECONDS'])
+        return response, 503
+    
+    try:
+        event_broker.start()
+    except Exception:
+        if holds_slot:
+            event_broker.close_stream()
+        raise
+    cursor = event_broker.last_id if last_event_id is None else last_event_id
+    
+    # Passed through as is, so the ASGI adapter can iterate it asynchronously
+    stream = EventStream(current_app._get_current_object(), cursor, holds_slot)
+    response = Response(stream, mimetype='text/event-stream', direct_passthrough=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
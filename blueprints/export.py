@@ -0,0 +1,46 @@
+import logging
+from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
+from services.export_service import ExportService, InvalidExportRequest, MIMETYPES
+
+export_bp = Blueprint('export', __name__)
+logger = logging.getLogger(__name__)
+
+def _streamed(chunks, fmt, name):
+    """Stream export chunks as a download, within the request's app context"""
+    filename = f"{name}-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    response = current_app.response_class(stream_with_context(chunks), mimetype=MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@export_bp.route('/export/consents', methods=['GET'])
+def export_consents():
+    """Stream consents as CSV or NDJSON, or their signed documents as a ZIP.
+
+    Filters: ?status=, ?since= and ?until= (ISO dates, until inclusive) on
+    ?date_field= (created_at, sent_at or signed_at).
+    """
+    fmt = request.args.get('format', 'csv')
+    try:
+        chunks = ExportService.export_consents(fmt, **ExportService.parse_consent_filters(request.args))
+    except InvalidExportRequest as e:
+        return jsonify({'error': str(e)}), 400
+
+    logger.info("Exporting consents as %s: %s", fmt, request.query_string.decode())
+    return _streamed(chunks, fmt, 'consents')
+
+@export_bp.route('/export/transmissions', methods=['GET'])
+def export_transmissions():
+    """Stream transmissions with their patient as CSV or NDJSON.
+
+    Filters: ?status=, ?method=, ?since= and ?until= on created_at.
+    """
+    fmt = request.args.get('format', 'csv')
+    try:
+        chunks = ExportService.export_transmissions(fmt, **ExportService.parse_transmission_filters(request.args))
+    except InvalidExportRequest as e:
+        return jsonify({'error': str(e)}), 400
+
+    logger.info("Exporting transmissions as %s: %s", fmt, request.query_string.decode())
+    return _streamed(chunks, fmt, 'transmissions')
@@ -0,0 +1,117 @@
+import os
+import logging
+from flask import Blueprint, Response, abort, request, jsonify, current_app, send_file
+from models import Consent
+from services.archive_service import ArchiveService
+from services.blob_store import BlobStore
+from services.file_service import FileService
+from services.metrics_service import metrics
+
+files_bp = Blueprint('files', __name__)
+logger = logging.getLogger(__name__)
+
+# Blob store files never change, so clients may cache them indefinitely
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def serve_stored_file(file_path, download_name=None, as_attachment=False):
+    """Serve a stored PDF with a strong ETag, conditional GET and Range support.
+
+    Werkzeug answers If-None-Match/If-Modified-Since with 304 and Range with
+    206, and hands the file to the server's wsgi.file_wrapper (sendfile under
+    gunicorn). With USE_X_SENDFILE or FILE_ACCEL_REDIRECT_PREFIX configured
+    the body is left to the front-end web server entirely. Signed documents
+    that were archived are served from their pack instead.
+    """
+    absolute_path = FileService.resolve_stored_path(file_path)
+    if absolute_path is None:
+        entry = ArchiveService.find_document(file_path)
+        if entry is None or entry.document_pack is None:
+            return jsonify({'error': 'File not found'}), 404
+        return serve_archived_document(entry, download_name or os.path.basename(file_path), as_attachment)
+
+    etag = FileService.content_etag(absolute_path)
+    immutable = BlobStore.digest_from_path(absolute_path) is not None
+    download_name = download_name or os.path.basename(absolute_path)
+
+    accel_prefix = current_app.config.get('FILE_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        # nginx serves the body (including ranges) from its internal location
+        relative = os.path.relpath(absolute_path, os.path.realpath(current_app.root_path))
+        response = Response(mimetype='application/pdf')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + relative.replace(os.sep, '/')
+        response.headers['Content-Disposition'] = \
+            f"{'attachment' if as_attachment else 'inline'}; filename=\"{download_name}\""
+        response.set_etag(etag)
+        response.last_modified = os.path.getmtime(absolute_path)
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE if immutable else 0
+        return response.make_conditional(request)
+
+    response = send_file(
+        absolute_path,
+        mimetype='application/pdf',
+        as_attachment=as_attachment,
+        download_name=download_name,
+        conditional=True,
+        etag=etag,
+        max_age=IMMUTABLE_MAX_AGE if immutable else 0
+    )
+    if immutable:
+        response.cache_control.immutable = True
+    if response.status_code in (200, 206):
+        metrics.record_file_bytes('read', response.content_length)
+    return response
+
+def serve_archived_document(entry, download_name, as_attachment=False):
+    """Serve a signed document out of its archive pack.
+
+    The document is streamed from its window of the pack (decompressed on
+    the way when stored compressed), and Werkzeug answers conditional and
+    Range requests as it does for live files, so the body is never left to
+    the front-end web server.
+    """
+    response = send_file(
+        ArchiveService.open_document(entry),
+        mimetype='application/pdf',
+        as_attachment=as_attachment,
+        download_name=download_name,
+        conditional=False,
+        etag=entry.document_sha256,
+        last_modified=entry.archived_at,
+        max_age=IMMUTABLE_MAX_AGE
+    )
+    # The length is only known from the index, so it is passed on here
+    response.content_length = entry.document_size
+    response = response.make_conditional(request.environ, accept_ranges=True,
+                                         complete_length=entry.document_size)
+    response.cache_control.immutable = True
+    return response
+
+@files_bp.route('/files/<path:file_path>', methods=['GET'])
+def get_file(file_path):
+    """Serve an uploaded or signed document by its stored path"""
+    return serve_stored_file(file_path, as_attachment=request.args.get('download') == '1')
+
+@files_bp.route('/consents/<int:consent_id>/document', methods=['GET'])
+def get_consent_document(consent_id):
+    """Serve the form sent with a consent, or its signed copy with ?signed=1"""
+    consent = Consent.query.get(consent_id)
+    if consent is not None:
+        consent = consent.to_dict(('file_path', 'signed_file_path', 'form_name'))
+    else:
+        archived = ArchiveService.load(consent_id)
+        if archived is None:
+            abort(404)
+        consent = archived[1]['consent']
+
+    if request.args.get('signed') == '1':
+        if not consent['signed_file_path']:
+            return jsonify({'error': 'Consent has not been signed'}), 404
+        file_path = consent['signed_file_path']
+        base_name, ext = os.path.splitext(consent['form_name'])
+        download_name = f"{base_name}_signed{ext or '.pdf'}"
+    else:
+        file_path = consent['file_path']
+        download_name = consent['form_name']
+
+    return serve_stored_file(file_path, download_name, as_attachment=request.args.get('download') == '1')
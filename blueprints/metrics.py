@@ -0,0 +1,9 @@
+from flask import Blueprint, Response
+from services.metrics_service import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint for the request metrics of this process"""
+    return Response(metrics.expose(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,29 @@
+import logging
+from flask import Blueprint, request, jsonify
+from database import use_replica
+from services.stats_service import StatsService
+
+stats_bp = Blueprint('stats', __name__)
+logger = logging.getLogger(__name__)
+
+MAX_STATS_DAYS = 366
+
+@stats_bp.route('/stats', methods=['GET'])
+@use_replica
+def get_stats():
+    """Get the dashboard tiles: consents per status and delivery outcomes per method.
+
+    ?days=N adds per-day counts for the last N days.
+    """
+    try:
+        days = int(request.args.get('days', 0))
+    except ValueError:
+        return jsonify({'error': 'days must be an integer'}), 400
+    if not 0 <= days <= MAX_STATS_DAYS:
+        return jsonify({'error': f'days must be between 0 and {MAX_STATS_DAYS}'}), 400
+
+    try:
+        return jsonify(StatsService.dashboard(days)), 200
+    except Exception as e:
+        logger.error("Error fetching stats: %s", e)
+        return jsonify({'error': 'Failed to fetch stats'}), 500
@@ -1,8 +1,12 @@
 import os
 import logging
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, send_file
 from werkzeug.utils import secure_filename
+from services.blob_store import BlobStore, THUMBNAIL_EXT
 from services.file_service import FileService
+from services.pdf_service import pdf_analysis
+from services.upload_service import ChunkedUploadService, UploadOffsetMismatch
+from models import Blob, UploadSession
 
 upload_bp = Blueprint('upload', __name__)
 logger = logging.getLogger(__name__)
@@ -14,6 +18,22 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def analysis_fields(file_path):
+    """Queue PDF analysis of a stored upload and describe its current state.
+    
+    The content is validated off the request, so a first upload normally
+    reports a pending analysis while a re-upload of known content reports
+    the stored results straight away.
+    """
+    try:
+        blob = pdf_analysis.submit(file_path)
+    except Exception as e:
+        logger.error("Error queueing PDF analysis: %s", e)
+        blob = None
+    if blob is None:
+        return {}
+    return {'sha256': blob.sha256, 'analysis': blob.analysis_dict()}
+
 @upload_bp.route('/upload', methods=['POST'])
 def upload_file():
     """Handle PDF file upload"""
@@ -32,14 +52,119 @@ def upload_file():
         filename = secure_filename(file.filename or '')
         file_path = FileService.save_upload(file, filename)
         
-        logger.info(f"File uploaded successfully: {file_path}")
+        logger.info("File uploaded successfully: %s", file_path)
         
         return jsonify({
             'message': 'File uploaded successfully',
             'filename': filename,
-            'file_path': file_path
+            'file_path': file_path,
+            **analysis_fields(file_path)
         }), 200
         
     except Exception as e:
-        logger.error(f"Upload error: {str(e)}")
+        logger.error("Upload error: %s", e)
         return jsonify({'error': 'Upload failed'}), 500
+
+@upload_bp.route('/uploads', methods=['POST'])
+def create_upload():
+    """Start a resumable chunked upload"""
+    try:
+        data = request.get_json()
+        
+        # Validate required fields
+        if not data.get('filename') or not data.get('size'):
+            return jsonify({'error': 'filename and size are required'}), 400
+        
+        if not allowed_file(data['filename']):
+            return jsonify({'error': 'Only PDF files are allowed'}), 400
+        
+        session = ChunkedUploadService.create_session(
+            filename=data['filename'],
+            total_size=int(data['size']),
+            expected_sha256=data.get('sha256')
+        )
+        
+        response = session.to_dict()
+        response['chunk_size'] = current_app.config['UPLOAD_CHUNK_SIZE']
+        return jsonify(response), 201
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+        
+    except Exception as e:
+        logger.error("Error starting upload: %s", e)
+        return jsonify({'error': 'Failed to start upload'}), 500
+
+@upload_bp.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Get the offset a resumable upload should continue from"""
+    session = UploadSession.query.get_or_404(upload_id)
+    return jsonify(session.to_dict()), 200
+
+@upload_bp.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Append a chunk, sent as the raw request body, at ?offset="""
+    session = UploadSession.query.get_or_404(upload_id)
+    try:
+        offset = int(request.args.get('offset', session.received))
+        
+        received = ChunkedUploadService.append_chunk(session, offset, request.stream)
+        
+        return jsonify({'upload_id': upload_id, 'offset': received}), 200
+        
+    except UploadOffsetMismatch as e:
+        return jsonify({'error': str(e), 'offset': e.expected}), 409
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+        
+    except Exception as e:
+        logger.error("Error receiving upload chunk: %s", e)
+        return jsonify({'error': 'Failed to store chunk'}), 500
+
+@upload_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """Verify a fully received upload and store it"""
+    session = UploadSession.query.get_or_404(upload_id)
+    try:
+        file_path = ChunkedUploadService.finalize(session)
+        
+        logger.info("File uploaded successfully: %s", file_path)
+        
+        return jsonify({
+            'message': 'File uploaded successfully',
+            'filename': session.filename,
+            'file_path': file_path,
+            **analysis_fields(file_path)
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+        
+    except Exception as e:
+        logger.error("Error completing upload: %s", e)
+        return jsonify({'error': 'Failed to complete upload'}), 500
+
+@upload_bp.route('/blobs/<sha256>', methods=['GET'])
+def get_blob(sha256):
+    """Get the size and PDF analysis of stored content"""
+    blob = Blob.query.get_or_404(sha256)
+    return jsonify({
+        'sha256': blob.sha256,
+        'size': blob.size,
+        'analysis': blob.analysis_dict()
+    }), 200
+
+@upload_bp.route('/blobs/<sha256>/thumbnail', methods=['GET'])
+def get_blob_thumbnail(sha256):
+    """Serve the first-page thumbnail rendered during analysis"""
+    blob = Blob.query.get_or_404(sha256)
+    thumbnail_path = BlobStore.blob_path(blob.sha256, THUMBNAIL_EXT)
+    if not blob.has_thumbnail or not os.path.exists(thumbnail_path):
+        return jsonify({'error': 'Thumbnail not available'}), 404
+    
+    # Named by content hash, so the thumbnail never changes
+    response = send_file(os.path.abspath(thumbnail_path), mimetype='image/png',
+                         conditional=True, etag=f"{blob.sha256}-thumbnail", max_age=365 * 24 * 3600)
+    response.cache_control.immutable = True
+    return response
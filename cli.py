@@ -0,0 +1,123 @@
+import time
+import click
+from flask import current_app
+
+def register_commands(app):
+    """Attach the maintenance commands to `flask --app main ...`"""
+
+    @app.cli.command('bootstrap')
+    def bootstrap_command():
+        """Create the storage folders and tables and apply schema upgrades."""
+        from app import bootstrap
+
+        bootstrap(app)
+        click.echo("Database and storage folders are up to date")
+
+    @app.cli.command('deliver')
+    @click.option('--workers', type=int, default=None, help='Number of worker threads (defaults to DELIVERY_WORKERS).')
+    def deliver(workers):
+        """Run delivery workers in the foreground until interrupted."""
+        from services.delivery_service import delivery_pool
+
+        app = current_app._get_current_object()
+        delivery_pool.start(app, workers)
+        click.echo(f"Delivering with {len(delivery_pool.workers)} workers, press Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            delivery_pool.stop()
+
+    @app.cli.command('process-webhooks')
+    def process_webhooks():
+        """Apply every pending webhook inbox event and exit."""
+        from services.webhook_service import WebhookService
+
+        total = 0
+        while True:
+            processed = WebhookService.process_batch()
+            if not processed:
+                break
+            total += processed
+        click.echo(f"Processed {total} webhook events")
+
+    @app.cli.command('reconcile-stats')
+    @click.option('--days', type=int, default=None, help='Day buckets to recount (defaults to STATS_RECONCILE_DAYS).')
+    def reconcile_stats(days):
+        """Recount the dashboard counters from the consent tables."""
+        from services.stats_service import StatsService
+
+        corrected = StatsService.reconcile(days)
+        click.echo(f"Corrected {corrected} dashboard counters")
+
+    @app.cli.command('expire-consents')
+    def expire_consents():
+        """Expire every consent that is overdue under the TTL policy and exit."""
+        from services.expiry_service import ExpiryService
+
+        expired = ExpiryService.sweep()
+        click.echo(f"Expired {expired} consents")
+
+    @app.cli.command('archive-consents')
+    @click.option('--older-than', type=float, default=None, help='Days since signing (defaults to ARCHIVE_AFTER_DAYS).')
+    def archive_consents(older_than):
+        """Archive every signed consent past the archive age and exit."""
+        from services.archive_service import ArchiveService
+
+        if older_than is not None:
+            app.config['ARCHIVE_AFTER_DAYS'] = older_than
+        if app.config['ARCHIVE_AFTER_DAYS'] is None:
+            raise click.UsageError('Archiving is off: pass --older-than or set ARCHIVE_AFTER_DAYS.')
+        archived = ArchiveService.sweep()
+        click.echo(f"Archived {archived} consents")
+
+    @app.cli.command('cleanup-uploads')
+    def cleanup_uploads():
+        """Remove every resumable upload idle past UPLOAD_SESSION_TTL_HOURS and exit."""
+        from services.upload_service import ChunkedUploadService
+
+        removed = ChunkedUploadService.cleanup()
+        click.echo(f"Removed {removed} expired upload sessions")
+
+    @app.cli.command('analyze-pdfs')
+    @click.option('--workers', type=int, default=None, help='Worker processes (defaults to PDF_ANALYSIS_WORKERS).')
+    def analyze_pdfs(workers):
+        """Analyze every stored PDF that has no analysis yet and exit."""
+        from concurrent.futures import ProcessPoolExecutor
+        from services.pdf_service import PdfService, pool_context
+
+        workers = app.config['PDF_ANALYSIS_WORKERS'] if workers is None else workers
+        if workers:
+            with ProcessPoolExecutor(workers, mp_context=pool_context(app.config['PDF_ANALYSIS_START_METHOD'])) as executor:
+                analyzed = PdfService.analyze_pending(executor, batch_size=workers * 16)
+        else:
+            analyzed = PdfService.analyze_pending()
+        click.echo(f"Analyzed {analyzed} PDFs")
+
+    @app.cli.command('export')
+    @click.argument('kind', type=click.Choice(['consents', 'transmissions']))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson', 'zip']), default='csv')
+    @click.option('--status', default=None, help='Only rows in this status.')
+    @click.option('--method', default=None, help='Transmissions only: delivery method.')
+    @click.option('--since', default=None, help='ISO date or datetime, inclusive.')
+    @click.option('--until', default=None, help='ISO date (inclusive) or datetime (exclusive).')
+    @click.option('--date-field', default='created_at', help='Consents only: created_at, sent_at or signed_at.')
+    @click.option('--output', type=click.File('wb'), default='-', help='Output file (defaults to stdout).')
+    def export(kind, fmt, status, method, since, until, date_field, output):
+        """Stream an export of consents or transmissions to a file."""
+        from services.export_service import ExportService, InvalidExportRequest
+
+        args = {'status': status, 'method': method, 'since': since, 'until': until, 'date_field': date_field}
+        try:
+            if kind == 'consents':
+                chunks = ExportService.export_consents(fmt, **ExportService.parse_consent_filters(args))
+            else:
+                chunks = ExportService.export_transmissions(fmt, **ExportService.parse_transmission_filters(args))
+        except InvalidExportRequest as e:
+            raise click.UsageError(str(e))
+
+        written = 0
+        for chunk in chunks:
+            output.write(chunk)
+            written += len(chunk)
+        click.echo(f"Exported {written} bytes of {kind}", err=True)
@@ -0,0 +1,86 @@
+import os
+import logging
+from functools import wraps
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+def engine_options(database_url):
+    """Get the engine options of the profile for a database URL.
+
+    SQLite connections use a busy timeout so concurrent writers wait for the
+    lock instead of failing, and skip the pre-ping a local file never needs.
+    Server databases get an explicitly sized pool; pre-ping is opt-in
+    because it costs a round trip on every checkout, and pool_recycle
+    already retires connections before typical server-side idle timeouts.
+    """
+    if make_url(database_url).get_backend_name() == 'sqlite':
+        return {
+            'connect_args': {'timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000},
+            'pool_pre_ping': False,
+        }
+    return {
+        'pool_size': _env_int('DB_POOL_SIZE', 10),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING') == '1',
+    }
+
+def configure_engine(engine):
+    """Apply per-connection settings for the engine's database"""
+    if engine.dialect.name != 'sqlite' or engine.url.database in (None, '', ':memory:'):
+        return
+
+    journal_mode = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    synchronous = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    cache_size_kb = _env_int('SQLITE_CACHE_SIZE_KB', 65536)
+    busy_timeout_ms = _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers run alongside the single writer; NORMAL only
+        # syncs at checkpoints, which is durable across process crashes
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute(f'PRAGMA busy_timeout={busy_timeout_ms}')
+        cursor.execute(f'PRAGMA cache_size=-{cache_size_kb}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.close()
+
+class RoutingSession(Session):
+    """Session that sends the reads of read-only views to the replica bind.
+
+    Only SELECTs issued while a view marked with @use_replica is running go
+    to the replica, and only when one is configured; flushes and every other
+    statement use the primary. Replica reads may lag the primary slightly.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and isinstance(clause, Select)
+                and has_app_context() and g.get('use_replica')):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def use_replica(view):
+    """Route the SELECTs of a read-only view to the replica bind"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.use_replica = False
+    return wrapper
@@ -0,0 +1,13 @@
+"""Extension objects shared by the app factory, the models and the services.
+
+They are created unbound and attached to an app by create_app(), so
+importing a model or a service never builds an app.
+"""
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import DeclarativeBase
+from database import RoutingSession
+
+class Base(DeclarativeBase):
+    pass
+
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
@@ -0,0 +1,41 @@
+"""Gunicorn settings, read from the working directory by `gunicorn main:app`.
+
+The app is imported once in the master (preload_app) and the workers are
+forked from it, sharing its memory copy-on-write instead of each importing
+it again. Set GUNICORN_PRELOAD=0 when running with --reload, which needs
+every worker to import the code afresh.
+
+The same settings serve the ASGI app (`gunicorn -k
+uvicorn.workers.UvicornWorker asgi:app`), which wraps this one.
+"""
+import os
+import sys
+import subprocess
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+
+def on_starting(server):
+    """Create the tables and folders and apply schema upgrades, once.
+
+    Runs `flask bootstrap` in a child process so the master never opens a
+    database connection that forked workers could inherit.
+    """
+    if os.environ.get('BOOTSTRAP_ON_START', '1') == '1':
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'main', 'bootstrap'], check=True)
+
+def post_fork(server, worker):
+    """Drop any pooled connections a preloaded app carried over the fork.
+
+    close=False leaves the parent's sockets alone; the worker simply opens
+    its own connections on first use.
+    """
+    if server.cfg.preload_app:
+        from extensions import db
+
+        # Under the ASGI worker this is the adapter around the Flask app
+        app = server.app.wsgi()
+        app = getattr(app, 'flask_app', app)
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
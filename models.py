@@ -1,6 +1,6 @@
 from datetime import datetime
-from app import db
-from sqlalchemy import String, Integer, DateTime, Enum as SQLEnum, Text
+from extensions import db
+from sqlalchemy import String, Integer, BigInteger, DateTime, Enum as SQLEnum, Text, Boolean, Float
 from enum import Enum
 
 class ConsentStatus(Enum):
@@ -20,8 +20,28 @@ class TransmissionStatus(Enum):
     DELIVERED = "delivered"
     FAILED = "failed"
 
+def _serialize(value):
+    """Convert a column value into its JSON representation"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
 class Consent(db.Model):
     __tablename__ = 'consents'
+    __table_args__ = (
+        db.Index('ix_consents_created_at_id', 'created_at', 'id'),
+        db.Index('ix_consents_status_created_at', 'status', 'created_at'),
+        db.Index('ix_consents_status_sent_at', 'status', 'sent_at'),
+        db.Index('ix_consents_status_signed_at', 'status', 'signed_at'),
+    )
+    
+    SERIALIZABLE_FIELDS = (
+        'id', 'patient_name', 'patient_email', 'patient_phone', 'patient_fax',
+        'form_name', 'file_path', 'signed_file_path', 'status',
+        'created_at', 'sent_at', 'signed_at'
+    )
     
     id = db.Column(Integer, primary_key=True)
     patient_name = db.Column(String(255), nullable=False)
@@ -39,24 +59,22 @@ class Consent(db.Model):
     # Relationship to transmissions
     transmissions = db.relationship('Transmission', backref='consent', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'patient_name': self.patient_name,
-            'patient_email': self.patient_email,
-            'patient_phone': self.patient_phone,
-            'patient_fax': self.patient_fax,
-            'form_name': self.form_name,
-            'file_path': self.file_path,
-            'signed_file_path': self.signed_file_path,
-            'status': self.status.value,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'sent_at': self.sent_at.isoformat() if self.sent_at else None,
-            'signed_at': self.signed_at.isoformat() if self.signed_at else None
-        }
+    def to_dict(self, fields=None):
+        """Serialize the consent, optionally restricted to a subset of fields"""
+        return {field: _serialize(getattr(self, field)) for field in (fields or self.SERIALIZABLE_FIELDS)}
 
 class Transmission(db.Model):
     __tablename__ = 'transmissions'
+    __table_args__ = (
+        db.Index('ix_transmissions_consent_id_created_at', 'consent_id', 'created_at'),
+        db.Index('ix_transmissions_created_at_id', 'created_at', 'id'),
+        db.Index('ix_transmissions_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+    
+    SERIALIZABLE_FIELDS = (
+        'id', 'consent_id', 'method', 'recipient', 'status',
+        'created_at', 'sent_at', 'delivered_at', 'error_message', 'attempts'
+    )
     
     id = db.Column(Integer, primary_key=True)
     consent_id = db.Column(Integer, db.ForeignKey('consents.id'), nullable=False)
@@ -68,15 +86,190 @@ class Transmission(db.Model):
     delivered_at = db.Column(DateTime, nullable=True)
     error_message = db.Column(Text, nullable=True)
     
+    # Delivery queue bookkeeping: a worker owns a pending row until locked_until
+    attempts = db.Column(Integer, default=0, server_default='0', nullable=False)
+    next_attempt_at = db.Column(DateTime, nullable=True)
+    locked_until = db.Column(DateTime, nullable=True)
+    
+    def to_dict(self, fields=None):
+        """Serialize the transmission, optionally restricted to a subset of fields"""
+        return {field: _serialize(getattr(self, field)) for field in (fields or self.SERIALIZABLE_FIELDS)}
+
+class Blob(db.Model):
+    """A stored file, addressed by the SHA-256 of its content"""
+    __tablename__ = 'blobs'
+    
+    sha256 = db.Column(String(64), primary_key=True)
+    size = db.Column(BigInteger, nullable=False)
+    # Number of uploads and signed copies that point at this content
+    ref_count = db.Column(Integer, default=0, nullable=False)
+    created_at = db.Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    # PDF analysis, filled in off the request by the analysis pool; all
+    # null until analyzed_at is set
+    valid = db.Column(Boolean, nullable=True)
+    analysis_error = db.Column(Text, nullable=True)
+    pdf_version = db.Column(String(10), nullable=True)
+    page_count = db.Column(Integer, nullable=True)
+    page_width = db.Column(Float, nullable=True)  # first page, in points
+    page_height = db.Column(Float, nullable=True)
+    encrypted = db.Column(Boolean, nullable=True)
+    has_thumbnail = db.Column(Boolean, nullable=True)
+    analyzed_at = db.Column(DateTime, nullable=True)
+    
+    def analysis_dict(self):
+        """Serialize the PDF analysis, with status pending until it has run"""
+        if self.analyzed_at is None:
+            return {'status': 'pending'}
+        return {
+            'status': 'valid' if self.valid else 'invalid',
+            'error': self.analysis_error,
+            'pdf_version': self.pdf_version,
+            'page_count': self.page_count,
+            'page_width': self.page_width,
+            'page_height': self.page_height,
+            'encrypted': self.encrypted,
+            'thumbnail': bool(self.has_thumbnail),
+            'analyzed_at': _serialize(self.analyzed_at),
+        }
+
+class ArchivedConsent(db.Model):
+    """Index entry of a consent moved to the archive tier.
+    
+    The consent, its transmissions and its audit trail are one record in a
+    block of a compressed segment file, and its signed document is an entry
+    in a pack file; both paths are relative to ARCHIVE_FOLDER.
+    """
+    __tablename__ = 'archived_consents'
+    __table_args__ = (
+        db.Index('ix_archived_consents_signed_file_path', 'signed_file_path'),
+    )
+    
+    consent_id = db.Column(Integer, primary_key=True)
+    signed_at = db.Column(DateTime, nullable=False)
+    partition = db.Column(String(7), nullable=False)  # YYYY-MM of signed_at
+    segment = db.Column(String(255), nullable=False)
+    block_offset = db.Column(BigInteger, nullable=False)
+    block_length = db.Column(Integer, nullable=False)
+    # The signed document, looked up by the path it was served from
+    signed_file_path = db.Column(String(500), nullable=True)
+    document_pack = db.Column(String(255), nullable=True)
+    document_offset = db.Column(BigInteger, nullable=True)
+    document_length = db.Column(BigInteger, nullable=True)  # as stored in the pack
+    document_size = db.Column(BigInteger, nullable=True)
+    document_sha256 = db.Column(String(64), nullable=True)
+    document_compressed = db.Column(Boolean, nullable=True)
+    archived_at = db.Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class UploadSession(db.Model):
+    """A resumable upload whose chunks are streamed to a partial file"""
+    __tablename__ = 'upload_sessions'
+    __table_args__ = (
+        db.Index('ix_upload_sessions_updated_at', 'updated_at'),
+    )
+    
+    id = db.Column(String(32), primary_key=True)
+    filename = db.Column(String(255), nullable=False)
+    total_size = db.Column(BigInteger, nullable=False)
+    received = db.Column(BigInteger, default=0, nullable=False)
+    expected_sha256 = db.Column(String(64), nullable=True)
+    file_path = db.Column(String(500), nullable=True)  # set once finalized
+    locked_until = db.Column(DateTime, nullable=True)  # lease of the request writing a chunk
+    created_at = db.Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(DateTime, default=datetime.utcnow, nullable=False)
+    
     def to_dict(self):
         return {
-            'id': self.id,
-            'consent_id': self.consent_id,
-            'method': self.method.value,
-            'recipient': self.recipient,
-            'status': self.status.value,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'sent_at': self.sent_at.isoformat() if self.sent_at else None,
-            'delivered_at': self.delivered_at.isoformat() if self.delivered_at else None,
-            'error_message': self.error_message
+            'upload_id': self.id,
+            'filename': self.filename,
+            'size': self.total_size,
+            'offset': self.received,
+            'complete': self.file_path is not None,
+            'file_path': self.file_path
         }
+
+class CacheGeneration(db.Model):
+    """Generation counter for a group of cached responses.
+    
+    Writes bump the counter in the same transaction as the data they change,
+    so cached entries keyed by an older generation are never served again.
+    """
+    __tablename__ = 'cache_generations'
+    
+    namespace = db.Column(String(50), primary_key=True)
+    generation = db.Column(BigInteger, nullable=False)
+
+class ConsentEvent(db.Model):
+    """Append-only log of consent and transmission state changes.
+    
+    The change feed reads it in id order and the audit trail by consent.
+    occurred_at is when the change committed, created_at when the entry was
+    written to the log.
+    """
+    __tablename__ = 'consent_events'
+    __table_args__ = (
+        db.Index('ix_consent_events_consent_id_occurred_at', 'consent_id', 'occurred_at', 'id'),
+    )
+    
+    id = db.Column(Integer, primary_key=True)
+    event_type = db.Column(String(50), nullable=False)
+    consent_id = db.Column(Integer, nullable=False)
+    transmission_id = db.Column(Integer, nullable=True)
+    consent_status = db.Column(String(20), nullable=True)
+    transmission_status = db.Column(String(20), nullable=True)
+    method = db.Column(String(20), nullable=True)
+    recipient = db.Column(String(255), nullable=True)
+    attempts = db.Column(Integer, nullable=True)
+    detail = db.Column(Text, nullable=True)
+    # Nullable so upgrade_schema can add it to an existing log
+    occurred_at = db.Column(DateTime, nullable=True)
+    created_at = db.Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    FEED_FIELDS = (
+        'event_type', 'consent_id', 'transmission_id', 'consent_status', 'transmission_status',
+        'created_at'
+    )
+    AUDIT_FIELDS = (
+        'event_type', 'consent_id', 'transmission_id', 'consent_status', 'transmission_status',
+        'method', 'recipient', 'attempts', 'detail', 'occurred_at'
+    )
+    
+    def to_dict(self, fields=None):
+        """Serialize the event as a change feed entry, or with the given fields"""
+        return {'id': self.id, **{field: _serialize(getattr(self, field)) for field in (fields or self.FEED_FIELDS)}}
+
+class WebhookEvent(db.Model):
+    """Raw provider webhook kept in an inbox until the consumer applies it"""
+    __tablename__ = 'webhook_events'
+    __table_args__ = (
+        db.UniqueConstraint('provider', 'provider_event_id', name='uq_webhook_events_provider_event'),
+        db.Index('ix_webhook_events_status_id', 'status', 'id'),
+    )
+    
+    id = db.Column(Integer, primary_key=True)
+    provider = db.Column(String(50), nullable=False)
+    provider_event_id = db.Column(String(255), nullable=False)
+    event_type = db.Column(String(100), nullable=False)
+    consent_id = db.Column(Integer, nullable=True)
+    occurred_at = db.Column(DateTime, nullable=True)
+    payload = db.Column(Text, nullable=False)
+    # pending -> processing -> applied | ignored | failed
+    status = db.Column(String(20), default='pending', nullable=False)
+    error_message = db.Column(Text, nullable=True)
+    received_at = db.Column(DateTime, default=datetime.utcnow, nullable=False)
+    claimed_at = db.Column(DateTime, nullable=True)
+    processed_at = db.Column(DateTime, nullable=True)
+
+class StatCounter(db.Model):
+    """Pre-aggregated dashboard counter.
+    
+    The 'total' bucket holds the current number of consents per status and
+    of transmissions per method and status; day buckets ('YYYY-MM-DD') count
+    how many entered that status on the day.
+    """
+    __tablename__ = 'stat_counters'
+    
+    metric = db.Column(String(50), primary_key=True)
+    bucket = db.Column(String(10), primary_key=True)
+    dimension = db.Column(String(50), primary_key=True)
+    value = db.Column(BigInteger, nullable=False, default=0)
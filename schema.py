@@ -0,0 +1,120 @@
+import logging
+from sqlalchemy import event, inspect, text
+from models import Consent
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+def _digits(column):
+    """SQLite expression stripping the usual phone punctuation from a column"""
+    expr = f"coalesce({column}, '')"
+    for char in (' ', '-', '(', ')', '+', '.'):
+        expr = f"replace({expr}, '{char}', '')"
+    return expr
+
+def _search_row(row):
+    return (f"-{row}.id, {row}.patient_name, coalesce({row}.patient_email, ''), "
+            f"{_digits(f'{row}.patient_phone')} || ' ' || {_digits(f'{row}.patient_fax')}, {row}.form_name")
+
+SEARCHED_COLUMNS = 'patient_name, patient_email, patient_phone, patient_fax, form_name'
+
+# Patient search index: an FTS5 trigram table kept in sync by triggers on
+# SQLite, a pg_trgm GIN expression index on Postgres. Phone and fax numbers
+# are indexed as bare digits so any formatting of the number matches.
+# FTS rows are keyed by the negated consent id: FTS5 walks its doclists
+# forwards about twice as fast as backwards, and newest first is the order
+# searches read them in.
+PG_SEARCH_EXPRESSION = (
+    "lower(coalesce(patient_name, '') || ' ' || coalesce(patient_email, '') || ' ' || "
+    "regexp_replace(coalesce(patient_phone, '') || ' ' || coalesce(patient_fax, ''), '[^0-9 ]', '', 'g') "
+    "|| ' ' || coalesce(form_name, ''))"
+)
+
+SEARCH_INDEX_DDL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS consent_search USING fts5("
+        "patient_name, patient_email, contact, form_name, tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS consents_search_insert AFTER INSERT ON consents BEGIN "
+        f"INSERT INTO consent_search(rowid, patient_name, patient_email, contact, form_name) "
+        f"VALUES ({_search_row('new')}); END",
+        f"CREATE TRIGGER IF NOT EXISTS consents_search_update AFTER UPDATE OF {SEARCHED_COLUMNS} ON consents BEGIN "
+        f"DELETE FROM consent_search WHERE rowid = -old.id; "
+        f"INSERT INTO consent_search(rowid, patient_name, patient_email, contact, form_name) "
+        f"VALUES ({_search_row('new')}); END",
+        "CREATE TRIGGER IF NOT EXISTS consents_search_delete AFTER DELETE ON consents BEGIN "
+        "DELETE FROM consent_search WHERE rowid = -old.id; END",
+    ],
+    'postgresql': [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        f"CREATE INDEX IF NOT EXISTS ix_consents_search_trgm ON consents "
+        f"USING gin (({PG_SEARCH_EXPRESSION}) gin_trgm_ops)",
+    ],
+}
+
+SEARCH_INDEX_DROP = {
+    'sqlite': ["DROP TABLE IF EXISTS consent_search"],
+    'postgresql': [],
+}
+
+def create_search_index(conn, backfill=False):
+    """Create the patient search index, optionally indexing existing rows"""
+    for ddl in SEARCH_INDEX_DDL.get(conn.dialect.name, []):
+        conn.execute(text(ddl))
+    if backfill and conn.dialect.name == 'sqlite':
+        conn.execute(text("DELETE FROM consent_search"))
+        conn.execute(text(
+            "INSERT INTO consent_search(rowid, patient_name, patient_email, contact, form_name) "
+            f"SELECT {_search_row('consents')} FROM consents"
+        ))
+
+def optimize_search_index(conn):
+    """Merge the FTS5 index segments, dropping the entries of deleted consents.
+
+    FTS5 only marks deleted rows until their segments are merged, so after
+    removing many consents the index keeps its size until this runs.
+    """
+    if conn.dialect.name == 'sqlite':
+        conn.execute(text("INSERT INTO consent_search(consent_search) VALUES('optimize')"))
+
+@event.listens_for(Consent.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    create_search_index(connection)
+
+@event.listens_for(Consent.__table__, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    for ddl in SEARCH_INDEX_DROP.get(connection.dialect.name, []):
+        connection.execute(text(ddl))
+
+def upgrade_schema(engine):
+    """Bring an existing database up to date with the models.
+
+    db.create_all() only creates missing tables, so columns and indexes that
+    were added to an existing table are applied here. New columns must be
+    nullable or carry a server default.
+    """
+    inspector = inspect(engine)
+
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
+                logger.info("Added column %s.%s", table.name, column.name)
+
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+        if engine.dialect.name == 'sqlite' and not inspector.has_table('consent_search'):
+            create_search_index(conn, backfill=True)
+            logger.info("Built the consent search index")
+        elif engine.dialect.name == 'postgresql':
+            create_search_index(conn)
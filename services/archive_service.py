@@ -0,0 +1,480 @@
+import io
+import os
+import gzip
+import time
+import uuid
+import zlib
+import shutil
+import hashlib
+import logging
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from flask import current_app
+from sqlalchemy import delete, exists, func, insert, select
+from models import ArchivedConsent, Consent, ConsentEvent, Transmission, ConsentStatus, TransmissionStatus
+from services.background import BackgroundWorker
+from services.blob_store import BlobStore, CHUNK_SIZE
+from services.cache_service import response_cache, CONSENTS, TRANSMISSIONS
+from services.db_utils import unindexed
+from services.file_service import FileService
+from services.metrics_service import metrics
+from services.serialization import dumps, loads
+from services.stats_service import StatsService
+from extensions import db
+from schema import optimize_search_index
+
+logger = logging.getLogger(__name__)
+
+# A packed document is kept compressed only when that saves at least this
+# fraction; most PDFs are compressed internally already
+MIN_COMPRESSION_SAVING = 0.1
+
+@lru_cache(maxsize=32)
+def _read_block(path, offset, length):
+    """Decompress one segment block into its records by consent id.
+
+    Segments are never modified once written, so blocks are cached as they
+    are; callers must not change the records they get.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = gzip.decompress(f.read(length))
+    records = {}
+    for line in data.splitlines():
+        record = loads(line)
+        records[record['consent']['id']] = record
+    return records
+
+class PackWindow(io.RawIOBase):
+    """The bytes [offset, offset + length) of a pack file, as a seekable file"""
+
+    def __init__(self, path, offset, length):
+        self._file = open(path, 'rb')
+        self._offset = offset
+        self._length = length
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, position, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._length}[whence]
+        self._position = min(max(base + position, 0), self._length)
+        return self._position
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._length - self._position)
+        if size <= 0:
+            return 0
+        self._file.seek(self._offset + self._position)
+        read = self._file.readinto(memoryview(buffer)[:size])
+        self._position += read
+        metrics.record_file_bytes('read', read)
+        return read
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+class PackedDocument(io.RawIOBase):
+    """A document stored compressed in a pack, decompressed as it is read"""
+
+    def __init__(self, path, offset, length):
+        self._window = PackWindow(path, offset, length)
+        self._decompressor = zlib.decompressobj()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._decompressor.eof:
+            data = self._decompressor.unconsumed_tail or self._window.read(CHUNK_SIZE)
+            if not data:
+                raise ValueError("Archived document is truncated")
+            # Never more output than the caller asked for
+            out = self._decompressor.decompress(data, len(buffer))
+            if out:
+                buffer[:len(out)] = out
+                return len(out)
+        return 0
+
+    def close(self):
+        self._window.close()
+        super().close()
+
+class ArchiveService:
+    """Service that moves old signed consents to compressed cold storage.
+
+    Consents signed more than ARCHIVE_AFTER_DAYS days ago leave the live
+    tables together with their transmissions and audit trail. Each batch
+    writes, per month of signed_at, a segment file of gzip members
+    (archive/2024-03/consents-*.ndjson.gz, readable with zcat), each member
+    a block of ARCHIVE_BLOCK_RECORDS NDJSON records, and a pack file of the
+    signed documents, each distinct content stored once. The
+    archived_consents table indexes both, so reading one consent back
+    decompresses a single block and a single document.
+    """
+
+    @staticmethod
+    def cutoff(now=None):
+        """Get the signed_at before which consents are archived, or None when disabled"""
+        days = current_app.config['ARCHIVE_AFTER_DAYS']
+        if days is None:
+            return None
+        # Archived rows must be older than the day buckets the stats
+        # reconciler recounts from the live tables
+        days = max(days, current_app.config['STATS_RECONCILE_DAYS'] + 1)
+        return (now or datetime.utcnow()) - timedelta(days=days)
+
+    @staticmethod
+    def _path(relative):
+        return os.path.join(current_app.config['ARCHIVE_FOLDER'], relative)
+
+    @staticmethod
+    def _candidates(cutoff, limit):
+        """Find the oldest signed consents due for archiving, with no delivery outstanding"""
+        # SQLite hands out max(rowid) + 1, so the newest consent and the
+        # owners of the newest transmission and log entry stay live and
+        # archived ids (or change feed ids) are never handed out again
+        newest_consent = db.session.scalar(select(func.max(Consent.id)))
+        newest_transmission = db.session.scalar(select(func.max(Transmission.id)))
+        newest_event = db.session.scalar(select(func.max(ConsentEvent.id)))
+        pending = exists().where(Transmission.consent_id == Consent.id,
+                                 unindexed(Transmission.status) == TransmissionStatus.PENDING)
+        newest = exists().where(Transmission.consent_id == Consent.id, Transmission.id == newest_transmission)
+        newest_logged = exists().where(ConsentEvent.consent_id == Consent.id, ConsentEvent.id == newest_event)
+        return db.session.scalars(
+            select(Consent)
+            .where(Consent.status == ConsentStatus.SIGNED, Consent.signed_at < cutoff,
+                   Consent.id != newest_consent, ~pending, ~newest, ~newest_logged)
+            .order_by(Consent.signed_at)
+            .limit(limit)
+        ).all()
+
+    @staticmethod
+    def _write_segment(relative, records):
+        """Write records as gzip blocks to a new segment file.
+
+        Returns the (offset, length) of the block holding each record.
+        """
+        block_records = current_app.config['ARCHIVE_BLOCK_RECORDS']
+        blocks = []
+        with open(ArchiveService._path(relative), 'xb') as f:
+            for start in range(0, len(records), block_records):
+                block = records[start:start + block_records]
+                data = gzip.compress(b''.join(dumps(record) + b'\n' for record in block), mtime=0)
+                blocks.extend([(f.tell(), len(data))] * len(block))
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return blocks
+
+    @staticmethod
+    def _write_pack(relative, file_paths):
+        """Append the documents at file_paths to a new pack file.
+
+        Each document is hashed and compressed as it is copied, CHUNK_SIZE
+        bytes at a time, and copied again uncompressed when that did not
+        save enough. Returns the index columns of each document, or None
+        for a consent whose signed document is missing.
+        """
+        documents = []
+        stored = {}
+        with open(ArchiveService._path(relative), 'xb') as f:
+            for file_path in file_paths:
+                if not file_path or not os.path.isfile(file_path):
+                    if file_path:
+                        logger.warning("Signed document %s is missing, archiving the consent without it", file_path)
+                    documents.append(None)
+                    continue
+
+                # Blob store names already give the content hash
+                known = BlobStore.digest_from_path(file_path)
+                if known in stored:
+                    documents.append(stored[known])
+                    continue
+
+                start = f.tell()
+                digest = hashlib.sha256()
+                compressor = zlib.compressobj()
+                size = 0
+                with open(file_path, 'rb') as source:
+                    for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        f.write(compressor.compress(chunk))
+                    f.write(compressor.flush())
+                metrics.record_file_bytes('read', size)
+                digest = digest.hexdigest()
+                length = f.tell() - start
+                keep = length <= size * (1 - MIN_COMPRESSION_SAVING)
+
+                if digest in stored or not keep:
+                    # A duplicate, or not worth keeping compressed
+                    f.seek(start)
+                    f.truncate()
+                if digest not in stored:
+                    if not keep:
+                        with open(file_path, 'rb') as source:
+                            shutil.copyfileobj(source, f, CHUNK_SIZE)
+                        metrics.record_file_bytes('read', size)
+                        length = size
+                    stored[digest] = {
+                        'document_pack': relative,
+                        'document_offset': start,
+                        'document_length': length,
+                        'document_size': size,
+                        'document_sha256': digest,
+                        'document_compressed': keep,
+                    }
+                documents.append(stored[digest])
+            f.flush()
+            os.fsync(f.fileno())
+        return documents
+
+    @staticmethod
+    def archive_batch(limit=None, now=None):
+        """Archive up to `limit` consents signed before the cutoff.
+
+        The segment and pack files are written and synced before the rows
+        are deleted, in one transaction with their index entries; the live
+        signed documents are released once that has committed. Returns the
+        number of consents archived.
+        """
+        limit = limit or current_app.config['ARCHIVE_BATCH_SIZE']
+        cutoff = ArchiveService.cutoff(now)
+        if cutoff is None:
+            return 0
+
+        consents = ArchiveService._candidates(cutoff, limit)
+        consent_ids = [consent.id for consent in consents]
+        transmissions = defaultdict(list)
+        audit = defaultdict(list)
+        if consent_ids:
+            for transmission in db.session.scalars(
+                    select(Transmission).where(Transmission.consent_id.in_(consent_ids))
+                    .order_by(Transmission.created_at, Transmission.id)):
+                transmissions[transmission.consent_id].append(transmission)
+            for event in db.session.scalars(
+                    select(ConsentEvent).where(ConsentEvent.consent_id.in_(consent_ids))
+                    .order_by(ConsentEvent.occurred_at.desc(), ConsentEvent.id.desc())):
+                audit[event.consent_id].append(event.to_dict(ConsentEvent.AUDIT_FIELDS))
+
+        # Build the records before taking any write lock, then end the read
+        partitions = defaultdict(list)
+        for consent in consents:
+            partitions[consent.signed_at.strftime('%Y-%m')].append((consent.id, consent.signed_at, {
+                'consent': consent.to_dict(),
+                'transmissions': [transmission.to_dict() for transmission in transmissions[consent.id]],
+                'audit': audit[consent.id],
+            }))
+        transmission_counts = Counter((transmission.method, transmission.status)
+                                      for rows in transmissions.values() for transmission in rows)
+        db.session.commit()
+        if not consent_ids:
+            return 0
+
+        written = []
+        signed_paths = []
+        try:
+            index = []
+            name = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+            for partition, items in sorted(partitions.items()):
+                os.makedirs(ArchiveService._path(partition), exist_ok=True)
+                segment = os.path.join(partition, f'consents-{name}.ndjson.gz')
+                pack = os.path.join(partition, f'documents-{name}.pack')
+                written.append(ArchiveService._path(segment))
+                blocks = ArchiveService._write_segment(segment, [record for _, _, record in items])
+                written.append(ArchiveService._path(pack))
+                file_paths = [record['consent']['signed_file_path'] for _, _, record in items]
+                documents = ArchiveService._write_pack(pack, file_paths)
+                signed_paths.extend(filter(None, file_paths))
+
+                for (consent_id, signed_at, _), file_path, (offset, length), document in \
+                        zip(items, file_paths, blocks, documents):
+                    index.append({
+                        'consent_id': consent_id,
+                        'signed_at': signed_at,
+                        'partition': partition,
+                        'segment': segment,
+                        'block_offset': offset,
+                        'block_length': length,
+                        'signed_file_path': os.path.normpath(file_path) if file_path else None,
+                        **(document or {}),
+                    })
+
+            db.session.execute(delete(Transmission).where(Transmission.consent_id.in_(consent_ids))
+                                                   .execution_options(synchronize_session=False))
+            db.session.execute(delete(ConsentEvent).where(ConsentEvent.consent_id.in_(consent_ids))
+                                                   .execution_options(synchronize_session=False))
+            # Only rows still signed are removed; anything changed since
+            # the read leaves the whole batch for the next run
+            archived = db.session.execute(
+                delete(Consent)
+                .where(Consent.id.in_(consent_ids), unindexed(Consent.status) == ConsentStatus.SIGNED)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if archived != len(consent_ids):
+                db.session.rollback()
+                for path in written:
+                    os.remove(path)
+                logger.warning("Consents changed while being archived, retrying later")
+                return 0
+
+            db.session.execute(insert(ArchivedConsent), index)
+            StatsService.archive(len(consent_ids), transmission_counts)
+            response_cache.bump(CONSENTS, TRANSMISSIONS)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for path in written:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+
+        # The archive now holds the signed documents; a failure here only
+        # leaves a stray live copy behind
+        for file_path in signed_paths:
+            try:
+                FileService.delete_file(file_path)
+            except Exception as e:
+                logger.warning("Could not release archived document %s: %s", file_path, e)
+
+        logger.info("Archived %s consents into %s partitions", len(consent_ids), len(partitions))
+        return len(consent_ids)
+
+    @staticmethod
+    def compact():
+        """Shrink the search index after consents were archived out of it"""
+        started = time.perf_counter()
+        with db.engine.begin() as conn:
+            optimize_search_index(conn)
+        logger.info("Compacted the search index in %.3fs", time.perf_counter() - started)
+
+    @staticmethod
+    def sweep(now=None, limit=None):
+        """Archive every consent due at `now`, batch by batch, then compact.
+
+        Pauses ARCHIVE_BATCH_PAUSE seconds between batches so other writers
+        waiting on the lock get their turn. Returns the number archived.
+        """
+        now = now or datetime.utcnow()
+        limit = limit or current_app.config['ARCHIVE_BATCH_SIZE']
+        total = 0
+        while True:
+            archived = ArchiveService.archive_batch(limit, now)
+            total += archived
+            if archived < limit:
+                break
+            time.sleep(current_app.config['ARCHIVE_BATCH_PAUSE'])
+        if total:
+            ArchiveService.compact()
+        return total
+
+    @staticmethod
+    def load(consent_id):
+        """Get the index entry and archived record of a consent, or None if not archived.
+
+        The record holds the consent, its transmissions and its audit trail
+        (newest first) as they were serialized when archived.
+        """
+        entry = db.session.get(ArchivedConsent, consent_id)
+        if entry is None:
+            return None
+        records = _read_block(ArchiveService._path(entry.segment), entry.block_offset, entry.block_length)
+        return entry, records[consent_id]
+
+    @staticmethod
+    def find_document(file_path):
+        """Get the index entry of the archived consent whose signed document was at file_path"""
+        return ArchivedConsent.query.filter_by(signed_file_path=os.path.normpath(file_path)).first()
+
+    @staticmethod
+    def open_document(entry):
+        """Open an archived signed document in its pack for reading.
+
+        Documents stored as is are seekable, so ranges are read directly;
+        compressed ones are decompressed as they are read. Either way only
+        CHUNK_SIZE bytes are read at a time.
+        """
+        path = ArchiveService._path(entry.document_pack)
+        reader = PackedDocument if entry.document_compressed else PackWindow
+        return io.BufferedReader(reader(path, entry.document_offset, entry.document_length), CHUNK_SIZE)
+
+    @staticmethod
+    def read_document(entry):
+        """Read a whole archived signed document out of its pack"""
+        with ArchiveService.open_document(entry) as f:
+            return f.read()
+
+class ArchiveWorker(BackgroundWorker):
+    """Thread that archives old signed consents a batch at a time"""
+
+    archived = 0
+
+    def run_once(self):
+        archived = ArchiveService.archive_batch()
+        self.archived += archived
+        # A full batch means more are due, so carry on after a pause;
+        # otherwise the backlog is done and the search index is compacted
+        if archived < current_app.config['ARCHIVE_BATCH_SIZE']:
+            if self.archived:
+                ArchiveService.compact()
+                self.archived = 0
+            return False
+        self._stop_event.wait(current_app.config['ARCHIVE_BATCH_PAUSE'])
+        return True
+
+class Archiver:
+    """The archiver thread, started lazily in each process.
+
+    Runs at startup and then every ARCHIVE_INTERVAL seconds (0 disables
+    it), once ARCHIVE_AFTER_DAYS is set. Concurrent archivers in other processes are safe: a batch whose
+    rows were already removed by another one is rolled back.
+    """
+
+    def __init__(self):
+        self.worker = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('ARCHIVE_FOLDER', 'archive')
+        app.config.setdefault('ARCHIVE_AFTER_DAYS', None)
+        app.config.setdefault('ARCHIVE_BATCH_SIZE', 500)
+        app.config.setdefault('ARCHIVE_BLOCK_RECORDS', 128)
+        app.config.setdefault('ARCHIVE_BATCH_PAUSE', 0.05)
+        app.config.setdefault('ARCHIVE_INTERVAL', 3600)
+        app.extensions['archiver'] = self
+
+        @app.before_request
+        def start_archiver():
+            if not app.testing and app.config['ARCHIVE_INTERVAL'] and app.config['ARCHIVE_AFTER_DAYS']:
+                self.start(app)
+
+    def start(self, app):
+        """Start the archiver thread for this process if not already running"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.worker = ArchiveWorker(app, app.config['ARCHIVE_INTERVAL'], name='archiver')
+            self.worker.start()
+            self._pid = os.getpid()
+
+    def stop(self, timeout=None):
+        if self.worker is not None:
+            self.worker.stop(timeout)
+        self.worker = None
+        self._pid = None
+
+archiver = Archiver()
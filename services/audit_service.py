@@ -0,0 +1,202 @@
+import os
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, insert
+from models import ConsentEvent
+from services.background import BackgroundWorker
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Every entry carries every column so buffered rows insert as one batch
+EMPTY_ROW = dict.fromkeys(ConsentEvent.AUDIT_FIELDS)
+
+def _status(value):
+    return value.value if value is not None else None
+
+class AuditFlusher(BackgroundWorker):
+    """Thread that writes buffered log entries in batches"""
+
+    def __init__(self, app, interval, audit_log):
+        super().__init__(app, interval, name='audit-flusher')
+        self.audit_log = audit_log
+
+    def run(self):
+        # Started by the commit that buffered the first entries, which wait
+        # for the interval like every later batch
+        self._wake_event.wait(self.interval)
+        super().run()
+
+    def run_once(self):
+        return self.audit_log.flush() >= self.app.config['AUDIT_BATCH_SIZE']
+
+class AuditLog:
+    """Buffered writer of the append-only state change log (ConsentEvent).
+
+    Writers add entries to their session; they move to an in-memory buffer
+    only when that session commits and are dropped on rollback, so the log
+    never holds a change that did not happen. A flusher thread per process
+    writes the buffer with multi-row INSERTs once AUDIT_BATCH_SIZE entries
+    are waiting or every AUDIT_FLUSH_INTERVAL seconds, keeping the write off
+    the business transaction. Writers flush inline when the buffer exceeds
+    AUDIT_MAX_BUFFER, and always when no flusher runs (under tests).
+
+    Entries are therefore durable up to AUDIT_FLUSH_INTERVAL after their
+    change. The buffer is written at interpreter exit, which covers a
+    graceful shutdown; a process killed outright loses the entries of its
+    last interval. The change feed reads the same table, so it trails the
+    commits by that interval too.
+    """
+
+    def __init__(self):
+        self.flusher = None
+        self._buffer = deque()
+        self._listeners = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('AUDIT_BATCH_SIZE', 500)
+        app.config.setdefault('AUDIT_FLUSH_INTERVAL', 1.0)
+        app.config.setdefault('AUDIT_MAX_BUFFER', 50000)
+        app.extensions['audit_log'] = self
+
+        # The session hooks are global; register them once however many
+        # apps are created
+        if not event.contains(db.session, 'after_commit', self._after_commit):
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_rollback', self._after_rollback)
+            atexit.register(self.close)
+
+    def subscribe(self, callback):
+        """Call callback (with no arguments) after each batch is written"""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def record(self, event_type, consent=None, transmission=None, detail=None):
+        """Add a log entry for a consent (and transmission) to the session"""
+        row = {
+            **EMPTY_ROW,
+            'event_type': event_type,
+            'consent_id': consent.id if consent is not None else transmission.consent_id,
+            'consent_status': _status(consent.status) if consent is not None else None,
+            'occurred_at': datetime.utcnow(),
+        }
+        if transmission is not None:
+            row.update({
+                'transmission_id': transmission.id,
+                'transmission_status': _status(transmission.status),
+                'method': _status(transmission.method),
+                'recipient': transmission.recipient,
+                'attempts': transmission.attempts,
+                'detail': detail or transmission.error_message,
+            })
+        elif detail:
+            row['detail'] = detail
+        db.session.info.setdefault('audit_pending', []).append(row)
+
+    def record_many(self, rows):
+        """Add log entries given as dicts of ConsentEvent columns to the session"""
+        now = datetime.utcnow()
+        pending = db.session.info.setdefault('audit_pending', [])
+        pending.extend({**EMPTY_ROW, 'occurred_at': now, **row} for row in rows)
+
+    def _after_commit(self, session):
+        rows = session.info.pop('audit_pending', None)
+        if not rows:
+            return
+        with self._lock:
+            self._buffer.extend(rows)
+            size = len(self._buffer)
+        self.start(current_app._get_current_object())
+        if self.flusher is None or size >= current_app.config['AUDIT_MAX_BUFFER']:
+            # The flusher is falling behind: apply backpressure to the writer.
+            # While the database refuses writes, commits fail too, so the
+            # buffer stops growing
+            self.flush_all()
+        elif size >= current_app.config['AUDIT_BATCH_SIZE']:
+            self.flusher.wake()
+
+    def _after_rollback(self, session):
+        session.info.pop('audit_pending', None)
+
+    def start(self, app):
+        """Start the flusher for this process if it is not running yet"""
+        if self._pid == os.getpid() or app.testing:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.flusher = AuditFlusher(app, app.config['AUDIT_FLUSH_INTERVAL'], self)
+            self.flusher.start()
+            self._pid = os.getpid()
+
+    def flush(self, limit=None):
+        """Write up to one batch of buffered entries, returning how many.
+
+        Uses its own connection so it neither joins nor commits the
+        caller's transaction. Entries are put back if the insert fails.
+        """
+        limit = limit or current_app.config['AUDIT_BATCH_SIZE']
+        with self._flush_lock:
+            with self._lock:
+                rows = [self._buffer.popleft() for _ in range(min(limit, len(self._buffer)))]
+            if not rows:
+                return 0
+            # created_at is the write time, which the change feed settles
+            # on (see EventService.events_after), not the change's
+            now = datetime.utcnow()
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(insert(ConsentEvent), [{**row, 'created_at': now} for row in rows])
+            except Exception as e:
+                logger.error("Error writing %s log entries, will retry: %s", len(rows), e)
+                with self._lock:
+                    self._buffer.extendleft(reversed(rows))
+                return 0
+        for callback in self._listeners:
+            callback()
+        return len(rows)
+
+    def flush_all(self):
+        """Write every buffered entry"""
+        while self.flush():
+            pass
+
+    def pending_for(self, consent_id):
+        """Get this process's committed but unwritten entries for a consent"""
+        with self._lock:
+            return [row for row in self._buffer if row['consent_id'] == consent_id]
+
+    def history(self, consent_id):
+        """Get the audit trail of a consent, newest first.
+
+        One range scan of the (consent_id, occurred_at) index, plus the
+        entries this process has not written yet.
+        """
+        events = ConsentEvent.query.filter(ConsentEvent.consent_id == consent_id)\
+                                   .order_by(ConsentEvent.occurred_at.desc(), ConsentEvent.id.desc())\
+                                   .all()
+        history = [event.to_dict(ConsentEvent.AUDIT_FIELDS) for event in events]
+        pending = [{'id': None, **row, 'occurred_at': row['occurred_at'].isoformat()}
+                   for row in self.pending_for(consent_id)]
+        return list(reversed(pending)) + history
+
+    def close(self):
+        """Stop the flusher and write everything still buffered"""
+        flusher, self.flusher = self.flusher, None
+        self._pid = None
+        if flusher is None:
+            return
+        flusher.stop()
+        with flusher.app.app_context():
+            self.flush_all()
+        if self._buffer:
+            logger.error("%s log entries could not be written on shutdown", len(self._buffer))
+
+audit_log = AuditLog()
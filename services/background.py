@@ -0,0 +1,46 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class BackgroundWorker(threading.Thread):
+    """Daemon thread that repeatedly runs a unit of work inside an app context.
+
+    Subclasses implement run_once(), returning True when it did some work so
+    it is called again straight away. Otherwise the worker sleeps for
+    `interval` seconds or until wake() is called.
+    """
+
+    def __init__(self, app, interval, name=None):
+        super().__init__(name=name, daemon=True)
+        self.app = app
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+
+    def run_once(self):
+        raise NotImplementedError
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                with self.app.app_context():
+                    did_work = self.run_once()
+            except Exception as e:
+                logger.error("Error in background worker %s: %s", self.name, e)
+                did_work = False
+
+            if not did_work:
+                self._wake_event.wait(self.interval)
+                self._wake_event.clear()
+
+    def wake(self):
+        """Cut the current sleep short"""
+        self._wake_event.set()
+
+    def stop(self, timeout=None):
+        """Ask the worker to exit and wait for it"""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self.is_alive():
+            self.join(timeout)
@@ -0,0 +1,128 @@
+import os
+import re
+import uuid
+import hashlib
+import logging
+from flask import current_app
+from sqlalchemy import delete, update
+from models import Blob
+from services.db_utils import dialect_insert
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+THUMBNAIL_EXT = '.png'
+DIGEST_PATTERN = re.compile(r'^([0-9a-f]{64})')
+
+class BlobStore:
+    """Content-addressed storage for uploaded and signed documents.
+
+    Each distinct file is stored once under UPLOAD_FOLDER, sharded by the
+    first two byte pairs of its SHA-256 (uploads/ab/cd/abcd...pdf). The blobs
+    table counts how many uploads and signed copies refer to each file, and
+    the file, and its first-page thumbnail if one was rendered, are removed
+    when the last reference is released.
+    """
+
+    @staticmethod
+    def blob_path(digest, ext='.pdf'):
+        """Get the storage path of a blob"""
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        return os.path.join(upload_folder, digest[:2], digest[2:4], f"{digest}{ext}")
+
+    @staticmethod
+    def digest_from_path(path):
+        """Get the content digest encoded in a blob or signed file name"""
+        match = DIGEST_PATTERN.match(os.path.basename(path or ''))
+        return match.group(1) if match else None
+
+    @staticmethod
+    def temp_path():
+        """Get a fresh temporary path on the same filesystem as the blobs"""
+        temp_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], '.tmp')
+        os.makedirs(temp_folder, exist_ok=True)
+        return os.path.join(temp_folder, uuid.uuid4().hex)
+
+    @staticmethod
+    def write_stream(stream):
+        """Copy a stream to a temporary file, hashing it on the way.
+
+        Returns the temporary path, the SHA-256 hex digest and the size.
+        """
+        temp_path = BlobStore.temp_path()
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(temp_path, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return temp_path, digest.hexdigest(), size
+
+    @staticmethod
+    def ingest(temp_path, digest, size, ext='.pdf'):
+        """Move a hashed temporary file into the store and take a reference.
+
+        If the content is already stored the temporary file is discarded.
+        Returns the blob path.
+        """
+        # Take the reference first so a concurrent release cannot collect
+        # the blob between the existence check and the reference
+        BlobStore.add_ref(digest, size)
+
+        path = BlobStore.blob_path(digest, ext)
+        if os.path.exists(path):
+            os.remove(temp_path)
+            logger.info("Deduplicated upload into existing blob %s", digest)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+
+        return path
+
+    @staticmethod
+    def add_ref(digest, size, commit=True):
+        """Increment the reference count of a blob, creating its row if needed.
+
+        A single upsert, so concurrent callers cannot race on the insert and
+        commit=False can leave it in a larger transaction.
+        """
+        db.session.execute(
+            dialect_insert(Blob).values(sha256=digest, size=size, ref_count=1)
+                                .on_conflict_do_update(index_elements=['sha256'],
+                                                       set_={'ref_count': Blob.ref_count + 1})
+        )
+        if commit:
+            db.session.commit()
+
+    @staticmethod
+    def release(digest):
+        """Drop one reference to a blob, deleting it when none remain.
+
+        Returns True when the blob was garbage collected.
+        """
+        db.session.execute(
+            update(Blob).where(Blob.sha256 == digest, Blob.ref_count > 0)
+                        .values(ref_count=Blob.ref_count - 1)
+        )
+        collected = db.session.execute(
+            delete(Blob).where(Blob.sha256 == digest, Blob.ref_count == 0)
+        ).rowcount > 0
+        db.session.commit()
+
+        if collected:
+            for path in (BlobStore.blob_path(digest), BlobStore.blob_path(digest, THUMBNAIL_EXT)):
+                if os.path.exists(path):
+                    os.remove(path)
+            logger.info("Blob %s garbage collected", digest)
+        return collected
@@ -0,0 +1,153 @@
+import random
+import logging
+import threading
+from collections import OrderedDict
+from werkzeug.utils import import_string
+from models import CacheGeneration
+from services.db_utils import dialect_insert
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+CONSENTS = 'consents'
+TRANSMISSIONS = 'transmissions'
+
+class CacheBackend:
+    """Storage for cached responses.
+
+    Implement get/set/clear to plug in a shared cache such as Redis; the
+    backend only needs to honour max_entries on a best-effort basis.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.evictions = 0
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        return 0
+
+class LRUCacheBackend(CacheBackend):
+    """In-process least-recently-used cache"""
+
+    def __init__(self, max_entries=1024):
+        super().__init__(max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class ResponseCache:
+    """Read-through cache for list responses with write-driven invalidation.
+
+    Entries are keyed by namespace, the namespace's current generation and a
+    request key. Write paths call bump() before committing, which moves the
+    namespace to a new generation in the same transaction, so a reader can
+    never be served an entry computed before a committed write, whichever
+    process made it.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.enabled = False
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_ENABLED', True)
+        app.config.setdefault('CACHE_BACKEND', 'services.cache_service.LRUCacheBackend')
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+
+        backend_class = app.config['CACHE_BACKEND']
+        if isinstance(backend_class, str):
+            backend_class = import_string(backend_class)
+        self.backend = backend_class(app.config['CACHE_MAX_ENTRIES'])
+        self.enabled = app.config['CACHE_ENABLED']
+        app.extensions['response_cache'] = self
+
+    def generation(self, namespace):
+        """Get the current generation of a namespace, None if never written"""
+        return db.session.query(CacheGeneration.generation)\
+                         .filter(CacheGeneration.namespace == namespace)\
+                         .scalar()
+
+    def bump(self, *namespaces):
+        """Invalidate namespaces as part of the caller's open transaction"""
+        for namespace in namespaces:
+            # New rows start at a random generation so that entries cached
+            # against a since-recreated database can never match
+            stmt = dialect_insert(CacheGeneration).values(
+                namespace=namespace,
+                generation=random.getrandbits(48)
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[CacheGeneration.namespace],
+                set_={'generation': CacheGeneration.generation + 1}
+            )
+            db.session.execute(stmt)
+
+    def get_or_compute(self, namespace, key, compute):
+        """Return the cached value for key, computing and storing it on a miss"""
+        if not self.enabled or self.backend is None:
+            return compute()
+
+        generation = self.generation(namespace)
+        if generation is None:
+            # Nothing has been written yet, so there is no generation to key on
+            return compute()
+
+        cache_key = f"{namespace}:{generation}:{key}"
+        value = self.backend.get(cache_key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        with self._lock:
+            self.misses += 1
+        value = compute()
+        self.backend.set(cache_key, value)
+        return value
+
+    def stats(self):
+        """Get hit/miss/eviction counters"""
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.backend.evictions if self.backend else 0,
+            'entries': len(self.backend) if self.backend else 0
+        }
+
+response_cache = ResponseCache()
@@ -1,17 +1,35 @@
 import logging
 from datetime import datetime
 from models import Consent, Transmission, ConsentStatus, DeliveryMethod, TransmissionStatus
+from flask import current_app
+from sqlalchemy import insert
+from services.cache_service import response_cache, CONSENTS, TRANSMISSIONS
+from services.delivery_service import delivery_pool
+from services.event_service import EventService
 from services.file_service import FileService
-from app import db
+from services.pagination import DEFAULT_PAGE_SIZE, keyset_page
+from services.stats_service import StatsService
+from extensions import db
 
 logger = logging.getLogger(__name__)
 
+# Patient contact field used as the recipient for each delivery method
+RECIPIENT_FIELDS = {
+    DeliveryMethod.EMAIL: 'patient_email',
+    DeliveryMethod.SMS: 'patient_phone',
+    DeliveryMethod.FAX: 'patient_fax',
+}
+
 class ConsentService:
     """Service for handling consent operations"""
     
     @staticmethod
     def send_consent(consent, method, recipient):
-        """Send consent form to patient via specified method"""
+        """Queue a consent form for delivery to the patient.
+        
+        The transmission is stored as PENDING and handed to the delivery
+        workers, so gateway latency and retries stay off the request thread.
+        """
         try:
             # Create transmission record
             transmission = Transmission()
@@ -23,64 +41,206 @@ class ConsentService:
             db.session.add(transmission)
             
             # Update consent status and sent timestamp
+            StatsService.consent_transition(consent.status, ConsentStatus.SENT)
+            StatsService.transmission_transition(method, None, TransmissionStatus.PENDING)
             consent.status = ConsentStatus.SENT
             consent.sent_at = datetime.utcnow()
             
-            # Simulate sending (in real implementation, this would integrate with actual services)
-            transmission.status = TransmissionStatus.SENT
-            transmission.sent_at = datetime.utcnow()
-            
+            db.session.flush()
+            EventService.record('consent.sent', consent, transmission)
+            response_cache.bump(CONSENTS, TRANSMISSIONS)
             db.session.commit()
+            delivery_pool.notify()
             
-            logger.info(f"Consent {consent.id} sent via {method.value} to {recipient}")
+            logger.info("Consent %s queued for %s delivery", consent.id, method.value,
+                        extra={'consent_id': consent.id, 'transmission_id': transmission.id})
             
             return transmission
             
         except Exception as e:
-            logger.error(f"Error sending consent: {str(e)}")
+            logger.error("Error sending consent: %s", e)
             db.session.rollback()
             raise
     
     @staticmethod
-    def complete_signature(consent):
-        """Complete the signature process for a consent"""
+    def batch_send(form_name, file_path, method, patients):
+        """Create and queue one consent per patient for the same form.
+        
+        Rows are written with bulk INSERT ... RETURNING statements, one
+        transaction per BATCH_SEND_CHUNK_SIZE patients, so a failed chunk
+        does not roll back the chunks before it.
+        Returns one result per patient, in request order.
+        """
+        recipient_field = RECIPIENT_FIELDS[method]
+        chunk_size = current_app.config['BATCH_SEND_CHUNK_SIZE']
+        results = [None] * len(patients)
+        
+        # Validate every row up front so only good rows reach the database
+        valid = []
+        for index, patient in enumerate(patients):
+            if not isinstance(patient, dict) or not patient.get('patient_name'):
+                results[index] = {'index': index, 'error': 'patient_name is required'}
+                continue
+            recipient = patient.get('recipient') or patient.get(recipient_field)
+            if not recipient:
+                results[index] = {'index': index, 'error': f'recipient or {recipient_field} is required'}
+                continue
+            valid.append((index, patient, recipient))
+        
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            now = datetime.utcnow()
+            try:
+                consent_ids = db.session.scalars(
+                    insert(Consent).returning(Consent.id, sort_by_parameter_order=True),
+                    [{
+                        'patient_name': patient['patient_name'],
+                        'patient_email': patient.get('patient_email'),
+                        'patient_phone': patient.get('patient_phone'),
+                        'patient_fax': patient.get('patient_fax'),
+                        'form_name': form_name,
+                        'file_path': file_path,
+                        'status': ConsentStatus.SENT,
+                        'created_at': now,
+                        'sent_at': now,
+                    } for _, patient, _ in chunk]
+                ).all()
+                
+                transmission_ids = db.session.scalars(
+                    insert(Transmission).returning(Transmission.id, sort_by_parameter_order=True),
+                    [{
+                        'consent_id': consent_id,
+                        'method': method,
+                        'recipient': recipient,
+                        'status': TransmissionStatus.PENDING,
+                        'created_at': now,
+                    } for consent_id, (_, _, recipient) in zip(consent_ids, chunk)]
+                ).all()
+                
+                EventService.record_many([{
+                    'event_type': 'consent.sent',
+                    'consent_id': consent_id,
+                    'transmission_id': transmission_id,
+                    'consent_status': ConsentStatus.SENT.value,
+                    'transmission_status': TransmissionStatus.PENDING.value,
+                    'method': method.value,
+                    'recipient': recipient,
+                    'attempts': 0,
+                } for consent_id, transmission_id, (_, _, recipient) in zip(consent_ids, transmission_ids, chunk)])
+                StatsService.consent_transition(None, ConsentStatus.SENT, count=len(consent_ids), when=now)
+                StatsService.transmission_transition(method, None, TransmissionStatus.PENDING,
+                                                     count=len(transmission_ids), when=now)
+                response_cache.bump(CONSENTS, TRANSMISSIONS)
+                db.session.commit()
+                
+            except Exception as e:
+                logger.error("Error in batch send chunk at row %s: %s", chunk[0][0], e)
+                db.session.rollback()
+                for index, _, _ in chunk:
+                    results[index] = {'index': index, 'error': 'Failed to queue consent'}
+                continue
+            
+            for (index, _, _), consent_id, transmission_id in zip(chunk, consent_ids, transmission_ids):
+                results[index] = {
+                    'index': index,
+                    'consent_id': consent_id,
+                    'transmission_id': transmission_id,
+                    'status': TransmissionStatus.PENDING.value
+                }
+            delivery_pool.notify()
+        
+        logger.info("Batch send of %s via %s: %s of %s rows valid",
+                    form_name, method.value, len(valid), len(patients))
+        
+        return results
+    
+    @staticmethod
+    def complete_signature(consent, signed_at=None, commit=True):
+        """Complete the signature process for a consent.
+        
+        signed_at defaults to now. With commit=False the changes are left in
+        the session so a caller can apply many signatures in one transaction;
+        the caller then commits.
+        """
         try:
             # Move file to signed directory
-            signed_path = FileService.move_to_signed(consent.file_path, consent.id)
+            signed_path = FileService.move_to_signed(consent.file_path, consent.id, commit=commit,
+                                                     recorded_path=consent.signed_file_path)
             
             # Update consent record
+            signed_at = signed_at or datetime.utcnow()
+            StatsService.consent_transition(consent.status, ConsentStatus.SIGNED, when=signed_at)
             consent.status = ConsentStatus.SIGNED
-            consent.signed_at = datetime.utcnow()
+            consent.signed_at = signed_at
             consent.signed_file_path = signed_path
             
-            # Update any pending transmissions to delivered
+            # Settle outstanding transmissions as delivered: sent ones reached
+            # the patient, and queued ones no longer need sending. Releasing
+            # the lease drops the outcome of a worker still sending one.
             for transmission in consent.transmissions:
-                if transmission.status == TransmissionStatus.SENT:
+                if transmission.status in (TransmissionStatus.SENT, TransmissionStatus.PENDING):
+                    StatsService.transmission_transition(transmission.method, transmission.status,
+                                                         TransmissionStatus.DELIVERED)
                     transmission.status = TransmissionStatus.DELIVERED
                     transmission.delivered_at = datetime.utcnow()
+                    transmission.locked_until = None
+                    transmission.next_attempt_at = None
+                    EventService.record('transmission.delivered', consent, transmission)
             
+            EventService.record('consent.signed', consent)
+            if not commit:
+                return consent
+            response_cache.bump(CONSENTS, TRANSMISSIONS)
             db.session.commit()
             
-            logger.info(f"Signature completed for consent {consent.id}")
+            logger.info("Signature completed for consent %s", consent.id, extra={'consent_id': consent.id})
             
             return consent
             
         except Exception as e:
-            logger.error(f"Error completing signature: {str(e)}")
+            logger.error("Error completing signature: %s", e)
             db.session.rollback()
             raise
     
     @staticmethod
-    def get_outgoing_consents():
-        """Get all consents that have been sent but not signed"""
-        return Consent.query.filter(Consent.status == ConsentStatus.SENT).all()
+    def list_consents(status=None, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None):
+        """Get one page of consents, newest first.
+        
+        Only the requested fields (plus the pagination key) are selected,
+        as plain row tuples rather than ORM instances. Each row holds the
+        values of `fields` (Consent.SERIALIZABLE_FIELDS by default) in order,
+        so dict(zip(fields, row)) gives the serialized consent.
+        Returns the rows and the cursor of the next page.
+        """
+        fields = list(fields or Consent.SERIALIZABLE_FIELDS)
+        columns = fields + [column for column in ('created_at', 'id') if column not in fields]
+        query = db.session.query(*[getattr(Consent, column) for column in columns])
+        if status:
+            query = query.filter(Consent.status == status)
+        
+        return keyset_page(query, Consent.created_at, Consent.id, limit, cursor)
+    
+    @staticmethod
+    def get_outgoing_consents(limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None):
+        """Get a page of consents that have been sent but not signed"""
+        return ConsentService.list_consents(ConsentStatus.SENT, limit, cursor, fields)
     
     @staticmethod
-    def get_received_consents():
-        """Get all consents that have been signed"""
-        return Consent.query.filter(Consent.status == ConsentStatus.SIGNED).all()
+    def get_received_consents(limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None):
+        """Get a page of consents that have been signed"""
+        return ConsentService.list_consents(ConsentStatus.SIGNED, limit, cursor, fields)
     
     @staticmethod
-    def get_transmission_history():
-        """Get all transmission attempts"""
-        return Transmission.query.order_by(Transmission.created_at.desc()).all()
+    def get_transmission_history(limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """Get a page of transmission attempts, newest first.
+        
+        Each row is a tuple of the Transmission.SERIALIZABLE_FIELDS values
+        followed by the consent's patient_name, fetched with a single joined
+        query.
+        Returns the rows and the cursor of the next page.
+        """
+        query = db.session.query(*[getattr(Transmission, column) for column in Transmission.SERIALIZABLE_FIELDS],
+                                 Consent.patient_name)\
+                          .join(Consent, Transmission.consent_id == Consent.id)
+        
+        return keyset_page(query, Transmission.created_at, Transmission.id, limit, cursor)
@@ -0,0 +1,23 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+from extensions import db
+
+def dialect_insert(model):
+    """Get an INSERT construct supporting ON CONFLICT for the current database"""
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def unindexed(column):
+    """Keep a filter on `column` from driving the query plan.
+
+    Without ANALYZE statistics SQLite assumes an equality on an indexed
+    column matches a handful of rows, so a status recheck can be chosen
+    over the primary key and scan every row in that status. SQLite does not
+    use an index for a term under unary +; other databases plan on their
+    own statistics and get the column unchanged.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        return UnaryExpression(column, operator=operators.custom_op('+'), type_=column.type)
+    return column
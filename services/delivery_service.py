@@ -0,0 +1,305 @@
+import os
+import random
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_, select, update
+from models import Consent, ConsentStatus, Transmission, TransmissionStatus
+from services.background import BackgroundWorker
+from services.cache_service import response_cache, TRANSMISSIONS
+from services.event_service import EventService
+from services.expiry_service import EXPIRED_MESSAGE
+from services.stats_service import StatsService
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+class DeliveryError(Exception):
+    """Raised by a delivery adapter when the gateway rejects a transmission"""
+
+class DeliveryAdapter:
+    """Base class for the gateways that actually deliver a consent form.
+
+    One adapter is registered per DeliveryMethod. send() must raise
+    DeliveryError (or any exception) when delivery fails.
+    """
+
+    def send(self, transmission):
+        raise NotImplementedError
+
+class FakeGateway(DeliveryAdapter):
+    """Local stand-in for an email/SMS/fax gateway with configurable latency"""
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def send(self, transmission):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise DeliveryError(f"Simulated {transmission.method.value} gateway failure")
+
+class DeliveryService:
+    """Service for the asynchronous delivery queue.
+
+    Transmissions are enqueued as PENDING rows. Workers claim them with a
+    lease (locked_until), dispatch them through the adapter registered for
+    their method and either mark them SENT or reschedule them with
+    exponential backoff until DELIVERY_MAX_ATTEMPTS is reached.
+    """
+
+    adapters = {}
+
+    @staticmethod
+    def register_adapter(method, adapter):
+        """Route transmissions of the given DeliveryMethod through adapter"""
+        DeliveryService.adapters[method] = adapter
+
+    @staticmethod
+    def get_adapter(method):
+        """Get the adapter for a method, defaulting to the fake gateway"""
+        adapter = DeliveryService.adapters.get(method)
+        if adapter is None:
+            adapter = FakeGateway(latency=current_app.config['DELIVERY_GATEWAY_LATENCY'])
+            DeliveryService.adapters[method] = adapter
+        return adapter
+
+    @staticmethod
+    def backoff_delay(attempts):
+        """Seconds to wait before retrying after the given number of attempts"""
+        base = current_app.config['DELIVERY_BACKOFF_SECONDS']
+        return min(base * 2 ** (attempts - 1), current_app.config['DELIVERY_BACKOFF_MAX_SECONDS'])
+
+    @staticmethod
+    def claim_pending(limit):
+        """Atomically claim up to `limit` due transmissions for this worker.
+
+        Postgres uses SELECT ... FOR UPDATE SKIP LOCKED so concurrent workers
+        never wait on each other's rows. Other databases claim with a single
+        conditional UPDATE ... RETURNING, which is atomic on SQLite.
+
+        A claim counts the attempt, which cached transmission lists show, so
+        it bumps their generation in the same transaction. Polls that claim
+        nothing write nothing.
+        """
+        now = datetime.utcnow()
+        lease = now + timedelta(seconds=current_app.config['DELIVERY_LEASE_SECONDS'])
+        claimable = (
+            Transmission.status == TransmissionStatus.PENDING,
+            or_(Transmission.next_attempt_at.is_(None), Transmission.next_attempt_at <= now),
+            or_(Transmission.locked_until.is_(None), Transmission.locked_until < now),
+        )
+
+        if db.engine.dialect.name == 'postgresql':
+            claimed = Transmission.query.filter(*claimable)\
+                                        .order_by(Transmission.id)\
+                                        .limit(limit)\
+                                        .with_for_update(skip_locked=True)\
+                                        .all()
+            for transmission in claimed:
+                transmission.locked_until = lease
+                transmission.attempts = (transmission.attempts or 0) + 1
+            if claimed:
+                response_cache.bump(TRANSMISSIONS)
+            db.session.commit()
+            return claimed
+
+        candidates = select(Transmission.id).where(*claimable)\
+                                            .order_by(Transmission.id)\
+                                            .limit(limit)\
+                                            .scalar_subquery()
+        claimed_ids = db.session.execute(
+            update(Transmission)
+            .where(Transmission.id.in_(candidates), *claimable)
+            .values(locked_until=lease, attempts=Transmission.attempts + 1)
+            .returning(Transmission.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        if claimed_ids:
+            response_cache.bump(TRANSMISSIONS)
+        db.session.commit()
+
+        if not claimed_ids:
+            return []
+        return Transmission.query.filter(Transmission.id.in_(claimed_ids))\
+                                 .order_by(Transmission.id).all()
+
+    @staticmethod
+    def dispatch(transmission, lease=None):
+        """Send one claimed transmission and record the outcome.
+
+        lease is the locked_until the transmission was claimed with, by
+        default its current one. The outcome is only written while that
+        lease is still held: if the send outlasted it and another worker
+        claimed the transmission again, this worker's outcome is dropped.
+        Returns whether the transmission was sent.
+        """
+        lease = lease or transmission.locked_until
+        # The expiry sweep leaves leased transmissions to their worker, so
+        # one whose consent expired meanwhile is failed here instead of sent,
+        # and one whose consent was signed meanwhile is not sent either
+        consent_status = db.session.scalar(select(Consent.status).where(Consent.id == transmission.consent_id))
+        if consent_status == ConsentStatus.EXPIRED:
+            DeliveryService.record_expired(transmission, lease)
+            return False
+        if consent_status == ConsentStatus.SIGNED:
+            DeliveryService._settle(transmission, lease, 'transmission.delivered',
+                                    status=TransmissionStatus.DELIVERED, delivered_at=datetime.utcnow(),
+                                    next_attempt_at=None)
+            return False
+
+        try:
+            DeliveryService.get_adapter(transmission.method).send(transmission)
+        except Exception as e:
+            DeliveryService.record_failure(transmission, str(e), lease)
+            return False
+
+        if not DeliveryService._settle(transmission, lease, 'transmission.sent',
+                                       status=TransmissionStatus.SENT, sent_at=datetime.utcnow(),
+                                       error_message=None):
+            return False
+
+        logger.info("Transmission %s sent via %s", transmission.id, transmission.method.value,
+                    extra={'transmission_id': transmission.id, 'consent_id': transmission.consent_id})
+        return True
+
+    @staticmethod
+    def record_expired(transmission, lease=None):
+        """Fail a transmission of an expired consent without sending it"""
+        if not DeliveryService._settle(transmission, lease or transmission.locked_until, 'transmission.failed',
+                                       status=TransmissionStatus.FAILED, error_message=EXPIRED_MESSAGE,
+                                       next_attempt_at=None):
+            return
+
+        logger.info("Transmission %s not sent: its consent expired", transmission.id,
+                    extra={'transmission_id': transmission.id, 'consent_id': transmission.consent_id})
+
+    @staticmethod
+    def record_failure(transmission, error_message, lease=None):
+        """Reschedule a failed transmission, or fail it once out of attempts"""
+        lease = lease or transmission.locked_until
+
+        if transmission.attempts >= current_app.config['DELIVERY_MAX_ATTEMPTS']:
+            if DeliveryService._settle(transmission, lease, 'transmission.failed',
+                                       status=TransmissionStatus.FAILED, error_message=error_message):
+                logger.warning("Transmission %s failed after %s attempts: %s",
+                               transmission.id, transmission.attempts, error_message,
+                               extra={'transmission_id': transmission.id, 'consent_id': transmission.consent_id})
+        else:
+            delay = DeliveryService.backoff_delay(transmission.attempts)
+            if DeliveryService._settle(transmission, lease, 'transmission.retrying',
+                                       next_attempt_at=datetime.utcnow() + timedelta(seconds=delay),
+                                       error_message=error_message):
+                logger.info("Transmission %s attempt %s failed, retrying in %ss: %s",
+                            transmission.id, transmission.attempts, delay, error_message,
+                            extra={'transmission_id': transmission.id, 'consent_id': transmission.consent_id})
+
+    @staticmethod
+    def _settle(transmission, lease, event_type, **values):
+        """Commit the outcome of a claimed transmission and release its lease.
+
+        The update is conditional on the lease, like an upload chunk's
+        offset claim. Returns False, having written nothing, when the lease
+        ran out and another worker has the transmission now.
+        """
+        old_status = transmission.status
+        settled = db.session.execute(
+            update(Transmission)
+            .where(Transmission.id == transmission.id, Transmission.locked_until == lease)
+            .values(locked_until=None, **values)
+            .execution_options(synchronize_session='fetch')
+        ).rowcount == 1
+        if not settled:
+            db.session.rollback()
+            logger.warning("Transmission %s lost its lease before its outcome was recorded; dropping %s",
+                           transmission.id, event_type,
+                           extra={'transmission_id': transmission.id, 'consent_id': transmission.consent_id})
+            return False
+
+        StatsService.transmission_transition(transmission.method, old_status, transmission.status)
+        EventService.record(event_type, None, transmission)
+        response_cache.bump(TRANSMISSIONS)
+        db.session.commit()
+        return True
+
+    @staticmethod
+    def process_pending(limit=None):
+        """Claim and dispatch one batch of due transmissions.
+
+        Returns the number of transmissions that were attempted.
+        """
+        limit = limit or current_app.config['DELIVERY_BATCH_SIZE']
+        claimed = DeliveryService.claim_pending(limit)
+        # Each outcome's commit expires the other rows, so their leases are
+        # read now, before a late one could be replaced by another worker's
+        leases = [transmission.locked_until for transmission in claimed]
+        for transmission, lease in zip(claimed, leases):
+            DeliveryService.dispatch(transmission, lease)
+        return len(claimed)
+
+class DeliveryWorker(BackgroundWorker):
+    """Worker thread that drains the delivery queue"""
+
+    def run_once(self):
+        return DeliveryService.process_pending() > 0
+
+class DeliveryWorkerPool:
+    """Pool of delivery worker threads, started lazily in each process.
+
+    Workers are started on the first request a process serves rather than at
+    import time, so pre-forked servers get their own threads per worker.
+    """
+
+    def __init__(self):
+        self.workers = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('DELIVERY_WORKERS', 2)
+        app.config.setdefault('DELIVERY_BATCH_SIZE', 10)
+        app.config.setdefault('DELIVERY_POLL_INTERVAL', 1.0)
+        app.config.setdefault('DELIVERY_LEASE_SECONDS', 60)
+        app.config.setdefault('DELIVERY_MAX_ATTEMPTS', 5)
+        app.config.setdefault('DELIVERY_BACKOFF_SECONDS', 2)
+        app.config.setdefault('DELIVERY_BACKOFF_MAX_SECONDS', 300)
+        app.config.setdefault('DELIVERY_GATEWAY_LATENCY', 0.0)
+        app.extensions['delivery_pool'] = self
+
+        @app.before_request
+        def start_delivery_workers():
+            if not app.testing:
+                self.start(app)
+
+    def start(self, app, count=None):
+        """Start the worker threads for this process if not already running"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            count = app.config['DELIVERY_WORKERS'] if count is None else count
+            self.workers = [
+                DeliveryWorker(app, app.config['DELIVERY_POLL_INTERVAL'], name=f"delivery-worker-{i}")
+                for i in range(count)
+            ]
+            for worker in self.workers:
+                worker.start()
+            self._pid = os.getpid()
+            logger.info("Started %s delivery workers", count)
+
+    def notify(self):
+        """Wake idle workers so newly enqueued transmissions go out immediately"""
+        for worker in self.workers:
+            worker.wake()
+
+    def stop(self, timeout=None):
+        for worker in self.workers:
+            worker.stop(timeout)
+        self.workers = []
+        self._pid = None
+
+delivery_pool = DeliveryWorkerPool()
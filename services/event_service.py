@@ -0,0 +1,227 @@
+import os
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from flask import current_app
+from models import ConsentEvent
+from services.audit_service import audit_log
+from services.background import BackgroundWorker
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+class EventService:
+    """Service for the consent change feed.
+
+    State changes are recorded in the audit log (services/audit_service.py),
+    which writes them to the ConsentEvent table in batches once their
+    transaction has committed. The feed reads that table in id order, so
+    clients can resume from the last id they saw.
+    """
+
+    @staticmethod
+    def record(event_type, consent, transmission=None):
+        """Add a change event for a consent (and transmission) to the session"""
+        audit_log.record(event_type, consent, transmission)
+
+    @staticmethod
+    def record_many(rows):
+        """Add change events given as dicts of ConsentEvent columns to the session"""
+        audit_log.record_many(rows)
+
+    @staticmethod
+    def events_after(event_id, limit=500):
+        """Get settled events newer than event_id, oldest first.
+
+        Ids are assigned at insert but become visible at commit, so on a
+        database with concurrent writers an event can commit after one with
+        a higher id and be skipped by a reader resuming from that id. Only
+        events older than EVENT_SETTLE_SECONDS are returned, up to the first
+        newer one; any transaction still open behind them would have to
+        have taken longer than that between its insert and its commit.
+        """
+        events = ConsentEvent.query.filter(ConsentEvent.id > event_id)\
+                                   .order_by(ConsentEvent.id)\
+                                   .limit(limit).all()
+        horizon = EventService.settle_horizon()
+        if horizon is not None:
+            for index, event in enumerate(events):
+                if event.created_at > horizon:
+                    events = events[:index]
+                    break
+        return [event.to_dict() for event in events]
+
+    @staticmethod
+    def latest_event_id():
+        """Get the id readers can start from without skipping an unsettled event"""
+        recent = db.session.query(ConsentEvent.id, ConsentEvent.created_at)\
+                           .order_by(ConsentEvent.id.desc())\
+                           .limit(current_app.config['EVENT_BUFFER_SIZE']).all()
+        if not recent:
+            return 0
+        horizon = EventService.settle_horizon()
+        if horizon is None:
+            return recent[0].id
+        unsettled = [event_id for event_id, created_at in recent if created_at > horizon]
+        return min(unsettled) - 1 if unsettled else recent[0].id
+
+    @staticmethod
+    def settle_horizon():
+        """Get the creation time events must predate to be read, or None for any"""
+        settle = current_app.config['EVENT_SETTLE_SECONDS']
+        if settle is None:
+            # SQLite runs one write transaction at a time, so its ids
+            # become visible in order
+            settle = 0 if db.engine.dialect.name == 'sqlite' else 2.0
+        if not settle:
+            return None
+        return datetime.utcnow() - timedelta(seconds=settle)
+
+class EventPoller(BackgroundWorker):
+    """Thread that moves new events from the database into the broker"""
+
+    def __init__(self, app, interval, broker):
+        super().__init__(app, interval, name='event-poller')
+        self.broker = broker
+
+    def run_once(self):
+        return self.broker.poll_once()
+
+class EventBroker:
+    """Fans the change feed out to the streaming clients of one process.
+
+    A single poller thread per process reads new events with one indexed
+    range query and buffers the most recent ones, and waiting clients block
+    on a condition variable, or await a future when served from an event
+    loop. Connected clients therefore cost nothing while
+    nothing changes, however many there are. The audit log calls notify()
+    after writing a batch, so events written in this process go out without
+    waiting for the next poll.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.poller = None
+        self.last_id = 0
+        self._events = deque()
+        self._condition = threading.Condition()
+        self._async_waiters = set()
+        self._streams = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('EVENT_POLL_INTERVAL', 1.0)
+        app.config.setdefault('EVENT_BUFFER_SIZE', 1000)
+        app.config.setdefault('EVENT_HEARTBEAT_SECONDS', 15)
+        app.config.setdefault('EVENT_STREAM_MAX_SECONDS', 300)
+        # None settles events for 2 seconds, except on SQLite where they
+        # are visible in id order anyway
+        app.config.setdefault('EVENT_SETTLE_SECONDS', None)
+        # Streams iterated on a request thread (any WSGI server) hold that
+        # thread while open, so each process serves at most this many and
+        # answers 503 beyond; over ASGI they hold no thread and are not capped
+        app.config.setdefault('EVENT_STREAM_MAX_CLIENTS', 8)
+        app.extensions['event_broker'] = self
+        self.app = app
+        audit_log.subscribe(self.notify)
+
+    def start(self):
+        """Start the poller for this process if it is not running yet"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            with self.app.app_context():
+                self.last_id = EventService.latest_event_id()
+            self._events = deque(maxlen=self.app.config['EVENT_BUFFER_SIZE'])
+            self.poller = EventPoller(self.app, self.app.config['EVENT_POLL_INTERVAL'], self)
+            self.poller.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        if self.poller is not None:
+            self.poller.stop()
+        self.poller = None
+        self._pid = None
+
+    def notify(self):
+        """Wake the poller after new events were written"""
+        if self.poller is not None:
+            self.poller.wake()
+
+    def open_stream(self):
+        """Take one of the EVENT_STREAM_MAX_CLIENTS thread-held stream slots.
+
+        Returns False when they are all in use.
+        """
+        with self._lock:
+            if self._streams >= self.app.config['EVENT_STREAM_MAX_CLIENTS']:
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._lock:
+            self._streams -= 1
+
+    def poll_once(self):
+        events = EventService.events_after(self.last_id)
+        if not events:
+            return False
+        with self._condition:
+            self._events.extend(events)
+            self.last_id = events[-1]['id']
+            self._condition.notify_all()
+            for loop, future in self._async_waiters:
+                try:
+                    loop.call_soon_threadsafe(_wake, future)
+                except RuntimeError:
+                    # The waiter's loop has closed
+                    pass
+        return True
+
+    def wait_for(self, after_id, timeout):
+        """Wait for events newer than after_id.
+
+        Returns the buffered events, an empty list on timeout, or None when
+        after_id is older than the buffer and the caller must backfill from
+        the database.
+        """
+        with self._condition:
+            if after_id < self.last_id:
+                return self._buffered(after_id)
+            self._condition.wait(timeout)
+            return [event for event in self._events if event['id'] > after_id]
+
+    async def wait_for_async(self, after_id, timeout):
+        """Like wait_for, but waiting on the running event loop, not a thread"""
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            if after_id < self.last_id:
+                return self._buffered(after_id)
+            waiter = (loop, loop.create_future())
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._condition:
+                self._async_waiters.discard(waiter)
+        with self._condition:
+            return [event for event in self._events if event['id'] > after_id]
+
+    def _buffered(self, after_id):
+        if not self._events or self._events[0]['id'] > after_id + 1:
+            return None
+        return [event for event in self._events if event['id'] > after_id]
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+event_broker = EventBroker()
@@ -0,0 +1,209 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, or_, select, update
+from models import Consent, Transmission, ConsentStatus, TransmissionStatus
+from services.background import BackgroundWorker
+from services.cache_service import response_cache, CONSENTS, TRANSMISSIONS
+from services.db_utils import unindexed
+from services.event_service import EventService
+from services.stats_service import StatsService
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+EXPIRED_MESSAGE = 'Consent expired before it was signed'
+
+class ExpiryService:
+    """Service that expires consents left unsigned past their time to live.
+
+    The TTL counts from sent_at: CONSENT_TTL_BY_FORM maps form names to
+    their own number of days, and every other form uses CONSENT_TTL_DAYS
+    (None, the default, disables it). Overdue consents are found through the
+    (status, sent_at) index, oldest first, and expired in batches of
+    EXPIRY_BATCH_SIZE, each its own short transaction, so a sweep over a
+    large backlog never holds its locks for longer than one batch.
+    """
+
+    @staticmethod
+    def policy():
+        """Get the (global TTL, per-form TTLs) in days from the config"""
+        return current_app.config['CONSENT_TTL_DAYS'], current_app.config['CONSENT_TTL_BY_FORM']
+
+    @staticmethod
+    def _overdue(now):
+        """Build the filter matching overdue consents, or None without a policy"""
+        default_days, form_days = ExpiryService.policy()
+        cutoffs = {form_name: now - timedelta(days=days) for form_name, days in form_days.items()}
+        default_cutoff = now - timedelta(days=default_days) if default_days is not None else None
+        latest = max(list(cutoffs.values()) + ([default_cutoff] if default_cutoff else []), default=None)
+        if latest is None:
+            return None
+
+        # The range on the index stops at the latest cutoff; the per-form
+        # cutoff then only filters rows already inside that range. The status
+        # comes first so rechecks can swap it for an unindexed one
+        overdue = [Consent.status == ConsentStatus.SENT, Consent.sent_at < latest]
+        if cutoffs:
+            overdue.append(Consent.sent_at < case(cutoffs, value=Consent.form_name, else_=default_cutoff))
+        return overdue
+
+    @staticmethod
+    def expire_batch(limit=None, now=None):
+        """Expire up to `limit` overdue consents and fail their pending transmissions.
+
+        Returns the number of consents expired.
+        """
+        limit = limit or current_app.config['EXPIRY_BATCH_SIZE']
+        now = now or datetime.utcnow()
+        overdue = ExpiryService._overdue(now)
+        if overdue is None:
+            return 0
+
+        # Find the batch and build its events before taking any write lock,
+        # then end the read so the write starts from a fresh snapshot
+        # Status rechecks stay off the status indexes so the id lookups drive the plan
+        pending_only = unindexed(Transmission.status) == TransmissionStatus.PENDING
+        unleased = or_(Transmission.locked_until.is_(None), Transmission.locked_until < now)
+        consent_ids = db.session.scalars(
+            select(Consent.id).where(*overdue).order_by(Consent.sent_at).limit(limit)
+        ).all()
+        pending = db.session.execute(
+            select(Transmission.id, Transmission.consent_id, Transmission.method,
+                   Transmission.recipient, Transmission.attempts)
+            .where(Transmission.consent_id.in_(consent_ids), pending_only, unleased)
+        ).all() if consent_ids else []
+        db.session.commit()
+        if not consent_ids:
+            return 0
+
+        try:
+            # Rows signed, or sent again with a fresh sent_at, since they were
+            # read are skipped
+            expired = set(db.session.execute(
+                update(Consent)
+                .where(Consent.id.in_(consent_ids), unindexed(Consent.status) == ConsentStatus.SENT, *overdue[1:])
+                .values(status=ConsentStatus.EXPIRED)
+                .returning(Consent.id)
+                .execution_options(synchronize_session=False)
+            ).scalars())
+            failed = set(db.session.execute(
+                update(Transmission)
+                .where(Transmission.id.in_([row.id for row in pending]),
+                       Transmission.consent_id.in_(expired), pending_only, unleased)
+                .values(status=TransmissionStatus.FAILED, error_message=EXPIRED_MESSAGE, next_attempt_at=None)
+                .returning(Transmission.id)
+                .execution_options(synchronize_session=False)
+            ).scalars()) if pending and expired else set()
+            if not expired:
+                db.session.rollback()
+                return 0
+            failed = [row for row in pending if row.id in failed]
+
+            EventService.record_many([{
+                'event_type': 'consent.expired',
+                'consent_id': consent_id,
+                'consent_status': ConsentStatus.EXPIRED.value,
+            } for consent_id in consent_ids if consent_id in expired] + [{
+                'event_type': 'transmission.failed',
+                'consent_id': row.consent_id,
+                'transmission_id': row.id,
+                'consent_status': ConsentStatus.EXPIRED.value,
+                'transmission_status': TransmissionStatus.FAILED.value,
+                'method': row.method.value,
+                'recipient': row.recipient,
+                'attempts': row.attempts,
+                'detail': EXPIRED_MESSAGE,
+            } for row in failed])
+
+            StatsService.consent_transition(ConsentStatus.SENT, ConsentStatus.EXPIRED,
+                                            count=len(expired), when=now)
+            for method, count in Counter(row.method for row in failed).items():
+                StatsService.transmission_transition(method, TransmissionStatus.PENDING,
+                                                     TransmissionStatus.FAILED, count=count, when=now)
+
+            response_cache.bump(CONSENTS, TRANSMISSIONS)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        logger.info("Expired %s consents and failed %s pending transmissions", len(expired), len(failed))
+        return len(expired)
+
+    @staticmethod
+    def sweep(now=None, limit=None):
+        """Expire every consent overdue at `now`, batch by batch.
+
+        Pauses EXPIRY_BATCH_PAUSE seconds between batches so other writers
+        waiting on the lock get their turn. Returns the number expired.
+        """
+        now = now or datetime.utcnow()
+        limit = limit or current_app.config['EXPIRY_BATCH_SIZE']
+        total = 0
+        while True:
+            expired = ExpiryService.expire_batch(limit, now)
+            total += expired
+            if expired < limit:
+                return total
+            time.sleep(current_app.config['EXPIRY_BATCH_PAUSE'])
+
+class ExpiryWorker(BackgroundWorker):
+    """Thread that expires overdue consents a batch at a time"""
+
+    def run_once(self):
+        # A full batch means more may be overdue, so carry on after a pause
+        if ExpiryService.expire_batch() < current_app.config['EXPIRY_BATCH_SIZE']:
+            return False
+        self._stop_event.wait(current_app.config['EXPIRY_BATCH_PAUSE'])
+        return True
+
+class ExpirySweeper:
+    """The expiry sweeper thread, started lazily in each process.
+
+    Runs at startup and then every EXPIRY_SWEEP_INTERVAL seconds (0 disables
+    it), once a TTL is configured. Concurrent sweepers in other processes are safe: each batch only
+    updates rows still in the sent status.
+    """
+
+    def __init__(self):
+        self.worker = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('CONSENT_TTL_DAYS', None)
+        app.config.setdefault('CONSENT_TTL_BY_FORM', {})
+        app.config.setdefault('EXPIRY_BATCH_SIZE', 500)
+        app.config.setdefault('EXPIRY_BATCH_PAUSE', 0.05)
+        app.config.setdefault('EXPIRY_SWEEP_INTERVAL', 300)
+        app.extensions['expiry_sweeper'] = self
+
+        @app.before_request
+        def start_expiry_sweeper():
+            if not app.testing and app.config['EXPIRY_SWEEP_INTERVAL'] and \
+                    (app.config['CONSENT_TTL_DAYS'] or app.config['CONSENT_TTL_BY_FORM']):
+                self.start(app)
+
+    def start(self, app):
+        """Start the sweeper thread for this process if not already running"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.worker = ExpiryWorker(app, app.config['EXPIRY_SWEEP_INTERVAL'], name='expiry-sweeper')
+            self.worker.start()
+            self._pid = os.getpid()
+
+    def stop(self, timeout=None):
+        if self.worker is not None:
+            self.worker.stop(timeout)
+        self.worker = None
+        self._pid = None
+
+expiry_sweeper = ExpirySweeper()
@@ -0,0 +1,248 @@
+import io
+import os
+import csv
+import logging
+import zipfile
+from datetime import datetime, timedelta
+from enum import Enum
+from sqlalchemy import select
+from werkzeug.utils import secure_filename
+from database import REPLICA_BIND
+from models import Consent, Transmission, ConsentStatus, DeliveryMethod, TransmissionStatus
+from services.file_service import FileService
+from services.serialization import dumps
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'ndjson', 'zip')
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'zip': 'application/zip',
+}
+CONSENT_DATE_FIELDS = ('created_at', 'sent_at', 'signed_at')
+
+# Rows fetched from the cursor, and document bytes read, per yielded chunk
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_COPY_BUFFER = 256 * 1024
+
+CONSENT_EXPORT_FIELDS = Consent.SERIALIZABLE_FIELDS
+TRANSMISSION_EXPORT_FIELDS = Transmission.SERIALIZABLE_FIELDS + ('patient_name',)
+
+class InvalidExportRequest(ValueError):
+    """Raised when export filters cannot be parsed"""
+
+def parse_date(value, end=False):
+    """Parse an ISO date or datetime bound; a bare end date covers that whole day"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError as e:
+        raise InvalidExportRequest(f'Invalid date: {value}') from e
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+def parse_choice(value, enum, name):
+    if not value:
+        return None
+    try:
+        return enum(value)
+    except ValueError as e:
+        raise InvalidExportRequest(f'Invalid {name}: {value}') from e
+
+def _cell(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable file collecting what zipfile writes to it.
+
+    Being unseekable makes zipfile write each entry's sizes and CRC in a
+    data descriptor after its data, so nothing has to be rewritten later
+    and each chunk can be sent as soon as it is written.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+class ExportService:
+    """Service for bulk exports of consents and transmissions.
+
+    Rows are read from a server-side cursor on a dedicated connection, a
+    chunk at a time, and encoded as they arrive, so an export of any size
+    runs in constant memory. On SQLite the export holds a read transaction
+    for its whole duration, which keeps WAL checkpoints from completing
+    until it finishes.
+    """
+
+    @staticmethod
+    def consent_query(status=None, since=None, until=None, date_field='created_at'):
+        """Select the consents to export, oldest first by date_field"""
+        if date_field not in CONSENT_DATE_FIELDS:
+            raise InvalidExportRequest(f'Invalid date_field: {date_field}')
+        column = getattr(Consent, date_field)
+        stmt = select(*[getattr(Consent, field) for field in CONSENT_EXPORT_FIELDS])
+        if status:
+            stmt = stmt.where(Consent.status == status)
+        if since:
+            stmt = stmt.where(column >= since)
+        if until:
+            stmt = stmt.where(column < until)
+        return stmt.order_by(column, Consent.id)
+
+    @staticmethod
+    def transmission_query(status=None, method=None, since=None, until=None):
+        """Select the transmissions to export with their patient, oldest first"""
+        stmt = select(*[getattr(Transmission, field) for field in Transmission.SERIALIZABLE_FIELDS],
+                      Consent.patient_name)\
+            .join(Consent, Transmission.consent_id == Consent.id)
+        if status:
+            stmt = stmt.where(Transmission.status == status)
+        if method:
+            stmt = stmt.where(Transmission.method == method)
+        if since:
+            stmt = stmt.where(Transmission.created_at >= since)
+        if until:
+            stmt = stmt.where(Transmission.created_at < until)
+        return stmt.order_by(Transmission.created_at, Transmission.id)
+
+    @staticmethod
+    def row_chunks(stmt, chunk_size=EXPORT_CHUNK_ROWS):
+        """Yield the rows of stmt in lists of up to chunk_size.
+
+        Reads from the replica when one is configured.
+        """
+        engine = db.engines.get(REPLICA_BIND) or db.engine
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(stmt)
+            for partition in result.partitions(chunk_size):
+                yield partition
+
+    @staticmethod
+    def csv_chunks(stmt, fields):
+        """Yield the rows of stmt as CSV, header first"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for rows in ExportService.row_chunks(stmt):
+            writer.writerows([_cell(value) for value in row] for row in rows)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+    @staticmethod
+    def ndjson_chunks(stmt, fields):
+        """Yield the rows of stmt as newline-delimited JSON objects"""
+        for rows in ExportService.row_chunks(stmt):
+            yield b''.join(dumps(dict(zip(fields, row))) + b'\n' for row in rows)
+
+    @staticmethod
+    def document_name(row):
+        """Archive name of a consent's signed document"""
+        base_name = os.path.splitext(secure_filename(row.form_name))[0] or 'consent'
+        return f"documents/{row.id}_{base_name}_signed.pdf"
+
+    @staticmethod
+    def zip_chunks(stmt, fields):
+        """Yield a ZIP of the signed documents of the consents in stmt.
+
+        The archive ends with consents.csv, listing every consent with the
+        archive name of its document (empty when the file is missing). PDFs
+        are stored uncompressed; they are compressed already. Only the
+        central directory, a small record per document, is kept in memory.
+        """
+        sink = _ChunkSink()
+        archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+
+        for rows in ExportService.row_chunks(stmt):
+            for row in rows:
+                path = FileService.resolve_stored_path(row.signed_file_path)
+                if path is None:
+                    continue
+                info = zipfile.ZipInfo(ExportService.document_name(row),
+                                       (row.signed_at or row.created_at).timetuple()[:6])
+                with open(path, 'rb') as source, archive.open(info, 'w', force_zip64=True) as target:
+                    while True:
+                        data = source.read(EXPORT_COPY_BUFFER)
+                        if not data:
+                            break
+                        target.write(data)
+                        yield sink.drain()
+                yield sink.drain()
+
+        # The manifest needs a second pass; it streams from its own cursor
+        manifest = zipfile.ZipInfo('consents.csv', datetime.utcnow().timetuple()[:6])
+        manifest.compress_type = zipfile.ZIP_DEFLATED
+        with archive.open(manifest, 'w', force_zip64=True) as target:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(tuple(fields) + ('document',))
+            for rows in ExportService.row_chunks(stmt):
+                for row in rows:
+                    document = ExportService.document_name(row) \
+                        if FileService.resolve_stored_path(row.signed_file_path) else ''
+                    writer.writerow([_cell(value) for value in row] + [document])
+                target.write(buffer.getvalue().encode())
+                buffer.seek(0)
+                buffer.truncate()
+                yield sink.drain()
+
+        archive.close()
+        yield sink.drain()
+
+    @staticmethod
+    def export_consents(fmt, status=None, since=None, until=None, date_field='created_at'):
+        """Get a generator of the consent export in the given format"""
+        if fmt not in FORMATS:
+            raise InvalidExportRequest(f'Invalid format: {fmt}')
+        stmt = ExportService.consent_query(status, since, until, date_field)
+        return getattr(ExportService, f'{fmt}_chunks')(stmt, CONSENT_EXPORT_FIELDS)
+
+    @staticmethod
+    def export_transmissions(fmt, status=None, method=None, since=None, until=None):
+        """Get a generator of the transmission export as CSV or NDJSON"""
+        if fmt not in ('csv', 'ndjson'):
+            raise InvalidExportRequest(f'Invalid format for transmissions: {fmt}')
+        stmt = ExportService.transmission_query(status, method, since, until)
+        return getattr(ExportService, f'{fmt}_chunks')(stmt, TRANSMISSION_EXPORT_FIELDS)
+
+    @staticmethod
+    def parse_consent_filters(args):
+        """Parse status/since/until/date_field request arguments"""
+        return {
+            'status': parse_choice(args.get('status'), ConsentStatus, 'status'),
+            'since': parse_date(args.get('since')),
+            'until': parse_date(args.get('until'), end=True),
+            'date_field': args.get('date_field') or 'created_at',
+        }
+
+    @staticmethod
+    def parse_transmission_filters(args):
+        """Parse status/method/since/until request arguments"""
+        return {
+            'status': parse_choice(args.get('status'), TransmissionStatus, 'status'),
+            'method': parse_choice(args.get('method'), DeliveryMethod, 'method'),
+            'since': parse_date(args.get('since')),
+            'until': parse_date(args.get('until'), end=True),
+        }
@@ -1,73 +1,166 @@
 import os
 import shutil
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 from flask import current_app
 from werkzeug.utils import secure_filename
+from services.blob_store import BlobStore, CHUNK_SIZE
+from services.metrics_service import metrics
 
 logger = logging.getLogger(__name__)
 
+# Content hashes of files stored outside the blob store, keyed by
+# (path, mtime, size) so a changed file is rehashed
+MAX_CACHED_ETAGS = 4096
+_etag_cache = OrderedDict()
+_etag_lock = threading.Lock()
+
 class FileService:
     """Service for handling file operations"""
     
     @staticmethod
     def save_upload(file, filename):
-        """Save uploaded file to uploads directory"""
+        """Save uploaded file into the content-addressed blob store.
+        
+        Identical uploads share one stored file, so the returned path is the
+        blob path rather than one derived from the filename.
+        """
         try:
             filename = secure_filename(filename)
-            upload_folder = current_app.config['UPLOAD_FOLDER']
-            file_path = os.path.join(upload_folder, filename)
-            
-            # Handle duplicate filenames
-            counter = 1
-            base_name, ext = os.path.splitext(filename)
-            while os.path.exists(file_path):
-                new_filename = f"{base_name}_{counter}{ext}"
-                file_path = os.path.join(upload_folder, new_filename)
-                filename = new_filename
-                counter += 1
+            _, ext = os.path.splitext(filename)
             
-            file.save(file_path)
-            logger.info(f"File saved: {file_path}")
+            temp_path, digest, size = BlobStore.write_stream(file.stream)
+            file_path = BlobStore.ingest(temp_path, digest, size, ext.lower() or '.pdf')
+            metrics.record_file_bytes('write', size)
+            logger.info("File saved: %s (%s, %s bytes)", file_path, filename, size)
             
             return file_path
             
         except Exception as e:
-            logger.error(f"Error saving file: {str(e)}")
+            logger.error("Error saving file: %s", e)
             raise
     
     @staticmethod
-    def move_to_signed(original_path, consent_id):
-        """Move file from uploads to signed directory"""
+    def move_to_signed(original_path, consent_id, commit=True, recorded_path=None):
+        """Link file from uploads into the signed directory.
+        
+        recorded_path is the signed path the consent already has committed,
+        if any. With commit=False the blob reference is left in the caller's
+        transaction.
+        """
         try:
             if not os.path.exists(original_path):
                 raise FileNotFoundError(f"Original file not found: {original_path}")
             
             signed_folder = current_app.config['SIGNED_FOLDER']
+            os.makedirs(signed_folder, exist_ok=True)
             filename = os.path.basename(original_path)
             base_name, ext = os.path.splitext(filename)
             signed_filename = f"{base_name}_signed_{consent_id}{ext}"
             signed_path = os.path.join(signed_folder, signed_filename)
             
-            # Copy file to signed directory
-            shutil.copy2(original_path, signed_path)
-            logger.info(f"File copied to signed directory: {signed_path}")
+            digest = BlobStore.digest_from_path(original_path)
+            if digest is None:
+                # Files stored before the blob store keep the old copy behaviour
+                shutil.copy2(original_path, signed_path)
+                metrics.record_file_bytes('write', os.path.getsize(signed_path))
+                logger.info("File copied to signed directory: %s", signed_path)
+                return signed_path
+            
+            # The signed copy is a hardlink to the blob, counted as a reference
+            if not os.path.exists(signed_path):
+                try:
+                    os.link(original_path, signed_path)
+                except OSError:
+                    # Filesystems without hardlinks fall back to a copy
+                    shutil.copy2(original_path, signed_path)
+            
+            # The reference belongs to the consent that records the signed
+            # path, not to the link: a link left by a rolled back or crashed
+            # signature is counted again when the retry commits
+            if recorded_path != signed_path:
+                BlobStore.add_ref(digest, os.path.getsize(signed_path), commit=commit)
+            logger.info("File linked to signed directory: %s", signed_path)
             
             return signed_path
             
         except Exception as e:
-            logger.error(f"Error moving file to signed: {str(e)}")
+            logger.error("Error moving file to signed: %s", e)
             raise
     
+    @staticmethod
+    def resolve_stored_path(file_path):
+        """Map a stored file path to an absolute path inside uploads/ or signed/.
+        
+        Returns None for paths outside those folders, for the upload staging
+        areas, and for files that do not exist.
+        """
+        if not file_path:
+            return None
+        absolute = os.path.realpath(file_path)
+        for folder in (current_app.config['UPLOAD_FOLDER'], current_app.config['SIGNED_FOLDER']):
+            root = os.path.realpath(folder)
+            if os.path.commonpath([root, absolute]) != root:
+                continue
+            relative = os.path.relpath(absolute, root)
+            if relative.split(os.sep)[0] in ('.tmp', '.partial'):
+                return None
+            return absolute if os.path.isfile(absolute) else None
+        return None
+    
+    @staticmethod
+    def content_etag(absolute_path):
+        """Get a strong ETag derived from the file content.
+        
+        Blob store files carry their SHA-256 in the name; other files are
+        hashed once and cached until they change.
+        """
+        digest = BlobStore.digest_from_path(absolute_path)
+        if digest:
+            return digest
+        
+        stat = os.stat(absolute_path)
+        key = (absolute_path, stat.st_mtime_ns, stat.st_size)
+        with _etag_lock:
+            if key in _etag_cache:
+                _etag_cache.move_to_end(key)
+                return _etag_cache[key]
+        
+        digest = hashlib.sha256()
+        with open(absolute_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        etag = digest.hexdigest()
+        metrics.record_file_bytes('read', stat.st_size)
+        
+        with _etag_lock:
+            _etag_cache[key] = etag
+            while len(_etag_cache) > MAX_CACHED_ETAGS:
+                _etag_cache.popitem(last=False)
+        return etag
+    
     @staticmethod
     def delete_file(file_path):
-        """Delete a file safely"""
+        """Release a file, garbage collecting its blob when unreferenced"""
         try:
-            if os.path.exists(file_path):
+            digest = BlobStore.digest_from_path(file_path)
+            if digest is None:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                    logger.info("File deleted: %s", file_path)
+                else:
+                    logger.warning("File not found for deletion: %s", file_path)
+                return
+            
+            # Signed copies are per-consent links; the blob itself is only
+            # removed once its last reference is released
+            if file_path != BlobStore.blob_path(digest) and os.path.exists(file_path):
                 os.remove(file_path)
-                logger.info(f"File deleted: {file_path}")
-            else:
-                logger.warning(f"File not found for deletion: {file_path}")
-                
+            BlobStore.release(digest)
+            logger.info("File reference released: %s", file_path)
+            
         except Exception as e:
-            logger.error(f"Error deleting file: {str(e)}")
+            logger.error("Error deleting file: %s", e)
             raise
@@ -0,0 +1,241 @@
+import os
+import re
+import sys
+import time
+import queue
+import random
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from enum import Enum
+from logging.handlers import QueueHandler, QueueListener
+from flask import has_request_context, request
+from services.metrics_service import metrics
+from services.serialization import dumps
+
+# Attributes every LogRecord has; anything else was passed in extra=
+RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Structured fields that hold patient details, and patterns for the
+# contact details that can still appear in message text
+PII_FIELDS = frozenset({
+    'patient_name', 'patient_email', 'patient_phone', 'patient_fax',
+    'recipient', 'email', 'phone', 'fax',
+})
+EMAIL_PATTERN = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+PHONE_PATTERN = re.compile(r'\+\d[\d\s().-]{7,}\d|\(?\b\d{3}\)?[\s.-]\d{3}[\s.-]\d{4}\b')
+REDACTED = '[redacted]'
+
+# Arguments that format the same later on the listener thread; anything
+# else (ORM objects in particular) is formatted before the record is queued
+DEFERRABLE_ARGS = (str, int, float, bool, type(None), Enum, BaseException)
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# Extra field values written as they are; anything else is written as str()
+JSON_FIELD_TYPES = (str, int, float, bool, type(None), Enum, datetime)
+
+def redact_text(text):
+    """Mask email addresses and phone numbers in free text"""
+    return PHONE_PATTERN.sub(REDACTED, EMAIL_PATTERN.sub(REDACTED, text))
+
+class TextFormatter(logging.Formatter):
+    """The classic one-line format, with contact details masked"""
+
+    def __init__(self, redact=True):
+        super().__init__(TEXT_FORMAT)
+        self.redact = redact
+
+    def format(self, record):
+        text = super().format(record)
+        return redact_text(text) if self.redact else text
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, the fields
+    passed in extra= and any exception. PII fields and contact details in
+    the message are masked.
+    """
+
+    def __init__(self, redact=True):
+        super().__init__()
+        self.redact = redact
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key in RESERVED_ATTRS:
+                continue
+            if self.redact and key in PII_FIELDS and value is not None:
+                value = REDACTED
+            entry[key] = value if isinstance(value, JSON_FIELD_TYPES) else str(value)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if self.redact:
+            entry['message'] = redact_text(entry['message'])
+            if 'exception' in entry:
+                entry['exception'] = redact_text(entry['exception'])
+        return dumps(entry).decode()
+
+class SamplingFilter(logging.Filter):
+    """Thins out INFO and DEBUG records before they are queued.
+
+    Records logged while serving an endpoint listed in sample_rates are
+    kept with that probability, and each logger may queue at most
+    rate_limit such records per second (0 disables either). Warnings and
+    errors always pass.
+    """
+
+    def __init__(self, sample_rates=None, rate_limit=0):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+        self.rate_limit = rate_limit
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+
+        if self.sample_rates and has_request_context():
+            rate = self.sample_rates.get(request.endpoint)
+            if rate is not None and random.random() >= rate:
+                metrics.log_records_dropped.inc(('sampled',))
+                return False
+
+        if self.rate_limit:
+            second = int(time.monotonic())
+            with self._lock:
+                window = self._windows.get(record.name)
+                if window is None or window[0] != second:
+                    window = self._windows[record.name] = [second, 0]
+                window[1] += 1
+                allowed = window[1] <= self.rate_limit
+            if not allowed:
+                metrics.log_records_dropped.inc(('rate_limited',))
+                return False
+        return True
+
+class BackgroundQueueHandler(QueueHandler):
+    """Hands records to the listener thread without formatting or blocking.
+
+    Unlike QueueHandler the message is not formatted here: the listener
+    does it, unless an argument might change or lazy-load before then.
+    When the bounded queue is full the record is dropped and counted
+    instead of stalling the request.
+    """
+
+    def __init__(self, log_queue, pipeline):
+        super().__init__(log_queue)
+        self.pipeline = pipeline
+
+    def prepare(self, record):
+        if record.args and not all(isinstance(arg, DEFERRABLE_ARGS) for arg in
+                                   (record.args.values() if isinstance(record.args, dict) else record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.pipeline.start()
+        except RuntimeError:
+            # No new threads at interpreter shutdown: write it out directly
+            self.pipeline.output.handle(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.log_records_dropped.inc(('queue_full',))
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room rather than failing to stop when the queue is full
+        self.queue.put(self._sentinel)
+
+class LoggingPipeline:
+    """Root logging through a bounded queue to a background listener thread.
+
+    Request threads only filter and enqueue records; formatting (JSON or
+    text, with PII masked) and the writes to stderr or LOG_FILE happen on
+    the listener thread. The listener is started lazily in each process by
+    the first record, so forked workers get their own, and stopped at exit
+    after draining the queue.
+    """
+
+    def __init__(self):
+        self.handler = None
+        self.output = None
+        self.listener = None
+        self.queue_size = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._registered = False
+
+    def init_app(self, app):
+        app.config.setdefault('LOG_LEVEL', 'INFO')
+        app.config.setdefault('LOG_FORMAT', 'json')
+        app.config.setdefault('LOG_FILE', None)
+        app.config.setdefault('LOG_QUEUE_SIZE', 10000)
+        app.config.setdefault('LOG_REDACT_PII', True)
+        app.config.setdefault('LOG_RATE_LIMIT', 200)
+        app.config.setdefault('LOG_SAMPLE_RATES', {})
+        app.extensions['logging_pipeline'] = self
+        self.configure(app.config)
+
+    def configure(self, config, output=None):
+        """Install the queue handler on the root logger, replacing any
+        handler from an earlier configuration.
+
+        output overrides the handler the listener writes to.
+        """
+        self.stop()
+        root = logging.getLogger()
+        if self.handler is not None:
+            root.removeHandler(self.handler)
+
+        if output is None:
+            output = logging.FileHandler(config['LOG_FILE']) if config['LOG_FILE'] \
+                else logging.StreamHandler(sys.stderr)
+        formatter = JsonFormatter if config['LOG_FORMAT'] == 'json' else TextFormatter
+        output.setFormatter(formatter(redact=config['LOG_REDACT_PII']))
+        self.output = output
+
+        self.queue_size = config['LOG_QUEUE_SIZE']
+        self.handler = BackgroundQueueHandler(queue.Queue(self.queue_size), self)
+        self.handler.addFilter(SamplingFilter(config['LOG_SAMPLE_RATES'], config['LOG_RATE_LIMIT']))
+        root.addHandler(self.handler)
+        root.setLevel(config['LOG_LEVEL'])
+
+        if not self._registered:
+            atexit.register(self.stop)
+            self._registered = True
+
+    def start(self):
+        """Start the listener thread for this process if not already running"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked: records queued before the fork belong to the parent
+                self.handler.queue = queue.Queue(self.queue_size)
+            self.listener = _Listener(self.handler.queue, self.output, respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        """Write out the queued records and stop the listener"""
+        with self._lock:
+            if self.listener is not None and self._pid == os.getpid():
+                self.listener.stop()
+            self.listener = None
+            self._pid = None
+
+logging_pipeline = LoggingPipeline()
@@ -0,0 +1,284 @@
+import os
+import re
+import sys
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+BYTES_BUCKETS = (0, 1024, 16 * 1024, 256 * 1024, 1024 * 1024, 8 * 1024 * 1024, 64 * 1024 * 1024)
+
+# Per-thread accumulator of the request being served, None outside requests
+_local = threading.local()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Histogram:
+    """Thread-safe Prometheus histogram with a fixed set of label names"""
+
+    def __init__(self, name, documentation, buckets, labels=('method', 'route')):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for label_values, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, label_values)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}')
+        return '\n'.join(lines)
+
+class CounterMetric:
+    """Thread-safe Prometheus counter with a fixed set of label names"""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return '\n'.join(lines)
+
+class RequestStats:
+    """What one request spent: SQL statements, SQL time and file bytes"""
+
+    __slots__ = ('started', 'sql_count', 'sql_time', 'file_bytes', 'query_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.file_bytes = 0
+        self.query_started = None
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.query_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_local, 'stats', None)
+    if stats is not None and stats.query_started is not None:
+        stats.sql_time += time.perf_counter() - stats.query_started
+        stats.sql_count += 1
+        stats.query_started = None
+
+def fold_stack(frame):
+    """Render a frame's stack root-first in flamegraph folded format"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class SamplingProfiler(threading.Thread):
+    """Samples the stacks of threads that are serving a request.
+
+    Every `interval` seconds the stack of each registered thread is folded
+    and counted, so a slow request can be written out afterwards as a
+    flamegraph-ready file without tracing every call.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name='sampling-profiler', daemon=True)
+        self.interval = interval
+        self._samples = {}
+        self._stop_event = threading.Event()
+
+    def begin(self, ident):
+        self._samples[ident] = Counter()
+
+    def end(self, ident):
+        return self._samples.pop(ident, None)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            if not self._samples:
+                continue
+            frames = sys._current_frames()
+            for ident, samples in list(self._samples.items()):
+                frame = frames.get(ident)
+                if frame is not None:
+                    samples[fold_stack(frame)] += 1
+
+    def stop(self):
+        self._stop_event.set()
+
+class Metrics:
+    """Per-route request instrumentation exported in Prometheus format.
+
+    Each request records its wall time, the number and total time of the
+    SQL statements it ran (from engine cursor events) and the document bytes
+    FileService read or wrote for it. With METRICS_ENABLED off the SQL
+    events are detached and the request hooks return straight away.
+    With PROFILE_SLOW_REQUESTS on, requests slower than
+    PROFILE_THRESHOLD_SECONDS are dumped as folded stacks to
+    PROFILE_OUTPUT_DIR, ready for flamegraph.pl or speedscope.
+
+    Metrics are kept per process; scrape each worker or run one worker per
+    metrics target.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.profiler = None
+        self._profiler_pid = None
+        self._lock = threading.Lock()
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Wall time of requests by route.', DURATION_BUCKETS)
+        self.sql_queries = Histogram(
+            'http_request_sql_queries', 'SQL statements executed per request by route.', QUERY_BUCKETS)
+        self.sql_duration = Histogram(
+            'http_request_sql_duration_seconds', 'Time spent in SQL per request by route.', DURATION_BUCKETS)
+        self.file_bytes = Histogram(
+            'http_request_file_bytes', 'Document bytes read or written per request by route.', BYTES_BUCKETS)
+        self.file_bytes_total = CounterMetric(
+            'file_io_bytes_total', 'Document bytes read or written by FileService.', ('direction',))
+        self.log_records_dropped = CounterMetric(
+            'log_records_dropped_total', 'Log records discarded before output, by reason.', ('reason',))
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('PROFILE_SLOW_REQUESTS', False)
+        app.config.setdefault('PROFILE_THRESHOLD_SECONDS', 0.5)
+        app.config.setdefault('PROFILE_INTERVAL', 0.005)
+        app.config.setdefault('PROFILE_OUTPUT_DIR', 'profiles')
+        app.extensions['metrics'] = self
+        self.app = app
+
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+        self.set_enabled(app.config['METRICS_ENABLED'])
+
+    def set_enabled(self, enabled):
+        """Attach or detach the SQL instrumentation"""
+        if enabled and not self.enabled:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        elif not enabled and self.enabled:
+            event.remove(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.remove(Engine, 'after_cursor_execute', _after_cursor_execute)
+        self.enabled = enabled
+
+    def start_profiler(self):
+        """Start the sampling thread for this process if not running yet"""
+        if self._profiler_pid == os.getpid():
+            return
+        with self._lock:
+            if self._profiler_pid == os.getpid():
+                return
+            self.profiler = SamplingProfiler(self.app.config['PROFILE_INTERVAL'])
+            self.profiler.start()
+            self._profiler_pid = os.getpid()
+
+    def before_request(self):
+        if not self.enabled:
+            return
+        _local.stats = RequestStats()
+        if self.app.config['PROFILE_SLOW_REQUESTS']:
+            self.start_profiler()
+            self.profiler.begin(threading.get_ident())
+
+    def after_request(self, response):
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            return response
+        _local.stats = None
+
+        duration = time.perf_counter() - stats.started
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        labels = (request.method, route)
+        self.request_duration.observe(labels, duration)
+        self.sql_queries.observe(labels, stats.sql_count)
+        self.sql_duration.observe(labels, stats.sql_time)
+        self.file_bytes.observe(labels, stats.file_bytes)
+
+        if self.profiler is not None and self._profiler_pid == os.getpid():
+            samples = self.profiler.end(threading.get_ident())
+            if samples and duration >= self.app.config['PROFILE_THRESHOLD_SECONDS']:
+                self.dump_profile(labels, duration, samples)
+        return response
+
+    def teardown_request(self, exc):
+        # after_request is skipped when a view raises
+        if getattr(_local, 'stats', None) is not None:
+            _local.stats = None
+            if self.profiler is not None:
+                self.profiler.end(threading.get_ident())
+
+    def record_file_bytes(self, direction, amount):
+        """Count document bytes read or written, towards the current request too"""
+        if not self.enabled or not amount:
+            return
+        self.file_bytes_total.inc((direction,), amount)
+        stats = getattr(_local, 'stats', None)
+        if stats is not None:
+            stats.file_bytes += amount
+
+    def dump_profile(self, labels, duration, samples):
+        """Write the folded stacks of a slow request to PROFILE_OUTPUT_DIR"""
+        output_dir = self.app.config['PROFILE_OUTPUT_DIR']
+        os.makedirs(output_dir, exist_ok=True)
+        method, route = labels
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        path = os.path.join(output_dir, f"{int(time.time() * 1000)}_{method}_{slug}_{int(duration * 1000)}ms.folded")
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.warning("Slow request %s %s took %.3fs, profile written to %s", method, route, duration, path)
+        return path
+
+    def expose(self):
+        """Render every metric in the Prometheus text exposition format"""
+        metrics = [self.request_duration, self.sql_queries, self.sql_duration,
+                   self.file_bytes, self.file_bytes_total, self.log_records_dropped]
+        return '\n'.join(metric.expose() for metric in metrics) + '\n'
+
+metrics = Metrics()
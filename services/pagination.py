@@ -0,0 +1,88 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+class InvalidPageRequest(ValueError):
+    """Raised when a limit, cursor or field list cannot be parsed"""
+
+def encode_cursor(created_at, row_id):
+    """Encode the (created_at, id) position of a row as an opaque cursor"""
+    payload = json.dumps([created_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidPageRequest(f'Invalid cursor: {cursor}') from e
+
+def encode_search_cursor(offset, before_id=None, fuzzy=False):
+    """Encode a position in search results as an opaque cursor"""
+    payload = json.dumps([offset, before_id, fuzzy]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+def decode_search_cursor(cursor):
+    """Decode a cursor produced by encode_search_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        offset, before_id, fuzzy = json.loads(base64.urlsafe_b64decode(padded))
+        offset = int(offset)
+        before_id = None if before_id is None else int(before_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidPageRequest(f'Invalid cursor: {cursor}') from e
+    if offset < 0:
+        raise InvalidPageRequest(f'Invalid cursor: {cursor}')
+    return offset, before_id, bool(fuzzy)
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Parse a limit query parameter, clamping it to the allowed maximum"""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (ValueError, TypeError) as e:
+        raise InvalidPageRequest(f'Invalid limit: {value}') from e
+    if limit < 1:
+        raise InvalidPageRequest(f'Invalid limit: {value}')
+    return min(limit, maximum)
+
+def parse_fields(value, allowed):
+    """Parse a comma-separated field list, always including the id"""
+    if not value:
+        return None
+    fields = ['id']
+    for field in value.split(','):
+        field = field.strip()
+        if field not in allowed:
+            raise InvalidPageRequest(f'Unknown field: {field}')
+        if field not in fields:
+            fields.append(field)
+    return fields
+
+def keyset_page(query, created_col, id_col, limit, cursor=None, key=None):
+    """Fetch one page of a query ordered newest first.
+
+    Rows are ordered by (created_at, id) descending and the cursor marks the
+    last row of the previous page, so each page is a single index range scan
+    no matter how deep the client has paged.
+    Pass key to pick the entity carrying created_at/id out of a joined row.
+    Returns the rows and the cursor for the next page (None on the last page).
+    """
+    if cursor:
+        query = query.filter(tuple_(created_col, id_col) < decode_cursor(cursor))
+    rows = query.order_by(created_col.desc(), id_col.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = key(rows[-1]) if key else rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    return rows, next_cursor
@@ -0,0 +1,220 @@
+"""Structural checks and metadata extraction for uploaded PDFs.
+
+This module runs inside the PDF analysis process pool, so it must not
+import the app: worker processes only load what inspect_pdf() needs.
+
+Without PyMuPDF the document is checked with a small parser that follows
+startxref, the cross-reference table and the catalog to the page tree,
+falling back to scanning the file (and its compressed object streams) when
+the cross-reference data is missing or broken. With PyMuPDF installed it
+also opens the document properly and renders the first-page thumbnail.
+"""
+import os
+import re
+import mmap
+import zlib
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:  # pragma: no cover - optional dependency
+    fitz = None
+
+HEADER_WINDOW = 1024
+TRAILER_WINDOW = 4096
+DICT_WINDOW = 4096
+# Decompressed bytes read from all object streams of one file. Uploads are
+# untrusted, and a small deflate bomb would otherwise expand to gigabytes
+MAX_OBJSTM_BYTES = 64 * 1024 * 1024
+
+HEADER_PATTERN = re.compile(rb'%PDF-(\d\.\d)')
+STARTXREF_PATTERN = re.compile(rb'startxref\s+(\d+)\s+%%EOF')
+ROOT_PATTERN = re.compile(rb'/Root\s+(\d+)\s+(\d+)\s+R')
+PAGES_REF_PATTERN = re.compile(rb'/Pages\s+(\d+)\s+(\d+)\s+R')
+COUNT_PATTERN = re.compile(rb'/Count\s+(\d+)')
+MEDIABOX_PATTERN = re.compile(rb'/MediaBox\s*\[\s*([-+\d.]+)\s+([-+\d.]+)\s+([-+\d.]+)\s+([-+\d.]+)\s*\]')
+PAGES_DICT_PATTERN = re.compile(rb'/Type\s*/Pages\b')
+PAGE_DICT_PATTERN = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+OBJSTM_PATTERN = re.compile(rb'/Type\s*/ObjStm\b.*?stream\r?\n', re.S)
+XREF_SUBSECTION_PATTERN = re.compile(rb'(\d+)\s+(\d+)\s*[\r\n]+')
+
+class InvalidPdf(Exception):
+    """Raised when a file is not a readable PDF"""
+
+def _object_offset(data, xref_offset, number):
+    """Find an object through a classic cross-reference table, or None"""
+    if data[xref_offset:xref_offset + 4] != b'xref':
+        return None
+    position = xref_offset + 4
+    while True:
+        while data[position:position + 1] in (b' ', b'\r', b'\n'):
+            position += 1
+        match = XREF_SUBSECTION_PATTERN.match(data, position)
+        if not match:
+            return None
+        first, count = int(match.group(1)), int(match.group(2))
+        position = match.end()
+        if first <= number < first + count:
+            entry = data[position + (number - first) * 20:position + (number - first) * 20 + 18]
+            offset, _, kind = entry.split(b' ') if entry.count(b' ') == 2 else (b'', b'', b'')
+            return int(offset) if kind == b'n' and offset.isdigit() else None
+        position += count * 20
+
+def _find_object(data, xref_offset, number, generation):
+    """Get the start of the body of an indirect object, or None"""
+    header = f'{number} {generation} obj'.encode()
+    offset = _object_offset(data, xref_offset, number) if xref_offset is not None else None
+    if offset is not None and data[offset:offset + len(header)] == header:
+        return offset + len(header)
+    # Damaged or compressed cross-reference data: scan for the object instead
+    match = re.search(rb'(?<!\d)' + re.escape(header), data)
+    return match.end() if match else None
+
+def _dictionary(data, start):
+    """The text of the object starting at start, up to its endobj"""
+    window = data[start:start + DICT_WINDOW]
+    end = window.find(b'endobj')
+    return window if end < 0 else window[:end]
+
+def _object_streams(data):
+    """Decompress each object stream in the file, skipping undecodable ones.
+
+    Raises InvalidPdf once the streams expand beyond MAX_OBJSTM_BYTES.
+    """
+    budget = MAX_OBJSTM_BYTES
+    for match in OBJSTM_PATTERN.finditer(data):
+        end = data.find(b'endstream', match.end())
+        if end < 0:
+            continue
+        decompressor = zlib.decompressobj()
+        try:
+            stream = decompressor.decompress(data[match.end():end], budget + 1)
+        except zlib.error:
+            continue
+        budget -= len(stream)
+        if budget < 0:
+            raise InvalidPdf(f'Damaged PDF: object streams expand beyond {MAX_OBJSTM_BYTES} bytes')
+        yield stream
+
+def _scan_page_tree(data):
+    """Page count and first MediaBox found by scanning, for damaged files.
+
+    The root of the page tree has the largest /Count of all /Pages nodes.
+    """
+    count = None
+    leaves = 0
+    mediabox = None
+    sources = [data]
+    if not PAGE_DICT_PATTERN.search(data):
+        sources = _object_streams(data)
+    for source in sources:
+        for match in PAGES_DICT_PATTERN.finditer(source):
+            found = COUNT_PATTERN.search(source, max(match.start() - 512, 0), match.end() + 512)
+            if found:
+                count = max(count or 0, int(found.group(1)))
+        leaves += len(PAGE_DICT_PATTERN.findall(source))
+        mediabox = mediabox or MEDIABOX_PATTERN.search(source)
+    return count or leaves or None, mediabox
+
+def _read_structure(data):
+    """Version, page count, first page size and encryption of a PDF"""
+    header = HEADER_PATTERN.search(data[:HEADER_WINDOW])
+    if not header:
+        raise InvalidPdf('Not a PDF: missing %PDF header')
+    tail = data[-TRAILER_WINDOW:]
+    if b'%%EOF' not in tail:
+        raise InvalidPdf('Truncated PDF: missing %%EOF marker')
+
+    xref_offset = None
+    startxrefs = STARTXREF_PATTERN.findall(tail)
+    if startxrefs and int(startxrefs[-1]) < len(data):
+        xref_offset = int(startxrefs[-1])
+
+    # The trailer follows a classic xref table; an xref stream carries the
+    # same keys in its own dictionary
+    trailer = tail
+    if xref_offset is not None and data[xref_offset:xref_offset + 4] != b'xref':
+        trailer = _dictionary(data, xref_offset) + tail
+
+    count = None
+    mediabox = None
+    root = ROOT_PATTERN.search(trailer)
+    catalog = _find_object(data, xref_offset, *map(int, root.groups())) if root else None
+    pages_ref = PAGES_REF_PATTERN.search(_dictionary(data, catalog)) if catalog is not None else None
+    pages = _find_object(data, xref_offset, *map(int, pages_ref.groups())) if pages_ref else None
+    if pages is not None:
+        pages_dict = _dictionary(data, pages)
+        found = COUNT_PATTERN.search(pages_dict)
+        count = int(found.group(1)) if found else None
+        mediabox = MEDIABOX_PATTERN.search(pages_dict)
+    if count is None or mediabox is None:
+        scanned_count, scanned_mediabox = _scan_page_tree(data)
+        count = count if count is not None else scanned_count
+        mediabox = mediabox or scanned_mediabox
+    if not count:
+        raise InvalidPdf('Damaged PDF: no pages found')
+
+    width = height = None
+    if mediabox:
+        x0, y0, x1, y1 = (float(value) for value in mediabox.groups())
+        width, height = abs(x1 - x0), abs(y1 - y0)
+
+    return {
+        'pdf_version': header.group(1).decode(),
+        'page_count': count,
+        'page_width': width,
+        'page_height': height,
+        'encrypted': b'/Encrypt' in trailer,
+    }
+
+def _render_thumbnail(path, thumbnail_path, width):
+    """Render the first page as a PNG with PyMuPDF; returns the page size"""
+    with fitz.open(path) as document:
+        if document.needs_pass:
+            return document.page_count, None
+        page = document[0]
+        scale = width / page.rect.width
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False).save(thumbnail_path)
+        return document.page_count, (page.rect.width, page.rect.height)
+
+def inspect_pdf(path, thumbnail_path=None, max_pages=None, thumbnail_width=200):
+    """Validate a PDF and extract its metadata.
+
+    Returns a dict with valid, error, pdf_version, page_count, page_width,
+    page_height (points), encrypted and thumbnail (whether thumbnail_path was
+    written). Never raises for a bad document; the reason is in error.
+    """
+    result = {
+        'valid': False,
+        'error': None,
+        'pdf_version': None,
+        'page_count': None,
+        'page_width': None,
+        'page_height': None,
+        'encrypted': None,
+        'thumbnail': False,
+    }
+    try:
+        if os.path.getsize(path) == 0:
+            raise InvalidPdf('Not a PDF: empty file')
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            result.update(_read_structure(data))
+
+        if fitz is not None and thumbnail_path:
+            try:
+                page_count, size = _render_thumbnail(path, thumbnail_path, thumbnail_width)
+            except Exception as e:
+                raise InvalidPdf(f'Damaged PDF: {e}') from e
+            result['page_count'] = page_count
+            if size:
+                result['page_width'], result['page_height'] = size
+                result['thumbnail'] = True
+
+        if max_pages and result['page_count'] > max_pages:
+            raise InvalidPdf(f"Too many pages: {result['page_count']} (limit {max_pages})")
+        result['valid'] = True
+    except InvalidPdf as e:
+        result['error'] = str(e)
+    except (OSError, ValueError) as e:
+        result['error'] = f'Unreadable PDF: {e}'
+    return result
@@ -0,0 +1,216 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select, update
+from models import Blob
+from services.blob_store import BlobStore, THUMBNAIL_EXT
+from services.pdf_inspect import inspect_pdf
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+class PdfService:
+    """Service for the PDF analysis stored on each blob.
+
+    Analysis results belong to the content, so they are stored on the blob
+    row keyed by SHA-256: a re-upload of the same template finds them there
+    and is never analyzed again.
+    """
+
+    @staticmethod
+    def analysis_args(digest):
+        """Get the inspect_pdf() arguments for a blob"""
+        return (BlobStore.blob_path(digest), BlobStore.blob_path(digest, THUMBNAIL_EXT),
+                current_app.config['PDF_MAX_PAGES'], current_app.config['PDF_THUMBNAIL_WIDTH'])
+
+    @staticmethod
+    def record(digest, result):
+        """Store an inspect_pdf() result on its blob.
+
+        Returns False when the blob was released in the meantime.
+        """
+        stored = db.session.execute(
+            update(Blob).where(Blob.sha256 == digest).values(
+                valid=result['valid'],
+                analysis_error=result['error'],
+                pdf_version=result['pdf_version'],
+                page_count=result['page_count'],
+                page_width=result['page_width'],
+                page_height=result['page_height'],
+                encrypted=result['encrypted'],
+                has_thumbnail=result['thumbnail'],
+                analyzed_at=datetime.utcnow(),
+            )
+        ).rowcount > 0
+        db.session.commit()
+
+        if not stored:
+            thumbnail_path = BlobStore.blob_path(digest, THUMBNAIL_EXT)
+            if os.path.exists(thumbnail_path):
+                os.remove(thumbnail_path)
+        elif not result['valid']:
+            logger.warning("Blob %s is not a usable PDF: %s", digest, result['error'])
+        else:
+            logger.info("Blob %s analyzed: %s pages", digest, result['page_count'])
+        return stored
+
+    @staticmethod
+    def analyze(digest):
+        """Analyze a blob in this process"""
+        return PdfService.record(digest, inspect_pdf(*PdfService.analysis_args(digest)))
+
+    @staticmethod
+    def unanalyzed(limit, after=''):
+        """Get the digests of blobs not yet analyzed, in digest order"""
+        return db.session.execute(
+            select(Blob.sha256).where(Blob.analyzed_at.is_(None), Blob.sha256 > after)
+                               .order_by(Blob.sha256).limit(limit)
+        ).scalars().all()
+
+    @staticmethod
+    def analyze_pending(executor=None, batch_size=100):
+        """Analyze every blob without results, in parallel on an executor.
+
+        Blobs whose file is missing are skipped. Returns the number analyzed.
+        """
+        analyzed = 0
+        after = ''
+        while True:
+            digests = PdfService.unanalyzed(batch_size, after)
+            if not digests:
+                return analyzed
+            after = digests[-1]
+            digests = [digest for digest in digests if os.path.exists(BlobStore.blob_path(digest))]
+            if not digests:
+                continue
+            args = zip(*[PdfService.analysis_args(digest) for digest in digests])
+            results = (executor.map if executor else map)(inspect_pdf, *args)
+            for digest, result in zip(digests, results):
+                analyzed += PdfService.record(digest, result)
+
+def pool_context(method):
+    """Multiprocessing context for the analysis pool.
+
+    forkserver children are forked from a clean server process rather than
+    from a threaded app worker, and have the inspection module preloaded.
+    """
+    context = multiprocessing.get_context(method)
+    if method == 'forkserver':
+        context.set_forkserver_preload(['services.pdf_inspect'])
+    return context
+
+class PdfAnalysisPool:
+    """Process pool that analyzes uploaded PDFs off the request thread.
+
+    Started lazily in each process with PDF_ANALYSIS_WORKERS processes (one
+    per core by default; 0 analyzes inline, as the tests do). Each upload is
+    submitted once per content hash: blobs already analyzed, or being
+    analyzed, are not submitted again. Results are written back to the blob
+    from the pool's result thread.
+    """
+
+    def __init__(self):
+        self.executor = None
+        self.app = None
+        self.workers = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._inflight = set()
+
+    def init_app(self, app):
+        app.config.setdefault('PDF_ANALYSIS_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('PDF_ANALYSIS_START_METHOD', 'forkserver')
+        app.config.setdefault('PDF_MAX_PAGES', 2000)
+        app.config.setdefault('PDF_THUMBNAIL_WIDTH', 200)
+        app.extensions['pdf_analysis'] = self
+
+        @app.before_request
+        def start_pdf_analysis():
+            if not app.testing and app.config['PDF_ANALYSIS_WORKERS']:
+                self.start(app)
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers,
+                                   mp_context=pool_context(self.app.config['PDF_ANALYSIS_START_METHOD']))
+
+    def start(self, app, workers=None):
+        """Start the process pool for this process if not already running"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.app = app
+            self.workers = workers or app.config['PDF_ANALYSIS_WORKERS']
+            self.executor = self._new_executor()
+            self._inflight = set()
+            self._pid = os.getpid()
+
+    def submit(self, file_path):
+        """Queue analysis of an uploaded blob unless its results are known.
+
+        Without a running pool the blob is analyzed inline. Returns the
+        blob, or None for files outside the blob store.
+        """
+        digest = BlobStore.digest_from_path(file_path)
+        blob = db.session.get(Blob, digest) if digest else None
+        if blob is None or blob.analyzed_at is not None:
+            return blob
+
+        if self._pid != os.getpid():
+            PdfService.analyze(digest)
+            db.session.refresh(blob)
+            return blob
+
+        args = PdfService.analysis_args(digest)
+        with self._lock:
+            if digest in self._inflight:
+                return blob
+            try:
+                future = self.executor.submit(inspect_pdf, *args)
+            except BrokenProcessPool:
+                # A worker died, perhaps on a hostile file; replace the pool
+                logger.error("PDF analysis pool broken, restarting it")
+                self.executor = self._new_executor()
+                future = self.executor.submit(inspect_pdf, *args)
+            self._inflight.add(digest)
+        future.add_done_callback(lambda done: self._finished(digest, done))
+        return blob
+
+    def _finished(self, digest, future):
+        try:
+            result = future.result()
+            with self.app.app_context():
+                PdfService.record(digest, result)
+        except BrokenProcessPool:
+            # Every analysis in flight fails with the pool, not only the one
+            # that killed it; leave them for `flask analyze-pdfs` to retry
+            logger.error("PDF analysis of blob %s lost to a crashed worker", digest)
+        except Exception as e:
+            logger.error("Error in PDF analysis of blob %s: %s", digest, e)
+        finally:
+            with self._lock:
+                self._inflight.discard(digest)
+                self._idle.notify_all()
+
+    def wait(self, timeout=None):
+        """Wait until every submitted analysis has been recorded.
+
+        Returns False if some were still running after timeout seconds.
+        """
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._inflight, timeout)
+
+    def stop(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait, cancel_futures=not wait)
+        self.executor = None
+        self._pid = None
+
+pdf_analysis = PdfAnalysisPool()
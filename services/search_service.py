@@ -0,0 +1,225 @@
+import re
+import logging
+from difflib import SequenceMatcher
+from functools import lru_cache
+from sqlalchemy import and_, literal_column, select, text
+from models import Consent
+from schema import PG_SEARCH_EXPRESSION
+from services.pagination import DEFAULT_PAGE_SIZE, InvalidPageRequest, decode_search_cursor, encode_search_cursor
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+MIN_TERM_LENGTH = 3
+MAX_TERMS = 8
+
+# FTS5 reads the position lists of every trigram of a phrase, so long terms
+# (emails, phone numbers) are matched as shorter phrases that must all
+# occur, and candidates are checked for the whole term afterwards
+MAX_PHRASE_LENGTH = 8
+PHRASE_CHUNK_LENGTH = 6
+
+# Only the newest RANK_WINDOW matches are ranked by relevance; pages past
+# that continue through older matches newest first. Scoring a bounded
+# window keeps broad queries ("smith", a form name) as cheap as narrow ones.
+RANK_WINDOW = 200
+FUZZY_THRESHOLD = 0.75
+
+# Relevance weight of a match in each indexed field
+FIELD_WEIGHTS = (10, 5, 5, 1)
+
+PHONE_PUNCTUATION = re.compile(r'[\s().+-]')
+WORD_SPLIT = re.compile(r'[^\w]+')
+
+def normalize_term(term):
+    """Lowercase a search term; phone and fax numbers become bare digits"""
+    digits = PHONE_PUNCTUATION.sub('', term)
+    if digits.isdigit():
+        return digits
+    return term.lower()
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+def _fts_term(term):
+    if len(term) <= MAX_PHRASE_LENGTH:
+        return _fts_phrase(term)
+    chunks = [term[i:i + PHRASE_CHUNK_LENGTH] for i in range(0, len(term), PHRASE_CHUNK_LENGTH)]
+    if len(chunks[-1]) < MIN_TERM_LENGTH:
+        chunks[-1] = term[-MIN_TERM_LENGTH:]
+    return ' AND '.join(_fts_phrase(chunk) for chunk in chunks)
+
+def _term_pieces(term):
+    """Substrings of a term of which at least one survives a single typo"""
+    if len(term) >= 2 * MIN_TERM_LENGTH:
+        middle = len(term) // 2
+        return [term[:middle], term[middle:]]
+    return [term[i:i + MIN_TERM_LENGTH] for i in range(len(term) - MIN_TERM_LENGTH + 1)]
+
+@lru_cache(maxsize=65536)
+def _similarity(term, word):
+    """Similarity of a term to a word or to the start of a longer word.
+
+    Cached, since the same names, domains and form names recur across rows.
+    """
+    best = 0
+    for candidate in {word, word[:len(term)]}:
+        # Skip words whose length alone rules out a close match
+        if 2 * min(len(term), len(candidate)) < FUZZY_THRESHOLD * (len(term) + len(candidate)):
+            continue
+        matcher = SequenceMatcher(None, term, candidate)
+        if matcher.quick_ratio() >= FUZZY_THRESHOLD:
+            best = max(best, matcher.ratio())
+    return best
+
+class SearchService:
+    """Service for patient search over the consent search index"""
+
+    @staticmethod
+    def parse_query(query):
+        """Split a search query into normalized terms.
+
+        A query that is only a phone or fax number is one digits term no
+        matter how it is spaced. Terms shorter than three characters cannot
+        use the trigram index and are dropped.
+        """
+        query = (query or '').strip()
+        if PHONE_PUNCTUATION.sub('', query).isdigit():
+            terms = [normalize_term(query)]
+        else:
+            terms = [normalize_term(term) for term in query.split()]
+
+        terms = [term for term in dict.fromkeys(terms) if len(term) >= MIN_TERM_LENGTH]
+        if not terms:
+            raise InvalidPageRequest(f'Search needs a term of at least {MIN_TERM_LENGTH} characters')
+        return terms[:MAX_TERMS]
+
+    @staticmethod
+    def _candidates(terms, limit, fuzzy=False, before_id=None):
+        """Get the newest matching rows as (id, name, email, contact, form) tuples"""
+        if db.engine.dialect.name == 'sqlite':
+            if fuzzy:
+                match = ' AND '.join(
+                    '(' + ' OR '.join(_fts_phrase(piece) for piece in _term_pieces(term)) + ')'
+                    for term in terms
+                )
+            else:
+                match = ' AND '.join(_fts_term(term) for term in terms)
+
+            # Index rows are keyed by the negated consent id, newest first
+            sql = ("SELECT -rowid, patient_name, patient_email, contact, form_name FROM consent_search "
+                   "WHERE consent_search MATCH :match")
+            params = {'match': match, 'limit': limit}
+            if before_id is not None:
+                sql += " AND rowid > :after_rowid"
+                params['after_rowid'] = -before_id
+            sql += " ORDER BY rowid LIMIT :limit"
+            return db.session.execute(text(sql), params).all()
+
+        # Postgres: LIKE and word similarity both use the pg_trgm GIN index
+        document = literal_column(PG_SEARCH_EXPRESSION)
+        if fuzzy:
+            condition = and_(*[document.op('%>')(term) for term in terms])
+        else:
+            condition = and_(*[document.contains(term, autoescape=True) for term in terms])
+
+        query = select(Consent.id, Consent.patient_name, Consent.patient_email,
+                       Consent.patient_phone, Consent.patient_fax, Consent.form_name).where(condition)
+        if before_id is not None:
+            query = query.where(Consent.id < before_id)
+        rows = db.session.execute(query.order_by(Consent.id.desc()).limit(limit)).all()
+
+        return [(row.id, row.patient_name, row.patient_email,
+                 f"{PHONE_PUNCTUATION.sub('', row.patient_phone or '')} {PHONE_PUNCTUATION.sub('', row.patient_fax or '')}",
+                 row.form_name) for row in rows]
+
+    @staticmethod
+    def score(terms, row, fuzzy=False):
+        """Score how well a candidate row matches the search terms.
+
+        A term counts twice when it starts a word, so prefix matches rank
+        above matches in the middle of a word. Fuzzy scoring uses the best
+        similarity of each term to any word of the row instead.
+        Returns None when a term does not occur in the row (or, fuzzy, has
+        no word similar enough).
+        """
+        fields = [(weight, (value or '').lower()) for weight, value in zip(FIELD_WEIGHTS, row[1:])]
+        total = 0
+        for term in terms:
+            best = 0
+            for weight, value in fields:
+                if fuzzy:
+                    for word in WORD_SPLIT.split(value):
+                        similarity = _similarity(term, word)
+                        if similarity >= FUZZY_THRESHOLD:
+                            best = max(best, similarity * weight)
+                    continue
+                position = value.find(term)
+                if position < 0:
+                    continue
+                at_word_start = position == 0 or not value[position - 1].isalnum()
+                best = max(best, weight * (2 if at_word_start else 1))
+
+            if not best:
+                return None
+            total += best
+        return total
+
+    @staticmethod
+    def _ranked(terms, fuzzy):
+        """Get the ranked ids of the newest window of matches, and the oldest id of a full window"""
+        rows = SearchService._candidates(terms, RANK_WINDOW, fuzzy)
+
+        scored = []
+        for row in rows:
+            score = SearchService.score(terms, row, fuzzy)
+            if score is not None:
+                scored.append((score, row[0]))
+        scored.sort(key=lambda item: (-item[0], -item[1]))
+
+        full = len(rows) == RANK_WINDOW
+        oldest_id = rows[-1][0] if full else None
+        return [row_id for _, row_id in scored], oldest_id
+
+    @staticmethod
+    def search(query, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None):
+        """Get one page of consents matching a patient search.
+
+        Exact substring matches are tried first; when the first page has no
+        match at all the terms are retried with typo tolerance.
+        Returns the consents as row tuples of `fields` (as list_consents
+        does), the cursor of the next page and whether the results are
+        fuzzy matches.
+        """
+        terms = SearchService.parse_query(query)
+        offset, before_id, fuzzy = decode_search_cursor(cursor) if cursor else (0, None, False)
+
+        next_cursor = None
+        if before_id is None:
+            ids, oldest_id = SearchService._ranked(terms, fuzzy)
+            if not ids and not fuzzy and offset == 0:
+                fuzzy = True
+                ids, oldest_id = SearchService._ranked(terms, fuzzy)
+
+            page_ids = ids[offset:offset + limit]
+            if offset + limit < len(ids):
+                next_cursor = encode_search_cursor(offset + limit, None, fuzzy)
+            elif oldest_id is not None and not fuzzy:
+                # The window is full, so older matches follow in date order
+                next_cursor = encode_search_cursor(0, oldest_id)
+        else:
+            rows = SearchService._candidates(terms, limit + 1, before_id=before_id)
+            page_ids = [row[0] for row in rows[:limit] if SearchService.score(terms, row) is not None]
+            if len(rows) > limit:
+                next_cursor = encode_search_cursor(0, rows[limit - 1][0])
+
+        if not page_ids:
+            return [], next_cursor, fuzzy
+
+        fields = list(fields or Consent.SERIALIZABLE_FIELDS)
+        columns = fields if 'id' in fields else fields + ['id']
+        query = db.session.query(*[getattr(Consent, column) for column in columns])\
+                          .filter(Consent.id.in_(page_ids))
+        consents = {consent.id: consent for consent in query}
+
+        return [consents[row_id] for row_id in page_ids if row_id in consents], next_cursor, fuzzy
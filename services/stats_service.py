@@ -0,0 +1,298 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, func, select, update
+from models import Consent, Transmission, StatCounter, ConsentStatus, DeliveryMethod, TransmissionStatus
+from services.background import BackgroundWorker
+from services.db_utils import dialect_insert
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+TOTAL = 'total'
+# Rows moved to the archive tier, which the totals still count but a
+# recount of the live tables cannot see
+ARCHIVED = 'archived'
+CONSENT_STATUS = 'consent_status'
+TRANSMISSION_STATUS = 'transmission_status'
+# Unix time the last periodic reconciliation was claimed by a process
+RECONCILED_AT = ('reconcile', 'last_run', '')
+
+# Statuses whose entry time is stored on the row, so reconciliation can
+# recount their day buckets too. The others are only counted as they happen.
+CONSENT_DAY_COLUMNS = {
+    ConsentStatus.SENT: Consent.sent_at,
+    ConsentStatus.SIGNED: Consent.signed_at,
+}
+TRANSMISSION_DAY_COLUMNS = {
+    TransmissionStatus.PENDING: Transmission.created_at,
+    TransmissionStatus.SENT: Transmission.sent_at,
+    TransmissionStatus.DELIVERED: Transmission.delivered_at,
+}
+
+def _day(when=None):
+    return (when or datetime.utcnow()).strftime('%Y-%m-%d')
+
+def _day_expression(column):
+    if db.engine.dialect.name == 'postgresql':
+        return func.to_char(column, 'YYYY-MM-DD')
+    return func.date(column)
+
+def transmission_dimension(method, status):
+    return f'{method.value}:{status.value}'
+
+class StatsService:
+    """Service for the pre-aggregated dashboard counters.
+
+    State changes add counter deltas to the caller's session, and the deltas
+    are written as one upsert per counter just before that session commits,
+    so counters change atomically with the rows they count and hold their
+    row locks only for the commit. Reading the dashboard is a lookup of a
+    fixed number of counter rows, however many consents there are.
+    """
+
+    @staticmethod
+    def consent_transition(old_status, new_status, count=1, when=None):
+        """Count consents moving from old_status (None when created) to new_status"""
+        if old_status == new_status:
+            return
+        StatsService._add(CONSENT_STATUS,
+                          old_status.value if old_status is not None else None,
+                          new_status.value, count, when)
+
+    @staticmethod
+    def transmission_transition(method, old_status, new_status, count=1, when=None):
+        """Count transmissions moving from old_status (None when created) to new_status"""
+        if old_status == new_status:
+            return
+        StatsService._add(TRANSMISSION_STATUS,
+                          transmission_dimension(method, old_status) if old_status is not None else None,
+                          transmission_dimension(method, new_status), count, when)
+
+    @staticmethod
+    def archive(consents, transmissions):
+        """Count signed consents, and transmissions by (method, status), moved to the archive"""
+        deltas = db.session.info.setdefault('stat_deltas', Counter())
+        deltas[(CONSENT_STATUS, ARCHIVED, ConsentStatus.SIGNED.value)] += consents
+        for (method, status), count in transmissions.items():
+            deltas[(TRANSMISSION_STATUS, ARCHIVED, transmission_dimension(method, status))] += count
+
+    @staticmethod
+    def _add(metric, old_dimension, new_dimension, count, when):
+        deltas = db.session.info.setdefault('stat_deltas', Counter())
+        if old_dimension is not None:
+            deltas[(metric, TOTAL, old_dimension)] -= count
+        deltas[(metric, TOTAL, new_dimension)] += count
+        deltas[(metric, _day(when), new_dimension)] += count
+
+    @staticmethod
+    def apply(session, deltas):
+        """Add counter deltas to the stat_counters rows, creating missing ones"""
+        # Sorted, so concurrent writers lock shared rows in the same order
+        rows = [
+            {'metric': metric, 'bucket': bucket, 'dimension': dimension, 'value': delta}
+            for (metric, bucket, dimension), delta in sorted(deltas.items()) if delta
+        ]
+        if not rows:
+            return
+        stmt = dialect_insert(StatCounter)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['metric', 'bucket', 'dimension'],
+            set_={'value': StatCounter.value + stmt.excluded.value}
+        )
+        session.execute(stmt, rows)
+
+    @staticmethod
+    def dashboard(days=0):
+        """Get the dashboard totals, plus per-day counts for the last `days` days"""
+        consents = {status.value: 0 for status in ConsentStatus}
+        transmissions = {method.value: {status.value: 0 for status in TransmissionStatus}
+                         for method in DeliveryMethod}
+
+        totals = db.session.execute(
+            select(StatCounter.metric, StatCounter.dimension, StatCounter.value)
+            .where(StatCounter.metric.in_([CONSENT_STATUS, TRANSMISSION_STATUS]), StatCounter.bucket == TOTAL)
+        ).all()
+        for metric, dimension, value in totals:
+            if metric == CONSENT_STATUS:
+                consents[dimension] = value
+            else:
+                method, status = dimension.split(':')
+                transmissions[method][status] = value
+
+        for counts in transmissions.values():
+            succeeded = counts['sent'] + counts['delivered']
+            finished = succeeded + counts['failed']
+            counts['success_rate'] = round(succeeded / finished, 4) if finished else None
+
+        stats = {'consents': consents, 'transmissions': transmissions}
+        if days:
+            since = _day(datetime.utcnow() - timedelta(days=days - 1))
+            daily = {}
+            rows = db.session.execute(
+                select(StatCounter.metric, StatCounter.bucket, StatCounter.dimension, StatCounter.value)
+                .where(StatCounter.metric.in_([CONSENT_STATUS, TRANSMISSION_STATUS]),
+                       StatCounter.bucket >= since, StatCounter.bucket.notin_([TOTAL, ARCHIVED]))
+            ).all()
+            for metric, bucket, dimension, value in rows:
+                day = daily.setdefault(bucket, {'day': bucket, 'consents': {}, 'transmissions': {}})
+                day['consents' if metric == CONSENT_STATUS else 'transmissions'][dimension] = value
+            stats['daily'] = [daily[bucket] for bucket in sorted(daily)]
+        return stats
+
+    @staticmethod
+    def reconcile(days=None):
+        """Recount the counters from the consents and transmissions tables.
+
+        Corrects drift from writes that bypassed the incremental path. The
+        totals are recounted in full, plus the archived counts; day buckets
+        only for the last `days` days and only for statuses with a stored
+        timestamp. The rows and the counters are read from one snapshot,
+        without blocking writers, and the difference is then added to the
+        counters the same way writers add their deltas, so writes committed
+        in between are neither lost nor counted twice.
+        Returns the number of counters that were corrected.
+        """
+        days = current_app.config['STATS_RECONCILE_DAYS'] if days is None else days
+        since = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+
+        snapshot = db.engine
+        if snapshot.dialect.name == 'postgresql':
+            snapshot = snapshot.execution_options(isolation_level='REPEATABLE READ')
+        with snapshot.begin() as conn:
+            if conn.dialect.name == 'sqlite':
+                # A read transaction; its first select fixes the snapshot
+                conn.exec_driver_sql('BEGIN')
+
+            exact = Counter()
+            for metric, dimension, value in conn.execute(
+                    select(StatCounter.metric, StatCounter.dimension, StatCounter.value)
+                    .where(StatCounter.bucket == ARCHIVED)):
+                exact[(metric, ARCHIVED, dimension)] = value
+                exact[(metric, TOTAL, dimension)] += value
+            for status, count in conn.execute(select(Consent.status, func.count()).group_by(Consent.status)):
+                exact[(CONSENT_STATUS, TOTAL, status.value)] += count
+            for method, status, count in conn.execute(
+                    select(Transmission.method, Transmission.status, func.count())
+                    .group_by(Transmission.method, Transmission.status)):
+                exact[(TRANSMISSION_STATUS, TOTAL, transmission_dimension(method, status))] += count
+
+            for status, column in CONSENT_DAY_COLUMNS.items():
+                day = _day_expression(column)
+                for bucket, count in conn.execute(
+                        select(day, func.count()).where(column >= since).group_by(day)):
+                    exact[(CONSENT_STATUS, bucket, status.value)] = count
+            for status, column in TRANSMISSION_DAY_COLUMNS.items():
+                day = _day_expression(column)
+                for bucket, method, count in conn.execute(
+                        select(day, Transmission.method, func.count())
+                        .where(column >= since).group_by(day, Transmission.method)):
+                    exact[(TRANSMISSION_STATUS, bucket, transmission_dimension(method, status))] = count
+
+            # Only counters that can be recounted are compared
+            recountable = {status.value for status in CONSENT_DAY_COLUMNS} | {
+                transmission_dimension(method, status)
+                for method in DeliveryMethod for status in TRANSMISSION_DAY_COLUMNS
+            }
+            current = {}
+            for metric, bucket, dimension, value in conn.execute(
+                    select(StatCounter.metric, StatCounter.bucket, StatCounter.dimension, StatCounter.value)
+                    .where(StatCounter.metric.in_([CONSENT_STATUS, TRANSMISSION_STATUS]))):
+                if bucket in (TOTAL, ARCHIVED) or (bucket >= _day(since) and dimension in recountable):
+                    current[(metric, bucket, dimension)] = value
+
+            corrections = Counter()
+            for key in set(exact) | set(current):
+                if exact.get(key, 0) != current.get(key, 0):
+                    corrections[key] = exact.get(key, 0) - current.get(key, 0)
+
+        if corrections:
+            with db.engine.begin() as conn:
+                StatsService.apply(conn, corrections)
+            logger.info("Reconciled %s drifted dashboard counters", len(corrections))
+        return len(corrections)
+
+    @staticmethod
+    def claim_reconcile(interval):
+        """Claim the periodic reconciliation if no process ran it within `interval` seconds.
+
+        A conditional update on a counter row, so of all the processes
+        whose reconciler wakes up, only one recounts per interval.
+        """
+        now = int(time.time())
+        metric, bucket, dimension = RECONCILED_AT
+        key = (StatCounter.metric == metric, StatCounter.bucket == bucket, StatCounter.dimension == dimension)
+        with db.engine.begin() as conn:
+            conn.execute(dialect_insert(StatCounter)
+                         .values(metric=metric, bucket=bucket, dimension=dimension, value=0)
+                         .on_conflict_do_nothing(index_elements=['metric', 'bucket', 'dimension']))
+            return conn.execute(
+                update(StatCounter).where(*key, StatCounter.value <= now - interval).values(value=now)
+            ).rowcount == 1
+
+class StatsReconciler(BackgroundWorker):
+    """Thread that periodically recounts the dashboard counters"""
+
+    def run_once(self):
+        if StatsService.claim_reconcile(self.interval):
+            StatsService.reconcile()
+        return False
+
+class DashboardStats:
+    """Writes session counter deltas on commit and runs the reconciler.
+
+    The reconciler is started lazily in each process, but only one process
+    recounts per STATS_RECONCILE_INTERVAL seconds (0 disables it), whichever
+    claims the run first. The first run also fills the counters of a
+    database that predates them. `flask reconcile-stats` recounts at once.
+    """
+
+    def __init__(self):
+        self.reconciler = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('STATS_RECONCILE_INTERVAL', 3600)
+        app.config.setdefault('STATS_RECONCILE_DAYS', 35)
+        app.extensions['dashboard_stats'] = self
+
+        if not event.contains(db.session, 'before_commit', self._before_commit):
+            event.listen(db.session, 'before_commit', self._before_commit)
+            event.listen(db.session, 'after_rollback', self._after_rollback)
+
+        @app.before_request
+        def start_stats_reconciler():
+            if not app.testing and app.config['STATS_RECONCILE_INTERVAL']:
+                self.start(app)
+
+    def _before_commit(self, session):
+        deltas = session.info.pop('stat_deltas', None)
+        if deltas:
+            StatsService.apply(session, deltas)
+
+    def _after_rollback(self, session):
+        session.info.pop('stat_deltas', None)
+
+    def start(self, app):
+        """Start the reconciler for this process if not already running"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.reconciler = StatsReconciler(app, app.config['STATS_RECONCILE_INTERVAL'], name='stats-reconciler')
+            self.reconciler.start()
+            self._pid = os.getpid()
+
+    def stop(self, timeout=None):
+        if self.reconciler is not None:
+            self.reconciler.stop(timeout)
+        self.reconciler = None
+        self._pid = None
+
+dashboard_stats = DashboardStats()
@@ -0,0 +1,315 @@
+import os
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, or_, select, update
+from werkzeug.utils import secure_filename
+from models import UploadSession
+from services.background import BackgroundWorker
+from services.blob_store import BlobStore, CHUNK_SIZE
+from services.metrics_service import metrics
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Running SHA-256 state per upload, so finalizing does not re-read the file.
+# Only valid in the process that received every chunk; otherwise finalize
+# rehashes the partial file from disk.
+MAX_TRACKED_HASHES = 1000
+_hashes = OrderedDict()
+_hashes_lock = threading.Lock()
+
+class UploadOffsetMismatch(Exception):
+    """Raised when a chunk does not start where the upload left off"""
+
+    def __init__(self, expected, message=None):
+        super().__init__(message or f"Chunk must start at offset {expected}")
+        self.expected = expected
+
+class UploadBusy(UploadOffsetMismatch):
+    """Raised when another request is already writing a chunk of the upload"""
+
+    def __init__(self, expected):
+        super().__init__(expected, f"Another chunk is being written at offset {expected}")
+
+class ChunkedUploadService:
+    """Service for resumable uploads streamed to disk chunk by chunk.
+
+    A client creates a session, PUTs sequential chunks at the offset the
+    server reports, and finalizes the session, which verifies the checksum
+    and moves the file into the blob store. Each chunk is copied in
+    CHUNK_SIZE pieces, so memory use does not depend on the file size.
+
+    Sessions untouched for UPLOAD_SESSION_TTL_HOURS are removed by
+    cleanup_batch, together with the partial file of an unfinished one.
+    """
+
+    @staticmethod
+    def partial_path(upload_id):
+        """Get the path that collects the chunks of an upload"""
+        partial_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], '.partial')
+        os.makedirs(partial_folder, exist_ok=True)
+        return os.path.join(partial_folder, upload_id)
+
+    @staticmethod
+    def create_session(filename, total_size, expected_sha256=None):
+        """Start a resumable upload"""
+        if total_size < 1 or total_size > current_app.config['MAX_UPLOAD_SIZE']:
+            raise ValueError(f"size must be between 1 and {current_app.config['MAX_UPLOAD_SIZE']} bytes")
+
+        session = UploadSession()
+        session.id = uuid.uuid4().hex
+        session.filename = secure_filename(filename)
+        session.total_size = total_size
+        session.expected_sha256 = expected_sha256.lower() if expected_sha256 else None
+
+        open(ChunkedUploadService.partial_path(session.id), 'wb').close()
+        with _hashes_lock:
+            _hashes[session.id] = (0, hashlib.sha256())
+            while len(_hashes) > MAX_TRACKED_HASHES:
+                _hashes.popitem(last=False)
+
+        db.session.add(session)
+        db.session.commit()
+
+        logger.info("Upload session %s started for %s (%s bytes)", session.id, session.filename, total_size)
+        return session
+
+    @staticmethod
+    def append_chunk(session, offset, stream):
+        """Stream one chunk from the request body onto the end of the upload.
+
+        The offset is claimed with a lease before the file is touched, so
+        of two requests sending a chunk at the same offset only one writes
+        and the other gets UploadBusy. The lease is renewed while the chunk
+        arrives. Bytes that arrive before a client disconnects are kept, so
+        the client can resume from the offset reported afterwards.
+        Returns the new offset.
+        """
+        if session.file_path is not None:
+            raise ValueError("Upload is already complete")
+        if offset != session.received:
+            raise UploadOffsetMismatch(session.received)
+
+        lease_seconds = current_app.config['UPLOAD_CHUNK_LEASE_SECONDS']
+        lease = ChunkedUploadService._claim(session.id, offset, lease_seconds)
+        if lease is None:
+            db.session.refresh(session)
+            if session.received != offset:
+                raise UploadOffsetMismatch(session.received)
+            raise UploadBusy(offset)
+
+        with _hashes_lock:
+            tracked = _hashes.pop(session.id, None)
+        digest = tracked[1] if tracked and tracked[0] == offset else None
+
+        written = 0
+        limit = session.total_size - offset
+        renew_at = time.monotonic() + lease_seconds / 2
+        try:
+            with open(ChunkedUploadService.partial_path(session.id), 'r+b') as out:
+                out.seek(offset)
+                out.truncate()
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if written + len(chunk) > limit:
+                        raise ValueError("Chunk extends past the declared upload size")
+                    if time.monotonic() >= renew_at:
+                        lease = ChunkedUploadService._renew(session.id, lease, lease_seconds)
+                        if lease is None:
+                            raise UploadBusy(offset)
+                        renew_at = time.monotonic() + lease_seconds / 2
+                    out.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+                    written += len(chunk)
+        finally:
+            # Only record the bytes that made it to disk, and only while
+            # the lease is still this request's
+            if written:
+                metrics.record_file_bytes('write', written)
+            if lease is not None:
+                db.session.execute(
+                    update(UploadSession)
+                    .where(UploadSession.id == session.id, UploadSession.received == offset,
+                           UploadSession.locked_until == lease)
+                    .values(received=offset + written, locked_until=None, updated_at=datetime.utcnow())
+                )
+                db.session.commit()
+            db.session.refresh(session)
+            if digest is not None and lease is not None and session.received == offset + written:
+                with _hashes_lock:
+                    _hashes[session.id] = (session.received, digest)
+
+        return session.received
+
+    @staticmethod
+    def _claim(upload_id, offset, lease_seconds):
+        """Lease an upload for writing at offset; returns the lease, or None if taken"""
+        now = datetime.utcnow()
+        lease = now + timedelta(seconds=lease_seconds)
+        claimed = db.session.execute(
+            update(UploadSession)
+            .where(UploadSession.id == upload_id, UploadSession.received == offset,
+                   UploadSession.file_path.is_(None),
+                   or_(UploadSession.locked_until.is_(None), UploadSession.locked_until < now))
+            .values(locked_until=lease)
+        ).rowcount == 1
+        db.session.commit()
+        return lease if claimed else None
+
+    @staticmethod
+    def _renew(upload_id, lease, lease_seconds):
+        """Extend a lease still held; returns the new lease, or None if it was lost"""
+        renewed = datetime.utcnow() + timedelta(seconds=lease_seconds)
+        held = db.session.execute(
+            update(UploadSession)
+            .where(UploadSession.id == upload_id, UploadSession.locked_until == lease)
+            .values(locked_until=renewed)
+        ).rowcount == 1
+        db.session.commit()
+        return renewed if held else None
+
+    @staticmethod
+    def finalize(session):
+        """Verify a fully received upload and move it into the blob store.
+
+        Returns the blob path of the uploaded file.
+        """
+        if session.file_path is not None:
+            return session.file_path
+        if session.received != session.total_size:
+            raise ValueError(f"Upload incomplete: {session.received} of {session.total_size} bytes received")
+
+        partial_path = ChunkedUploadService.partial_path(session.id)
+        with _hashes_lock:
+            tracked = _hashes.pop(session.id, None)
+        if tracked and tracked[0] == session.received:
+            digest = tracked[1].hexdigest()
+        else:
+            digest = hashlib.sha256()
+            with open(partial_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            digest = digest.hexdigest()
+
+        if session.expected_sha256 and digest != session.expected_sha256:
+            raise ValueError("Checksum mismatch")
+
+        _, ext = os.path.splitext(session.filename)
+        session.file_path = BlobStore.ingest(partial_path, digest, session.total_size, ext.lower() or '.pdf')
+        session.updated_at = datetime.utcnow()
+        db.session.commit()
+
+        logger.info("Upload session %s finalized as %s", session.id, session.file_path)
+        return session.file_path
+
+    @staticmethod
+    def cleanup_batch(limit=None, now=None):
+        """Remove up to `limit` sessions idle past the TTL, oldest first.
+
+        Unfinished sessions take their partial file with them; a session
+        with a chunk being written (an unexpired lease) is left alone.
+        Returns the number of sessions removed.
+        """
+        limit = limit or current_app.config['UPLOAD_CLEANUP_BATCH_SIZE']
+        now = now or datetime.utcnow()
+        stale = [UploadSession.updated_at < now - timedelta(hours=current_app.config['UPLOAD_SESSION_TTL_HOURS']),
+                 or_(UploadSession.locked_until.is_(None), UploadSession.locked_until < now)]
+        upload_ids = db.session.scalars(
+            select(UploadSession.id).where(*stale).order_by(UploadSession.updated_at).limit(limit)
+        ).all()
+        if not upload_ids:
+            db.session.commit()
+            return 0
+
+        # Rechecked on delete, so a session resumed since the read is kept
+        removed = db.session.execute(
+            delete(UploadSession)
+            .where(UploadSession.id.in_(upload_ids), *stale)
+            .returning(UploadSession.id, UploadSession.file_path)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+
+        partial_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], '.partial')
+        for upload_id, file_path in removed:
+            with _hashes_lock:
+                _hashes.pop(upload_id, None)
+            if file_path is None:
+                try:
+                    os.remove(os.path.join(partial_folder, upload_id))
+                except FileNotFoundError:
+                    pass
+
+        logger.info("Removed %s expired upload sessions", len(removed))
+        return len(removed)
+
+    @staticmethod
+    def cleanup(now=None):
+        """Remove every session idle past the TTL at `now`, batch by batch"""
+        limit = current_app.config['UPLOAD_CLEANUP_BATCH_SIZE']
+        total = 0
+        while True:
+            removed = ChunkedUploadService.cleanup_batch(limit, now)
+            total += removed
+            if removed < limit:
+                return total
+
+class UploadCleanupWorker(BackgroundWorker):
+    """Thread that removes expired upload sessions a batch at a time"""
+
+    def run_once(self):
+        # A full batch means more may be stale, so carry on straight away
+        return ChunkedUploadService.cleanup_batch() >= current_app.config['UPLOAD_CLEANUP_BATCH_SIZE']
+
+class UploadCleaner:
+    """The upload session cleanup thread, started lazily in each process.
+
+    Runs at startup and then every UPLOAD_CLEANUP_INTERVAL seconds (0
+    disables it). Concurrent cleaners in other processes are safe: each
+    deletes only the rows still stale, and a partial file already gone is
+    skipped.
+    """
+
+    def __init__(self):
+        self.worker = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('UPLOAD_SESSION_TTL_HOURS', 24)
+        app.config.setdefault('UPLOAD_CLEANUP_BATCH_SIZE', 500)
+        app.config.setdefault('UPLOAD_CLEANUP_INTERVAL', 3600)
+        app.extensions['upload_cleaner'] = self
+
+        @app.before_request
+        def start_upload_cleaner():
+            if not app.testing and app.config['UPLOAD_CLEANUP_INTERVAL']:
+                self.start(app)
+
+    def start(self, app):
+        """Start the cleanup thread for this process if not already running"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.worker = UploadCleanupWorker(app, app.config['UPLOAD_CLEANUP_INTERVAL'], name='upload-cleaner')
+            self.worker.start()
+            self._pid = os.getpid()
+
+    def stop(self, timeout=None):
+        if self.worker is not None:
+            self.worker.stop(timeout)
+        self.worker = None
+        self._pid = None
+
+upload_cleaner = UploadCleaner()
@@ -0,0 +1,282 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.orm import selectinload
+from models import Consent, ConsentStatus, WebhookEvent
+from services.background import BackgroundWorker
+from services.cache_service import response_cache, CONSENTS, TRANSMISSIONS
+from services.consent_service import ConsentService
+from services.db_utils import dialect_insert
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_DOCUSEAL = 'docuseal'
+
+# DocuSeal event types that mean the patient finished signing
+SIGNING_EVENTS = {'form.completed', 'submission.completed'}
+
+class WebhookService:
+    """Service for the provider webhook inbox.
+
+    The callback endpoint only stores the raw event, keyed by the provider's
+    event id, and returns. A consumer applies the inbox in batches: events
+    are grouped per consent, redelivered and duplicate events collapse into
+    one state change, and events that arrive out of order are resolved by
+    the consent's current state rather than arrival order.
+    """
+
+    @staticmethod
+    def parse_timestamp(value):
+        """Parse an ISO 8601 timestamp into naive UTC, or None"""
+        if not isinstance(value, str):
+            return None
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+
+    @staticmethod
+    def event_id(payload, header_id=None):
+        """Get the provider event id, derived from the payload if not sent.
+
+        DocuSeal retries deliver the same body, so hashing the canonical JSON
+        gives retries the same id.
+        """
+        event_id = header_id or payload.get('event_id') or payload.get('id')
+        if event_id:
+            return str(event_id)
+        canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    @staticmethod
+    def consent_id(payload):
+        """Get our consent id from the external_id or metadata of the event"""
+        data = payload.get('data') or {}
+        metadata = data.get('metadata') or {}
+        value = data.get('external_id') or metadata.get('consent_id')
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def ingest(payload, header_id=None, provider=PROVIDER_DOCUSEAL):
+        """Store a raw webhook event in the inbox.
+
+        Returns False when the event was already received.
+        """
+        data = payload.get('data') or {}
+        result = db.session.execute(
+            dialect_insert(WebhookEvent).values(
+                provider=provider,
+                provider_event_id=WebhookService.event_id(payload, header_id),
+                event_type=str(payload.get('event_type') or 'unknown'),
+                consent_id=WebhookService.consent_id(payload),
+                occurred_at=WebhookService.parse_timestamp(data.get('completed_at') or payload.get('timestamp')),
+                payload=json.dumps(payload),
+                status='pending',
+                received_at=datetime.utcnow(),
+            ).on_conflict_do_nothing(index_elements=['provider', 'provider_event_id'])
+        )
+        db.session.commit()
+        return result.rowcount > 0
+
+    @staticmethod
+    def claim_pending(limit):
+        """Atomically claim up to `limit` inbox events for this consumer.
+
+        Events left in processing by a crashed consumer are claimed again
+        once WEBHOOK_LEASE_SECONDS have passed.
+        """
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=current_app.config['WEBHOOK_LEASE_SECONDS'])
+        claimable = or_(
+            WebhookEvent.status == 'pending',
+            and_(WebhookEvent.status == 'processing', WebhookEvent.claimed_at < stale),
+        )
+
+        if db.engine.dialect.name == 'postgresql':
+            claimed = WebhookEvent.query.filter(claimable)\
+                                        .order_by(WebhookEvent.id)\
+                                        .limit(limit)\
+                                        .with_for_update(skip_locked=True)\
+                                        .all()
+            for event in claimed:
+                event.status = 'processing'
+                event.claimed_at = now
+            db.session.commit()
+            return claimed
+
+        candidates = select(WebhookEvent.id).where(claimable)\
+                                            .order_by(WebhookEvent.id)\
+                                            .limit(limit)\
+                                            .scalar_subquery()
+        claimed_ids = db.session.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id.in_(candidates), claimable)
+            .values(status='processing', claimed_at=now)
+            .returning(WebhookEvent.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        db.session.commit()
+
+        if not claimed_ids:
+            return []
+        return WebhookEvent.query.filter(WebhookEvent.id.in_(claimed_ids))\
+                                 .order_by(WebhookEvent.id).all()
+
+    @staticmethod
+    def finish(event, status, error_message=None):
+        event.status = status
+        event.error_message = error_message
+        event.processed_at = datetime.utcnow()
+
+    @staticmethod
+    def apply_consent_events(consent, events):
+        """Apply every inbox event of one consent, in event time order.
+
+        Only a completion changes state. The earliest completion signs the
+        consent (with the provider's completion time); later or redelivered
+        completions and informational events are marked ignored.
+        Returns True when the consent was signed.
+        """
+        events = sorted(events, key=lambda event: (event.occurred_at or event.received_at, event.id))
+        if consent is None:
+            for event in events:
+                WebhookService.finish(event, 'ignored', 'Unknown consent')
+            return False
+
+        signing = [event for event in events if event.event_type in SIGNING_EVENTS]
+        for event in events:
+            if event.event_type not in SIGNING_EVENTS:
+                WebhookService.finish(event, 'ignored', 'No state change')
+        if not signing:
+            return False
+
+        first, duplicates = signing[0], signing[1:]
+        for event in duplicates:
+            WebhookService.finish(event, 'ignored', 'Duplicate completion')
+        if consent.status == ConsentStatus.SIGNED:
+            WebhookService.finish(first, 'ignored', 'Already signed')
+            return False
+        if not consent.file_path or not os.path.exists(consent.file_path):
+            WebhookService.finish(first, 'failed', f'Consent file not found: {consent.file_path}')
+            return False
+
+        ConsentService.complete_signature(consent, signed_at=first.occurred_at, commit=False)
+        WebhookService.finish(first, 'applied')
+        return True
+
+    @staticmethod
+    def process_batch(limit=None):
+        """Claim and apply one batch of inbox events in a single transaction.
+
+        If the batch transaction fails it is rolled back and its consents
+        are applied one by one, so one bad event cannot block the others.
+        Returns the number of events processed.
+        """
+        limit = limit or current_app.config['WEBHOOK_BATCH_SIZE']
+        claimed = WebhookService.claim_pending(limit)
+        if not claimed:
+            return 0
+
+        by_consent = {}
+        for event in claimed:
+            by_consent.setdefault(event.consent_id, []).append(event)
+        event_ids = {consent_id: [event.id for event in events] for consent_id, events in by_consent.items()}
+        consent_ids = [consent_id for consent_id in by_consent if consent_id is not None]
+
+        try:
+            consents = Consent.query.options(selectinload(Consent.transmissions))\
+                                    .filter(Consent.id.in_(consent_ids)).all()
+            consents = {consent.id: consent for consent in consents}
+            signed = 0
+            for consent_id, events in by_consent.items():
+                if WebhookService.apply_consent_events(consents.get(consent_id), events):
+                    signed += 1
+            if signed:
+                response_cache.bump(CONSENTS, TRANSMISSIONS)
+            db.session.commit()
+            logger.info("Applied %s webhook events, %s consents signed", len(claimed), signed)
+
+        except Exception as e:
+            logger.error("Error applying webhook batch, retrying per consent: %s", e)
+            db.session.rollback()
+            for consent_id, ids in event_ids.items():
+                WebhookService.apply_one(consent_id, ids)
+
+        return len(claimed)
+
+    @staticmethod
+    def apply_one(consent_id, event_ids):
+        """Apply the events of one consent in their own transaction"""
+        events = WebhookEvent.query.filter(WebhookEvent.id.in_(event_ids)).all()
+        try:
+            consent = db.session.get(Consent, consent_id) if consent_id is not None else None
+            if WebhookService.apply_consent_events(consent, events):
+                response_cache.bump(CONSENTS, TRANSMISSIONS)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for event in WebhookEvent.query.filter(WebhookEvent.id.in_(event_ids)).all():
+                WebhookService.finish(event, 'failed', str(e))
+            db.session.commit()
+
+class WebhookWorker(BackgroundWorker):
+    """Worker thread that drains the webhook inbox"""
+
+    def run_once(self):
+        return WebhookService.process_batch() > 0
+
+class WebhookConsumer:
+    """The webhook inbox consumer thread, started lazily in each process"""
+
+    def __init__(self):
+        self.worker = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('WEBHOOK_CONSUMER_ENABLED', True)
+        app.config.setdefault('WEBHOOK_BATCH_SIZE', 500)
+        app.config.setdefault('WEBHOOK_POLL_INTERVAL', 1.0)
+        app.config.setdefault('WEBHOOK_LEASE_SECONDS', 300)
+        app.extensions['webhook_consumer'] = self
+
+        @app.before_request
+        def start_webhook_consumer():
+            if not app.testing and app.config['WEBHOOK_CONSUMER_ENABLED']:
+                self.start(app)
+
+    def start(self, app):
+        """Start the consumer thread for this process if not already running"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.worker = WebhookWorker(app, app.config['WEBHOOK_POLL_INTERVAL'], name='webhook-consumer')
+            self.worker.start()
+            self._pid = os.getpid()
+
+    def notify(self):
+        """Wake the consumer after new events were stored"""
+        if self.worker is not None:
+            self.worker.wake()
+
+    def stop(self, timeout=None):
+        if self.worker is not None:
+            self.worker.stop(timeout)
+        self.worker = None
+        self._pid = None
+
+webhook_consumer = WebhookConsumer()
@@ -4,6 +4,15 @@
 let currentUploadedFile = null;
 let currentConsent = null;
 
+const MAX_UPLOAD_SIZE = 1024 * 1024 * 1024;
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+const MAX_CHUNK_RETRIES = 5;
+
+const CHANGE_EVENT_TYPES = [
+    'consent.created', 'consent.sent', 'consent.signed', 'consent.expired',
+    'transmission.sent', 'transmission.retrying', 'transmission.failed', 'transmission.delivered'
+];
+
 function initializeUpload() {
     const uploadArea = document.getElementById('upload-area');
     const fileInput = document.getElementById('file-input');
@@ -54,9 +63,15 @@ function uploadFile(file) {
         return;
     }
     
-    // Validate file size (16MB limit)
-    if (file.size > 16 * 1024 * 1024) {
-        showAlert('error', 'File size must be less than 16MB.');
+    // Validate file size (1GB limit for resumable uploads)
+    if (file.size > MAX_UPLOAD_SIZE) {
+        showAlert('error', 'File size must be less than 1GB.');
+        return;
+    }
+    
+    // Large scans go through the resumable chunked upload API
+    if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+        uploadFileInChunks(file);
         return;
     }
     
@@ -85,12 +100,77 @@ function uploadFile(file) {
     });
 }
 
+function uploadFileInChunks(file) {
+    showUploadStatus(true);
+    
+    const failUpload = function(xhr) {
+        showUploadStatus(false);
+        const error = xhr.responseJSON ? xhr.responseJSON.error : 'Upload failed';
+        showAlert('error', error);
+    };
+    
+    $.ajax({
+        url: '/api/uploads',
+        type: 'POST',
+        contentType: 'application/json',
+        data: JSON.stringify({filename: file.name, size: file.size}),
+        success: function(upload) {
+            sendNextChunk(file, upload.upload_id, 0, upload.chunk_size, MAX_CHUNK_RETRIES, failUpload);
+        },
+        error: failUpload
+    });
+}
+
+function sendNextChunk(file, uploadId, offset, chunkSize, retriesLeft, failUpload) {
+    if (offset >= file.size) {
+        $.ajax({
+            url: `/api/uploads/${uploadId}/complete`,
+            type: 'POST',
+            success: function(response) {
+                showUploadStatus(false);
+                currentUploadedFile = response;
+                showPDFPreview(file.name);
+                showAlert('success', 'File uploaded successfully!');
+            },
+            error: failUpload
+        });
+        return;
+    }
+    
+    $.ajax({
+        url: `/api/uploads/${uploadId}?offset=${offset}`,
+        type: 'PUT',
+        data: file.slice(offset, offset + chunkSize),
+        processData: false,
+        contentType: 'application/octet-stream',
+        success: function(response) {
+            sendNextChunk(file, uploadId, response.offset, chunkSize, MAX_CHUNK_RETRIES, failUpload);
+        },
+        error: function(xhr) {
+            if (retriesLeft === 0) {
+                failUpload(xhr);
+                return;
+            }
+            // Ask the server how far it got and resume from there
+            $.ajax({
+                url: `/api/uploads/${uploadId}`,
+                type: 'GET',
+                success: function(upload) {
+                    sendNextChunk(file, uploadId, upload.offset, chunkSize, retriesLeft - 1, failUpload);
+                },
+                error: failUpload
+            });
+        }
+    });
+}
+
 function showUploadStatus(show) {
     $('#upload-status').toggle(show);
 }
 
 function showPDFPreview(filename) {
     $('#pdf-filename').text(filename);
+    $('#pdf-open-link').attr('href', `/api/files/${currentUploadedFile.file_path}`);
     $('#pdf-preview').show();
 }
 
@@ -185,8 +265,8 @@ function sendConsent() {
                 success: function(transmission) {
                     $('#sendModal').modal('hide');
                     resetForm();
-                    showAlert('success', `Consent sent successfully via ${deliveryMethod}!`);
-                    loadDashboardData();
+                    showAlert('success', `Consent queued for delivery via ${deliveryMethod}!`);
+                    refreshAfterChange();
                 },
                 error: function(xhr) {
                     const error = xhr.responseJSON ? xhr.responseJSON.error : 'Failed to send consent';
@@ -210,18 +290,103 @@ function resetForm() {
 }
 
 function loadDashboardData() {
+    loadStats();
     loadOutgoingConsents();
     loadReceivedConsents();
     loadTransmissionHistory();
 }
 
+// Only the columns the dashboard tables render
+const CONSENT_LIST_FIELDS = 'patient_name,form_name,status,sent_at,signed_at';
+
+function subscribeToChanges() {
+    if (!window.EventSource) {
+        // Browsers without server-sent events fall back to polling
+        setInterval(loadDashboardData, 30000);
+        return;
+    }
+    
+    // The browser reconnects on its own and resumes from the last event id
+    const source = new EventSource('/api/events/stream');
+    const pending = {consents: false, transmissions: false};
+    let refreshTimer = null;
+    
+    const scheduleRefresh = function(event) {
+        const change = JSON.parse(event.data);
+        if (change.event_type.startsWith('consent.')) {
+            pending.consents = true;
+        }
+        if (change.transmission_id) {
+            pending.transmissions = true;
+        }
+        
+        // Coalesce bursts of events (e.g. a batch send) into one refresh
+        if (refreshTimer === null) {
+            refreshTimer = setTimeout(function() {
+                loadStats();
+                if (pending.consents) {
+                    loadOutgoingConsents();
+                    loadReceivedConsents();
+                }
+                if (pending.transmissions) {
+                    loadTransmissionHistory();
+                }
+                pending.consents = pending.transmissions = false;
+                refreshTimer = null;
+            }, 250);
+        }
+    };
+    
+    CHANGE_EVENT_TYPES.forEach(type => source.addEventListener(type, scheduleRefresh));
+    
+    // A refused stream (503 when the server has no stream slot free) is not
+    // retried by the browser: poll for a while, then subscribe again
+    source.onerror = function() {
+        if (source.readyState === EventSource.CLOSED) {
+            const poller = setInterval(loadDashboardData, 30000);
+            setTimeout(function() {
+                clearInterval(poller);
+                subscribeToChanges();
+            }, 300000);
+        }
+    };
+}
+
+function refreshAfterChange() {
+    // With an event stream open the server pushes the change instead
+    if (!window.EventSource) {
+        loadDashboardData();
+    }
+}
+
+function loadStats() {
+    // Pre-aggregated counters, so the tiles cost the same at any table size
+    $.ajax({
+        url: '/api/stats',
+        type: 'GET',
+        success: function(stats) {
+            $('#outgoing-count').text(stats.consents.sent);
+            $('#received-count').text(stats.consents.signed);
+            $('#stat-outgoing').text(stats.consents.sent);
+            $('#stat-received').text(stats.consents.signed);
+            $('#stat-expired').text(stats.consents.expired);
+            Object.keys(stats.transmissions).forEach(method => {
+                const rate = stats.transmissions[method].success_rate;
+                $(`#stat-success-${method}`).text(rate === null ? '-' : `${(rate * 100).toFixed(1)}%`);
+            });
+        },
+        error: function(xhr) {
+            console.error('Failed to load stats:', xhr);
+        }
+    });
+}
+
 function loadOutgoingConsents() {
     $.ajax({
-        url: '/api/consents?status=sent',
+        url: `/api/consents?status=sent&fields=${CONSENT_LIST_FIELDS}`,
         type: 'GET',
-        success: function(consents) {
-            populateConsentTable('outgoing', consents, true);
-            $('#outgoing-count').text(consents.length);
+        success: function(page) {
+            populateConsentTable('outgoing', page.consents, true);
         },
         error: function(xhr) {
             console.error('Failed to load outgoing consents:', xhr);
@@ -231,11 +396,10 @@ function loadOutgoingConsents() {
 
 function loadReceivedConsents() {
     $.ajax({
-        url: '/api/consents?status=signed',
+        url: `/api/consents?status=signed&fields=${CONSENT_LIST_FIELDS}`,
         type: 'GET',
-        success: function(consents) {
-            populateConsentTable('received', consents, false);
-            $('#received-count').text(consents.length);
+        success: function(page) {
+            populateConsentTable('received', page.consents, false);
         },
         error: function(xhr) {
             console.error('Failed to load received consents:', xhr);
@@ -244,48 +408,15 @@ function loadReceivedConsents() {
 }
 
 function loadTransmissionHistory() {
-    // Load all consents and their transmissions
+    // One request returns transmissions already joined with the patient name
     $.ajax({
-        url: '/api/consents',
+        url: '/api/transmissions',
         type: 'GET',
-        success: function(consents) {
-            const allTransmissions = [];
-            let loadCount = 0;
-            
-            if (consents.length === 0) {
-                populateHistoryTable([]);
-                return;
-            }
-            
-            consents.forEach(consent => {
-                $.ajax({
-                    url: `/api/consents/${consent.id}/history`,
-                    type: 'GET',
-                    success: function(transmissions) {
-                        transmissions.forEach(transmission => {
-                            transmission.patient_name = consent.patient_name;
-                        });
-                        allTransmissions.push(...transmissions);
-                        loadCount++;
-                        
-                        if (loadCount === consents.length) {
-                            // Sort by date descending
-                            allTransmissions.sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
-                            populateHistoryTable(allTransmissions);
-                        }
-                    },
-                    error: function(xhr) {
-                        console.error(`Failed to load history for consent ${consent.id}:`, xhr);
-                        loadCount++;
-                        if (loadCount === consents.length) {
-                            populateHistoryTable(allTransmissions);
-                        }
-                    }
-                });
-            });
+        success: function(page) {
+            populateHistoryTable(page.transmissions);
         },
         error: function(xhr) {
-            console.error('Failed to load consents for history:', xhr);
+            console.error('Failed to load transmission history:', xhr);
         }
     });
 }
@@ -308,7 +439,11 @@ function populateConsentTable(tableType, consents, includeActions) {
         const row = $('<tr></tr>');
         
         row.append(`<td>${escapeHtml(consent.patient_name)}</td>`);
-        row.append(`<td>${escapeHtml(consent.form_name)}</td>`);
+        if (tableType === 'received') {
+            row.append(`<td><a href="/api/consents/${consent.id}/document?signed=1" target="_blank">${escapeHtml(consent.form_name)}</a></td>`);
+        } else {
+            row.append(`<td>${escapeHtml(consent.form_name)}</td>`);
+        }
         row.append(`<td>${formatDate(consent.sent_at)}</td>`);
         
         if (tableType === 'received') {
@@ -368,7 +503,7 @@ function simulateSignature(consentId) {
         type: 'POST',
         success: function(response) {
             showAlert('success', 'Signature completed successfully!');
-            loadDashboardData();
+            refreshAfterChange();
         },
         error: function(xhr) {
             const error = xhr.responseJSON ? xhr.responseJSON.error : 'Failed to complete signature';
@@ -1 +1,12 @@
 # Tests package initialization
+import os
+import atexit
+import tempfile
+
+# Run the suite against a throwaway database rather than the development one
+if 'DATABASE_URL' not in os.environ:
+    _fd, _path = tempfile.mkstemp(suffix='.db', prefix='tests_')
+    os.close(_fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{_path}'
+    atexit.register(lambda: [os.remove(path) for path in (_path, f'{_path}-wal', f'{_path}-shm')
+                             if os.path.exists(path)])
@@ -0,0 +1,50 @@
+import unittest
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class AppFactoryTestCase(unittest.TestCase):
+    """Startup runs in child processes so each one begins from a clean import."""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.workdir = tempfile.mkdtemp()
+        self.database = os.path.join(self.workdir, 'factory.db')
+        self.env = dict(os.environ, DATABASE_URL=f'sqlite:///{self.database}', PYTHONPATH=ROOT)
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        shutil.rmtree(self.workdir)
+
+    def _run(self, *args):
+        result = subprocess.run([sys.executable, *args], cwd=self.workdir, env=self.env,
+                                capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout
+
+    def test_create_app_has_no_side_effects(self):
+        """Test that building an app and serving a request touches neither the database nor the disk."""
+        self._run('-c', 'from app import create_app\n'
+                        'app = create_app({"TESTING": True})\n'
+                        'assert app.test_client().get("/").status_code == 200')
+        self.assertEqual(sorted(os.listdir(self.workdir)), [])
+
+    def test_bootstrap_command_creates_schema(self):
+        """Test that `flask bootstrap` creates the folders and tables, and can be rerun."""
+        for _ in range(2):
+            output = self._run('-m', 'flask', '--app', 'main', 'bootstrap')
+            self.assertIn('up to date', output)
+
+        self.assertTrue(os.path.isdir(os.path.join(self.workdir, 'uploads')))
+        self.assertTrue(os.path.isdir(os.path.join(self.workdir, 'signed')))
+        with sqlite3.connect(self.database) as conn:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertTrue({'consents', 'transmissions', 'blobs', 'consent_search'} <= tables)
+
+if __name__ == '__main__':
+    unittest.main()
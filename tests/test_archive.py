@@ -0,0 +1,228 @@
+import unittest
+import io
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+from app import app, db
+from models import ArchivedConsent, Blob, Consent, Transmission, ConsentStatus, DeliveryMethod, TransmissionStatus
+from services.archive_service import ArchiveService, _read_block
+from services.blob_store import BlobStore
+from services.consent_service import ConsentService
+from services.stats_service import StatsService
+
+TEST_PDF = b'%PDF-1.4\n1 0 obj\n<<\n/Type /Catalog\n>>\nendobj\n' + b'% padding\n' * 200 + b'%%EOF'
+
+class ArchiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+        self.settings = {key: app.config[key] for key in
+                         ('UPLOAD_FOLDER', 'SIGNED_FOLDER', 'ARCHIVE_FOLDER', 'ARCHIVE_AFTER_DAYS',
+                          'ARCHIVE_BLOCK_RECORDS')}
+        app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+        app.config['SIGNED_FOLDER'] = tempfile.mkdtemp()
+        app.config['ARCHIVE_FOLDER'] = tempfile.mkdtemp()
+        app.config['ARCHIVE_AFTER_DAYS'] = 90
+
+        self.app = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+
+        response = self.app.post('/api/upload', data={'file': (io.BytesIO(TEST_PDF), 'intake.pdf')},
+                                 content_type='multipart/form-data')
+        self.file_path = response.get_json()['file_path']
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        for key in ('UPLOAD_FOLDER', 'SIGNED_FOLDER', 'ARCHIVE_FOLDER'):
+            shutil.rmtree(app.config[key])
+        app.config.update(self.settings)
+
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def _signed(self, days_ago, transmission_status=TransmissionStatus.SENT):
+        """Create a consent sent by email and signed `days_ago` days ago"""
+        signed_at = datetime.utcnow() - timedelta(days=days_ago)
+        consent = Consent(patient_name='Archive Patient', patient_email='patient@example.com',
+                          form_name='intake.pdf', file_path=self.file_path,
+                          status=ConsentStatus.SENT, created_at=signed_at, sent_at=signed_at)
+        db.session.add(consent)
+        db.session.flush()
+        StatsService.consent_transition(None, ConsentStatus.SENT, when=signed_at)
+        db.session.add(Transmission(consent_id=consent.id, method=DeliveryMethod.EMAIL,
+                                    recipient='patient@example.com', status=transmission_status,
+                                    created_at=signed_at, sent_at=signed_at))
+        StatsService.transmission_transition(DeliveryMethod.EMAIL, None, transmission_status, when=signed_at)
+        db.session.commit()
+        ConsentService.complete_signature(consent, signed_at=signed_at)
+        Transmission.query.filter_by(consent_id=consent.id, status=TransmissionStatus.DELIVERED)\
+                          .update({'delivered_at': signed_at})
+        if transmission_status == TransmissionStatus.PENDING:
+            # Signing settles queued deliveries now; rows signed before it
+            # did can still have one outstanding
+            Transmission.query.filter_by(consent_id=consent.id)\
+                              .update({'status': TransmissionStatus.PENDING, 'delivered_at': None})
+        db.session.commit()
+        return consent.id
+
+    def test_old_signed_consents_move_to_the_archive(self):
+        """Test that archiving keeps history, documents and dashboard totals readable."""
+        with app.app_context():
+            archived_id = self._signed(400)
+            outstanding_id = self._signed(400, TransmissionStatus.PENDING)
+            recent_id = self._signed(10)
+            newest_id = self._signed(400)
+            signed_path = db.session.get(Consent, archived_id).signed_file_path
+            StatsService.reconcile()
+            dashboard = StatsService.dashboard()
+
+        history = self.app.get(f'/api/consents/{archived_id}/audit').get_json()
+        self.assertEqual([event['event_type'] for event in history][:2],
+                         ['consent.signed', 'transmission.delivered'])
+        transmissions = self.app.get(f'/api/consents/{archived_id}/history').get_json()
+        self.assertEqual([transmission['status'] for transmission in transmissions], ['delivered'])
+
+        with app.app_context():
+            self.assertEqual(ArchiveService.sweep(), 1)
+            self.assertIsNone(db.session.get(Consent, archived_id))
+            self.assertEqual(Transmission.query.filter_by(consent_id=archived_id).count(), 0)
+            self.assertEqual({consent.id for consent in Consent.query},
+                             {outstanding_id, recent_id, newest_id})
+
+            # The signed link is gone; the upload still holds the blob
+            self.assertFalse(os.path.exists(signed_path))
+            digest = BlobStore.digest_from_path(self.file_path)
+            self.assertEqual(db.session.get(Blob, digest).ref_count, 4)
+
+            entry = db.session.get(ArchivedConsent, archived_id)
+            self.assertEqual(entry.document_sha256, hashlib.sha256(TEST_PDF).hexdigest())
+            self.assertTrue(entry.document_compressed)
+            self.assertEqual(ArchiveService.find_document(signed_path).consent_id, archived_id)
+
+            # Segments are plain gzipped NDJSON
+            with gzip.open(os.path.join(app.config['ARCHIVE_FOLDER'], entry.segment)) as f:
+                record, = [json.loads(line) for line in f]
+            self.assertEqual(record['consent']['id'], archived_id)
+            self.assertEqual(record['transmissions'][0]['status'], 'delivered')
+
+            self.assertEqual(StatsService.dashboard(), dashboard)
+            self.assertEqual(StatsService.reconcile(), 0)
+
+        self.assertEqual(self.app.get(f'/api/consents/{archived_id}/audit').get_json(), history)
+        self.assertEqual(self.app.get(f'/api/consents/{archived_id}/history').get_json(), transmissions)
+
+        response = self.app.get(f'/api/consents/{archived_id}/document?signed=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, TEST_PDF)
+        self.assertEqual(response.headers['Content-Disposition'], 'inline; filename=intake_signed.pdf')
+        etag = response.headers['ETag']
+
+        response = self.app.get(f'/api/consents/{archived_id}/document?signed=1', headers={'Range': 'bytes=0-7'})
+        self.assertEqual((response.status_code, response.data), (206, TEST_PDF[:8]))
+        response = self.app.get(f'/api/consents/{archived_id}/document?signed=1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        # The unsigned form is still served from the live store
+        response = self.app.get(f'/api/consents/{archived_id}/document')
+        self.assertEqual(response.data, TEST_PDF)
+        self.assertEqual(self.app.get('/api/consents/999999/document').status_code, 404)
+
+        response = self.app.get('/api/consents/999999/history')
+        self.assertEqual((response.status_code, response.get_json()), (404, {'error': 'Consent not found'}))
+        # A damaged segment fails the read with the route's error, not a crash
+        with app.app_context():
+            segment = db.session.get(ArchivedConsent, archived_id).segment
+        with open(os.path.join(app.config['ARCHIVE_FOLDER'], segment), 'wb') as f:
+            f.write(b'not gzip')
+        _read_block.cache_clear()
+        response = self.app.get(f'/api/consents/{archived_id}/history')
+        self.assertEqual((response.status_code, response.get_json()), (500, {'error': 'Failed to fetch history'}))
+        # Live consents never touch the archive
+        self.assertEqual(self.app.get(f'/api/consents/{recent_id}/history').status_code, 200)
+
+    def test_segments_are_bucketed_by_month_in_blocks(self):
+        """Test that each month gets its own segment and pack, and every record reads back."""
+        app.config['ARCHIVE_BLOCK_RECORDS'] = 2
+        with app.app_context():
+            ids = [self._signed(days) for days in (400, 401, 402, 403, 404, 300)]
+            self._signed(0)
+            self.assertEqual(ArchiveService.sweep(limit=4), 6)
+
+            entries = {entry.consent_id: entry for entry in ArchivedConsent.query}
+            self.assertEqual(set(entries), set(ids))
+            self.assertEqual(len({entry.partition for entry in entries.values()}),
+                             len({(datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m')
+                                  for days in (400, 401, 402, 403, 404, 300)}))
+            # Identical documents in a pack are stored once
+            for pack in {entry.document_pack for entry in entries.values()}:
+                offsets = {entry.document_offset for entry in entries.values() if entry.document_pack == pack}
+                self.assertEqual(offsets, {0})
+
+            for consent_id in ids:
+                entry, record = ArchiveService.load(consent_id)
+                self.assertEqual(record['consent']['id'], consent_id)
+                self.assertEqual(record['consent']['status'], 'signed')
+                self.assertEqual(ArchiveService.read_document(entry), TEST_PDF)
+            self.assertIsNone(ArchiveService.load(999999))
+
+    def test_large_documents_are_streamed(self):
+        """Test that big documents are packed and served without being held in memory whole."""
+        size = 4 * 1024 * 1024
+        documents = {
+            'compressible': b'%PDF-1.4\n' + b'BT /F1 11 Tf (Consent form) Tj ET\n' * (size // 34),
+            'incompressible': b'%PDF-1.4\n' + os.urandom(size),
+        }
+        ids = {}
+        with app.app_context():
+            for name, data in documents.items():
+                response = self.app.post('/api/upload', data={'file': (io.BytesIO(data), f'{name}.pdf')},
+                                         content_type='multipart/form-data')
+                self.file_path = response.get_json()['file_path']
+                ids[name] = self._signed(400)
+            self._signed(0)
+
+            tracemalloc.start()
+            try:
+                self.assertEqual(ArchiveService.sweep(), 2)
+                packed_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.reset_peak()
+
+                for name, data in documents.items():
+                    entry = db.session.get(ArchivedConsent, ids[name])
+                    self.assertEqual(entry.document_compressed, name == 'compressible')
+                    self.assertEqual(entry.document_size, len(data))
+                    response = self.app.get(f'/api/consents/{ids[name]}/document?signed=1')
+                    self.assertEqual(response.headers['Content-Length'], str(len(data)))
+                    self.assertEqual(hashlib.sha256(response.data).hexdigest(), entry.document_sha256)
+                    response.close()
+                del response
+
+                tracemalloc.reset_peak()
+                for name, data in documents.items():
+                    response = self.app.get(f'/api/consents/{ids[name]}/document?signed=1',
+                                            headers={'Range': 'bytes=3000000-3000099'})
+                    self.assertEqual((response.status_code, response.data), (206, data[3000000:3000100]))
+                    response.close()
+                ranged_peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+            self.assertLess(packed_peak, size // 4)
+            self.assertLess(ranged_peak, size // 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,247 @@
+import unittest
+import os
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+from app import app, db
+from asgi import AsgiAdapter
+from models import Consent, ConsentStatus, DeliveryMethod
+from services.consent_service import ConsentService
+from services.event_service import event_broker
+
+TEST_PDF = b'%PDF-1.4\n1 0 obj\n<<\n/Type /Catalog\n>>\nendobj\ntrailer\n<<\n/Root 1 0 R\n>>\n%%EOF'
+
+def scope(method, path, query=b'', headers=()):
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'root_path': '',
+        'query_string': query, 'headers': [(name.encode(), value.encode()) for name, value in headers],
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+
+async def call(adapter, scope, chunks=None, delay=0):
+    """Send a list of body chunks, `delay` seconds apart, and collect the response.
+
+    Chunks the adapter did not read are left in the list.
+    """
+    chunks = [b''] if chunks is None else chunks
+    messages = []
+
+    async def receive():
+        if not chunks:
+            await asyncio.sleep(3600)
+            return {'type': 'http.disconnect'}
+        if delay:
+            await asyncio.sleep(delay)
+        chunk = chunks.pop(0)
+        return {'type': 'http.request', 'body': chunk, 'more_body': bool(chunks)}
+
+    async def send(message):
+        messages.append(message)
+
+    await adapter(scope, receive, send)
+    start, *body = messages
+    return start['status'], dict(start['headers']), b''.join(m['body'] for m in body), len(body)
+
+def multipart(field, filename, data, boundary='asgi-test-boundary'):
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: application/pdf\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+class AsgiAdapterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+        self.settings = {key: app.config[key] for key in
+                         ('UPLOAD_FOLDER', 'MAX_CONTENT_LENGTH', 'ASGI_THREADS', 'ASGI_RESPONSE_BUFFER',
+                          'EVENT_POLL_INTERVAL', 'EVENT_HEARTBEAT_SECONDS', 'EVENT_STREAM_MAX_SECONDS')}
+        app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+
+        self.app = app.test_client()
+        self.adapter = AsgiAdapter(app)
+
+        with app.app_context():
+            db.create_all()
+            consent = Consent(patient_name='Asgi Patient', patient_email='asgi@example.com',
+                              form_name='intake.pdf', file_path='uploads/intake.pdf', status=ConsentStatus.DRAFT)
+            db.session.add(consent)
+            db.session.commit()
+            self.consent_id = consent.id
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        if self.adapter.executor is not None:
+            self.adapter.executor.shutdown()
+        event_broker.stop()
+        shutil.rmtree(app.config['UPLOAD_FOLDER'])
+        app.config.update(self.settings)
+
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def test_reads_match_the_wsgi_app(self):
+        """Test that list and history responses are the same over ASGI."""
+        for path, query in (('/api/consents', b'limit=10'), (f'/api/consents/{self.consent_id}/history', b'')):
+            status, headers, body, _ = asyncio.run(call(self.adapter, scope('GET', path, query)))
+            expected = self.app.get(f'{path}?{query.decode()}')
+            self.assertEqual(status, expected.status_code)
+            self.assertEqual(headers[b'content-type'], expected.headers['Content-Type'].encode())
+            self.assertEqual(json.loads(body), expected.get_json())
+
+    def test_bodies_sent_in_chunks(self):
+        """Test that upload, send and webhook bodies arrive whole when trickled in."""
+        body, content_type = multipart('file', 'intake.pdf', TEST_PDF)
+        status, _, response, _ = asyncio.run(call(
+            self.adapter, scope('POST', '/api/upload', headers=[('content-type', content_type)]),
+            [body[i:i + 16] for i in range(0, len(body), 16)]))
+        self.assertEqual(status, 200, response)
+        with open(json.loads(response)['file_path'], 'rb') as f:
+            self.assertEqual(f.read(), TEST_PDF)
+
+        body = json.dumps({'delivery_method': 'email', 'recipient': 'asgi@example.com'}).encode()
+        status, _, response, _ = asyncio.run(call(
+            self.adapter, scope('POST', f'/api/consents/{self.consent_id}/send',
+                                headers=[('content-type', 'application/json')]),
+            [body[:10], body[10:]]))
+        self.assertEqual(status, 202, response)
+        self.assertEqual(json.loads(response)['recipient'], 'asgi@example.com')
+
+        body = json.dumps({'event_type': 'form.viewed', 'data': {'id': 1}}).encode()
+        headers = [('content-type', 'application/json'), ('x-webhook-id', 'evt-asgi-1')]
+        results = [asyncio.run(call(self.adapter, scope('POST', '/api/docuseal-callback', headers=headers),
+                                    [body[:5], body[5:]]))
+                   for _ in range(2)]
+        self.assertEqual([status for status, *_ in results], [202, 202])
+        self.assertEqual([json.loads(response)['duplicate'] for _, _, response, _ in results], [False, True])
+
+    def test_streamed_response_is_sent_in_parts(self):
+        """Test that a streamed body goes out as several messages, in order."""
+        app.config['ASGI_RESPONSE_BUFFER'] = 64
+        with app.app_context():
+            db.session.add_all([Consent(patient_name=f'Export Patient {i}', form_name='intake.pdf',
+                                        file_path='uploads/intake.pdf') for i in range(200)])
+            db.session.commit()
+
+        status, _, body, parts = asyncio.run(call(self.adapter, scope('GET', '/api/export/consents',
+                                                                      b'format=ndjson')))
+        self.assertEqual(status, 200)
+        self.assertGreater(parts, 1)
+        lines = body.decode().splitlines()
+        self.assertEqual(len(lines), 201)
+        self.assertEqual(body, self.app.get('/api/export/consents?format=ndjson').data)
+
+    def test_slow_clients_do_not_hold_threads(self):
+        """Test that with one view thread, a fast request overtakes trickling uploads."""
+        app.config['ASGI_THREADS'] = 1
+        self.adapter = AsgiAdapter(app)
+        body, content_type = multipart('file', 'intake.pdf', TEST_PDF)
+        chunks = [body[i:i + 32] for i in range(0, len(body), 32)]
+
+        async def run():
+            slow = [asyncio.create_task(call(self.adapter, scope('POST', '/api/upload',
+                                                                 headers=[('content-type', content_type)]),
+                                             list(chunks), delay=0.05))
+                    for _ in range(20)]
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            status, *_ = await call(self.adapter, scope('GET', '/api/consents'))
+            elapsed = time.perf_counter() - started
+            results = await asyncio.gather(*slow)
+            return status, elapsed, [result[0] for result in results]
+
+        status, elapsed, statuses = asyncio.run(run())
+        self.assertEqual(status, 200)
+        self.assertLess(elapsed, 0.05 * len(chunks) / 2)
+        self.assertEqual(statuses, [200] * 20)
+
+    def test_event_stream_frames_arrive_while_it_is_open(self):
+        """Test that SSE frames are forwarded as they happen, without holding a view thread."""
+        app.config.update({'ASGI_THREADS': 1, 'EVENT_POLL_INTERVAL': 0.05,
+                           'EVENT_HEARTBEAT_SECONDS': 0.1, 'EVENT_STREAM_MAX_SECONDS': 30})
+        self.adapter = AsgiAdapter(app)
+
+        def send_consent():
+            with app.app_context():
+                ConsentService.send_consent(db.session.get(Consent, self.consent_id),
+                                            DeliveryMethod.EMAIL, 'asgi@example.com')
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            frames = asyncio.Queue()
+            disconnect = asyncio.Event()
+            requests = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+            async def receive():
+                if requests:
+                    return requests.pop()
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                await frames.put(message)
+
+            started = time.monotonic()
+            stream = asyncio.create_task(self.adapter(scope('GET', '/api/events/stream'), receive, send))
+            start = await asyncio.wait_for(frames.get(), 5)
+            retry = await asyncio.wait_for(frames.get(), 5)
+
+            # The only view thread is free for other requests meanwhile
+            status, *_ = await asyncio.wait_for(call(self.adapter, scope('GET', '/api/consents')), 5)
+
+            await loop.run_in_executor(None, send_consent)
+            event_broker.notify()
+            body = b''
+            while b'event: consent.sent' not in body:
+                body += (await asyncio.wait_for(frames.get(), 5))['body']
+            received = time.monotonic() - started
+
+            disconnect.set()
+            await asyncio.wait_for(stream, 5)
+            return start, retry, status, body, received
+
+        start, retry, status, body, received = asyncio.run(run())
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), start['headers'])
+        self.assertEqual(retry['body'], b'retry: 3000\n\n')
+        self.assertEqual(status, 200)
+        self.assertIn(f'"consent_id": {self.consent_id}'.encode(), body)
+        self.assertLess(received, 5)
+
+    def test_oversized_body_is_refused(self):
+        """Test that the app's own 413 is returned without reading the whole body."""
+        app.config['MAX_CONTENT_LENGTH'] = 1024
+        body = json.dumps({'event_type': 'form.viewed', 'padding': 'x' * 8192}).encode()
+        chunks = [body[i:i + 512] for i in range(0, len(body), 512)]
+        for headers in ([('content-type', 'application/json')],
+                        [('content-type', 'application/json'), ('content-length', str(len(body)))]):
+            pending = list(chunks)
+            status, *_ = asyncio.run(call(self.adapter, scope('POST', '/api/docuseal-callback', headers=headers),
+                                          pending))
+            self.assertEqual(status, 413)
+            self.assertTrue(pending)
+
+    def test_lifespan(self):
+        """Test that startup and shutdown are acknowledged."""
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.adapter({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+if __name__ == '__main__':
+    unittest.main()
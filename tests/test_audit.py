@@ -0,0 +1,162 @@
+import unittest
+import os
+import tempfile
+from app import app, db
+from models import ConsentEvent, Consent, Transmission, DeliveryMethod, TransmissionStatus
+from services.audit_service import audit_log
+from services.consent_service import ConsentService
+from services.delivery_service import DeliveryService, DeliveryError, FakeGateway
+
+class FlakyGateway(FakeGateway):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def send(self, transmission):
+        if self.failures:
+            self.failures -= 1
+            raise DeliveryError("Gateway timeout")
+
+class AuditLogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+        self.backoff = app.config['DELIVERY_BACKOFF_SECONDS']
+        app.config['DELIVERY_BACKOFF_SECONDS'] = 0
+
+        self.app = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        DeliveryService.adapters.clear()
+        app.config['DELIVERY_BACKOFF_SECONDS'] = self.backoff
+
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def _create_consent(self):
+        consent = Consent()
+        consent.patient_name = "Jane Smith"
+        consent.form_name = "consent_form.pdf"
+        consent.file_path = "/uploads/consent_form.pdf"
+        db.session.add(consent)
+        db.session.commit()
+        return consent
+
+    def test_audit_trail_keeps_every_attempt(self):
+        """Test that retries stay in the trail after the transmission is sent."""
+        DeliveryService.register_adapter(DeliveryMethod.SMS, FlakyGateway(failures=1))
+        with app.app_context():
+            consent = self._create_consent()
+            ConsentService.send_consent(consent, DeliveryMethod.SMS, "+15550001111")
+            DeliveryService.process_pending()
+            DeliveryService.process_pending()
+            consent_id = consent.id
+
+            # Without a flusher thread (as under tests) entries are written on commit
+            self.assertEqual(ConsentEvent.query.filter_by(consent_id=consent_id).count(), 3)
+
+        history = self.app.get(f'/api/consents/{consent_id}/audit').get_json()
+        self.assertEqual([event['event_type'] for event in history],
+                         ['transmission.sent', 'transmission.retrying', 'consent.sent'])
+        self.assertEqual(history[1]['detail'], 'Gateway timeout')
+        self.assertEqual(history[1]['attempts'], 1)
+        self.assertEqual(history[0]['attempts'], 2)
+        self.assertEqual(history[2]['recipient'], '+15550001111')
+
+        # The history endpoint still lists the transmission rows
+        transmissions = self.app.get(f'/api/consents/{consent_id}/history').get_json()
+        self.assertEqual(len(transmissions), 1)
+        self.assertEqual(transmissions[0]['status'], 'sent')
+        self.assertEqual(transmissions[0]['attempts'], 2)
+        self.assertEqual(set(transmissions[0]), set(Transmission.SERIALIZABLE_FIELDS))
+
+    def test_rolled_back_changes_are_not_audited(self):
+        """Test that only committed state changes reach the audit log."""
+        with app.app_context():
+            consent = self._create_consent()
+            ConsentService.send_consent(consent, DeliveryMethod.EMAIL, "jane@example.com")
+            audit_log.record('consent.signed', consent)
+            db.session.rollback()
+            db.session.commit()
+
+            events = [event.event_type for event in ConsentEvent.query.filter_by(consent_id=consent.id)]
+            self.assertEqual(events, ['consent.sent'])
+
+    def test_batch_send_logs_every_consent(self):
+        """Test that a batch send logs an entry per consent with its recipient."""
+        with app.app_context():
+            patients = [{'patient_name': f'Patient {i}', 'recipient': f'p{i}@example.com'} for i in range(7)]
+            results = ConsentService.batch_send('form.pdf', '/uploads/form.pdf', DeliveryMethod.EMAIL, patients)
+            consent_ids = [result['consent_id'] for result in results]
+
+            written = ConsentEvent.query.filter(ConsentEvent.consent_id.in_(consent_ids)).all()
+            self.assertEqual(len(written), 7)
+            self.assertEqual({event.recipient for event in written}, {f'p{i}@example.com' for i in range(7)})
+            self.assertTrue(all(event.method == 'email' for event in written))
+
+    def test_entries_are_buffered_until_flushed(self):
+        """Test that a running flusher takes log writes off the committing request."""
+        self.addCleanup(app.config.__setitem__, 'AUDIT_FLUSH_INTERVAL', app.config['AUDIT_FLUSH_INTERVAL'])
+        app.config['AUDIT_FLUSH_INTERVAL'] = 60
+
+        with app.app_context():
+            consent = self._create_consent()
+            # Outside tests the first commit with entries starts the flusher
+            app.config['TESTING'] = False
+            try:
+                ConsentService.send_consent(consent, DeliveryMethod.EMAIL, "jane@example.com")
+            finally:
+                app.config['TESTING'] = True
+            consent_id = consent.id
+            self.addCleanup(audit_log.close)
+            self.assertIsNotNone(audit_log.flusher)
+            self.assertEqual(ConsentEvent.query.filter_by(consent_id=consent_id).count(), 0)
+
+        # This process's unwritten entries are already in the trail
+        history = self.app.get(f'/api/consents/{consent_id}/audit').get_json()
+        self.assertEqual([(event['id'], event['event_type']) for event in history], [(None, 'consent.sent')])
+
+        # Stopping the process writes the buffer out
+        audit_log.close()
+        with app.app_context():
+            written, = ConsentEvent.query.filter_by(consent_id=consent_id).all()
+            self.assertEqual(written.recipient, 'jane@example.com')
+            self.assertIsNotNone(written.occurred_at)
+            self.assertGreaterEqual(written.created_at, written.occurred_at)
+        self.assertEqual(self.app.get(f'/api/consents/{consent_id}/audit').get_json()[0]['event_type'],
+                         'consent.sent')
+
+    def test_audit_trail_falls_back_to_transmissions(self):
+        """Test that consents without audit entries show their transmissions."""
+        with app.app_context():
+            consent = self._create_consent()
+            transmission = Transmission()
+            transmission.consent_id = consent.id
+            transmission.method = DeliveryMethod.FAX
+            transmission.recipient = "+15550002222"
+            transmission.status = TransmissionStatus.DELIVERED
+            db.session.add(transmission)
+            db.session.commit()
+            consent_id = consent.id
+
+        history = self.app.get(f'/api/consents/{consent_id}/audit').get_json()
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0]['event_type'], 'transmission.delivered')
+        self.assertEqual(history[0]['method'], 'fax')
+
+        self.assertEqual(self.app.get('/api/consents/999999/audit').status_code, 404)
+        self.assertEqual(self.app.get('/api/consents/999999/history').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,12 @@
 import unittest
+import io
 import os
 import tempfile
+from sqlalchemy import event
 from app import app, db
 from models import Consent, Transmission, ConsentStatus, DeliveryMethod
 from services.consent_service import ConsentService
+from services.cache_service import response_cache
 
 class ConsentTestCase(unittest.TestCase):
     
@@ -105,7 +108,173 @@ class ConsentTestCase(unittest.TestCase):
         data = response.get_json()
         self.assertEqual(data['patient_name'], 'Test Patient')
         self.assertEqual(data['status'], 'draft')
+    
+    def test_api_list_consents_paginated(self):
+        """Test walking the consent list with keyset cursors."""
+        with app.app_context():
+            for i in range(5):
+                consent = Consent()
+                consent.patient_name = f"Patient {i}"
+                consent.form_name = "test_form.pdf"
+                consent.file_path = "/uploads/test_form.pdf"
+                consent.status = ConsentStatus.SENT if i % 2 else ConsentStatus.DRAFT
+                db.session.add(consent)
+            db.session.commit()
+        
+        seen = []
+        cursor = ''
+        while True:
+            response = self.app.get(f'/api/consents?limit=2&cursor={cursor}')
+            self.assertEqual(response.status_code, 200)
+            page = response.get_json()
+            self.assertLessEqual(len(page['consents']), 2)
+            seen.extend(consent['id'] for consent in page['consents'])
+            if not page['next_cursor']:
+                break
+            cursor = page['next_cursor']
+        
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        
+        response = self.app.get('/api/consents?status=sent')
+        self.assertEqual(len(response.get_json()['consents']), 2)
+    
+    def test_api_list_consents_projection(self):
+        """Test that the field list restricts the serialized columns."""
+        self.app.post('/api/consents', json={
+            'patient_name': 'Test Patient',
+            'form_name': 'test_form.pdf',
+            'file_path': '/uploads/test_form.pdf'
+        })
+        
+        response = self.app.get('/api/consents?fields=patient_name,status')
+        self.assertEqual(response.status_code, 200)
+        consent = response.get_json()['consents'][0]
+        self.assertEqual(set(consent), {'id', 'patient_name', 'status'})
+        self.assertEqual(consent['status'], 'draft')
+        
+        response = self.app.get('/api/consents?fields=password')
+        self.assertEqual(response.status_code, 400)
+        response = self.app.get('/api/consents?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+    
+    def _count_queries(self, func):
+        """Run func and return the number of SQL statements it executed."""
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            func()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return len(statements)
+    
+    def _create_sent_consents(self, count):
+        with app.app_context():
+            for i in range(count):
+                consent = Consent()
+                consent.patient_name = f"Patient {i}"
+                consent.form_name = "test_form.pdf"
+                consent.file_path = "/uploads/test_form.pdf"
+                db.session.add(consent)
+                db.session.commit()
+                ConsentService.send_consent(consent, DeliveryMethod.EMAIL, f"patient{i}@example.com")
+    
+    def test_api_transmissions_constant_queries(self):
+        """Test that the transmission list does not fan out per consent."""
+        self._create_sent_consents(2)
+        small = self._count_queries(lambda: self.app.get('/api/transmissions'))
+        
+        self._create_sent_consents(10)
+        response = None
+        def fetch():
+            nonlocal response
+            response = self.app.get('/api/transmissions')
+        large = self._count_queries(fetch)
+        
+        self.assertEqual(small, large)
+        transmissions = response.get_json()['transmissions']
+        self.assertEqual(len(transmissions), 12)
+        self.assertEqual(transmissions[0]['patient_name'], 'Patient 9')
+        self.assertEqual(transmissions[0]['recipient'], 'patient9@example.com')
+    
+    def test_api_batch_send(self):
+        """Test queueing one form for many patients in chunks."""
+        self.addCleanup(app.config.__setitem__, 'BATCH_SEND_CHUNK_SIZE', app.config['BATCH_SEND_CHUNK_SIZE'])
+        app.config['BATCH_SEND_CHUNK_SIZE'] = 2
+        patients = [
+            {'patient_name': 'Patient A', 'patient_email': 'a@example.com'},
+            {'patient_name': 'Patient B'},
+            {'patient_name': 'Patient C', 'recipient': 'c@example.com'},
+            {'patient_email': 'd@example.com'},
+            {'patient_name': 'Patient E', 'patient_email': 'e@example.com'},
+        ]
+        
+        response = self.app.post('/api/consents/batch-send', json={
+            'form_name': 'test_form.pdf',
+            'file_path': '/uploads/test_form.pdf',
+            'delivery_method': 'email',
+            'patients': patients
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['queued'], 3)
+        self.assertEqual(data['failed'], 2)
+        self.assertEqual([result['index'] for result in data['results']], [0, 1, 2, 3, 4])
+        self.assertIn('error', data['results'][1])
+        self.assertIn('error', data['results'][3])
+        
+        with app.app_context():
+            transmission = db.session.get(Transmission, data['results'][2]['transmission_id'])
+            self.assertEqual(transmission.recipient, 'c@example.com')
+            self.assertEqual(transmission.consent.patient_name, 'Patient C')
+            self.assertEqual(transmission.consent.status, ConsentStatus.SENT)
+            self.assertEqual(Consent.query.filter(Consent.patient_name.like('Patient _')).count(), 3)
+    
+    def test_list_cache_invalidated_by_writes(self):
+        """Test that cached list responses never outlive a write."""
+        self._create_sent_consents(1)
+        
+        hits = response_cache.hits
+        first = self.app.get('/api/consents?status=sent').get_json()
+        second = self.app.get('/api/consents?status=sent').get_json()
+        self.assertEqual(first, second)
+        self.assertEqual(response_cache.hits, hits + 1)
+        
+        self._create_sent_consents(1)
+        third = self.app.get('/api/consents?status=sent').get_json()
+        self.assertEqual(len(third['consents']), len(first['consents']) + 1)
+        
+        # Sign a consent whose form really exists on disk
+        test_data = b'%PDF-1.4\n%%EOF'
+        upload = self.app.post('/api/upload',
+                               data={'file': (io.BytesIO(test_data), 'test.pdf')},
+                               content_type='multipart/form-data').get_json()
+        consent_id = self.app.post('/api/consents', json={
+            'patient_name': 'Signing Patient',
+            'form_name': 'test.pdf',
+            'file_path': upload['file_path']
+        }).get_json()['id']
+        self.app.post(f'/api/consents/{consent_id}/send',
+                      json={'delivery_method': 'email', 'recipient': 'sign@example.com'})
+        sent_ids = [consent['id'] for consent in self.app.get('/api/consents?status=sent').get_json()['consents']]
+        self.assertIn(consent_id, sent_ids)
+        
+        response = self.app.post(f'/api/simulate-sign/{consent_id}')
+        self.assertEqual(response.status_code, 200)
+        signed_ids = [consent['id'] for consent in self.app.get('/api/consents?status=signed').get_json()['consents']]
+        self.assertIn(consent_id, signed_ids)
+        sent_ids = [consent['id'] for consent in self.app.get('/api/consents?status=sent').get_json()['consents']]
+        self.assertNotIn(consent_id, sent_ids)
+        
+        stats = self.app.get('/api/cache/stats').get_json()
+        self.assertGreaterEqual(stats['hits'], 1)
+        self.assertGreaterEqual(stats['misses'], 1)
 
 if __name__ == '__main__':
-    import io  # Import io for BytesIO
     unittest.main()
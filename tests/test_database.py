@@ -0,0 +1,90 @@
+import unittest
+import os
+import tempfile
+from sqlalchemy import create_engine, insert, text
+from app import app, db
+from database import REPLICA_BIND, configure_engine, engine_options
+from models import Consent, ConsentStatus
+
+class DatabaseProfileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+
+        self.app = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        with app.app_context():
+            db.engines.pop(REPLICA_BIND, None)
+            db.session.remove()
+            db.drop_all()
+
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def test_sqlite_profile_pragmas(self):
+        """Test that SQLite connections run in WAL mode with a busy timeout."""
+        with app.app_context():
+            self.assertEqual(db.session.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
+            self.assertEqual(db.session.execute(text('PRAGMA busy_timeout')).scalar(), 5000)
+            # 1 is NORMAL
+            self.assertEqual(db.session.execute(text('PRAGMA synchronous')).scalar(), 1)
+
+    def test_server_profile_sizes_the_pool(self):
+        """Test that server databases get an explicit pool and no pre-ping."""
+        options = engine_options('postgresql://consent@db.internal/consents')
+        self.assertEqual(options['pool_size'], 10)
+        self.assertEqual(options['max_overflow'], 20)
+        self.assertFalse(options['pool_pre_ping'])
+
+        options = engine_options('sqlite:///consent_management.db')
+        self.assertNotIn('pool_size', options)
+        self.assertEqual(options['connect_args']['timeout'], 5)
+
+    def test_read_only_views_use_the_replica(self):
+        """Test that list reads go to the replica while writes stay on the primary."""
+        fd, replica_path = tempfile.mkstemp()
+        replica = create_engine('sqlite:///' + replica_path)
+        configure_engine(replica)
+        db.metadata.create_all(replica)
+        with replica.begin() as conn:
+            conn.execute(insert(Consent), [{
+                'patient_name': 'Replica Only',
+                'form_name': 'form.pdf',
+                'file_path': 'uploads/form.pdf',
+                'status': ConsentStatus.SENT,
+            }])
+
+        try:
+            with app.app_context():
+                db.engines[REPLICA_BIND] = replica
+
+            names = [c['patient_name'] for c in self.app.get('/api/consents?status=sent').get_json()['consents']]
+            self.assertIn('Replica Only', names)
+
+            response = self.app.post('/api/consents', json={
+                'patient_name': 'Primary Only',
+                'form_name': 'form.pdf',
+                'file_path': 'uploads/form.pdf',
+            })
+            self.assertEqual(response.status_code, 201)
+
+            with replica.connect() as conn:
+                names = conn.execute(text('SELECT patient_name FROM consents')).scalars().all()
+            self.assertEqual(names, ['Replica Only'])
+            with app.app_context():
+                self.assertEqual(Consent.query.filter_by(patient_name='Replica Only').count(), 0)
+        finally:
+            replica.dispose()
+            os.close(fd)
+            os.unlink(replica_path)
+
+if __name__ == '__main__':
+    unittest.main()
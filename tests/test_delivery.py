@@ -0,0 +1,187 @@
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from app import app, db
+from models import Consent, Transmission, DeliveryMethod, TransmissionStatus
+from services.cache_service import response_cache, TRANSMISSIONS
+from services.consent_service import ConsentService
+from services.delivery_service import DeliveryService, DeliveryError, FakeGateway
+
+class FailingGateway(FakeGateway):
+    def send(self, transmission):
+        raise DeliveryError("Gateway unavailable")
+
+class DeliveryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+
+        self.app = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        DeliveryService.adapters.clear()
+
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def _queue_consent(self):
+        consent = Consent()
+        consent.patient_name = "Jane Smith"
+        consent.form_name = "consent_form.pdf"
+        consent.file_path = "/uploads/consent_form.pdf"
+        db.session.add(consent)
+        db.session.commit()
+
+        return ConsentService.send_consent(consent, DeliveryMethod.SMS, "+15550001111")
+
+    def test_send_endpoint_only_enqueues(self):
+        """Test that the send endpoint returns a pending transmission."""
+        with app.app_context():
+            consent = Consent()
+            consent.patient_name = "Jane Smith"
+            consent.form_name = "consent_form.pdf"
+            consent.file_path = "/uploads/consent_form.pdf"
+            db.session.add(consent)
+            db.session.commit()
+            consent_id = consent.id
+
+        response = self.app.post(f'/api/consents/{consent_id}/send',
+                                 json={'delivery_method': 'email', 'recipient': 'jane@example.com'})
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json()['status'], 'pending')
+
+    def test_process_pending_sends(self):
+        """Test that a worker pass delivers queued transmissions."""
+        with app.app_context():
+            transmission = self._queue_consent()
+            self.assertEqual(transmission.status, TransmissionStatus.PENDING)
+
+            self.assertEqual(DeliveryService.process_pending(), 1)
+            self.assertEqual(DeliveryService.process_pending(), 0)
+
+            transmission = db.session.get(Transmission, transmission.id)
+            self.assertEqual(transmission.status, TransmissionStatus.SENT)
+            self.assertEqual(transmission.attempts, 1)
+            self.assertIsNotNone(transmission.sent_at)
+
+    def test_claimed_rows_are_not_claimed_twice(self):
+        """Test that a leased transmission is invisible to other workers."""
+        with app.app_context():
+            self._queue_consent()
+
+            self.assertEqual(len(DeliveryService.claim_pending(10)), 1)
+            self.assertEqual(DeliveryService.claim_pending(10), [])
+
+    def test_claims_invalidate_cached_attempt_counts(self):
+        """Test that a claim's attempt count is never hidden behind a cached transmission list."""
+        with app.app_context():
+            self._queue_consent()
+        attempts = [row['attempts'] for row in self.app.get('/api/transmissions').get_json()['transmissions']]
+        self.assertEqual(attempts, [0])
+
+        with app.app_context():
+            generation = response_cache.generation(TRANSMISSIONS)
+            DeliveryService.claim_pending(10)
+            self.assertNotEqual(response_cache.generation(TRANSMISSIONS), generation)
+
+            # An empty poll leaves the generation alone
+            generation = response_cache.generation(TRANSMISSIONS)
+            self.assertEqual(DeliveryService.claim_pending(10), [])
+            self.assertEqual(response_cache.generation(TRANSMISSIONS), generation)
+        attempts = [row['attempts'] for row in self.app.get('/api/transmissions').get_json()['transmissions']]
+        self.assertEqual(attempts, [1])
+
+    def test_outcome_after_a_lost_lease_is_dropped(self):
+        """Test that a worker whose lease ran out does not overwrite the next claim."""
+        with app.app_context():
+            self._queue_consent()
+            transmission, = DeliveryService.claim_pending(10)
+            lease = transmission.locked_until
+
+            # The send outlasts the lease and another worker claims the row
+            transmission.locked_until = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+            reclaimed, = DeliveryService.claim_pending(10)
+            new_lease = reclaimed.locked_until
+
+            self.assertFalse(DeliveryService.dispatch(transmission, lease))
+            transmission = db.session.get(Transmission, transmission.id)
+            self.assertEqual(transmission.status, TransmissionStatus.PENDING)
+            self.assertEqual(transmission.locked_until, new_lease)
+            self.assertEqual(transmission.attempts, 2)
+
+            self.assertTrue(DeliveryService.dispatch(transmission, new_lease))
+            self.assertEqual(db.session.get(Transmission, transmission.id).status, TransmissionStatus.SENT)
+
+    def test_signed_consents_are_not_sent(self):
+        """Test that signing settles queued transmissions, including one being sent."""
+        self.addCleanup(app.config.__setitem__, 'SIGNED_FOLDER', app.config['SIGNED_FOLDER'])
+        app.config['SIGNED_FOLDER'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, app.config['SIGNED_FOLDER'])
+        fd, form_path = tempfile.mkstemp(suffix='.pdf')
+        os.close(fd)
+        self.addCleanup(os.unlink, form_path)
+
+        with app.app_context():
+            queued = self._queue_consent()
+            consent = db.session.get(Consent, queued.consent_id)
+            consent.file_path = form_path
+            ConsentService.complete_signature(consent)
+
+            transmission = db.session.get(Transmission, queued.id)
+            self.assertEqual(transmission.status, TransmissionStatus.DELIVERED)
+            self.assertIsNone(transmission.sent_at)
+            self.assertEqual(DeliveryService.process_pending(), 0)
+
+            leased = self._queue_consent()
+            transmission, = DeliveryService.claim_pending(10)
+            consent = db.session.get(Consent, leased.consent_id)
+            consent.file_path = form_path
+            ConsentService.complete_signature(consent)
+
+            self.assertFalse(DeliveryService.dispatch(transmission))
+            transmission = db.session.get(Transmission, leased.id)
+            self.assertEqual(transmission.status, TransmissionStatus.DELIVERED)
+            self.assertIsNone(transmission.sent_at)
+
+    def test_failures_back_off_then_fail(self):
+        """Test exponential backoff and the final FAILED state."""
+        DeliveryService.register_adapter(DeliveryMethod.SMS, FailingGateway())
+
+        with app.app_context():
+            transmission = self._queue_consent()
+
+            DeliveryService.process_pending()
+            transmission = db.session.get(Transmission, transmission.id)
+            self.assertEqual(transmission.status, TransmissionStatus.PENDING)
+            self.assertEqual(transmission.error_message, "Gateway unavailable")
+            self.assertGreater(transmission.next_attempt_at, datetime.utcnow())
+
+            # Not due yet, so nothing is claimed
+            self.assertEqual(DeliveryService.process_pending(), 0)
+
+            for _ in range(app.config['DELIVERY_MAX_ATTEMPTS'] - 1):
+                transmission.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+                db.session.commit()
+                DeliveryService.process_pending()
+                transmission = db.session.get(Transmission, transmission.id)
+
+            self.assertEqual(transmission.status, TransmissionStatus.FAILED)
+            self.assertEqual(transmission.attempts, app.config['DELIVERY_MAX_ATTEMPTS'])
+
+if __name__ == '__main__':
+    unittest.main()
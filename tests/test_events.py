@@ -0,0 +1,126 @@
+import unittest
+import os
+import time
+import tempfile
+from datetime import datetime, timedelta
+from app import app, db
+from models import Consent, ConsentEvent, DeliveryMethod
+from services.consent_service import ConsentService
+from services.delivery_service import DeliveryService
+from services.event_service import EventService, event_broker
+
+class EventStreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+        self.settings = {key: app.config[key] for key in ('EVENT_SETTLE_SECONDS', 'EVENT_STREAM_MAX_CLIENTS')}
+        app.config['EVENT_POLL_INTERVAL'] = 0.05
+        app.config['EVENT_HEARTBEAT_SECONDS'] = 0.1
+        app.config['EVENT_STREAM_MAX_SECONDS'] = 0.5
+
+        self.app = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        event_broker.stop()
+        app.config.update(self.settings)
+
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def _send_consent(self):
+        with app.app_context():
+            consent = Consent()
+            consent.patient_name = "Jane Smith"
+            consent.form_name = "consent_form.pdf"
+            consent.file_path = "/uploads/consent_form.pdf"
+            db.session.add(consent)
+            db.session.commit()
+
+            transmission = ConsentService.send_consent(consent, DeliveryMethod.EMAIL, "jane@example.com")
+            DeliveryService.process_pending()
+            return consent.id, transmission.id
+
+    def test_poll_events_after_id(self):
+        """Test that state changes are readable from the change feed."""
+        after = self.app.get('/api/events').get_json()['last_event_id']
+        consent_id, transmission_id = self._send_consent()
+
+        data = self.app.get(f'/api/events?after={after}').get_json()
+        events = [(event['event_type'], event['consent_id']) for event in data['events']]
+        self.assertEqual(events, [('consent.sent', consent_id), ('transmission.sent', consent_id)])
+        self.assertEqual(data['events'][1]['transmission_id'], transmission_id)
+        self.assertEqual(data['events'][1]['transmission_status'], 'sent')
+
+        data = self.app.get(f"/api/events?after={data['last_event_id']}").get_json()
+        self.assertEqual(data['events'], [])
+
+        data = self.app.get(f'/api/events?after={after}&limit=1').get_json()
+        self.assertEqual([event['event_type'] for event in data['events']], ['consent.sent'])
+        for limit in ('-1', '0', 'ten'):
+            response = self.app.get(f'/api/events?limit={limit}')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json()['error'], f'Invalid limit: {limit}')
+
+    def test_stream_resumes_from_last_event_id(self):
+        """Test that a reconnecting SSE client receives the events it missed."""
+        last_event_id = self.app.get('/api/events').get_json()['last_event_id']
+        consent_id, _ = self._send_consent()
+
+        response = self.app.get('/api/events/stream', headers={'Last-Event-ID': str(last_event_id)})
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        body = response.get_data(as_text=True)
+
+        self.assertIn('event: consent.sent', body)
+        self.assertIn('event: transmission.sent', body)
+        self.assertIn(f'"consent_id": {consent_id}', body)
+        self.assertIn(f'id: {last_event_id + 1}\n', body)
+
+    def test_unsettled_events_hold_back_the_feed(self):
+        """Test that readers stop before an event that may still have lower ids committing."""
+        app.config['EVENT_SETTLE_SECONDS'] = 60
+        now = datetime.utcnow()
+        with app.app_context():
+            db.session.add_all([
+                ConsentEvent(id=1, event_type='consent.created', consent_id=1, created_at=now - timedelta(minutes=5)),
+                ConsentEvent(id=3, event_type='consent.sent', consent_id=1, created_at=now),
+                ConsentEvent(id=4, event_type='consent.created', consent_id=2, created_at=now - timedelta(minutes=5)),
+            ])
+            db.session.commit()
+
+            # Event 2 could still commit, so nothing from 3 on is read yet
+            self.assertEqual([event['id'] for event in EventService.events_after(0)], [1])
+            self.assertEqual(EventService.latest_event_id(), 2)
+
+            app.config['EVENT_SETTLE_SECONDS'] = 0
+            self.assertEqual([event['id'] for event in EventService.events_after(0)], [1, 3, 4])
+            self.assertEqual(EventService.latest_event_id(), 4)
+
+    def test_thread_held_streams_are_capped(self):
+        """Test that streams beyond EVENT_STREAM_MAX_CLIENTS are refused until one closes."""
+        app.config['EVENT_STREAM_MAX_CLIENTS'] = 1
+
+        first = self.app.get('/api/events/stream', buffered=False)
+        self.assertEqual(first.status_code, 200)
+        refused = self.app.get('/api/events/stream')
+        self.assertEqual(refused.status_code, 503)
+        self.assertEqual(refused.headers['Retry-After'], str(app.config['EVENT_STREAM_MAX_SECONDS']))
+
+        first.close()
+        second = self.app.get('/api/events/stream')
+        self.assertEqual(second.status_code, 200)
+        self.assertIn('retry: 3000', second.get_data(as_text=True))
+        second.close()
+
+if __name__ == '__main__':
+    unittest.main()
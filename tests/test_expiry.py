@@ -0,0 +1,182 @@
+import unittest
+import os
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import event, insert, update
+from app import app, db
+from models import Consent, Transmission, ConsentEvent, ConsentStatus, DeliveryMethod, TransmissionStatus
+from services.delivery_service import DeliveryService
+from services.expiry_service import ExpiryService, EXPIRED_MESSAGE
+from services.stats_service import StatsService
+
+class ExpiryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+        self.policy = app.config['CONSENT_TTL_DAYS'], app.config['CONSENT_TTL_BY_FORM']
+        app.config['CONSENT_TTL_DAYS'] = 30
+        app.config['CONSENT_TTL_BY_FORM'] = {}
+
+        self.app = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        app.config['CONSENT_TTL_DAYS'], app.config['CONSENT_TTL_BY_FORM'] = self.policy
+
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def _sent(self, days_ago, form_name='form.pdf', status=ConsentStatus.SENT, leased=False):
+        """Insert a consent sent `days_ago` days ago with a pending email transmission"""
+        sent_at = datetime.utcnow() - timedelta(days=days_ago)
+        consent_id = db.session.scalar(insert(Consent).returning(Consent.id), [{
+            'patient_name': 'Expiry Patient',
+            'form_name': form_name,
+            'file_path': f'uploads/{form_name}',
+            'status': status,
+            'sent_at': sent_at,
+        }])
+        db.session.execute(insert(Transmission), [{
+            'consent_id': consent_id,
+            'method': DeliveryMethod.EMAIL,
+            'recipient': 'patient@example.com',
+            'status': TransmissionStatus.PENDING,
+            'created_at': sent_at,
+            'locked_until': datetime.utcnow() + timedelta(minutes=5) if leased else None,
+        }])
+        db.session.commit()
+        return consent_id
+
+    def test_overdue_consents_expire_with_their_transmissions(self):
+        """Test that overdue consents expire and their pending transmissions fail."""
+        with app.app_context():
+            overdue = self._sent(31)
+            recent = self._sent(5)
+            signed = self._sent(60, status=ConsentStatus.SIGNED)
+            StatsService.reconcile()
+            before = StatsService.dashboard()
+
+            self.assertEqual(ExpiryService.sweep(), 1)
+
+            statuses = {consent.id: consent.status
+                        for consent in Consent.query.filter(Consent.id.in_([overdue, recent, signed]))}
+            self.assertEqual(statuses, {overdue: ConsentStatus.EXPIRED, recent: ConsentStatus.SENT,
+                                        signed: ConsentStatus.SIGNED})
+            transmission = Transmission.query.filter_by(consent_id=overdue).one()
+            self.assertEqual(transmission.status, TransmissionStatus.FAILED)
+            self.assertEqual(transmission.error_message, EXPIRED_MESSAGE)
+            self.assertEqual(Transmission.query.filter_by(consent_id=recent).one().status,
+                             TransmissionStatus.PENDING)
+
+            events = ConsentEvent.query.filter_by(consent_id=overdue).all()
+            self.assertEqual(sorted(event.event_type for event in events),
+                             ['consent.expired', 'transmission.failed'])
+
+            stats = StatsService.dashboard()
+            self.assertEqual(stats['consents']['expired'], before['consents']['expired'] + 1)
+            self.assertEqual(stats['consents']['sent'], before['consents']['sent'] - 1)
+            self.assertEqual(stats['transmissions']['email']['failed'],
+                             before['transmissions']['email']['failed'] + 1)
+            self.assertEqual(StatsService.reconcile(), 0)
+
+            # Nothing is left to expire
+            self.assertEqual(ExpiryService.sweep(), 0)
+
+    def test_per_form_ttl_overrides_global(self):
+        """Test that forms with their own TTL expire on their own schedule."""
+        app.config['CONSENT_TTL_BY_FORM'] = {'short.pdf': 2, 'long.pdf': 90}
+        with app.app_context():
+            short = self._sent(3, form_name='short.pdf')
+            long_kept = self._sent(60, form_name='long.pdf')
+            long_overdue = self._sent(91, form_name='long.pdf')
+            default_kept = self._sent(10)
+
+            self.assertEqual(ExpiryService.sweep(), 2)
+            expired = {consent.id for consent in Consent.query.filter_by(status=ConsentStatus.EXPIRED)}
+            self.assertEqual(expired & {short, long_kept, long_overdue, default_kept}, {short, long_overdue})
+
+            # Without a global TTL only the listed forms expire
+            app.config['CONSENT_TTL_DAYS'] = None
+            self._sent(400)
+            self.assertEqual(ExpiryService.sweep(), 0)
+            app.config['CONSENT_TTL_BY_FORM'] = {}
+            self.assertEqual(ExpiryService.expire_batch(), 0)
+
+    def test_sweep_runs_in_bounded_batches(self):
+        """Test that a sweep expires the oldest first, one batch at a time."""
+        with app.app_context():
+            ids = [self._sent(100 - n) for n in range(5)]
+            leased = self._sent(50, leased=True)
+
+            self.assertEqual(ExpiryService.expire_batch(limit=2), 2)
+            expired = [consent.id for consent in Consent.query.filter_by(status=ConsentStatus.EXPIRED)]
+            self.assertEqual(sorted(expired), ids[:2])
+
+            self.assertEqual(ExpiryService.sweep(limit=2), 4)
+            self.assertEqual(Consent.query.filter_by(status=ConsentStatus.SENT).count(), 0)
+
+            # A transmission a delivery worker holds is left to that worker
+            self.assertEqual(Transmission.query.filter_by(consent_id=leased).one().status,
+                             TransmissionStatus.PENDING)
+
+    def test_consent_sent_again_after_the_read_is_kept(self):
+        """Test that a consent re-sent between finding and expiring the batch is not expired."""
+        with app.app_context():
+            consent_id = self._sent(31)
+
+            def resend(session):
+                # Another request sends the consent again once the batch is read
+                with db.engine.begin() as connection:
+                    connection.execute(update(Consent).where(Consent.id == consent_id)
+                                       .values(sent_at=datetime.utcnow()))
+
+            event.listen(db.session, 'after_commit', resend, once=True)
+            self.assertEqual(ExpiryService.expire_batch(), 0)
+
+            self.assertEqual(db.session.get(Consent, consent_id).status, ConsentStatus.SENT)
+            self.assertEqual(Transmission.query.filter_by(consent_id=consent_id).one().status,
+                             TransmissionStatus.PENDING)
+
+    def test_leased_transmission_of_expired_consent_is_not_sent(self):
+        """Test that a worker fails, rather than sends, a transmission whose consent expired under its lease."""
+        sent = []
+
+        class RecordingGateway:
+            def send(self, transmission):
+                sent.append(transmission.id)
+
+        adapters = dict(DeliveryService.adapters)
+        DeliveryService.register_adapter(DeliveryMethod.EMAIL, RecordingGateway())
+        try:
+            with app.app_context():
+                consent_id = self._sent(31)
+                StatsService.reconcile()
+                claimed = DeliveryService.claim_pending(10)
+                self.assertEqual([transmission.consent_id for transmission in claimed], [consent_id])
+
+                self.assertEqual(ExpiryService.sweep(), 1)
+                transmission = Transmission.query.filter_by(consent_id=consent_id).one()
+                self.assertEqual(transmission.status, TransmissionStatus.PENDING)
+
+                self.assertFalse(DeliveryService.dispatch(claimed[0]))
+                self.assertEqual(sent, [])
+                transmission = Transmission.query.filter_by(consent_id=consent_id).one()
+                self.assertEqual(transmission.status, TransmissionStatus.FAILED)
+                self.assertEqual(transmission.error_message, EXPIRED_MESSAGE)
+                self.assertIsNone(transmission.locked_until)
+                self.assertEqual(StatsService.reconcile(), 0)
+        finally:
+            DeliveryService.adapters = adapters
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import io
+import csv
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from app import app, db
+
+TEST_PDF = b'%PDF-1.4\n1 0 obj\n<<\n/Type /Catalog\n>>\nendobj\ntrailer\n<<\n/Root 1 0 R\n>>\n%%EOF'
+
+class ExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+        app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+        app.config['SIGNED_FOLDER'] = tempfile.mkdtemp()
+
+        self.app = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        shutil.rmtree(app.config['UPLOAD_FOLDER'])
+        shutil.rmtree(app.config['SIGNED_FOLDER'])
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def _consent(self, name, signed=False, data=TEST_PDF):
+        response = self.app.post('/api/upload',
+                                 data={'file': (io.BytesIO(data), 'intake form.pdf')},
+                                 content_type='multipart/form-data')
+        response = self.app.post('/api/consents', json={
+            'patient_name': name,
+            'form_name': 'intake form.pdf',
+            'file_path': response.get_json()['file_path'],
+        })
+        consent_id = response.get_json()['id']
+        self.app.post(f'/api/consents/{consent_id}/send',
+                      json={'delivery_method': 'email', 'recipient': 'patient@example.com'})
+        if signed:
+            self.assertEqual(self.app.post(f'/api/simulate-sign/{consent_id}').status_code, 200)
+        return consent_id
+
+    def test_csv_and_ndjson_exports(self):
+        """Test that filtered exports contain exactly the matching rows."""
+        signed = self._consent('Signed, "Quoted" Patient', signed=True)
+        unsigned = self._consent('Unsigned Patient')
+
+        response = self.app.get('/api/export/consents?status=signed&date_field=signed_at&since=2000-01-01')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertIn('attachment', response.headers['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual([int(row['id']) for row in rows], [signed])
+        self.assertEqual(rows[0]['patient_name'], 'Signed, "Quoted" Patient')
+        self.assertEqual(rows[0]['status'], 'signed')
+
+        response = self.app.get('/api/export/consents?format=ndjson&until=2000-01-01')
+        self.assertEqual(response.get_data(), b'')
+
+        response = self.app.get('/api/export/transmissions?format=ndjson&method=email')
+        lines = [json.loads(line) for line in response.get_data().splitlines()]
+        self.assertEqual(sorted(line['consent_id'] for line in lines), sorted([signed, unsigned]))
+        self.assertTrue(all(line['patient_name'] for line in lines))
+
+    def test_zip_export_streams_signed_documents(self):
+        """Test that the archive holds each signed PDF and a manifest."""
+        first = self._consent('First Patient', signed=True)
+        second = self._consent('Second Patient', signed=True, data=TEST_PDF + b'\n')
+        self._consent('Pending Patient')
+
+        response = self.app.get('/api/export/consents?format=zip&status=signed')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+
+        archive = zipfile.ZipFile(io.BytesIO(response.get_data()))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.read(f'documents/{first}_intake_form_signed.pdf'), TEST_PDF)
+        self.assertEqual(archive.read(f'documents/{second}_intake_form_signed.pdf'), TEST_PDF + b'\n')
+
+        manifest = list(csv.DictReader(io.StringIO(archive.read('consents.csv').decode())))
+        self.assertEqual([int(row['id']) for row in manifest], [first, second])
+        self.assertEqual(manifest[0]['document'], f'documents/{first}_intake_form_signed.pdf')
+
+    def test_invalid_exports_are_rejected(self):
+        """Test that unknown formats and malformed filters return 400."""
+        for query in ('format=xml', 'status=bogus', 'since=yesterday', 'date_field=patient_name'):
+            self.assertEqual(self.app.get(f'/api/export/consents?{query}').status_code, 400, query)
+        self.assertEqual(self.app.get('/api/export/transmissions?format=zip').status_code, 400)
+
+    def test_cli_export(self):
+        """Test that the export command writes the same CSV as the endpoint."""
+        self._consent('Cli Patient', signed=True)
+        output = os.path.join(app.config['UPLOAD_FOLDER'], 'export.csv')
+
+        result = app.test_cli_runner().invoke(args=['export', 'consents', '--status', 'signed', '--output', output])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), self.app.get('/api/export/consents?status=signed').get_data())
+
+if __name__ == '__main__':
+    unittest.main()
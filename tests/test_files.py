@@ -0,0 +1,305 @@
+import unittest
+import io
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+from app import app, db
+from models import Blob, Consent, UploadSession
+from services.blob_store import BlobStore
+from services.consent_service import ConsentService
+from services.file_service import FileService
+from services.upload_service import ChunkedUploadService
+
+TEST_PDF = b'%PDF-1.4\n1 0 obj\n<<\n/Type /Catalog\n>>\nendobj\ntrailer\n<<\n/Root 1 0 R\n>>\n%%EOF'
+
+class FileStorageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+
+        # Create test directories
+        app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+        app.config['SIGNED_FOLDER'] = tempfile.mkdtemp()
+
+        self.app = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        shutil.rmtree(app.config['UPLOAD_FOLDER'])
+        shutil.rmtree(app.config['SIGNED_FOLDER'])
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def _upload(self, data=TEST_PDF, filename='form.pdf'):
+        response = self.app.post('/api/upload',
+                                 data={'file': (io.BytesIO(data), filename)},
+                                 content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['file_path']
+
+    def test_identical_uploads_share_one_blob(self):
+        """Test that the same content uploaded twice is stored once."""
+        first = self._upload(filename='intake.pdf')
+        second = self._upload(filename='intake_copy.pdf')
+        other = self._upload(data=TEST_PDF + b'\n', filename='intake.pdf')
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        with open(first, 'rb') as f:
+            self.assertEqual(f.read(), TEST_PDF)
+
+        with app.app_context():
+            blob = db.session.get(Blob, BlobStore.digest_from_path(first))
+            self.assertEqual(blob.ref_count, 2)
+            self.assertEqual(blob.size, len(TEST_PDF))
+
+    def test_signed_copy_is_a_reference(self):
+        """Test that signing links the blob instead of copying it."""
+        file_path = self._upload()
+
+        with app.app_context():
+            signed_path = FileService.move_to_signed(file_path, 7)
+            digest = BlobStore.digest_from_path(file_path)
+
+            self.assertTrue(os.path.samefile(file_path, signed_path))
+            self.assertEqual(BlobStore.digest_from_path(signed_path), digest)
+            self.assertEqual(db.session.get(Blob, digest).ref_count, 2)
+
+    def test_signature_retried_after_rollback_counts_its_reference(self):
+        """Test that a link left by a rolled back signature is counted by the retry."""
+        file_path = self._upload()
+
+        with app.app_context():
+            consent = Consent(patient_name='Retry Patient', form_name='form.pdf', file_path=file_path)
+            db.session.add(consent)
+            db.session.commit()
+            digest = BlobStore.digest_from_path(file_path)
+
+            ConsentService.complete_signature(consent, commit=False)
+            db.session.rollback()
+            self.assertEqual(db.session.get(Blob, digest).ref_count, 1)
+
+            consent = db.session.get(Consent, consent.id)
+            ConsentService.complete_signature(consent)
+            self.assertEqual(db.session.get(Blob, digest).ref_count, 2)
+
+            # Signing again does not count the same signed copy twice
+            ConsentService.complete_signature(consent)
+            self.assertEqual(db.session.get(Blob, digest).ref_count, 2)
+
+            # Releasing the upload leaves the signed copy's blob in place
+            FileService.delete_file(file_path)
+            self.assertTrue(os.path.exists(consent.signed_file_path))
+            self.assertIsNotNone(db.session.get(Blob, digest))
+
+    def test_delete_collects_unreferenced_blobs(self):
+        """Test that the blob survives until its last reference is released."""
+        file_path = self._upload()
+        self._upload()
+
+        with app.app_context():
+            signed_path = FileService.move_to_signed(file_path, 3)
+            digest = BlobStore.digest_from_path(file_path)
+
+            FileService.delete_file(signed_path)
+            self.assertFalse(os.path.exists(signed_path))
+            FileService.delete_file(file_path)
+            self.assertTrue(os.path.exists(file_path))
+
+            FileService.delete_file(file_path)
+            self.assertFalse(os.path.exists(file_path))
+            self.assertIsNone(db.session.get(Blob, digest))
+
+    def test_chunked_upload_resumes(self):
+        """Test a resumable upload sent in chunks with a retried chunk."""
+        data = TEST_PDF * 50
+        response = self.app.post('/api/uploads', json={
+            'filename': 'scan.pdf',
+            'size': len(data),
+            'sha256': hashlib.sha256(data).hexdigest()
+        })
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.get_json()['upload_id']
+
+        response = self.app.put(f'/api/uploads/{upload_id}?offset=0', data=data[:1000])
+        self.assertEqual(response.get_json()['offset'], 1000)
+
+        # A chunk at the wrong offset is rejected with the offset to resume from
+        response = self.app.put(f'/api/uploads/{upload_id}?offset=0', data=data[1000:2000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()['offset'], 1000)
+
+        offset = self.app.get(f'/api/uploads/{upload_id}').get_json()['offset']
+        response = self.app.put(f'/api/uploads/{upload_id}?offset={offset}', data=data[offset:])
+        self.assertEqual(response.get_json()['offset'], len(data))
+
+        response = self.app.post(f'/api/uploads/{upload_id}/complete')
+        self.assertEqual(response.status_code, 200)
+        file_path = response.get_json()['file_path']
+        with open(file_path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+        # The same content sent through the plain upload dedupes onto it
+        self.assertEqual(self._upload(data=data), file_path)
+
+    def test_concurrent_chunks_at_one_offset(self):
+        """Test that of two chunks sent at the same offset only one is written."""
+        data = TEST_PDF * 50
+        upload_id = self.app.post('/api/uploads', json={
+            'filename': 'scan.pdf',
+            'size': len(data),
+            'sha256': hashlib.sha256(data).hexdigest()
+        }).get_json()['upload_id']
+
+        arrived = threading.Event()
+        release = threading.Event()
+
+        class SlowBody(io.RawIOBase):
+            """A request body that stalls after its first part"""
+            parts = [data[:500], data[500:1000]]
+
+            def readable(self):
+                return True
+
+            def readinto(self, buffer):
+                if not self.parts:
+                    return 0
+                if len(self.parts) == 1:
+                    arrived.set()
+                    release.wait(5)
+                part = self.parts.pop(0)
+                buffer[:len(part)] = part
+                return len(part)
+
+        responses = {}
+
+        def slow_put():
+            environ = EnvironBuilder(path=f'/api/uploads/{upload_id}', query_string='offset=0',
+                                     method='PUT', data=b'\0' * 1000).get_environ()
+            environ['wsgi.input'] = io.BufferedReader(SlowBody(), 500)
+            body, status, _ = run_wsgi_app(app, environ, buffered=True)
+            responses['slow'] = status, json.loads(b''.join(body))
+
+        writer = threading.Thread(target=slow_put)
+        writer.start()
+        self.assertTrue(arrived.wait(5))
+
+        response = self.app.put(f'/api/uploads/{upload_id}?offset=0', data=b'x' * 1000)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()['offset'], 0)
+
+        release.set()
+        writer.join(5)
+        self.assertEqual(responses['slow'][0], '200 OK')
+        self.assertEqual(responses['slow'][1]['offset'], 1000)
+
+        # The loser retrying at the old offset is told where to resume
+        response = self.app.put(f'/api/uploads/{upload_id}?offset=0', data=b'x' * 1000)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()['offset'], 1000)
+
+        response = self.app.put(f'/api/uploads/{upload_id}?offset=1000', data=data[1000:])
+        self.assertEqual(response.get_json()['offset'], len(data))
+        self.assertEqual(self.app.post(f'/api/uploads/{upload_id}/complete').status_code, 200)
+
+    def test_chunked_upload_checksum_mismatch(self):
+        """Test that a corrupted upload is refused at finalize."""
+        response = self.app.post('/api/uploads', json={
+            'filename': 'scan.pdf',
+            'size': len(TEST_PDF),
+            'sha256': '0' * 64
+        })
+        upload_id = response.get_json()['upload_id']
+
+        response = self.app.post(f'/api/uploads/{upload_id}/complete')
+        self.assertEqual(response.status_code, 400)
+
+        self.app.put(f'/api/uploads/{upload_id}', data=TEST_PDF)
+        response = self.app.post(f'/api/uploads/{upload_id}/complete')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['error'], 'Checksum mismatch')
+
+    def test_idle_upload_sessions_are_removed(self):
+        """Test that sessions idle past the TTL are removed with their partial file."""
+        data = TEST_PDF * 50
+        idle_id, active_id, leased_id, finished_id = [self.app.post('/api/uploads', json={
+            'filename': 'scan.pdf',
+            'size': len(data)
+        }).get_json()['upload_id'] for _ in range(4)]
+        for upload_id in (idle_id, active_id, leased_id):
+            self.app.put(f'/api/uploads/{upload_id}?offset=0', data=data[:1000])
+        self.app.put(f'/api/uploads/{finished_id}?offset=0', data=data)
+        file_path = self.app.post(f'/api/uploads/{finished_id}/complete').get_json()['file_path']
+
+        with app.app_context():
+            later = datetime.utcnow() + timedelta(hours=app.config['UPLOAD_SESSION_TTL_HOURS'], minutes=1)
+            db.session.execute(update(UploadSession).where(UploadSession.id == active_id)
+                               .values(updated_at=later - timedelta(hours=1)))
+            db.session.execute(update(UploadSession).where(UploadSession.id == leased_id)
+                               .values(locked_until=later + timedelta(minutes=1)))
+            db.session.commit()
+
+            self.assertEqual(ChunkedUploadService.cleanup_batch(now=later), 2)
+            self.assertEqual({session.id for session in UploadSession.query}, {active_id, leased_id})
+            self.assertFalse(os.path.exists(ChunkedUploadService.partial_path(idle_id)))
+            self.assertTrue(os.path.exists(ChunkedUploadService.partial_path(active_id)))
+
+        self.assertEqual(self.app.get(f'/api/uploads/{idle_id}').status_code, 404)
+        # The finished upload's file stays in the blob store
+        self.assertTrue(os.path.exists(file_path))
+        # A session still in use carries on where it left off
+        self.assertEqual(self.app.put(f'/api/uploads/{active_id}?offset=1000', data=data[1000:]).status_code, 200)
+
+    def test_document_conditional_and_range(self):
+        """Test ETag revalidation and byte ranges on consent documents."""
+        file_path = self._upload()
+        response = self.app.post('/api/consents', json={
+            'patient_name': 'Test Patient',
+            'form_name': 'intake.pdf',
+            'file_path': file_path
+        })
+        consent_id = response.get_json()['id']
+
+        response = self.app.get(f'/api/consents/{consent_id}/document')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, TEST_PDF)
+        etag = response.headers['ETag']
+        self.assertEqual(etag, f'"{BlobStore.digest_from_path(file_path)}"')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        response.close()
+
+        response = self.app.get(f'/api/consents/{consent_id}/document', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        response = self.app.get(f'/api/consents/{consent_id}/document', headers={'Range': 'bytes=0-7'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, TEST_PDF[:8])
+        response.close()
+
+        response = self.app.get(f'/api/consents/{consent_id}/document?signed=1')
+        self.assertEqual(response.status_code, 404)
+
+    def test_files_outside_storage_are_refused(self):
+        """Test that only files under uploads/ and signed/ are served."""
+        self.assertEqual(self.app.get('/api/files/app.py').status_code, 404)
+        self.assertEqual(self.app.get('/api/files/../app.py').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
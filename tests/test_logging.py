@@ -0,0 +1,124 @@
+import unittest
+import io
+import json
+import logging
+import threading
+from unittest import mock
+from app import app
+from services.logging_service import LoggingPipeline
+from services.metrics_service import metrics
+
+CONFIG = {
+    'LOG_LEVEL': 'INFO',
+    'LOG_FORMAT': 'json',
+    'LOG_FILE': None,
+    'LOG_QUEUE_SIZE': 100,
+    'LOG_REDACT_PII': True,
+    'LOG_RATE_LIMIT': 0,
+    'LOG_SAMPLE_RATES': {},
+}
+
+class BlockingStream(io.StringIO):
+    """Output that stalls the listener until released"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.release.wait(10)
+        return super().write(text)
+
+class LoggingPipelineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.root_level = logging.getLogger().level
+        self.pipeline = LoggingPipeline()
+        self.logger = logging.getLogger('tests.logging')
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        self.pipeline.stop()
+        logging.getLogger().removeHandler(self.pipeline.handler)
+        logging.getLogger().setLevel(self.root_level)
+
+    def _configure(self, stream=None, **overrides):
+        stream = stream or io.StringIO()
+        self.pipeline.configure(dict(CONFIG, **overrides), output=logging.StreamHandler(stream))
+        return stream
+
+    def _lines(self, stream):
+        self.pipeline.stop()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    def test_json_records_are_structured_and_redacted(self):
+        """Test that records carry their extra fields with patient details masked."""
+        stream = self._configure()
+        self.logger.info("Consent %s queued for %s", 42, 'jane@example.com',
+                         extra={'consent_id': 42, 'patient_name': 'Jane Doe', 'recipient': '+1 555 123 4567'})
+        self.logger.info("Called (555) 123-4567 about blob %s", 'ab' * 32)
+        try:
+            raise ValueError('bounced for jane@example.com')
+        except ValueError:
+            self.logger.exception("Delivery failed")
+
+        first, second, third = self._lines(stream)
+        self.assertEqual(first['message'], 'Consent 42 queued for [redacted]')
+        self.assertEqual((first['level'], first['logger']), ('INFO', 'tests.logging'))
+        self.assertEqual(first['consent_id'], 42)
+        self.assertEqual((first['patient_name'], first['recipient']), ('[redacted]', '[redacted]'))
+        self.assertEqual(second['message'], f"Called [redacted] about blob {'ab' * 32}")
+        self.assertIn('ValueError: bounced for [redacted]', third['exception'])
+
+    def test_formatting_is_deferred_to_the_listener(self):
+        """Test that plain arguments are formatted on the listener thread, objects before queueing."""
+        self._configure()
+        plain = logging.LogRecord('tests', logging.INFO, __file__, 1, "Consent %s", (7,), None)
+        self.assertEqual(self.pipeline.handler.prepare(plain).msg, "Consent %s")
+
+        class Row:
+            name = 'before'
+
+            def __str__(self):
+                return self.name
+
+        row = Row()
+        record = self.pipeline.handler.prepare(
+            logging.LogRecord('tests', logging.INFO, __file__, 1, "Row %s", (row,), None))
+        row.name = 'after'
+        self.assertEqual(record.getMessage(), "Row before")
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test that a stalled output never blocks the logging thread."""
+        stream = BlockingStream()
+        self._configure(stream, LOG_QUEUE_SIZE=5)
+        before = metrics.log_records_dropped._values[('queue_full',)]
+
+        for n in range(50):
+            self.logger.info("Record %s", n)
+        dropped = metrics.log_records_dropped._values[('queue_full',)] - before
+
+        stream.release.set()
+        written = len(self._lines(stream))
+        self.assertGreaterEqual(dropped, 40)
+        self.assertEqual(written + dropped, 50)
+
+    def test_sampling_and_rate_limit(self):
+        """Test that sampled endpoints and the rate limit only thin out INFO records."""
+        stream = self._configure(LOG_SAMPLE_RATES={'consent.get_consents': 0}, LOG_RATE_LIMIT=3)
+
+        with app.test_request_context('/api/consents'):
+            self.logger.info("Listed consents")
+            self.logger.warning("Slow consent list")
+        with mock.patch('services.logging_service.time.monotonic', return_value=1000.0):
+            for n in range(10):
+                self.logger.info("Background record %s", n)
+        self.logger.error("Still reported")
+
+        messages = [line['message'] for line in self._lines(stream)]
+        self.assertEqual(messages, ['Slow consent list', 'Background record 0', 'Background record 1',
+                                    'Background record 2', 'Still reported'])
+
+if __name__ == '__main__':
+    unittest.main()
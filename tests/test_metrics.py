@@ -0,0 +1,122 @@
+import unittest
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from app import app, db
+from services.metrics_service import metrics, SamplingProfiler
+
+TEST_PDF = b'%PDF-1.4\n1 0 obj\n<<\n/Type /Catalog\n>>\nendobj\ntrailer\n<<\n/Root 1 0 R\n>>\n%%EOF'
+
+def metric_value(body, name, labels):
+    match = re.search(rf'^{re.escape(name + labels)} (\S+)$', body, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+        app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+        app.config['SIGNED_FOLDER'] = tempfile.mkdtemp()
+        app.config['PROFILE_OUTPUT_DIR'] = tempfile.mkdtemp()
+
+        self.app = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        shutil.rmtree(app.config['UPLOAD_FOLDER'])
+        shutil.rmtree(app.config['SIGNED_FOLDER'])
+        shutil.rmtree(app.config['PROFILE_OUTPUT_DIR'])
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def test_route_timing_and_sql_counts(self):
+        """Test that each route gets wall time and SQL histograms."""
+        labels = '{method="GET",route="/api/consents"}'
+        before = self.app.get('/metrics').get_data(as_text=True)
+        self.app.get('/api/consents?status=sent')
+        self.app.get('/api/consents?status=sent')
+
+        response = self.app.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.mimetype.startswith('text/plain'))
+        body = response.get_data(as_text=True)
+
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertEqual(metric_value(body, 'http_request_duration_seconds_count', labels)
+                         - metric_value(before, 'http_request_duration_seconds_count', labels), 2)
+        self.assertGreater(metric_value(body, 'http_request_sql_queries_sum', labels),
+                           metric_value(before, 'http_request_sql_queries_sum', labels))
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="/api/consents",le="+Inf"}', body)
+
+    def test_file_bytes_are_counted(self):
+        """Test that uploaded and served document bytes are counted."""
+        before = self.app.get('/metrics').get_data(as_text=True)
+        response = self.app.post('/api/upload',
+                                 data={'file': (io.BytesIO(TEST_PDF), 'form.pdf')},
+                                 content_type='multipart/form-data')
+        response = self.app.post('/api/consents', json={
+            'patient_name': 'Jane Smith',
+            'form_name': 'form.pdf',
+            'file_path': response.get_json()['file_path'],
+        })
+        self.app.get(f"/api/consents/{response.get_json()['id']}/document")
+
+        body = self.app.get('/metrics').get_data(as_text=True)
+        for direction in ('write', 'read'):
+            labels = f'{{direction="{direction}"}}'
+            self.assertEqual(metric_value(body, 'file_io_bytes_total', labels)
+                             - metric_value(before, 'file_io_bytes_total', labels), len(TEST_PDF))
+        self.assertGreater(metric_value(body, 'http_request_file_bytes_sum', '{method="POST",route="/api/upload"}'), 0)
+
+    def test_disabled_metrics_record_nothing(self):
+        """Test that switching metrics off detaches the instrumentation."""
+        labels = '{method="GET",route="/api/transmissions"}'
+        before = self.app.get('/metrics').get_data(as_text=True)
+        metrics.set_enabled(False)
+        try:
+            self.app.get('/api/transmissions')
+        finally:
+            metrics.set_enabled(True)
+
+        body = self.app.get('/metrics').get_data(as_text=True)
+        self.assertEqual(metric_value(body, 'http_request_duration_seconds_count', labels),
+                         metric_value(before, 'http_request_duration_seconds_count', labels))
+
+    def test_sampling_profiler_dumps_folded_stacks(self):
+        """Test that sampled stacks are written in flamegraph folded format."""
+        profiler = SamplingProfiler(0.001)
+        profiler.start()
+        profiler.begin(threading.get_ident())
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        samples = profiler.end(threading.get_ident())
+        profiler.stop()
+
+        self.assertTrue(samples)
+        self.assertTrue(any('test_metrics.py:test_sampling_profiler_dumps_folded_stacks' in stack
+                            for stack in samples))
+
+        with app.app_context():
+            path = metrics.dump_profile(('GET', '/api/consents'), 0.75, samples)
+        self.assertTrue(path.endswith('_GET_api_consents_750ms.folded'))
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(all(re.match(r'^\S.* \d+$', line) for line in lines))
+
+if __name__ == '__main__':
+    unittest.main()
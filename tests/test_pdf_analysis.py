@@ -0,0 +1,168 @@
+import unittest
+import io
+import os
+import zlib
+import shutil
+import tempfile
+import tracemalloc
+from unittest import mock
+from app import app, db
+from models import Blob
+from services import pdf_inspect, pdf_service
+from services.pdf_inspect import inspect_pdf
+from services.pdf_service import pdf_analysis
+
+def make_pdf(pages, width=612, height=792):
+    """A minimal well-formed PDF with a cross-reference table"""
+    kids = ' '.join(f'{3 + n} 0 R' for n in range(pages))
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        f'<< /Type /Pages /Kids [{kids}] /Count {pages} /MediaBox [0 0 {width} {height}] >>'.encode(),
+    ] + [b'<< /Type /Page /Parent 2 0 R >>'] * pages
+
+    out = bytearray(b'%PDF-1.7\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return bytes(out)
+
+def make_compressed_pdf(pages):
+    """A PDF whose page tree only exists inside a compressed object stream"""
+    body = b'<< /Type /Pages /Count %d /MediaBox [0 0 595 842] >>' % pages
+    stream = zlib.compress(b'2 0 ' + body)
+    return (b'%PDF-1.5\n1 0 obj\n'
+            + b'<< /Type /ObjStm /N 1 /First 4 /Length %d /Filter /FlateDecode >>\nstream\n' % len(stream)
+            + stream + b'\nendstream\nendobj\nstartxref\n999999\n%%EOF\n')
+
+def make_deflate_bomb(size):
+    """A tiny PDF whose object stream inflates to size bytes of zeros"""
+    compressor = zlib.compressobj(9)
+    block = bytes(1024 * 1024)
+    stream = b''.join(compressor.compress(block) for _ in range(size // len(block))) + compressor.flush()
+    return (b'%PDF-1.5\n1 0 obj\n'
+            + b'<< /Type /ObjStm /N 1 /First 4 /Length %d /Filter /FlateDecode >>\nstream\n' % len(stream)
+            + stream + b'\nendstream\nendobj\nstartxref\n999999\n%%EOF\n')
+
+class PdfAnalysisTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+        app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+        app.config['SIGNED_FOLDER'] = tempfile.mkdtemp()
+
+        self.app = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        app.config['PDF_MAX_PAGES'] = 2000
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        shutil.rmtree(app.config['UPLOAD_FOLDER'])
+        shutil.rmtree(app.config['SIGNED_FOLDER'])
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def _upload(self, data, filename='form.pdf'):
+        response = self.app.post('/api/upload',
+                                 data={'file': (io.BytesIO(data), filename)},
+                                 content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_upload_records_analysis(self):
+        """Test that an upload is validated and its metadata stored on the blob."""
+        data = self._upload(make_pdf(3))
+        analysis = data['analysis']
+        self.assertEqual(analysis['status'], 'valid')
+        self.assertEqual(analysis['page_count'], 3)
+        self.assertEqual((analysis['page_width'], analysis['page_height']), (612, 792))
+        self.assertEqual(analysis['pdf_version'], '1.7')
+        self.assertFalse(analysis['encrypted'])
+
+        response = self.app.get(f"/api/blobs/{data['sha256']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['analysis'], analysis)
+        self.assertEqual(response.get_json()['size'], len(make_pdf(3)))
+
+    def test_invalid_pdfs_are_flagged(self):
+        """Test that corrupt, truncated and oversized PDFs are recorded as invalid."""
+        cases = {
+            b'GIF89a not a pdf': 'missing %PDF header',
+            make_pdf(2)[:-40]: 'missing %%EOF',
+            b'%PDF-1.4\n1 0 obj\n<< /Type /Catalog >>\nendobj\n%%EOF': 'no pages',
+        }
+        for content, error in cases.items():
+            analysis = self._upload(content)['analysis']
+            self.assertEqual(analysis['status'], 'invalid')
+            self.assertIn(error, analysis['error'])
+
+        app.config['PDF_MAX_PAGES'] = 5
+        analysis = self._upload(make_pdf(6))['analysis']
+        self.assertEqual(analysis['status'], 'invalid')
+        self.assertIn('Too many pages', analysis['error'])
+
+    def test_reupload_uses_cached_analysis(self):
+        """Test that the same content is only ever analyzed once."""
+        content = make_pdf(4)
+        with mock.patch.object(pdf_service, 'inspect_pdf', wraps=inspect_pdf) as inspect:
+            first = self._upload(content, 'consent.pdf')
+            second = self._upload(content, 'consent_copy.pdf')
+        self.assertEqual(inspect.call_count, 1)
+        self.assertEqual(first['analysis'], second['analysis'])
+
+    def test_damaged_cross_reference_is_scanned(self):
+        """Test that a page tree inside a compressed object stream is found."""
+        path = os.path.join(app.config['UPLOAD_FOLDER'], 'compressed.pdf')
+        with open(path, 'wb') as f:
+            f.write(make_compressed_pdf(12))
+        result = inspect_pdf(path)
+        self.assertTrue(result['valid'], result['error'])
+        self.assertEqual(result['page_count'], 12)
+        self.assertEqual((result['page_width'], result['page_height']), (595, 842))
+
+    def test_deflate_bomb_is_rejected(self):
+        """Test that an object stream inflating past the limit is not expanded."""
+        path = os.path.join(app.config['UPLOAD_FOLDER'], 'bomb.pdf')
+        with open(path, 'wb') as f:
+            f.write(make_deflate_bomb(4 * pdf_inspect.MAX_OBJSTM_BYTES))
+        tracemalloc.start()
+        try:
+            result = inspect_pdf(path)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertFalse(result['valid'])
+        self.assertIn('object streams expand beyond', result['error'])
+        # The decompressor joins its output blocks, so it briefly holds two copies
+        self.assertLess(peak, 3 * pdf_inspect.MAX_OBJSTM_BYTES)
+
+    def test_process_pool_analyzes_off_request(self):
+        """Test that a running pool records results after the upload returns."""
+        pdf_analysis.start(app, workers=1)
+        try:
+            data = self._upload(make_pdf(2))
+            self.assertIn(data['analysis']['status'], ('pending', 'valid'))
+            self.assertTrue(pdf_analysis.wait(timeout=60))
+        finally:
+            pdf_analysis.stop()
+
+        with app.app_context():
+            blob = db.session.get(Blob, data['sha256'])
+            self.assertTrue(blob.valid)
+            self.assertEqual(blob.page_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import os
+import tempfile
+from app import app, db
+from models import Consent
+from services import search_service
+from services.cache_service import response_cache, CONSENTS
+
+class SearchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+
+        self.app = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def _create(self, name, email=None, phone=None, fax=None, form_name='intake.pdf'):
+        response = self.app.post('/api/consents', json={
+            'patient_name': name,
+            'patient_email': email,
+            'patient_phone': phone,
+            'patient_fax': fax,
+            'form_name': form_name,
+            'file_path': f'uploads/{form_name}',
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()['id']
+
+    def _search(self, query, **params):
+        response = self.app.get('/api/consents/search', query_string={'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_prefix_search_ranks_name_matches_first(self):
+        """Test that a name prefix finds the patient, ranked above weaker matches."""
+        in_form = self._create('Other Patient', form_name='quixotic_release.pdf')
+        in_name = self._create('Zebulon Quixote', email='zq@example.com')
+
+        page = self._search('quix')
+        ids = [consent['id'] for consent in page['consents']]
+        self.assertEqual(ids[:2], [in_name, in_form])
+        self.assertFalse(page['fuzzy'])
+
+        page = self._search('zebulon quix', fields='patient_name')
+        self.assertEqual(page['consents'], [{'id': in_name, 'patient_name': 'Zebulon Quixote'}])
+
+    def test_phone_numbers_match_in_any_format(self):
+        """Test that phone and fax numbers match regardless of punctuation."""
+        by_phone = self._create('Phone Patient', phone='+1 (555) 867-5309')
+        by_fax = self._create('Fax Patient', fax='555.246.8101')
+
+        for query in ('5558675309', '(555) 867-5309', '867-5309'):
+            ids = [consent['id'] for consent in self._search(query)['consents']]
+            self.assertIn(by_phone, ids, query)
+        ids = [consent['id'] for consent in self._search('555 246 8101')['consents']]
+        self.assertEqual(ids, [by_fax])
+
+    def test_typo_falls_back_to_fuzzy_matches(self):
+        """Test that a misspelled name still finds the patient."""
+        consent_id = self._create('Bartholomew Quimby')
+
+        page = self._search('bartholmew')
+        self.assertTrue(page['fuzzy'])
+        self.assertIn(consent_id, [consent['id'] for consent in page['consents']])
+
+    def test_pagination_and_index_updates(self):
+        """Test paging through results and that edits and deletes reach the index."""
+        ids = {self._create(f'Paginated Xylophonist {n}') for n in range(5)}
+
+        # A small ranking window makes the last pages walk the older matches
+        rank_window = search_service.RANK_WINDOW
+        search_service.RANK_WINDOW = 3
+        try:
+            seen = []
+            page = self._search('xylophonist', limit=2)
+            while True:
+                self.assertLessEqual(len(page['consents']), 2)
+                seen.extend(consent['id'] for consent in page['consents'])
+                if not page['next_cursor']:
+                    break
+                page = self._search('xylophonist', limit=2, cursor=page['next_cursor'])
+        finally:
+            search_service.RANK_WINDOW = rank_window
+        self.assertEqual(sorted(seen), sorted(ids))
+
+        renamed = seen[0]
+        with app.app_context():
+            consent = db.session.get(Consent, renamed)
+            consent.patient_name = 'Renamed Patient'
+            db.session.delete(db.session.get(Consent, seen[1]))
+            response_cache.bump(CONSENTS)
+            db.session.commit()
+
+        ids = [consent['id'] for consent in self._search('xylophonist')['consents']]
+        self.assertEqual(sorted(ids), sorted(seen[2:]))
+        self.assertIn(renamed, [consent['id'] for consent in self._search('renamed patient')['consents']])
+
+    def test_invalid_searches_are_rejected(self):
+        """Test that too-short queries and malformed cursors return 400."""
+        self.assertEqual(self.app.get('/api/consents/search?q=ab').status_code, 400)
+        self.assertEqual(self.app.get('/api/consents/search').status_code, 400)
+        self.assertEqual(self.app.get('/api/consents/search?q=abc&cursor=bogus').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
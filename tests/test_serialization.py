@@ -0,0 +1,75 @@
+import unittest
+import json
+import os
+import tempfile
+from datetime import datetime
+from app import app, db
+from models import Consent, ConsentStatus
+from services import serialization
+from services.consent_service import ConsentService
+from services.serialization import dumps, row_dicts
+
+class SerializationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+
+        self.app = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def test_rows_encode_like_to_dict(self):
+        """Test that column-tuple rows serialize exactly as the ORM objects did."""
+        with app.app_context():
+            consent = Consent()
+            consent.patient_name = 'Row Patient'
+            consent.form_name = 'form.pdf'
+            consent.file_path = 'uploads/form.pdf'
+            consent.status = ConsentStatus.SENT
+            consent.sent_at = datetime(2024, 5, 1, 12, 30, 15, 250)
+            db.session.add(consent)
+            db.session.commit()
+
+            rows, _ = ConsentService.list_consents(status=ConsentStatus.SENT, limit=500)
+            row = next(row for row in rows if row.id == consent.id)
+            encoded = row_dicts([row], Consent.SERIALIZABLE_FIELDS)[0]
+            self.assertEqual(json.loads(dumps(encoded)), consent.to_dict())
+
+            # The stdlib fallback produces the same document
+            fast = serialization.orjson
+            serialization.orjson = None
+            try:
+                self.assertEqual(json.loads(dumps(encoded)), consent.to_dict())
+            finally:
+                serialization.orjson = fast
+
+    def test_batch_send_returns_every_result(self):
+        """Test that the batch send endpoint returns every result."""
+        patients = [{'patient_name': f'Batch {n}', 'recipient': f'b{n}@example.com'} for n in range(5)]
+        patients.append({'patient_name': 'No Recipient'})
+        response = self.app.post('/api/consents/batch-send', json={
+            'form_name': 'form.pdf',
+            'file_path': 'uploads/form.pdf',
+            'delivery_method': 'email',
+            'patients': patients,
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual((data['queued'], data['failed']), (5, 1))
+        self.assertEqual(len(data['results']), 6)
+
+if __name__ == '__main__':
+    unittest.main()
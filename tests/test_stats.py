@@ -0,0 +1,198 @@
+import unittest
+import io
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from sqlalchemy import insert, update
+from app import app, db
+from models import Consent, Transmission, StatCounter, ConsentStatus, DeliveryMethod, TransmissionStatus
+from services.delivery_service import DeliveryService, DeliveryError, FakeGateway
+from services.stats_service import StatsService, CONSENT_STATUS, TOTAL
+
+TEST_PDF = b'%PDF-1.4\n1 0 obj\n<<\n/Type /Catalog\n>>\nendobj\ntrailer\n<<\n/Root 1 0 R\n>>\n%%EOF'
+
+class FailingGateway(FakeGateway):
+    def send(self, transmission):
+        raise DeliveryError("Gateway unavailable")
+
+class StatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+        app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+        app.config['SIGNED_FOLDER'] = tempfile.mkdtemp()
+
+        self.app = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+            StatsService.reconcile()
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        DeliveryService.adapters.clear()
+
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        shutil.rmtree(app.config['UPLOAD_FOLDER'])
+        shutil.rmtree(app.config['SIGNED_FOLDER'])
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def _stats(self, days=0):
+        response = self.app.get(f'/api/stats?days={days}')
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def _create_and_send(self, method='email'):
+        response = self.app.post('/api/upload',
+                                 data={'file': (io.BytesIO(TEST_PDF), 'form.pdf')},
+                                 content_type='multipart/form-data')
+        response = self.app.post('/api/consents', json={
+            'patient_name': 'Stat Patient',
+            'form_name': 'form.pdf',
+            'file_path': response.get_json()['file_path'],
+        })
+        consent_id = response.get_json()['id']
+        response = self.app.post(f'/api/consents/{consent_id}/send',
+                                 json={'delivery_method': method, 'recipient': 'patient@example.com'})
+        self.assertEqual(response.status_code, 202)
+        return consent_id
+
+    def test_counters_follow_state_changes(self):
+        """Test that creating, sending, delivering and failing update the tiles."""
+        before = self._stats()
+
+        self._create_and_send('email')
+        self._create_and_send('fax')
+        stats = self._stats()
+        self.assertEqual(stats['consents']['sent'], before['consents']['sent'] + 2)
+        self.assertEqual(stats['consents']['draft'], before['consents']['draft'])
+        self.assertEqual(stats['transmissions']['email']['pending'], before['transmissions']['email']['pending'] + 1)
+
+        max_attempts = app.config['DELIVERY_MAX_ATTEMPTS']
+        app.config['DELIVERY_MAX_ATTEMPTS'] = 1
+        try:
+            with app.app_context():
+                DeliveryService.register_adapter(DeliveryMethod.FAX, FailingGateway())
+                DeliveryService.process_pending()
+        finally:
+            app.config['DELIVERY_MAX_ATTEMPTS'] = max_attempts
+
+        stats = self._stats(days=1)
+        self.assertEqual(stats['transmissions']['email']['sent'], before['transmissions']['email']['sent'] + 1)
+        self.assertEqual(stats['transmissions']['email']['pending'], before['transmissions']['email']['pending'])
+        self.assertEqual(stats['transmissions']['fax']['failed'], before['transmissions']['fax']['failed'] + 1)
+        self.assertEqual(stats['transmissions']['fax']['success_rate'], 0.0)
+        today = stats['daily'][-1]
+        self.assertEqual(today['day'], datetime.utcnow().strftime('%Y-%m-%d'))
+        self.assertGreaterEqual(today['transmissions']['fax:failed'], 1)
+
+    def test_signature_moves_sent_to_signed(self):
+        """Test that completing a signature counts the consent and delivery."""
+        consent_id = self._create_and_send('sms')
+        with app.app_context():
+            DeliveryService.process_pending()
+        before = self._stats()
+
+        response = self.app.post(f'/api/simulate-sign/{consent_id}')
+        self.assertEqual(response.status_code, 200)
+
+        stats = self._stats()
+        self.assertEqual(stats['consents']['signed'], before['consents']['signed'] + 1)
+        self.assertEqual(stats['consents']['sent'], before['consents']['sent'] - 1)
+        self.assertEqual(stats['transmissions']['sms']['delivered'], before['transmissions']['sms']['delivered'] + 1)
+        self.assertEqual(stats['transmissions']['sms']['sent'], before['transmissions']['sms']['sent'] - 1)
+
+    def test_reconcile_fixes_drift(self):
+        """Test that reconciliation recounts rows written around the counters."""
+        with app.app_context():
+            now = datetime.utcnow()
+            consent_ids = db.session.scalars(insert(Consent).returning(Consent.id), [{
+                'patient_name': f'Bulk {n}',
+                'form_name': 'form.pdf',
+                'file_path': 'uploads/form.pdf',
+                'status': ConsentStatus.SENT,
+                'sent_at': now,
+            } for n in range(3)]).all()
+            db.session.execute(insert(Transmission), [{
+                'consent_id': consent_id,
+                'method': DeliveryMethod.EMAIL,
+                'recipient': 'bulk@example.com',
+                'status': TransmissionStatus.PENDING,
+            } for consent_id in consent_ids])
+            db.session.execute(update(StatCounter)
+                               .where(StatCounter.metric == CONSENT_STATUS, StatCounter.bucket == TOTAL)
+                               .values(value=StatCounter.value + 100))
+            db.session.commit()
+
+            exact = {status: Consent.query.filter_by(status=status).count() for status in ConsentStatus}
+            self.assertGreater(StatsService.reconcile(), 0)
+            self.assertEqual(StatsService.reconcile(), 0)
+
+            stats = StatsService.dashboard()
+            for status, count in exact.items():
+                self.assertEqual(stats['consents'][status.value], count)
+            self.assertEqual(stats['transmissions']['email']['pending'],
+                             Transmission.query.filter_by(method=DeliveryMethod.EMAIL,
+                                                          status=TransmissionStatus.PENDING).count())
+
+    def test_reconcile_keeps_writes_committed_during_the_recount(self):
+        """Test that a write committed between the recount and its correction is still counted."""
+        apply = StatsService.apply
+
+        def write_then_apply(target, deltas):
+            # The first call is the recount's correction; the write below
+            # commits its own deltas through the real apply
+            StatsService.apply = apply
+            response = self.app.post('/api/consents', json={
+                'patient_name': 'Concurrent Patient', 'form_name': 'form.pdf', 'file_path': 'uploads/form.pdf'})
+            self.assertEqual(response.status_code, 201)
+            apply(target, deltas)
+
+        self.app.post('/api/consents', json={
+            'patient_name': 'Draft Patient', 'form_name': 'form.pdf', 'file_path': 'uploads/form.pdf'})
+        with app.app_context():
+            db.session.execute(update(StatCounter)
+                               .where(StatCounter.metric == CONSENT_STATUS, StatCounter.bucket == TOTAL)
+                               .values(value=StatCounter.value + 100))
+            db.session.commit()
+
+            StatsService.apply = staticmethod(write_then_apply)
+            try:
+                self.assertGreater(StatsService.reconcile(), 0)
+            finally:
+                StatsService.apply = apply
+            self.assertEqual(StatsService.reconcile(), 0)
+            self.assertEqual(StatsService.dashboard()['consents']['draft'],
+                             Consent.query.filter_by(status=ConsentStatus.DRAFT).count())
+
+    def test_periodic_reconcile_runs_in_one_process(self):
+        """Test that only the first claim within an interval wins."""
+        with app.app_context():
+            self.assertTrue(StatsService.claim_reconcile(3600))
+            self.assertFalse(StatsService.claim_reconcile(3600))
+            self.assertTrue(StatsService.claim_reconcile(0))
+
+    def test_rolled_back_changes_are_not_counted(self):
+        """Test that counter deltas are dropped with a rolled back transaction."""
+        with app.app_context():
+            before = StatsService.dashboard()
+            StatsService.consent_transition(None, ConsentStatus.DRAFT)
+            db.session.rollback()
+            db.session.commit()
+            self.assertEqual(StatsService.dashboard(), before)
+
+    def test_invalid_days_are_rejected(self):
+        """Test that the stats endpoint validates ?days=."""
+        self.assertEqual(self.app.get('/api/stats?days=abc').status_code, 400)
+        self.assertEqual(self.app.get('/api/stats?days=1000').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import io
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from app import app, db
+from models import Consent, ConsentEvent, ConsentStatus, WebhookEvent
+from services.webhook_service import WebhookService
+
+TEST_PDF = b'%PDF-1.4\n1 0 obj\n<<\n/Type /Catalog\n>>\nendobj\ntrailer\n<<\n/Root 1 0 R\n>>\n%%EOF'
+
+def docuseal_event(event_type, consent_id, timestamp, **data):
+    return {
+        'event_type': event_type,
+        'timestamp': timestamp,
+        'data': {'id': consent_id * 10, 'external_id': str(consent_id), **data},
+    }
+
+class WebhookInboxTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE']
+        app.config['TESTING'] = True
+        app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+        app.config['SIGNED_FOLDER'] = tempfile.mkdtemp()
+
+        self.app = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        shutil.rmtree(app.config['UPLOAD_FOLDER'])
+        shutil.rmtree(app.config['SIGNED_FOLDER'])
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+
+    def _create_sent_consent(self, patient_name):
+        response = self.app.post('/api/upload',
+                                 data={'file': (io.BytesIO(TEST_PDF), 'form.pdf')},
+                                 content_type='multipart/form-data')
+        response = self.app.post('/api/consents', json={
+            'patient_name': patient_name,
+            'form_name': 'form.pdf',
+            'file_path': response.get_json()['file_path'],
+        })
+        consent_id = response.get_json()['id']
+        self.app.post(f'/api/consents/{consent_id}/send',
+                      json={'delivery_method': 'email', 'recipient': 'patient@example.com'})
+        return consent_id
+
+    def test_redelivered_callback_is_stored_once(self):
+        """Test that the callback acknowledges at once and dedupes retries."""
+        payload = docuseal_event('form.completed', 1, '2026-01-05T10:00:00Z')
+
+        first = self.app.post('/api/docuseal-callback', json=payload)
+        second = self.app.post('/api/docuseal-callback', json=payload)
+
+        self.assertEqual(first.status_code, 202)
+        self.assertFalse(first.get_json()['duplicate'])
+        self.assertEqual(second.status_code, 202)
+        self.assertTrue(second.get_json()['duplicate'])
+
+        with app.app_context():
+            events = WebhookEvent.query.all()
+            self.assertEqual(len(events), 1)
+            self.assertEqual(events[0].status, 'pending')
+            self.assertEqual(events[0].consent_id, 1)
+
+    def test_batch_collapses_duplicates_and_orders_by_event_time(self):
+        """Test that a batch signs each consent once, at its first completion."""
+        consent_id = self._create_sent_consent("Jane Smith")
+
+        # Arrival order differs from event time, and the completion is sent twice
+        for event_id, payload in [
+            ('evt-3', docuseal_event('form.completed', consent_id, '2026-01-05T10:07:00Z')),
+            ('evt-2', docuseal_event('form.completed', consent_id, '2026-01-05T10:05:00Z')),
+            ('evt-1', docuseal_event('form.viewed', consent_id, '2026-01-05T10:01:00Z')),
+            ('evt-4', docuseal_event('form.completed', 999999, '2026-01-05T10:08:00Z')),
+        ]:
+            self.app.post('/api/docuseal-callback', json=payload, headers={'X-Webhook-Id': event_id})
+
+        with app.app_context():
+            before = db.session.query(ConsentEvent).filter_by(event_type='consent.signed').count()
+            self.assertEqual(WebhookService.process_batch(), 4)
+            self.assertEqual(WebhookService.process_batch(), 0)
+
+            consent = db.session.get(Consent, consent_id)
+            self.assertEqual(consent.status, ConsentStatus.SIGNED)
+            self.assertEqual(consent.signed_at, datetime(2026, 1, 5, 10, 5))
+            self.assertTrue(os.path.exists(consent.signed_file_path))
+
+            statuses = {event.provider_event_id: (event.status, event.error_message)
+                        for event in WebhookEvent.query.all()}
+            self.assertEqual(statuses['evt-2'], ('applied', None))
+            self.assertEqual(statuses['evt-3'], ('ignored', 'Duplicate completion'))
+            self.assertEqual(statuses['evt-1'], ('ignored', 'No state change'))
+            self.assertEqual(statuses['evt-4'], ('ignored', 'Unknown consent'))
+
+            after = db.session.query(ConsentEvent).filter_by(event_type='consent.signed').count()
+            self.assertEqual(after - before, 1)
+
+    def test_late_completion_after_signing_is_ignored(self):
+        """Test that a completion arriving in a later batch changes nothing."""
+        consent_id = self._create_sent_consent("John Doe")
+        self.app.post('/api/docuseal-callback',
+                      json=docuseal_event('form.completed', consent_id, '2026-01-05T10:05:00Z'),
+                      headers={'X-Webhook-Id': 'evt-1'})
+        with app.app_context():
+            WebhookService.process_batch()
+
+        self.app.post('/api/docuseal-callback',
+                      json=docuseal_event('form.completed', consent_id, '2026-01-05T09:00:00Z'),
+                      headers={'X-Webhook-Id': 'evt-2'})
+        with app.app_context():
+            WebhookService.process_batch()
+
+            consent = db.session.get(Consent, consent_id)
+            self.assertEqual(consent.signed_at, datetime(2026, 1, 5, 10, 5))
+            late = WebhookEvent.query.filter_by(provider_event_id='evt-2').one()
+            self.assertEqual((late.status, late.error_message), ('ignored', 'Already signed'))
+
+if __name__ == '__main__':
+    unittest.main()